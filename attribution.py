@@ -0,0 +1,317 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+import re
+from helper import read_nop_details
+from schema import read_frame
+
+# Derived per-operator columns on the transmissions frame, e.g. "linkpool_fees"
+OPERATOR_COLUMN_PATTERN = re.compile(r"^(?P<name>.+)_(?P<kind>fees|feesUsd|consecutiveMissed|separateMissed|separateConsecutiveMissed)$")
+
+def load_price_store(feed_path, price_name):
+    """
+    Function to load a feed's price file as sorted arrays for as-of lookups
+
+    Args:
+        feed_path: The path of the feed
+        price_name: The name of the price file, e.g. eth-usd
+
+    Returns:
+        A tuple of sorted block numbers and the prices at those blocks
+    """
+    prices_filename = "data/"+feed_path+"/prices/"+price_name+".json"
+    with open(prices_filename, "r") as file:
+        prices = json.load(file)
+
+    blocks = np.fromiter((int(block) for block in prices), dtype=np.int64, count=len(prices))
+    values = np.fromiter(prices.values(), dtype=np.float64, count=len(prices))
+    order = np.argsort(blocks, kind="stable")
+
+    return blocks[order], values[order]
+
+def price_at_blocks(price_store, block_numbers):
+    """
+    Function to get the last known price at or before each block
+
+    Args:
+        price_store: A tuple of sorted block numbers and prices from load_price_store
+        block_numbers: The block numbers for which to get the prices
+
+    Returns:
+        A numpy array with a price for each block number. Blocks before the first known price use the first price
+    """
+    blocks, values = price_store
+    positions = np.searchsorted(blocks, np.asarray(block_numbers, dtype=np.int64), side="right") - 1
+    return values[np.clip(positions, 0, len(values) - 1)]
+
+def missed_streaks(answers):
+    """
+    Vectorized equivalent of count_consecutive_missed for one operator's answers
+
+    Args:
+        answers: Array of an operator's answers, where 0 is a missed observation
+
+    Returns:
+        1. The consecutive missed counter for each row
+        2. 1 where a separate missed instance starts, 0 otherwise
+        3. 1 where a separate consecutive missed instance starts, 0 otherwise
+    """
+    missed = np.asarray(answers) == 0
+    if len(missed) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    previous = np.concatenate(([False], missed[:-1]))
+    starts = missed & ~previous
+    positions = np.arange(len(missed))
+    last_start = np.maximum.accumulate(np.where(starts, positions, 0))
+    counter = np.where(missed, positions - last_start, 0)
+
+    return counter, starts.astype(np.int64), (counter == 1).astype(np.int64)
+
+class FeedAttribution:
+    """
+    Lazily derives per-operator fee, cost, payment and profit columns for a feed.
+
+    Derived columns are computed on first access and memoized, so a report only
+    pays for the columns it asks for. Column names match the ones get_totals reads:
+    ethPrice, <op>_fees, <op>_consecutiveMissed, <op>_separateMissed and
+    <op>_separateConsecutiveMissed on transmissions and usdAmount on payments.
+    """
+
+    def __init__(self, feed_details, transmissions=None, payments=None, nop_details=None, transmitters=None):
+        """
+        Args:
+            feed_details: The details of the feed
+            transmissions: DataFrame of submissions and transmissions. Read from transmissions.csv if not given
+            payments: DataFrame of payments. Read from payments.csv if not given
+            nop_details: The details of node operators. Read from nops.json if not given
+            transmitters: An array of transmitters. Read from nops.json if not given
+        """
+        self.feed_path = feed_details["path"]
+        if nop_details is None or transmitters is None:
+            nop_details, transmitters = read_nop_details(self.feed_path)
+        self.nop_details = nop_details
+        self.transmitters = transmitters
+        self.operator_names = list(dict.fromkeys(nop_details[transmitter.lower()]["name"] for transmitter in transmitters))
+        self._transmissions = transmissions
+        self._payments = payments
+        self._price_stores = {}
+        self._transmission_columns = {}
+        self._payment_columns = {}
+
+    @property
+    def transmissions(self):
+        if self._transmissions is None:
+            self._transmissions = read_frame("data/"+self.feed_path+"/transmissions.csv", "transmissions")
+        return self._transmissions
+
+    @property
+    def payments(self):
+        if self._payments is None:
+            self._payments = read_frame("data/"+self.feed_path+"/payments.csv", "payments")
+        return self._payments
+
+    def price_store(self, price_name):
+        """
+        Function to get a memoized price store for the feed
+
+        Args:
+            price_name: The name of the price file, e.g. eth-usd
+
+        Returns:
+            A tuple of sorted block numbers and prices
+        """
+        if price_name not in self._price_stores:
+            self._price_stores[price_name] = load_price_store(self.feed_path, price_name)
+        return self._price_stores[price_name]
+
+    def materialized(self):
+        """
+        Returns:
+            The names of the derived columns computed so far
+        """
+        return list(self._transmission_columns) + list(self._payment_columns)
+
+    def column(self, column_name):
+        """
+        Function to get a transmissions column, deriving and memoizing it if needed
+
+        Args:
+            column_name: The name of the column
+
+        Returns:
+            A Series aligned with the transmissions frame
+        """
+        if column_name in self.transmissions.columns:
+            return self.transmissions[column_name]
+        if column_name not in self._transmission_columns:
+            values = self._derive_transmission_column(column_name)
+            self._transmission_columns[column_name] = pd.Series(values, index=self.transmissions.index, name=column_name)
+        return self._transmission_columns[column_name]
+
+    def payment_column(self, column_name):
+        """
+        Function to get a payments column, deriving and memoizing it if needed
+
+        Args:
+            column_name: The name of the column
+
+        Returns:
+            A Series aligned with the payments frame
+        """
+        if column_name in self.payments.columns:
+            return self.payments[column_name]
+        if column_name not in self._payment_columns:
+            values = self._derive_payment_column(column_name)
+            self._payment_columns[column_name] = pd.Series(values, index=self.payments.index, name=column_name)
+        return self._payment_columns[column_name]
+
+    def _derive_transmission_column(self, column_name):
+        transmissions = self.transmissions
+        if column_name == "ethPrice":
+            return price_at_blocks(self.price_store("eth-usd"), transmissions["blockNumber"].to_numpy())
+        if column_name == "feeUsd":
+            return transmissions["fee"].to_numpy(dtype=np.float64) * self.column("ethPrice").to_numpy()
+        if column_name == "gasCost":
+            return transmissions["fee"].to_numpy(dtype=np.float64) / (transmissions["gasPriceGwei"].to_numpy(dtype=np.float64)/1000000000)
+        if column_name == "submitterName":
+            names = {transmitter.lower(): details["name"] for transmitter, details in self.nop_details.items()}
+            return transmissions["submitter"].str.lower().map(names).to_numpy()
+        if column_name == "txDatetime":
+            return pd.to_datetime(transmissions["txDate"], utc=True)
+
+        match = OPERATOR_COLUMN_PATTERN.match(column_name)
+        if match is None:
+            raise KeyError(column_name)
+        name, kind = match.group("name"), match.group("kind")
+        if kind == "fees":
+            return np.where(self.column("submitterName").to_numpy() == name, transmissions["fee"].to_numpy(dtype=np.float64), 0.0)
+        if kind == "feesUsd":
+            return self.column(name+"_fees").to_numpy() * self.column("ethPrice").to_numpy()
+
+        # all three missed columns come from one pass, so memoize them together
+        counter, separate, separate_consecutive = missed_streaks(transmissions[name+"_answer"].to_numpy())
+        streaks = {
+            "consecutiveMissed": counter,
+            "separateMissed": separate,
+            "separateConsecutiveMissed": separate_consecutive
+        }
+        for streak_kind in streaks:
+            if streak_kind != kind:
+                self._transmission_columns[name+"_"+streak_kind] = pd.Series(streaks[streak_kind], index=transmissions.index, name=name+"_"+streak_kind)
+        return streaks[kind]
+
+    def _derive_payment_column(self, column_name):
+        payments = self.payments
+        if column_name == "linkPrice":
+            return price_at_blocks(self.price_store("link-usd"), payments["blockNumber"].to_numpy())
+        if column_name == "usdAmount":
+            return payments["amount"].to_numpy(dtype=np.float64) * self.payment_column("linkPrice").to_numpy()
+        if column_name == "txDatetime":
+            return pd.to_datetime(payments["txDate"], utc=True)
+        raise KeyError(column_name)
+
+    def transmissions_frame(self, columns):
+        """
+        Function to build a transmissions frame with the requested derived columns
+
+        Args:
+            columns: The derived or stored column names to include on top of the stored ones
+
+        Returns:
+            A copy of the transmissions DataFrame with the requested columns
+        """
+        derived = {column: self.column(column) for column in columns if column not in self.transmissions.columns}
+        return pd.concat([self.transmissions, pd.DataFrame(derived, index=self.transmissions.index)], axis=1)
+
+    def payments_frame(self, columns):
+        """
+        Function to build a payments frame with the requested derived columns
+
+        Args:
+            columns: The derived or stored column names to include on top of the stored ones
+
+        Returns:
+            A copy of the payments DataFrame with the requested columns
+        """
+        derived = {column: self.payment_column(column) for column in columns if column not in self.payments.columns}
+        return pd.concat([self.payments, pd.DataFrame(derived, index=self.payments.index)], axis=1)
+
+    def totals_frames(self):
+        """
+        Function to build the inputs expected by get_totals
+
+        Returns:
+            The transmissions DataFrame and payments DataFrame with every column get_totals reads
+        """
+        columns = ["ethPrice"]
+        for name in self.operator_names:
+            columns += [name+"_fees", name+"_consecutiveMissed", name+"_separateMissed", name+"_separateConsecutiveMissed"]
+
+        return self.transmissions_frame(columns), self.payments_frame(["usdAmount"])
+
+    def cost_series(self, name):
+        """
+        Function to get an operator's transmission costs in USD
+
+        Args:
+            name: The operator's name
+
+        Returns:
+            A Series of USD costs indexed by transmission date, only for the operator's transmissions
+        """
+        costs = self.column(name+"_feesUsd")
+        mask = self.column("submitterName").to_numpy() == name
+        return pd.Series(costs.to_numpy()[mask], index=pd.DatetimeIndex(self.column("txDatetime")[mask]), name=name)
+
+    def payment_series(self, name):
+        """
+        Function to get an operator's payments in USD
+
+        Args:
+            name: The operator's name
+
+        Returns:
+            A Series of USD payments indexed by payment date
+        """
+        mask = (self.payments["oracleName"] == name).to_numpy()
+        amounts = self.payment_column("usdAmount").to_numpy()[mask]
+        return pd.Series(amounts, index=pd.DatetimeIndex(self.payment_column("txDatetime")[mask]), name=name)
+
+    def profit_series(self, name, freq="D"):
+        """
+        Function to get an operator's profit per period
+
+        Args:
+            name: The operator's name
+            freq: The pandas frequency of the periods
+
+        Returns:
+            A Series of USD payments minus USD transmission costs for every period
+        """
+        costs = self.cost_series(name).resample(freq).sum()
+        payments = self.payment_series(name).resample(freq).sum()
+        return payments.sub(costs, fill_value=0).rename(name)
+
+    def operator_summary(self, freq="D"):
+        """
+        Function to get cost, payment and profit per period for every operator
+
+        Args:
+            freq: The pandas frequency of the periods
+
+        Returns:
+            A DataFrame with cost, payment and profit columns per operator and period
+        """
+        summaries = []
+        for name in self.operator_names:
+            costs = self.cost_series(name).resample(freq).sum()
+            payments = self.payment_series(name).resample(freq).sum()
+            summary = pd.concat([costs.rename("cost"), payments.rename("payment")], axis=1).fillna(0)
+            summary["profit"] = summary["payment"] - summary["cost"]
+            summary["oracleName"] = name
+            summaries.append(summary)
+
+        return pd.concat(summaries).rename_axis("period").reset_index()
@@ -0,0 +1,846 @@
+import pandas as pd
+from web3 import Web3
+import contextlib
+import subprocess
+import tempfile
+import shutil
+import json
+import sys
+import os
+import time
+from datetime import datetime
+from helper import *
+import helper
+from attribution import FeedAttribution
+from replay_node import SyntheticChain, MergedChain, ReplayNode, write_feed_fixture, load_fixture
+import rpc_decode
+from ingestion import collect_feeds
+import sql_layer
+import rollups
+import sketches
+import similarity
+import bootstrap
+import reference_prices
+import simulator
+
+RESULTS_FILENAME = "benchmarks/results.jsonl"
+DEFAULT_SIZES = [250, 1000]
+RECORDED_FEED_PATH = "ethereum/mainnet/crypto-usd/link-usd"
+# a stage is a regression if it is this much slower than the previous commit's run
+REGRESSION_THRESHOLD = 1.25
+# and slower by at least this many seconds, so timer noise on tiny stages is ignored
+REGRESSION_MIN_SECONDS = 0.01
+# The payout simulator should replay thousands of parameter combinations in minutes
+SWEEP_COMBINATIONS_GRID = {
+    "linkGweiPerObservation": [5000000 * step for step in range(1, 11)],
+    "linkGweiPerTransmission": [10000000 * step for step in range(1, 11)],
+    "maximumGasPrice": [500, 1000, 1500, 3000, 5000],
+    "reasonableGasPrice": [10, 25, 50, 100]
+}
+SWEEP_BUDGET_SECONDS = 300
+
+def timed(label, function, *args, **kwargs):
+    """
+    Function to time a single call and print the duration
+
+    Args:
+        label: The label to print with the duration
+        function: The function to call
+        args: Positional arguments for the function
+        kwargs: Keyword arguments for the function
+
+    Returns:
+        The result of the function and the duration in seconds
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    duration = time.perf_counter() - start
+    print(f"{label:<45} {duration:10.4f}s")
+    return result, duration
+
+def best_of(repeat, function, *args, **kwargs):
+    """
+    Function to time a call several times, silencing its output
+
+    Args:
+        repeat: The number of times to call the function
+        function: The function to call
+        args: Positional arguments for the function
+        kwargs: Keyword arguments for the function
+
+    Returns:
+        The result of the last call and the fastest duration in seconds
+    """
+    durations = []
+    for _ in range(repeat):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            durations.append(time.perf_counter() - start)
+    return result, min(durations)
+
+def feed_path_for_dir(dir_path):
+    """
+    Function to get the feed path of a directory outside data/, as the helpers prefix paths with data/
+
+    Args:
+        dir_path: The directory of the feed
+
+    Returns:
+        The feed path to pass to the helpers
+    """
+    return os.path.relpath(dir_path, "data")
+
+def build_synthetic_feed(rounds, operators, dir_path, repeat=1):
+    """
+    Function to collect a synthetic feed from a local replay node, timing the collectors
+
+    Args:
+        rounds: The number of transmissions of the synthetic feed
+        operators: The number of operators of the synthetic feed
+        dir_path: The directory to write the feed's data to
+        repeat: The number of times to time each microbenchmark
+
+    Returns:
+        The details of the feed and a dict with the duration of each collection stage in seconds
+    """
+    feed_path = feed_path_for_dir(dir_path)
+    # a few withdrawals, so get_totals has ranges to go through
+    chain = SyntheticChain(rounds=rounds, operators=operators, payment_interval=max(rounds // 4, 1))
+    write_feed_fixture(chain, feed_path)
+    nop_details, transmitters = read_nop_details(feed_path)
+    results = {}
+
+    with ReplayNode(chain) as node:
+        w3 = Web3(Web3.HTTPProvider(node.url))
+        with open("abi/aggregator_abi.json", "r") as file:
+            contract_abi = json.load(file)
+        contract, events = create_contract(w3, chain.aggregator_address, contract_abi)
+        event_sigs = calculate_event_sigs(events)
+        event_params = get_event_params(events)
+
+        # "ethereum" in the feed path selects the same code paths as mainnet feeds
+        collection_path = feed_path+"/ethereum"
+        os.makedirs("data/"+collection_path, exist_ok=True)
+        shutil.copy("data/"+feed_path+"/nops.json", "data/"+collection_path+"/nops.json")
+        transmissions, results["get_transmissions"] = best_of(1, get_transmissions, w3, node.url, chain.aggregator_address, chain.start_block, event_sigs, event_params, collection_path, nop_details, transmitters, events, contract)
+        _, results["get_transmissions_lean"] = best_of(1, get_transmissions_lean, w3, node.url, chain.aggregator_address, chain.start_block, event_sigs, event_params, collection_path+"/lean", nop_details, transmitters, events, contract)
+        shutil.rmtree("data/"+collection_path+"/lean")
+        payments, results["get_payments"] = best_of(1, get_payments, w3, node.url, chain.aggregator_address, chain.start_block, event_sigs, event_params, collection_path, nop_details, transmitters, events, contract)
+        _, results["get_billing_params"] = best_of(1, get_billing_params, w3, node.url, chain.aggregator_address, event_sigs, event_params, collection_path, events, contract)
+
+        receipt = w3.eth.get_transaction_receipt(transmissions["txHash"].iloc[0])
+        _, results["get_decoded_logs"] = best_of(repeat, lambda: [get_decoded_logs(events, receipt, contract) for _ in range(100)])
+        payment_logs = get_logs(node.url, chain.aggregator_address, event_sigs["OraclePaid"], hex(chain.start_block))
+        _, results["decode_logs_data"] = best_of(repeat, lambda: [decode_logs_data(event_params["OraclePaid"]["params"], log.data) for log in payment_logs])
+
+        blocks = sorted(set(transmissions["blockNumber"].astype(int)) | set(payments["blockNumber"].astype(int)))
+        for price_feed in ["link-usd", "eth-usd"]:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                get_prices_for_blocknumbers(w3, chain.aggregator_address, contract_abi, blocks, price_feed, collection_path)
+
+    # move the collected files to the feed's directory
+    for filename in os.listdir("data/"+collection_path):
+        shutil.move("data/"+collection_path+"/"+filename, "data/"+feed_path+"/"+filename)
+    os.rmdir("data/"+collection_path)
+    _, results["save_per_op_data"] = best_of(1, save_per_op_data, transmissions, payments, transmitters, nop_details, feed_path)
+    results.update(bench_rpc_decoding(rpc_bodies(chain), repeat))
+
+    return {"path": feed_path}, results
+
+def rpc_bodies(chain, batch_size=50):
+    """
+    Function to get the raw responses of a chain's eth_getLogs and eth_getBlockReceipts calls
+
+    Args:
+        chain: A SyntheticChain, or a FixtureChain with recorded responses
+        batch_size: The number of eth_getBlockReceipts calls per batch, as sent by get_block_receipts
+
+    Returns:
+        A dict with the response bodies as bytes by method
+    """
+    if hasattr(chain, "responses"):
+        logs = [result for key, result in chain.responses.items() if key.startswith("eth_getLogs:")]
+        receipts = [result for key, result in chain.responses.items() if key.startswith("eth_getBlockReceipts:") and result is not None]
+    else:
+        logs = [chain.handle("eth_getLogs", [{"fromBlock": hex(chain.start_block)}])]
+        receipts = [chain.handle("eth_getBlockReceipts", [hex(block_number)]) for block_number in sorted(chain.block_transactions)]
+
+    batches = [receipts[i:i+batch_size] for i in range(0, len(receipts), batch_size)]
+    return {
+        "eth_getLogs": [json.dumps({"jsonrpc": "2.0", "id": 1, "result": result}).encode("utf-8") for result in logs],
+        "eth_getBlockReceipts": [json.dumps([{"jsonrpc": "2.0", "id": index, "result": result} for index, result in enumerate(batch)]).encode("utf-8") for batch in batches]
+    }
+
+def bench_rpc_decoding(bodies, repeat=3):
+    """
+    Function to time parsing raw eth_getLogs and eth_getBlockReceipts responses into ints and bytes. The json stages
+    parse the text with the standard library and convert the same fields from the parsed dicts
+
+    Args:
+        bodies: The response bodies by method, see rpc_bodies
+        repeat: The number of times to time each stage
+
+    Returns:
+        A dict of stage to its fastest duration in seconds
+    """
+    def parse_logs_json():
+        return [[(log["address"].lower(), int(log["blockNumber"], 16), int(log["transactionIndex"], 16), int(log["logIndex"], 16), bytes.fromhex(log["data"][2:]), [bytes.fromhex(topic[2:]) for topic in log["topics"]]) for log in json.loads(body.decode("utf-8"))["result"]] for body in bodies["eth_getLogs"]]
+
+    def parse_receipts_json():
+        return [[(int(receipt["blockNumber"], 16), int(receipt["gasUsed"], 16), int(receipt["effectiveGasPrice"], 16), int(receipt["status"], 16)) for response in json.loads(body.decode("utf-8")) for receipt in response["result"]] for body in bodies["eth_getBlockReceipts"]]
+
+    results = {}
+    _, results["parse getLogs json"] = best_of(repeat, parse_logs_json)
+    _, results["parse getLogs rpc_decode"] = best_of(repeat, lambda: [rpc_decode.decode_logs(rpc_decode.loads(body)["result"]) for body in bodies["eth_getLogs"]])
+    _, results["parse blockReceipts json"] = best_of(repeat, parse_receipts_json)
+    _, results["parse blockReceipts rpc_decode"] = best_of(repeat, lambda: [rpc_decode.decode_receipts(response["result"]) for body in bodies["eth_getBlockReceipts"] for response in rpc_decode.loads(body)])
+    return results
+
+def link_recorded_feed(source_feed_path, dir_path):
+    """
+    Function to mirror a recorded feed into a directory with symlinks, so get_totals does not overwrite its totals.json
+
+    Args:
+        source_feed_path: The path of the recorded feed
+        dir_path: The directory to mirror the feed into
+
+    Returns:
+        The details of the mirrored feed
+    """
+    source_dir = os.path.abspath("data/"+source_feed_path)
+    for filename in os.listdir(source_dir):
+        if filename != "totals.json":
+            os.symlink(source_dir+"/"+filename, dir_path+"/"+filename)
+    return {"path": feed_path_for_dir(dir_path)}
+
+def bench_analysis(feed_details, repeat=3):
+    """
+    Function to time the analysis hot paths over a feed's stored data
+
+    Args:
+        feed_details: The details of the feed
+        repeat: The number of times to time each stage
+
+    Returns:
+        A dict with the fastest duration of each stage in seconds
+    """
+    results = {}
+    feed_path = feed_details["path"]
+    nop_details, transmitters = read_nop_details(feed_path)
+
+    transmissions, results["read_csv transmissions"] = best_of(repeat, pd.read_csv, "data/"+feed_path+"/transmissions.csv")
+    _, results["read_frame transmissions"] = best_of(repeat, read_frame, "data/"+feed_path+"/transmissions.csv", "transmissions")
+    payments = pd.read_csv("data/"+feed_path+"/payments.csv")
+    output_dir = tempfile.mkdtemp()
+    _, results["to_csv transmissions"] = best_of(repeat, transmissions.to_csv, output_dir+"/transmissions.csv")
+    shutil.rmtree(output_dir)
+
+    operator_names = [nop_details[transmitter.lower()]["name"] for transmitter in transmitters]
+    _, results["count_consecutive_missed"] = best_of(repeat, lambda: [count_consecutive_missed(transmissions, name+"_answer") for name in operator_names])
+
+    with open("data/"+feed_path+"/billing_params.json", "r") as file:
+        billing_params = json.load(file)
+    submissions = transmissions.copy()
+    submissions["gasCost"] = submissions["fee"] / (submissions["gasPriceGwei"]/1000000000)
+    _, results["get_transmission_repayments"] = best_of(repeat, get_transmission_repayments, submissions, billing_params[list(billing_params)[-1]])
+
+    attribution = FeedAttribution(feed_details, transmissions, payments, nop_details, transmitters)
+    totals_transmissions, totals_payments = attribution.totals_frames()
+    # link prices are keyed by block number strings
+    totals_payments["blockNumber"] = totals_payments["blockNumber"].astype(str)
+    unique_withdrawal_dates = get_unique_withdrawal_dates(totals_payments)
+    # end to end over every range, so a single run is enough
+    totals, results["get_totals"] = best_of(1, get_totals, unique_withdrawal_dates, totals_payments, totals_transmissions, transmitters, nop_details, feed_details)
+    if sql_layer.duckdb is not None:
+        results.update(bench_sql(feed_details, totals))
+    results.update(bench_rollups(feed_details, totals, repeat))
+    results.update(bench_similarity(feed_details, transmissions, operator_names, unique_withdrawal_dates, repeat))
+    for shard in ["range", "operator"]:
+        results.update(bench_parallel_totals(feed_details, totals, shard, unique_withdrawal_dates, totals_payments, totals_transmissions, transmitters, nop_details))
+    results.update(bench_bootstrap(feed_details, totals, unique_withdrawal_dates, totals_payments, transmitters, nop_details))
+    results.update(bench_simulator(attribution, unique_withdrawal_dates, billing_params[list(billing_params)[-1]]))
+
+    return results
+
+def bench_rollups(feed_details, expected_totals, repeat=3):
+    """
+    Function to time building and reading a feed's rollups and check their totals against get_totals
+
+    Args:
+        feed_details: The details of the feed
+        expected_totals: The totals of get_totals for the feed
+        repeat: The number of times to time the reads
+
+    Returns:
+        A dict with the fastest duration of each stage in seconds
+    """
+    results = {}
+    feed_path = feed_details["path"]
+    shutil.rmtree(rollups.rollup_dir(feed_path), ignore_errors=True)
+    _, results["rollups build"] = best_of(1, rollups.update_rollups, feed_path)
+    _, results["rollups update unchanged"] = best_of(repeat, rollups.update_rollups, feed_path)
+    totals, results["rollups totals"] = best_of(repeat, rollups.rollup_totals, feed_path, False)
+    _, results["rollups load daily"] = best_of(repeat, rollups.load_rollup, feed_path, "daily")
+    quantiles, results["rollups deviation quantiles"] = best_of(repeat, rollups.deviation_quantiles, feed_path)
+
+    differences = sql_layer.compare_totals(expected_totals, totals)
+    for path, expected, actual in differences[:10]:
+        print(f"Rollup totals differ at {path}: {expected} != {actual}")
+    if len(differences) > 0:
+        raise AssertionError(str(len(differences))+" rollup totals differ from get_totals for "+feed_path)
+    check_deviation_quantiles(feed_path, quantiles)
+
+    return results
+
+def check_deviation_quantiles(feed_path, quantiles):
+    """
+    Function to check the quantiles of the deviation sketches against the exact quantiles of transmissions.csv
+
+    Args:
+        feed_path: The path of the feed
+        quantiles: The quantiles of deviation_quantiles over every day and operator
+
+    Raises:
+        AssertionError: If a quantile is further from the exact one than the sketches' relative accuracy
+    """
+    transmissions = pd.read_csv("data/"+feed_path+"/transmissions.csv")
+    exact = {}
+    for name in quantiles["oracleName"]:
+        columns = [name] if name != "all" else list(quantiles["oracleName"][:-1])
+        # the deviations of the rounds each operator observed, as in the sketches
+        deviations = np.concatenate([transmissions[column+"_deviation"][transmissions[column+"_answer"] != 0].dropna().to_numpy(dtype=np.float64) for column in columns])
+        exact[name] = deviations
+
+    failures = 0
+    for _, row in quantiles.iterrows():
+        deviations = exact[row["oracleName"]]
+        if len(deviations) != row["observations"]:
+            raise AssertionError(row["oracleName"]+" has "+str(row["observations"])+" deviations in the sketches and "+str(len(deviations))+" in transmissions.csv")
+        for column in quantiles.columns[2:]:
+            expected = np.quantile(deviations, float(column[1:]) / 100, method="lower")
+            # values up to MIN_VALUE are counted as zero
+            if abs(row[column] - expected) > sketches.RELATIVE_ACCURACY * expected + sketches.MIN_VALUE:
+                print(f"Deviation {column} of {row['oracleName']} is {row[column]}, exact {expected}")
+                failures += 1
+    if failures > 0:
+        raise AssertionError(str(failures)+" deviation quantiles are outside the sketches' accuracy for "+feed_path)
+
+def bench_parallel_totals(feed_details, expected_totals, shard, unique_withdrawal_dates, payments, transmissions, transmitters, nop_details):
+    """
+    Function to time get_totals over a process pool and check that its totals are the same as the serial ones
+
+    Args:
+        feed_details: The details of the feed
+        expected_totals: The totals of the serial get_totals for the feed
+        shard: "range" or "operator", how get_totals splits the work between the workers
+        unique_withdrawal_dates: Array of withdrawal dates
+        payments: DataFrame of payments
+        transmissions: DataFrame of submissions and transmissions
+        transmitters: An array of transmitters
+        nop_details: The details of node operators
+
+    Returns:
+        A dict with the duration of the stage in seconds
+    """
+    # at least two workers, so the pool is used on a single core as well
+    processes = max(2, os.cpu_count() or 1)
+    stage = "get_totals by "+shard
+    totals, seconds = best_of(1, get_totals, unique_withdrawal_dates, payments, transmissions, transmitters, nop_details, feed_details, processes, shard)
+
+    # compared as JSON, as NaN is not equal to itself
+    to_json = lambda value: json.dumps(value, default=lambda number: number.item())
+    if to_json(totals) != to_json(expected_totals):
+        raise AssertionError("get_totals sharded by "+shard+" differs from the serial totals for "+feed_details["path"])
+
+    return {stage: seconds}
+
+def bench_similarity(feed_details, transmissions, operator_names, unique_withdrawal_dates, repeat=3):
+    """
+    Function to time the operator similarity matrices and check them against pairwise comparisons of the columns, and
+    the matrices of a process pool over small blocks against the serial ones
+
+    Args:
+        feed_details: The details of the feed
+        transmissions: DataFrame of transmissions
+        operator_names: The names of the operators
+        unique_withdrawal_dates: Array of withdrawal dates
+        repeat: The number of times to time the serial matrices
+
+    Returns:
+        A dict with the fastest duration of each stage in seconds
+    """
+    results = {}
+    transmissions = read_frame("data/"+feed_details["path"]+"/transmissions.csv", "transmissions")
+    names = [name for name in dict.fromkeys(operator_names) if name+"_answer" in transmissions.columns]
+    expected, results["operator similarity"] = best_of(repeat, similarity.operator_similarity, transmissions, names, unique_withdrawal_dates)
+    if len(expected["rounds"]) == 0:
+        return results
+
+    processes = max(2, os.cpu_count() or 1)
+    actual, results["operator similarity parallel"] = best_of(1, similarity.operator_similarity, transmissions, names, unique_withdrawal_dates, processes, 64)
+    for key in similarity.MATRICES:
+        if not np.allclose(expected[key], actual[key], rtol=1e-9, atol=1e-12, equal_nan=True):
+            raise AssertionError("The "+key+" of the parallel blocks differs from the serial one for "+feed_details["path"])
+    check_operator_similarity(transmissions, names, unique_withdrawal_dates, expected)
+
+    return results
+
+def check_operator_similarity(transmissions, names, unique_withdrawal_dates, result):
+    """
+    Function to check the similarity matrices of the largest range against comparisons of each pair of columns
+
+    Args:
+        transmissions: DataFrame of transmissions
+        names: The names of the operators
+        unique_withdrawal_dates: Array of withdrawal dates
+        result: The result of operator_similarity
+
+    Raises:
+        AssertionError: If a matrix entry differs from the pairwise one
+    """
+    index = int(np.argmax(result["rounds"]))
+    submissions = transmissions[transmissions["txDate"] < unique_withdrawal_dates[index]]
+    if index > 0:
+        submissions = submissions[submissions["txDate"] >= unique_withdrawal_dates[index-1]]
+    if len(submissions) != result["rounds"][index]:
+        raise AssertionError("The range has "+str(result["rounds"][index])+" rounds in the similarity matrices and "+str(len(submissions))+" in transmissions.csv")
+
+    failures = 0
+    for first, name in enumerate(names):
+        for second, other in enumerate(names):
+            answers, other_answers = submissions[name+"_answer"], submissions[other+"_answer"]
+            # NaN answers are rounds the operator was not in the transmitter set for
+            both = answers.notna() & other_answers.notna() & (answers != 0) & (other_answers != 0)
+            both_eligible = answers.notna() & other_answers.notna()
+            deviations = (answers[both] - submissions["aggregatedAnswer"][both]) / submissions["aggregatedAnswer"][both]
+            other_deviations = (other_answers[both] - submissions["aggregatedAnswer"][both]) / submissions["aggregatedAnswer"][both]
+            expected = {
+                "bothObserved": both.sum(),
+                "exactMatchRate": (answers[both] == other_answers[both]).mean() if both.any() else np.nan,
+                "deviationCorrelation": deviations.astype(float).corr(other_deviations.astype(float)) if deviations.std() > 0 and other_deviations.std() > 0 else np.nan,
+                "jointMissRate": ((answers == 0) & (other_answers == 0))[both_eligible].mean() if both_eligible.any() else np.nan
+            }
+            for key, value in expected.items():
+                if not np.isclose(result[key][index][first, second], value, rtol=1e-6, atol=1e-9, equal_nan=True):
+                    print(f"{key} of {name} and {other} is {result[key][index][first, second]}, pairwise {value}")
+                    failures += 1
+    if failures > 0:
+        raise AssertionError(str(failures)+" similarity matrix entries differ from the pairwise comparisons")
+
+def bench_bootstrap(feed_details, expected_totals, unique_withdrawal_dates, payments, transmitters, nop_details):
+    """
+    Function to time the bootstrap intervals of a feed in this process and over a process pool, and check that both
+    give the same intervals around the values of get_totals
+
+    Args:
+        feed_details: The details of the feed
+        expected_totals: The totals of get_totals for the feed
+        unique_withdrawal_dates: Array of withdrawal dates
+        payments: DataFrame of payments with their usdAmount
+        transmitters: An array of transmitters
+        nop_details: The details of node operators
+
+    Returns:
+        A dict with the duration of each stage in seconds
+    """
+    results = {}
+    intervals, results["bootstrap"] = best_of(1, bootstrap.bootstrap_totals, unique_withdrawal_dates, payments, transmitters, nop_details, feed_details, processes=1)
+    # at least two workers, so the pool is used on a single core as well
+    processes = max(2, os.cpu_count() or 1)
+    parallel, results["bootstrap parallel"] = best_of(1, bootstrap.bootstrap_totals, unique_withdrawal_dates, payments, transmitters, nop_details, feed_details, processes=processes)
+
+    # compared as JSON, as NaN is not equal to itself
+    if json.dumps(parallel) != json.dumps(intervals):
+        raise AssertionError("The bootstrap intervals of the process pool differ from the serial ones for "+feed_details["path"])
+    failures = 0
+    for range_intervals, total in zip(intervals["intervals"], expected_totals["totals"]):
+        for metric in bootstrap.METRICS:
+            for name, interval in range_intervals[metric].items():
+                if not np.isclose(interval["value"], total[metric][name], rtol=1e-9, atol=1e-9, equal_nan=True):
+                    print(f"Bootstrap {metric} of {name} is {interval['value']}, get_totals {total[metric][name]}")
+                    failures += 1
+    if failures > 0:
+        raise AssertionError(str(failures)+" bootstrap values differ from get_totals for "+feed_details["path"])
+
+    return results
+
+def bench_simulator(attribution, unique_withdrawal_dates, billing):
+    """
+    Function to time a sweep of the OCR payout rule over thousands of parameter combinations, and check the
+    reimbursements of the rule against get_transmission_repayments
+
+    Args:
+        attribution: A FeedAttribution instance of the feed
+        unique_withdrawal_dates: Array of withdrawal dates, the starts of the periods
+        billing: The billing parameters the fixed ones of the sweep are taken from
+
+    Returns:
+        A dict with the duration of each stage in seconds
+    """
+    results = {}
+    matrix, results["simulator matrix"] = best_of(1, simulator.observation_matrix_for_feed, attribution)
+    period_edges = np.array([int(pd.Timestamp(date).timestamp()) for date in unique_withdrawal_dates], dtype=np.int64)
+
+    # without the rewards, the payouts are the reimbursements of the transmitted rounds
+    repayments = simulator.simulate(matrix, "ocr", dict(billing, linkGweiPerObservation=0, linkGweiPerTransmission=0))["rounds"].sum()
+    transmitted = matrix["transmitted"].any(axis=1)
+    expected = get_transmission_repayments(pd.DataFrame({"gasPriceGwei": matrix["gasPriceGwei"][transmitted], "gasCost": matrix["gasCost"][transmitted]}), billing)
+    if not np.isclose(repayments, expected, rtol=1e-9):
+        raise AssertionError("The OCR payout rule reimburses "+str(repayments)+" LINK and get_transmission_repayments "+str(expected)+" for "+attribution.feed_path)
+
+    param_grid = dict(SWEEP_COMBINATIONS_GRID, microLinkPerEth=billing["microLinkPerEth"])
+    sweep_df, results["simulator sweep"] = best_of(1, simulator.run_sweep, matrix, "ocr", param_grid, period_edges)
+    combinations = sweep_df["combination"].nunique()
+    if results["simulator sweep"] > SWEEP_BUDGET_SECONDS:
+        raise AssertionError(str(combinations)+" combinations took "+str(round(results["simulator sweep"]))+"s, over the "+str(SWEEP_BUDGET_SECONDS)+"s budget, for "+attribution.feed_path)
+
+    return results
+
+def bench_sql(feed_details, expected_totals, repeat=1):
+    """
+    Function to time the SQL layer's totals over a feed's stored data and check them against get_totals
+
+    Args:
+        feed_details: The details of the feed
+        expected_totals: The totals of get_totals for the feed
+        repeat: The number of times to time each stage
+
+    Returns:
+        A dict with the fastest duration of each stage in seconds
+    """
+    results = {}
+    database, results["sql register"] = best_of(repeat, sql_layer.FeedDatabase, [feed_details["path"]])
+    totals, results["sql totals"] = best_of(repeat, database.totals, feed_details["path"])
+    database.close()
+
+    differences = sql_layer.compare_totals(expected_totals, totals)
+    for path, expected, actual in differences[:10]:
+        print(f"SQL totals differ at {path}: {expected} != {actual}")
+    if len(differences) > 0:
+        raise AssertionError(str(len(differences))+" SQL totals differ from get_totals for "+feed_details["path"])
+
+    return results
+
+def bench_attribution(feed_details):
+    """
+    Function to benchmark the attribution engine over a feed's stored data
+
+    Args:
+        feed_details: The details of the feed
+
+    Returns:
+        A dict with the duration of each stage in seconds
+    """
+    durations = {}
+    transmissions, durations["read transmissions.csv"] = timed("read transmissions.csv", pd.read_csv, "data/"+feed_details["path"]+"/transmissions.csv")
+    payments, durations["read payments.csv"] = timed("read payments.csv", pd.read_csv, "data/"+feed_details["path"]+"/payments.csv")
+    print("rows", len(transmissions), "payments", len(payments))
+
+    attribution = FeedAttribution(feed_details, transmissions, payments)
+    _, durations["ethPrice"] = timed("ethPrice", attribution.column, "ethPrice")
+    _, durations["totals frames"] = timed("totals frames (all operators)", attribution.totals_frames)
+    _, durations["operator summary"] = timed("daily cost/payment/profit (all operators)", attribution.operator_summary)
+    print("materialized columns", len(attribution.materialized()))
+
+    # the loop it replaces, for one operator
+    name = attribution.operator_names[0]
+    _, durations["count_consecutive_missed"] = timed("count_consecutive_missed ("+name+")", count_consecutive_missed, transmissions, name+"_answer")
+
+    return durations
+
+def bench_feeds(feed_counts, rounds=250, operators=31):
+    """
+    Function to time collect_feeds over merged synthetic chains with different numbers of feeds sharing an operator set
+
+    Args:
+        feed_counts: The numbers of feeds to collect together
+        rounds: The number of transmissions of each feed
+        operators: The number of operators of each feed
+
+    Returns:
+        A dict with the duration in seconds and the calls per method of each number of feeds
+    """
+    with open("abi/aggregator_abi.json", "r") as file:
+        contract_abi = json.load(file)
+
+    results = {}
+    for feed_count in feed_counts:
+        dir_path = tempfile.mkdtemp()
+        try:
+            chains = [SyntheticChain(rounds=rounds, operators=operators, payment_interval=max(rounds // 4, 1), seed=index, name="feed"+str(index)) for index in range(feed_count)]
+            feeds = []
+            for index, chain in enumerate(chains):
+                # "ethereum" in the feed path selects the same code paths as mainnet feeds
+                feed_path = feed_path_for_dir(dir_path)+"/ethereum/feed"+str(index)
+                write_feed_fixture(chain, feed_path)
+                feeds.append({"path": feed_path, "address": chain.aggregator_address})
+
+            with ReplayNode(MergedChain(chains)) as node:
+                w3 = Web3(Web3.HTTPProvider(node.url))
+                _, seconds = best_of(1, collect_feeds, w3, node.url, feeds, chains[0].start_block, contract_abi)
+                results[feed_count] = {"seconds": seconds, "calls": dict(node.calls)}
+        finally:
+            shutil.rmtree(dir_path)
+
+        print(f"{feed_count:>4} feeds {results[feed_count]['seconds']:10.4f}s eth_getLogs {results[feed_count]['calls'].get('eth_getLogs', 0):>4} calls {sum(results[feed_count]['calls'].values()):>7}")
+
+    return results
+
+def synthetic_klines(minutes, prices, rng, missing=0.02):
+    """
+    Function to make the 1 minute klines of a synthetic market
+
+    Args:
+        minutes: The minutes since the epoch
+        prices: The close at each minute
+        rng: A numpy Generator
+        missing: The share of minutes without a kline
+
+    Returns:
+        The klines as reference_prices.klines_from_rows returns them
+    """
+    kept = rng.random(len(minutes)) >= missing
+    klines = {"timestamp": minutes[kept] * reference_prices.MINUTE_MS}
+    closes = prices[kept]
+    for name in ["open", "high", "low", "close"]:
+        klines[name] = closes
+    klines["volume"] = rng.exponential(100.0, len(closes))
+    return klines
+
+def bench_reference_prices(days=730, repeat=3):
+    """
+    Function to time building a minute reference price of LINK / ETH from synthetic LINKETH, LINKUSDT and ETHUSDT
+    klines with gaps, and check the alignment against pd.merge_asof
+
+    Args:
+        days: The number of days of klines
+        repeat: The number of times to time each stage
+
+    Returns:
+        A dict with the fastest duration of each stage in seconds
+    """
+    rng = np.random.default_rng(0)
+    start = int(datetime(2021, 1, 1).timestamp()) // 60
+    minutes = np.arange(start, start + days * 1440, dtype=np.int64)
+    eth = 1000 * np.exp(np.cumsum(rng.normal(0, 0.001, len(minutes))))
+    link = 20 * np.exp(np.cumsum(rng.normal(0, 0.0015, len(minutes))))
+    markets = {
+        "ETHUSDT": synthetic_klines(minutes, eth, rng),
+        "LINKUSDT": synthetic_klines(minutes, link, rng),
+        "LINKETH": synthetic_klines(minutes, link / eth * (1 + rng.normal(0, 0.0005, len(minutes))), rng, missing=0.3)
+    }
+    # a day without LINKETH, so the composite only has the cross
+    gap = (markets["LINKETH"]["timestamp"] // reference_prices.MINUTE_MS - start) // 1440 != days // 2
+    markets["LINKETH"] = {name: values[gap] for name, values in markets["LINKETH"].items()}
+
+    results = {}
+    dir_path = tempfile.mkdtemp()
+    try:
+        klines_dir = dir_path+"/binance"
+        for symbol, klines in markets.items():
+            reference_prices.save_klines(symbol, klines, klines_dir)
+        feed_details = {"name": "LINK / ETH", "path": feed_path_for_dir(dir_path+"/feed")}
+        reference, results["reference build"] = best_of(repeat, reference_prices.build_reference_prices, feed_details, klines_dir=klines_dir)
+        _, results["reference load"] = best_of(repeat, reference_prices.load_reference_prices, feed_details["path"])
+
+        grid = pd.DataFrame({"minute": np.arange(len(reference["price"]), dtype=np.int64) + int(reference["start"]) // reference_prices.MINUTE_MS})
+        closes = {}
+        for symbol, klines in markets.items():
+            market = pd.DataFrame({"minute": klines["timestamp"] // reference_prices.MINUTE_MS, "close": klines["close"]})
+            closes[symbol] = pd.merge_asof(grid, market, on="minute", direction="backward", tolerance=reference_prices.MAX_STALENESS)["close"].to_numpy()
+        routes = list(reference["routes"])
+        expected = {"LINKETH": closes["LINKETH"], "LINKUSDT*1/ETHUSDT": closes["LINKUSDT"] / closes["ETHUSDT"]}
+        for route, prices in expected.items():
+            if not np.allclose(reference["routePrices"][routes.index(route)], prices, rtol=1e-6, equal_nan=True):
+                raise AssertionError("The prices of route "+route+" differ from pd.merge_asof")
+
+        route_prices = reference["routePrices"].astype(np.float64)
+        with np.errstate(invalid="ignore"):
+            low, high = np.nanmin(route_prices, axis=0), np.nanmax(route_prices, axis=0)
+        priced = ~np.isnan(low)
+        if np.isnan(reference["price"][priced]).any() or not np.isnan(reference["price"][~priced]).all():
+            raise AssertionError("The composite has gaps where a route has a price, or prices where none has")
+        if ((reference["price"][priced] < low[priced] * (1 - 1e-6)) | (reference["price"][priced] > high[priced] * (1 + 1e-6))).any():
+            raise AssertionError("The composite is outside the prices of its routes")
+    finally:
+        shutil.rmtree(dir_path)
+
+    return results
+
+def run_suite(sizes, operators=31, recorded_feed_path=RECORDED_FEED_PATH, repeat=3):
+    """
+    Function to run every benchmark over synthetic feeds of several sizes and a recorded feed
+
+    Args:
+        sizes: The numbers of rounds of the synthetic feeds
+        operators: The number of operators of the synthetic feeds
+        recorded_feed_path: The path of a recorded feed to benchmark, skipped if None or missing
+        repeat: The number of times to time each stage
+
+    Returns:
+        A dict of dataset name to a dict of stage to its fastest duration in seconds
+    """
+    results = {}
+    for rounds in sizes:
+        dataset = "synthetic-"+str(rounds)
+        print("Benchmarking "+dataset)
+        dir_path = tempfile.mkdtemp()
+        try:
+            feed_details, results[dataset] = build_synthetic_feed(rounds, operators, dir_path, repeat)
+            results[dataset].update(bench_analysis(feed_details, repeat))
+        finally:
+            shutil.rmtree(dir_path)
+
+    if recorded_feed_path is not None and os.path.exists("data/"+recorded_feed_path+"/transmissions.csv"):
+        dataset = "recorded-"+recorded_feed_path.split("/")[-1]
+        print("Benchmarking "+dataset)
+        dir_path = tempfile.mkdtemp()
+        try:
+            results[dataset] = bench_analysis(link_recorded_feed(recorded_feed_path, dir_path), repeat)
+        finally:
+            shutil.rmtree(dir_path)
+
+    return results
+
+def get_commit():
+    """
+    Returns:
+        The short hash of the checked out commit, with a + suffix if the tree has uncommitted changes
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip() != ""
+        return commit + ("+" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_results(results, filename=RESULTS_FILENAME):
+    """
+    Function to append a suite run to the results history
+
+    Args:
+        results: The results of run_suite
+        filename: The JSON lines history file
+
+    Returns:
+        The stored run
+    """
+    run = {"commit": get_commit(), "date": datetime.utcnow().isoformat(), "python": sys.version.split()[0], "results": results}
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "a", encoding="utf-8") as outfile:
+        outfile.write(json.dumps(run)+"\n")
+    return run
+
+def read_results(filename=RESULTS_FILENAME):
+    """
+    Function to read the results history
+
+    Args:
+        filename: The JSON lines history file
+
+    Returns:
+        A list of stored runs, oldest first
+    """
+    if not os.path.exists(filename):
+        return []
+    with open(filename, "r") as file:
+        return [json.loads(line) for line in file if line.strip() != ""]
+
+def compare_results(run, previous):
+    """
+    Function to find stages that got slower than in a previous run
+
+    Args:
+        run: The new run
+        previous: The run to compare with
+
+    Returns:
+        A list of (dataset, stage, previous seconds, new seconds) for every regression
+    """
+    regressions = []
+    for dataset, stages in run["results"].items():
+        for stage, seconds in stages.items():
+            before = previous["results"].get(dataset, {}).get(stage)
+            if before is not None and seconds > before * REGRESSION_THRESHOLD and seconds - before > REGRESSION_MIN_SECONDS:
+                regressions.append((dataset, stage, before, seconds))
+    return regressions
+
+def print_results(run, previous=None):
+    for dataset, stages in run["results"].items():
+        print(dataset)
+        for stage, seconds in stages.items():
+            before = None if previous is None else previous["results"].get(dataset, {}).get(stage)
+            change = "" if before is None else f"{seconds / before:8.2f}x vs {previous['commit']}"
+            print(f"    {stage:<35} {seconds:10.4f}s {change}")
+
+if __name__ == "__main__":
+    args = sys.argv
+    # the synthetic contracts are not cached with the metadata of the collected feeds' contracts
+    helper.CONTRACTS_FILENAME = None
+
+    if len(args) > 1 and args[1] == "attribution":
+        # Data path of the feed, as feeds.json does not list every collected feed
+        feed_path = args[2] if len(args) > 2 else RECORDED_FEED_PATH
+        if not os.path.exists("data/"+feed_path+"/transmissions.csv"):
+            print("transmissions.csv is missing for "+feed_path+". Run data-getter.py first")
+            exit()
+        bench_attribution({"path": feed_path})
+        exit()
+
+    if len(args) > 1 and args[1] == "sql":
+        feed_path = args[2] if len(args) > 2 else RECORDED_FEED_PATH
+        if not os.path.exists("data/"+feed_path+"/transmissions.csv"):
+            print("transmissions.csv is missing for "+feed_path+". Run data-getter.py first")
+            exit()
+        dir_path = tempfile.mkdtemp()
+        try:
+            results = bench_analysis(link_recorded_feed(feed_path, dir_path), repeat=1)
+        finally:
+            shutil.rmtree(dir_path)
+        for stage in ["get_totals", "sql register", "sql totals"]:
+            if stage in results:
+                print(f"{stage:<45} {results[stage]:10.4f}s")
+        exit()
+
+    if len(args) > 1 and args[1] == "rpc":
+        # Responses recorded by replay_node.py, or those of a synthetic chain of the given number of rounds
+        if len(args) > 2 and args[2].endswith(".json"):
+            chain = load_fixture(args[2])
+        else:
+            chain = SyntheticChain(rounds=int(args[2]) if len(args) > 2 else 5000, operators=31)
+        bodies = rpc_bodies(chain)
+        for method, method_bodies in bodies.items():
+            print(f"{method:<45} {sum(len(body) for body in method_bodies) / 1000000:9.2f} MB in {len(method_bodies)} responses")
+        print("Parser: "+rpc_decode.parser_name())
+        for stage, seconds in bench_rpc_decoding(bodies).items():
+            print(f"{stage:<45} {seconds:10.4f}s")
+        exit()
+
+    if len(args) > 1 and args[1] == "reference":
+        # Days of synthetic klines of the markets of LINK / ETH
+        for stage, seconds in bench_reference_prices(int(args[2]) if len(args) > 2 else 730).items():
+            print(f"{stage:<45} {seconds:10.4f}s")
+        exit()
+
+    if len(args) > 1 and args[1] == "feeds":
+        bench_feeds([int(count) for count in args[2].split(",")] if len(args) > 2 else [1, 5, 20])
+        exit()
+
+    sizes = [int(size) for size in args[1].split(",")] if len(args) > 1 and args[1] != "--check" else DEFAULT_SIZES
+    history = read_results()
+    run = save_results(run_suite(sizes))
+
+    # compare with the latest run of another commit
+    previous = None
+    for stored in reversed(history):
+        if stored["commit"].rstrip("+") != run["commit"].rstrip("+"):
+            previous = stored
+            break
+    print_results(run, previous)
+
+    regressions = [] if previous is None else compare_results(run, previous)
+    for dataset, stage, before, seconds in regressions:
+        print(f"Regression in {dataset} {stage}: {before:.4f}s -> {seconds:.4f}s")
+    if "--check" in args and len(regressions) > 0:
+        exit(1)
@@ -0,0 +1,275 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from helper import read_nop_details, get_block_billing, get_unique_withdrawal_dates, transmission_repayments_link
+from schema import read_frame
+from attribution import load_price_store, price_at_blocks
+from simulator import expand_grid
+
+BILLING_KEYS = ["maximumGasPrice", "reasonableGasPrice", "microLinkPerEth", "linkGweiPerObservation", "linkGweiPerTransmission"]
+EARNINGS_KEYS = ["estimatedObservationsEarnings", "estimatedTransmissionsEarnings", "estimatedTransmissionsRepayments", "estimatedTotalEarnings"]
+
+def _source_files(feed_path, nop_details):
+    files = ["data/"+feed_path+"/payments.csv", "data/"+feed_path+"/billing_params.json", "data/"+feed_path+"/prices/link-usd.json"]
+    for nop in nop_details:
+        files.append("data/"+feed_path+"/per_op/"+nop_details[nop]["name"]+"/submissions.csv")
+    return files
+
+def _source_stamp(files):
+    return {file: [os.path.getsize(file), os.path.getmtime(file)] for file in files if os.path.exists(file)}
+
+def build_billing_base(feed_details, unique_withdrawal_dates=None, nop_details=None):
+    """
+    Function to pre-aggregate everything the estimated earnings need that does not depend on billing parameters
+
+    Args:
+        feed_details: The details of the feed
+        unique_withdrawal_dates: Array of withdrawal dates. Defaults to the dates every operator was paid
+        nop_details: The details of node operators. Read from nops.json if not given
+
+    Returns:
+        A dict with the withdrawal ranges, per-range per-operator counts and the gas price and gas used of every transmission
+    """
+    feed_path = feed_details["path"]
+    if nop_details is None:
+        nop_details, _ = read_nop_details(feed_path)
+
+    payments = read_frame("data/"+feed_path+"/payments.csv", "payments")
+    payment_dates = pd.to_datetime(payments["txDate"], utc=True)
+    if unique_withdrawal_dates is None:
+        unique_withdrawal_dates = get_unique_withdrawal_dates(payments)
+    withdrawal_dates = pd.to_datetime(pd.Series(unique_withdrawal_dates), utc=True)
+
+    with open("data/"+feed_path+"/billing_params.json", "r") as file:
+        billing_params = json.load(file)
+    link_prices = load_price_store(feed_path, "link-usd")
+
+    # same ranges and withdrawal blocks as get_totals
+    ranges = []
+    for index, withdrawal_date in enumerate(withdrawal_dates):
+        withdrawal_block = int(payments[payment_dates == withdrawal_date].iloc[0]["blockNumber"])
+        ranges.append({
+            "from": str(withdrawal_dates[index-1]) if index > 0 else None,
+            "to": str(withdrawal_date),
+            "blockNumber": withdrawal_block,
+            "linkPrice": float(price_at_blocks(link_prices, [withdrawal_block])[0]),
+            "billing": {key: get_block_billing(withdrawal_block, billing_params)[key] for key in BILLING_KEYS}
+        })
+    edges = withdrawal_dates.to_numpy()
+
+    names = []
+    observations = []
+    transmissions = []
+    tx_ranges = []
+    tx_operators = []
+    tx_gas_prices = []
+    tx_gas_costs = []
+    for nop in nop_details:
+        submissions_filename = "data/"+feed_path+"/per_op/"+nop_details[nop]["name"]+"/submissions.csv"
+        if not os.path.exists(submissions_filename):
+            continue
+        operator = len(names)
+        names.append(nop_details[nop]["name"])
+        submissions = read_frame(submissions_filename, "transmissions", usecols=["txDate", "submitter", "fee", "gasPriceGwei"])
+
+        # range index of each submission, -1 if after the last withdrawal
+        range_index = np.searchsorted(edges, pd.to_datetime(submissions["txDate"], utc=True).to_numpy(), side="right")
+        range_index[range_index == len(edges)] = -1
+        in_range = range_index >= 0
+        observations.append(np.bincount(range_index[in_range], minlength=len(ranges)))
+
+        transmitted = in_range & (submissions["submitter"].str.lower() == nop).to_numpy()
+        transmissions.append(np.bincount(range_index[transmitted], minlength=len(ranges)))
+        gas_prices = submissions["gasPriceGwei"].to_numpy(dtype=np.float64)[transmitted]
+        tx_gas_prices.append(gas_prices)
+        tx_gas_costs.append(submissions["fee"].to_numpy(dtype=np.float64)[transmitted] / (gas_prices/1000000000))
+        tx_ranges.append(range_index[transmitted])
+        tx_operators.append(np.full(len(gas_prices), operator))
+
+    return {
+        "ranges": ranges,
+        "names": names,
+        "observations": np.stack(observations, axis=1) if len(names) > 0 else np.zeros((len(ranges), 0), dtype=np.int64),
+        "transmissions": np.stack(transmissions, axis=1) if len(names) > 0 else np.zeros((len(ranges), 0), dtype=np.int64),
+        "txGroup": (np.concatenate(tx_ranges) * len(names) + np.concatenate(tx_operators)).astype(np.int64) if len(names) > 0 else np.zeros(0, dtype=np.int64),
+        "txGasPriceGwei": np.concatenate(tx_gas_prices) if len(names) > 0 else np.zeros(0),
+        "txGasCost": np.concatenate(tx_gas_costs) if len(names) > 0 else np.zeros(0)
+    }
+
+def get_billing_base(feed_details, unique_withdrawal_dates=None, nop_details=None):
+    """
+    Function to get the billing base of a feed from its cache, rebuilding it if the data it was built from changed
+
+    Args:
+        feed_details: The details of the feed
+        unique_withdrawal_dates: Array of withdrawal dates. Defaults to the dates every operator was paid
+        nop_details: The details of node operators. Read from nops.json if not given
+
+    Returns:
+        The billing base, see build_billing_base
+    """
+    feed_path = feed_details["path"]
+    if nop_details is None:
+        nop_details, _ = read_nop_details(feed_path)
+
+    meta_filename = "data/"+feed_path+"/billing_base.json"
+    arrays_filename = "data/"+feed_path+"/billing_base.npz"
+    stamp = _source_stamp(_source_files(feed_path, nop_details))
+    dates_key = None if unique_withdrawal_dates is None else [str(date) for date in unique_withdrawal_dates]
+
+    if os.path.exists(meta_filename) and os.path.exists(arrays_filename):
+        with open(meta_filename, "r") as file:
+            meta = json.load(file)
+        if meta["sources"] == stamp and meta["withdrawalDates"] == dates_key:
+            arrays = np.load(arrays_filename)
+            base = {key: arrays[key] for key in arrays.files}
+            base["ranges"] = meta["ranges"]
+            base["names"] = meta["names"]
+            return base
+
+    base = build_billing_base(feed_details, unique_withdrawal_dates, nop_details)
+    np.savez(arrays_filename, **{key: value for key, value in base.items() if isinstance(value, np.ndarray)})
+    with open(meta_filename, "w", encoding="utf-8") as outfile:
+        json.dump({"sources": stamp, "withdrawalDates": dates_key, "ranges": base["ranges"], "names": base["names"]}, outfile, ensure_ascii=False, indent=4)
+
+    return base
+
+def estimate_earnings_for_billing(base, overrides):
+    """
+    Function to recompute only the billing-dependent terms of the estimated earnings
+
+    Args:
+        base: The billing base of the feed
+        overrides: A dict of billing parameters replacing the ones in force at each withdrawal
+
+    Returns:
+        A dict of ranges x operators arrays with the estimated earnings in USD
+    """
+    billing = {key: np.array([overrides.get(key, billing_range["billing"][key]) for billing_range in base["ranges"]], dtype=np.float64) for key in BILLING_KEYS}
+    link_price = np.array([billing_range["linkPrice"] for billing_range in base["ranges"]], dtype=np.float64)
+    ranges_count, operators_count = base["observations"].shape
+
+    tx_range = base["txGroup"] // max(operators_count, 1)
+    repayments_link = transmission_repayments_link(base["txGasPriceGwei"], base["txGasCost"], {key: billing[key][tx_range] for key in BILLING_KEYS})
+    repayments_link = np.bincount(base["txGroup"], weights=repayments_link, minlength=ranges_count * operators_count).reshape(ranges_count, operators_count)
+
+    observations_earnings = base["observations"] * (billing["linkGweiPerObservation"] / 1000000000.0 * link_price)[:, None]
+    transmissions_earnings = base["transmissions"] * (billing["linkGweiPerTransmission"] / 1000000000.0 * link_price)[:, None]
+    repayments_usd = repayments_link * link_price[:, None]
+
+    return {
+        "estimatedObservationsEarnings": observations_earnings,
+        "estimatedTransmissionsEarnings": transmissions_earnings,
+        "estimatedTransmissionsRepayments": repayments_usd,
+        "estimatedTotalEarnings": observations_earnings + transmissions_earnings + repayments_usd
+    }
+
+# Set in each worker by the pool initializer, so the base is sent once per process
+_worker_state = {}
+
+def _init_sweep_worker(base):
+    _worker_state["base"] = base
+
+def _run_sweep_point(overrides):
+    return estimate_earnings_for_billing(_worker_state["base"], overrides)
+
+def billing_sweep_filename(feed_path):
+    return "data/"+feed_path+"/billing_sweep.npz"
+
+def run_billing_sweep(feed_details, param_grid, unique_withdrawal_dates=None, processes=None):
+    """
+    Function to estimate operator earnings for every combination of billing parameter overrides
+
+    Args:
+        feed_details: The details of the feed
+        param_grid: A dict of billing parameter name to a list of values, e.g. {"maximumGasPrice": [1500, 3000]}
+        unique_withdrawal_dates: Array of withdrawal dates. Defaults to the dates every operator was paid
+        processes: The number of worker processes. Defaults to the number of cores. 1 runs in this process
+
+    Returns:
+        A dict with the names, the swept parameters, an array per parameter with its value in each combination, the
+        from and to dates and withdrawal block of each range, the ranges x operators counts and a combinations x ranges
+        x operators array for each of EARNINGS_KEYS. Also saved to the feed's billing_sweep.npz
+    """
+    unknown = [key for key in param_grid if key not in BILLING_KEYS]
+    if len(unknown) > 0:
+        raise ValueError("Unknown billing parameters: "+", ".join(unknown))
+
+    base = get_billing_base(feed_details, unique_withdrawal_dates)
+    combinations = expand_grid(param_grid)
+    processes = processes or os.cpu_count()
+
+    if processes == 1:
+        _init_sweep_worker(base)
+        results = [_run_sweep_point(overrides) for overrides in combinations]
+    else:
+        chunksize = max(1, len(combinations) // (processes * 4))
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_sweep_worker, initargs=(base,)) as executor:
+            results = list(executor.map(_run_sweep_point, combinations, chunksize=chunksize))
+
+    ranges_count, operators_count = base["observations"].shape
+    sweep = {
+        "names": np.array(base["names"], dtype=str),
+        "parameters": np.array(list(param_grid), dtype=str),
+        "from": np.array([billing_range["from"] or "" for billing_range in base["ranges"]], dtype=str),
+        "to": np.array([billing_range["to"] for billing_range in base["ranges"]], dtype=str),
+        "withdrawalBlock": np.array([billing_range["blockNumber"] for billing_range in base["ranges"]], dtype=np.int64),
+        "observationsCounts": base["observations"],
+        "transmissionsCounts": base["transmissions"]
+    }
+    for key in param_grid:
+        sweep[key] = np.array([overrides[key] for overrides in combinations], dtype=np.float64)
+    for key in EARNINGS_KEYS:
+        sweep[key] = np.stack([result[key] for result in results]) if len(results) > 0 else np.zeros((0, ranges_count, operators_count))
+
+    os.makedirs("data/"+feed_details["path"], exist_ok=True)
+    np.savez(billing_sweep_filename(feed_details["path"]), **sweep)
+
+    return sweep
+
+def sweep_frame(sweep):
+    """
+    Function to list a billing sweep as rows
+
+    Args:
+        sweep: The result of run_billing_sweep, or the arrays of a billing_sweep.npz
+
+    Returns:
+        A DataFrame with one row per parameter set, withdrawal range and operator
+    """
+    combinations_count, ranges_count, operators_count = sweep[EARNINGS_KEYS[0]].shape
+    cells = ranges_count * operators_count
+    combination = np.repeat(np.arange(combinations_count), cells)
+    range_index = np.tile(np.repeat(np.arange(ranges_count), operators_count), combinations_count)
+    sweep_df = pd.DataFrame({
+        "combination": combination,
+        "rangeIndex": range_index,
+        "oracleName": np.tile(np.asarray(sweep["names"], dtype=object), ranges_count * combinations_count),
+        "observationsCounts": np.tile(sweep["observationsCounts"].reshape(-1), combinations_count),
+        "transmissionsCounts": np.tile(sweep["transmissionsCounts"].reshape(-1), combinations_count)
+    })
+    for key in EARNINGS_KEYS:
+        sweep_df[key] = sweep[key].reshape(-1)
+    for key in sweep["parameters"]:
+        sweep_df[key] = sweep[key][combination]
+    for key in ["from", "to", "withdrawalBlock"]:
+        sweep_df[key] = sweep[key][range_index]
+    return sweep_df
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv
+
+    if len(args) < 3:
+        print("Please pass in the data path of a feed and a JSON grid of billing parameters like: python billing_sweep.py ethereum/mainnet/crypto-usd/link-usd '{\"maximumGasPrice\": [1500, 3000], \"reasonableGasPrice\": [30, 60]}' [processes]")
+        print("Billing parameters: "+", ".join(BILLING_KEYS))
+        exit()
+
+    sweep = run_billing_sweep({"path": args[1]}, json.loads(args[2]), processes=int(args[3]) if len(args) > 3 else None)
+    print("Saved "+billing_sweep_filename(args[1])+" with "+str(len(sweep["estimatedTotalEarnings"]))+" parameter sets over "+str(len(sweep["to"]))+" ranges")
+    summary_df = pd.DataFrame({key: sweep[key] for key in sweep["parameters"]})
+    summary_df["estimatedTotalEarnings"] = sweep["estimatedTotalEarnings"].sum(axis=(1, 2))
+    print("Estimated earnings of every operator and range in USD:")
+    print(summary_df.head(50).to_string())
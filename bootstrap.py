@@ -0,0 +1,251 @@
+import pandas as pd
+import numpy as np
+import tempfile
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+from helper import read_nop_details, get_unique_withdrawal_dates, transmission_repayments_link
+from schema import read_frame, date_text
+from attribution import FeedAttribution
+from billing_sweep import get_billing_base
+
+METRICS = ["diffFromCalc", "diffFromCalcPerTransmission", "diffFromCalcPerObs"]
+REPLICATES = 10000
+CONFIDENCE = 0.95
+# The most rounds a task draws at once, over all its replicates. Bounds the memory of the draws and of their counts
+SAMPLE_CELLS = 4000000
+
+def round_earnings(feed_details, transmitters, nop_details, unique_withdrawal_dates):
+    """
+    Function to get the estimated earnings of every operator in every round, the terms calculate_estimated_earnings
+    sums over a withdrawal range
+
+    Args:
+        feed_details: The details of the feed
+        transmitters: An array of transmitters
+        nop_details: The details of node operators
+        unique_withdrawal_dates: Array of withdrawal dates
+
+    Returns:
+        A dict with the names of the operators, the billing ranges of get_billing_base, the [first row, row after the
+        last] of each range, and a rounds x (3 x operators) matrix with the estimated earnings in USD, then whether the
+        operator observed the round and then whether it transmitted it
+    """
+    feed_path = feed_details["path"]
+    base = get_billing_base(feed_details, unique_withdrawal_dates, nop_details)
+    names = list(dict.fromkeys(nop_details[transmitter.lower()]["name"] for transmitter in transmitters))
+    # when operators share a name, the estimate of the last one in nops.json is kept, as in calculate_estimated_earnings
+    name_nops = {nop_details[nop]["name"]: nop for nop in nop_details}
+
+    transmissions = read_frame("data/"+feed_path+"/transmissions.csv", "transmissions", usecols=["txDate", "txHash"])
+    edges = pd.to_datetime(pd.Series(unique_withdrawal_dates), utc=True).to_numpy()
+    # range index of each round, as in build_billing_base. Rounds after the last withdrawal are left out
+    range_index = np.searchsorted(edges, pd.to_datetime(transmissions["txDate"], utc=True).to_numpy(), side="right")
+    order = np.flatnonzero(range_index < len(edges))
+    order = order[np.argsort(range_index[order], kind="stable")]
+    ends = np.searchsorted(range_index[order], np.arange(len(edges)), side="right")
+    bounds = np.column_stack([np.concatenate([[0], ends[:-1]]), ends]).astype(np.int64)
+    rows = np.full(len(transmissions), -1, dtype=np.int64)
+    rows[order] = np.arange(len(order))
+    round_rows = pd.Index(transmissions["txHash"].astype(str).str.lower())
+
+    link_prices = np.array([billing_range["linkPrice"] for billing_range in base["ranges"]], dtype=np.float64)
+    billing = {key: np.array([billing_range["billing"][key] for billing_range in base["ranges"]], dtype=np.float64) for key in ["maximumGasPrice", "reasonableGasPrice", "microLinkPerEth", "linkGweiPerObservation", "linkGweiPerTransmission"]}
+    round_ranges = range_index[order]
+
+    values = np.zeros((len(order), 3 * len(names)))
+    with metrics.stage("bootstrap.rounds"):
+        for operator, name in enumerate(names):
+            submissions_filename = "data/"+feed_path+"/per_op/"+name+"/submissions.csv"
+            if not os.path.exists(submissions_filename):
+                continue
+            submissions = read_frame(submissions_filename, "transmissions", usecols=["txHash", "submitter", "fee", "gasPriceGwei"])
+            positions = round_rows.get_indexer(submissions["txHash"].astype(str).str.lower())
+            submission_rows = np.where(positions >= 0, rows[positions], -1)
+            in_range = submission_rows >= 0
+            observed = submission_rows[in_range]
+            transmitted = in_range & (submissions["submitter"] == name_nops[name]).to_numpy()
+
+            gas_prices = submissions["gasPriceGwei"].to_numpy(dtype=np.float64)[transmitted]
+            gas_costs = submissions["fee"].to_numpy(dtype=np.float64)[transmitted] / (gas_prices/1000000000)
+            transmitted = submission_rows[transmitted]
+            tx_ranges = round_ranges[transmitted]
+            repayments_link = transmission_repayments_link(gas_prices, gas_costs, {key: billing[key][tx_ranges] for key in billing})
+
+            values[observed, len(names) + operator] = 1.0
+            values[transmitted, 2 * len(names) + operator] = 1.0
+            values[observed, operator] = (billing["linkGweiPerObservation"] / 1000000000.0 * link_prices)[round_ranges[observed]]
+            values[transmitted, operator] += (billing["linkGweiPerTransmission"] / 1000000000.0 * link_prices)[tx_ranges] + repayments_link * link_prices[tx_ranges]
+        metrics.record_rows("bootstrap.rounds", len(order))
+
+    return {"names": names, "ranges": base["ranges"], "bounds": bounds, "values": values}
+
+def range_payments(payments, unique_withdrawal_dates, names):
+    """
+    Function to sum the USD paid to each operator in each withdrawal range, as get_range_total does
+
+    Args:
+        payments: DataFrame of payments with their usdAmount
+        unique_withdrawal_dates: Array of withdrawal dates
+        names: The names of the operators
+
+    Returns:
+        A ranges x operators array of payments
+    """
+    paid = np.zeros((len(unique_withdrawal_dates), len(names)))
+    for index, withdrawal_date in enumerate(unique_withdrawal_dates):
+        in_range = payments["txDate"] <= withdrawal_date
+        if index > 0:
+            in_range &= payments["txDate"] > unique_withdrawal_dates[index-1]
+        totals = payments[in_range].groupby("oracleName", observed=True)["usdAmount"].sum()
+        paid[index] = totals.reindex(names, fill_value=0).to_numpy(dtype=np.float64)
+    return paid
+
+def replicate_sums(values, replicates, seed):
+    """
+    Function to resample the rounds of a range with replacement and sum the columns of every resample
+
+    Args:
+        values: The rounds x columns matrix of the range
+        replicates: The number of resamples
+        seed: The seed or SeedSequence of the draws
+
+    Returns:
+        A replicates x columns array of sums
+    """
+    rng = np.random.default_rng(seed)
+    rounds = len(values)
+    sums = np.zeros((replicates, values.shape[1]))
+    if rounds == 0:
+        return sums
+    values = np.asarray(values)
+    block = max(1, SAMPLE_CELLS // rounds)
+    for start in range(0, replicates, block):
+        count = min(block, replicates - start)
+        draws = rng.integers(0, rounds, (count, rounds))
+        # times each round was drawn in each replicate, so a replicate's sums are a row of one matrix product
+        offsets = np.arange(count, dtype=np.int64)[:, None] * rounds
+        weights = np.bincount((draws + offsets).reshape(-1), minlength=count * rounds).reshape(count, rounds)
+        sums[start:start+count] = weights.astype(np.float64) @ values
+    return sums
+
+def bootstrap_tasks(bounds, replicates, seed):
+    """
+    Function to split the replicates of every range into tasks of at most SAMPLE_CELLS draws. The split and the seed
+    of each task only depend on the ranges, so the intervals are the same with any number of processes
+
+    Args:
+        bounds: The [first row, row after the last] of each range
+        replicates: The number of replicates per range
+        seed: The seed of the whole run
+
+    Returns:
+        A list of (range index, first row, row after the last, replicates, SeedSequence)
+    """
+    tasks = []
+    for index, (range_seed, (start, end)) in enumerate(zip(np.random.SeedSequence(seed).spawn(len(bounds)), bounds)):
+        block = max(1, SAMPLE_CELLS // max(int(end - start), 1))
+        counts = [min(block, replicates - first) for first in range(0, replicates, block)]
+        tasks += [(index, int(start), int(end), count, task_seed) for count, task_seed in zip(counts, range_seed.spawn(len(counts)))]
+    return tasks
+
+_worker_state = {}
+
+def _init_bootstrap_worker(shared_dir):
+    # the rounds are mapped from disk, so only their path is pickled
+    _worker_state["values"] = np.load(shared_dir+"/values.npy", mmap_mode="r")
+
+def _run_bootstrap_task(args):
+    _, start, end, count, seed = args
+    return replicate_sums(_worker_state["values"][start:end], count, seed)
+
+def bootstrap_totals(unique_withdrawal_dates, payments, transmitters, nop_details, feed_details, replicates=REPLICATES, confidence=CONFIDENCE, processes=None, seed=0):
+    """
+    Function to get bootstrap confidence intervals of diffFromCalc, diffFromCalcPerTransmission and diffFromCalcPerObs.
+    The rounds of each withdrawal range are resampled with replacement and the estimated earnings, observations and
+    transmissions of each operator summed again, while the payments stay the ones made
+
+    Args:
+        unique_withdrawal_dates: Array of withdrawal dates
+        payments: DataFrame of payments with their usdAmount, as for get_totals
+        transmitters: An array of transmitters
+        nop_details: The details of node operators
+        feed_details: The details of the feed
+        replicates: The number of resamples of each range
+        confidence: The confidence of the intervals
+        processes: The number of worker processes. None uses the number of cores. 1 runs in this process
+        seed: The seed of the draws
+
+    Returns:
+        A dict with the ranges as in totals.json and for each range, metric and operator the value of get_totals and
+        the bounds of its percentile interval
+    """
+    processes = processes or os.cpu_count()
+    earnings = round_earnings(feed_details, transmitters, nop_details, unique_withdrawal_dates)
+    names, bounds, values = earnings["names"], earnings["bounds"], earnings["values"]
+    paid = range_payments(payments, unique_withdrawal_dates, names)
+    tasks = bootstrap_tasks(bounds, replicates, seed)
+
+    with metrics.stage("bootstrap.replicates"):
+        if processes == 1 or len(tasks) < 2:
+            results = [replicate_sums(values[start:end], count, task_seed) for _, start, end, count, task_seed in tasks]
+        else:
+            with tempfile.TemporaryDirectory() as shared_dir:
+                np.save(shared_dir+"/values.npy", values)
+                with ProcessPoolExecutor(max_workers=processes, initializer=_init_bootstrap_worker, initargs=(shared_dir,)) as executor:
+                    results = list(executor.map(_run_bootstrap_task, tasks))
+        metrics.record_rows("bootstrap.replicates", replicates * len(bounds))
+
+    quantiles = [100 * (1 - confidence) / 2, 100 * (1 + confidence) / 2]
+    intervals = {"confidence": confidence, "replicates": replicates, "ranges": [], "intervals": []}
+    operators = len(names)
+    for index, withdrawal_date in enumerate(unique_withdrawal_dates):
+        start, end = bounds[index]
+        first_payment = payments["txDate"][payments["txDate"] <= withdrawal_date].iloc[0] if index == 0 else unique_withdrawal_dates[index-1]
+        intervals["ranges"].append({"from": date_text(first_payment), "to": date_text(withdrawal_date)})
+
+        sums = np.concatenate([values[start:end].sum(axis=0)[None, :]] + [result for task, result in zip(tasks, results) if task[0] == index])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            diffs = sums[:, :operators] - paid[index]
+            range_metrics = {
+                "diffFromCalc": diffs,
+                "diffFromCalcPerTransmission": diffs / sums[:, 2*operators:],
+                "diffFromCalcPerObs": diffs / sums[:, operators:2*operators]
+            }
+        # the first row is the range itself, the rest are the replicates
+        range_intervals = {}
+        for metric in METRICS:
+            # replicates without transmissions or observations have no value per transmission or observation
+            resampled = np.where(np.isfinite(range_metrics[metric][1:]), range_metrics[metric][1:], np.nan)
+            valid = ~np.isnan(resampled).all(axis=0)
+            low, high = np.full((2, operators), np.nan)
+            low[valid], high[valid] = np.nanpercentile(resampled[:, valid], quantiles, axis=0)
+            range_intervals[metric] = dict(sorted(((name, {"value": float(range_metrics[metric][0, operator]), "low": float(low[operator]), "high": float(high[operator])}) for operator, name in enumerate(names)), key=lambda item: item[1]["value"], reverse=True))
+        intervals["intervals"].append(range_intervals)
+
+    dir_path = "data/"+feed_details["path"]
+    os.makedirs(dir_path, exist_ok=True)
+    with open(dir_path+"/bootstrap.json", "w", encoding="utf-8") as outfile:
+        json.dump(intervals, outfile, ensure_ascii=False, indent=4)
+
+    return intervals
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv
+
+    if len(args) < 2:
+        print("Please pass in the data path of a feed like: python bootstrap.py ethereum/mainnet/crypto-usd/link-usd [replicates] [processes]")
+        exit()
+
+    feed_details = {"path": args[1]}
+    nop_details, transmitters = read_nop_details(args[1])
+    payments = FeedAttribution(feed_details, nop_details=nop_details, transmitters=transmitters).payments_frame(["usdAmount"])
+    unique_withdrawal_dates = get_unique_withdrawal_dates(payments)
+    intervals = bootstrap_totals(unique_withdrawal_dates, payments, transmitters, nop_details, feed_details, int(args[2]) if len(args) > 2 else REPLICATES, processes=int(args[3]) if len(args) > 3 else None)
+    print("Saved data/"+args[1]+"/bootstrap.json with "+str(len(intervals["ranges"]))+" ranges")
+    if len(intervals["ranges"]) > 0:
+        print("diffFromCalc from "+intervals["ranges"][-1]["from"]+" to "+intervals["ranges"][-1]["to"]+" with "+str(int(intervals["confidence"]*100))+"% intervals:")
+        for name, interval in intervals["intervals"][-1]["diffFromCalc"].items():
+            print(f"    {name:<30} {interval['value']:>12.2f}  [{interval['low']:.2f}, {interval['high']:.2f}]")
@@ -0,0 +1,639 @@
+import subprocess
+import json
+import time
+import sys
+import os
+from functools import lru_cache
+import metrics
+
+# Only the standard library and metrics are imported here. pandas, web3 and the helpers are imported by the commands
+# that need them, so a run over collected data does not import web3 or connect to a node
+
+USAGE = {
+    "data": "python cli.py data ethereum eth-usd 2023-01-01 [lean|scan]",
+    "prices": "python cli.py prices ethereum eth-usd 2023-01-01",
+    "feeds": "python cli.py feeds ethereum eth-usd,link-usd 2023-01-01",
+    "gas": "python cli.py gas ethereum eth-usd",
+    "binance": "python cli.py binance ETHUSD 2021-01-01 2023-01-01",
+    "reference": "python cli.py reference ethereum link-eth 2021-01-01 2023-01-01 [stored]",
+    "monitor": "python cli.py monitor ethereum eth-usd [snapshots.jsonl]",
+    "monitor replay": "python cli.py monitor replay ethereum/mainnet/crypto-usd/link-usd data/ethereum/mainnet/crypto-usd/link-usd/transmissions.csv 3600 [snapshots.jsonl]"
+}
+
+@lru_cache(maxsize=None)
+def read_json(filename):
+    with open(filename, "r") as file:
+        return json.load(file)
+
+def read_feed_details(network, feed):
+    """
+    Function to get the details of a feed from data/feeds.json
+
+    Args:
+        network: The network of the feed like ethereum
+        feed: The feed like eth-usd
+
+    Returns:
+        The details of the feed, or None if it is not in the list of Chainlink feeds
+    """
+    feed_path = network+"/mainnet/"+feed
+    feeds = read_json("data/feeds.json")
+    if feed_path not in feeds:
+        print(network+"/"+feed+" Does not exist in list of Chainlink feeds")
+        return None
+    return feeds[feed_path]
+
+@lru_cache(maxsize=None)
+def read_contract_events(abi_filename):
+    """
+    Function to get the events of an ABI with their signatures and parameters
+
+    Args:
+        abi_filename: The JSON file of the ABI
+
+    Returns:
+        The events, the signatures and the parameters of the events
+    """
+    from helper import calculate_event_sigs, get_event_params
+
+    events = [item for item in read_json(abi_filename) if item["type"] == "event"]
+    return events, calculate_event_sigs(events), get_event_params(events)
+
+class FeedSession:
+    """
+    Connections and contracts of a feed, created the first time a command needs them
+    """
+
+    def __init__(self, network, feed_details, abi_filename=None):
+        """
+        Args:
+            network: The network of the feed like ethereum
+            feed_details: The details of the feed from data/feeds.json
+            abi_filename: The ABI of the aggregator. Defaults to the network's aggregator ABI
+        """
+        self.network = network
+        self.feed_details = feed_details
+        self.abi_filename = abi_filename or ("abi/aggregator_abi.json" if network == "ethereum" else "abi/polygon_aggregator_abi.json")
+        self._router = None
+        self._w3 = None
+        self._contract = None
+        self._start_blocks = {}
+
+    @property
+    def provider(self):
+        """
+        The ProviderRouter of the network, sending historical state calls to the archive nodes and the rest to the full
+        nodes of config.json. Passed to the helpers in place of a provider URL
+        """
+        if self._router is None:
+            from router import ProviderRouter
+
+            self._router = ProviderRouter.from_config(read_json("config.json"), self.network)
+        return self._router
+
+    @property
+    def w3(self):
+        if self._w3 is None:
+            from web3.middleware import geth_poa_middleware
+
+            self._w3 = self.provider.web3()
+            if self.network != "ethereum":
+                self._w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+            metrics.instrument_web3(self._w3)
+        return self._w3
+
+    @property
+    def contract_abi(self):
+        return read_json(self.abi_filename)
+
+    @property
+    def contract(self):
+        if self._contract is None:
+            from helper import create_contract
+
+            self._contract, _ = create_contract(self.w3, self.feed_details["address"], self.contract_abi)
+        return self._contract
+
+    @property
+    def events(self):
+        return read_contract_events(self.abi_filename)[0]
+
+    @property
+    def event_sigs(self):
+        return read_contract_events(self.abi_filename)[1]
+
+    @property
+    def event_params(self):
+        return read_contract_events(self.abi_filename)[2]
+
+    def start_block(self, start_date):
+        """
+        Function to get the first block of a date, querying the node once per date
+
+        Args:
+            start_date: A date like 2023-01-01
+
+        Returns:
+            The block number at the date
+        """
+        if start_date not in self._start_blocks:
+            from helper import get_block_by_date
+
+            print("Getting start block...")
+            self._start_blocks[start_date] = get_block_by_date(self.w3, start_date)
+        return self._start_blocks[start_date]
+
+    def collector_args(self, start_date, nop_details, transmitters):
+        """
+        Function to get the arguments shared by the helpers that collect a feed's events
+
+        Args:
+            start_date: The date from which to collect
+            nop_details: The details of the node operators
+            transmitters: An array of operators
+
+        Returns:
+            A tuple with the arguments of get_transmissions, get_payments, collect_feed and the like
+        """
+        return (self.w3, self.provider, self.feed_details["address"], self.start_block(start_date), self.event_sigs, self.event_params, self.feed_details["path"], nop_details, transmitters, self.events, self.contract)
+
+def update_operators(session, feeds):
+    """
+    Function to bring the ConfigSet and PayeeshipTransferred index of feeds up to the latest block and write their
+    nops.json from it
+
+    Args:
+        session: The FeedSession of one of the feeds, for the network's node and the aggregator's events
+        feeds: The details of the feeds from data/feeds.json
+
+    Returns:
+        A dict with the ConfigIndex of each feed by feed path
+    """
+    from config_index import update_config_indexes, write_nops
+
+    print("Updating operators...")
+    indexes = update_config_indexes(session.provider, feeds, session.event_sigs, session.event_params, session.w3.eth.block_number)
+    for index in indexes.values():
+        write_nops(index)
+    return indexes
+
+def run_data(args):
+    """
+    Function to get the submissions and withdrawals of a feed and split them per operator
+
+    Args:
+        args: The network, the feed, the start date and optionally lean or scan
+    """
+    if len(args) < 2:
+        print("Please pass in a feed like: python cli.py data ethereum eth-usd")
+        return 1
+    if len(args) < 3:
+        print("Please pass in a date like: "+USAGE["data"])
+        return 1
+
+    network = args[0].lower()
+    feed = args[1].lower()
+    start_date = args[2]
+    # "lean" collects transmissions from logs and block receipts instead of a receipt per transmission
+    # "scan" also collects every event of the feed from a single scan of its logs
+    mode = args[3].lower() if len(args) > 3 else None
+    lean = mode in ["lean", "scan"]
+
+    feed_details = read_feed_details(network, feed)
+    if feed_details is None:
+        return 1
+
+    from helper import read_nop_details, save_per_op_data
+    from schema import read_frame
+    from rollups import update_rollups, missing_rollup_sources
+
+    session = FeedSession(network, feed_details)
+    payments_filename = "data/"+feed_details["path"]+"/payments.csv"
+    transmissions_filename = "data/"+feed_details["path"]+"/transmissions.csv"
+    billing_params_filename = "data/"+feed_details["path"]+"/billing_params.json"
+    collected = all(os.path.exists(filename) for filename in [payments_filename, transmissions_filename, billing_params_filename])
+
+    # operators are only looked up on chain when something is collected, a collected feed is split without a node
+    config_index = None
+    if not collected or not os.path.exists("data/"+feed_details["path"]+"/nops.json"):
+        config_index = update_operators(session, [feed_details])[feed_details["path"]]
+    nop_details, transmitters = read_nop_details(feed_details["path"])
+
+    if mode == "scan" and not collected:
+        from ingestion import collect_feed
+
+        print("Scanning logs...")
+        collect_feed(*session.collector_args(start_date, nop_details, transmitters), config_index=config_index)
+        config_index.save()
+
+    print("Getting payments...")
+    if os.path.exists(payments_filename):
+        payments = read_frame(payments_filename, "payments")
+    else:
+        from helper import get_payments
+
+        payments = get_payments(*session.collector_args(start_date, nop_details, transmitters), config_index=config_index)
+
+    print("Getting transmissions...")
+    if os.path.exists(transmissions_filename):
+        transmissions = read_frame(transmissions_filename, "transmissions")
+    elif lean:
+        from helper import get_transmissions_lean
+
+        transmissions = get_transmissions_lean(*session.collector_args(start_date, nop_details, transmitters), transmitter_sets=config_index.transmitter_sets())
+    else:
+        from helper import get_transmissions
+
+        transmissions = get_transmissions(*session.collector_args(start_date, nop_details, transmitters))
+
+    print("Getting billing params...")
+    if not os.path.exists(billing_params_filename):
+        from helper import get_billing_params
+
+        get_billing_params(session.w3, session.provider, feed_details["address"], session.event_sigs, session.event_params, feed_details["path"], session.events, session.contract)
+
+    # split submissions and withdrawals per operator
+    save_per_op_data(transmissions, payments, transmitters, nop_details, feed_details["path"])
+
+    # keep the feed's rollups up to date once its prices are collected
+    if len(missing_rollup_sources(feed_details["path"])) == 0:
+        print("Updating rollups...")
+        update_rollups(feed_details["path"])
+    return 0
+
+def run_prices(args):
+    """
+    Function to get the answers of a feed
+
+    Args:
+        args: The network, the feed and the start date
+    """
+    if len(args) < 2:
+        print("Please pass in a feed like: python cli.py prices ethereum eth-usd")
+        return 1
+    if len(args) < 3:
+        print("Please pass in a date like: "+USAGE["prices"])
+        return 1
+
+    network = args[0].lower()
+    feed_details = read_feed_details(network, args[1].lower())
+    if feed_details is None:
+        return 1
+    print("feed", feed_details)
+
+    print("Getting transmissions...")
+    answers_filename = "data/"+feed_details["path"]+"/answers.csv"
+    if os.path.exists(answers_filename):
+        print("Already collected "+answers_filename)
+        return 0
+
+    from helper import get_new_answers, read_nop_details
+
+    # answers are decoded with the ethereum aggregator's ABI on every network
+    session = FeedSession(network, feed_details, "abi/aggregator_abi.json")
+    if not os.path.exists("data/"+feed_details["path"]+"/nops.json"):
+        update_operators(session, [feed_details])
+    nop_details, transmitters = read_nop_details(feed_details["path"])
+    start_block = session.start_block(args[2])
+    print("start block "+str(start_block))
+    print("Querying transmissions...")
+    get_new_answers(*session.collector_args(args[2], nop_details, transmitters))
+    return 0
+
+def run_feeds(args):
+    """
+    Function to get the submissions and withdrawals of several feeds from a single scan of their logs
+
+    Args:
+        args: The network, the feeds separated by commas or all, and the start date
+    """
+    if len(args) < 3:
+        print("Please pass in a network, feeds and a date like: "+USAGE["feeds"])
+        return 1
+
+    network = args[0].lower()
+    start_date = args[2]
+    feeds = read_json("data/feeds.json")
+
+    # "all" collects every feed of the network in feeds.json
+    if args[1].lower() == "all":
+        feed_paths = [feed_path for feed_path in feeds if feed_path.startswith(network+"/")]
+    else:
+        feed_paths = [network+"/mainnet/"+feed for feed in args[1].lower().split(",")]
+
+    for feed_path in feed_paths:
+        if feed_path not in feeds:
+            print(feed_path+" Does not exist in list of Chainlink feeds")
+            return 1
+
+    selected_feeds = []
+    for feed_path in feed_paths:
+        feed_details = feeds[feed_path]
+        if os.path.exists("data/"+feed_details["path"]+"/transmissions.csv"):
+            print("Already collected "+feed_path)
+            continue
+        selected_feeds.append(feed_details)
+
+    if len(selected_feeds) == 0:
+        print("No feeds to collect")
+        return 0
+
+    from helper import read_nop_details, save_per_op_data
+    from ingestion import collect_feeds
+    from rollups import update_rollups, missing_rollup_sources
+
+    session = FeedSession(network, selected_feeds[0])
+    config_indexes = update_operators(session, selected_feeds)
+    start_block = session.start_block(start_date)
+    print("Scanning logs of "+str(len(selected_feeds))+" feeds...")
+    results = collect_feeds(session.w3, session.provider, selected_feeds, start_block, session.contract_abi, config_indexes=config_indexes)
+
+    # split submissions and withdrawals per operator
+    for feed_details in selected_feeds:
+        config_indexes[feed_details["path"]].save()
+        nop_details, transmitters = read_nop_details(feed_details["path"])
+        save_per_op_data(results[feed_details["path"]]["transmissions"], results[feed_details["path"]]["payments"], transmitters, nop_details, feed_details["path"])
+        # keep the feed's rollups up to date once its prices are collected
+        if len(missing_rollup_sources(feed_details["path"])) == 0:
+            update_rollups(feed_details["path"])
+    return 0
+
+def run_binance(args):
+    """
+    Function to get the 1 minute klines of a Binance symbol
+
+    Args:
+        args: The symbol, the from date and the to date
+    """
+    if len(args) < 1:
+        print("Please pass in a feed like: python cli.py binance ETHUSD FROM TO")
+        return 1
+    if len(args) < 2:
+        print("Please pass in a FROM date like: python cli.py binance ETHUSD 2021-01-01 TO")
+        return 1
+    if len(args) < 3:
+        print("Please pass in a TO date like: "+USAGE["binance"])
+        return 1
+
+    from datetime import datetime, timedelta
+    from binance.client import Client
+
+    def format_date(date):
+        return date.strftime("%d %b, %Y")
+
+    symbol = args[0].upper()
+    start_date = datetime.strptime(args[1], "%Y-%m-%d")
+    end_date = datetime.strptime(args[2], "%Y-%m-%d")
+
+    credentials = read_json("./binance-credentials.json")
+    client = Client(credentials["api_key"], credentials["api_secret"], requests_params={'timeout': 30})
+
+    # Calculate date ranges with 6-month intervals
+    date_ranges = []
+    while start_date <= end_date:
+        date_ranges.append((start_date, start_date + timedelta(days=180)))
+        start_date += timedelta(days=181)
+
+    output_data = []
+    for date_range in date_ranges:
+        from_date = format_date(date_range[0])
+        to_date = format_date(date_range[1])
+        print("Getting data between "+from_date+" to "+to_date)
+
+        # Fetch klines (candlestick data) for the specified date range
+        klines = client.get_historical_klines(symbol, Client.KLINE_INTERVAL_1MINUTE, from_date, to_date)
+        for kline in klines:
+            timestamp, open_price, high, low, close, volume = kline[:6]
+            output_data.append({
+                "Timestamp": timestamp,
+                "Open": open_price,
+                "High": high,
+                "Low": low,
+                "Close": close,
+                "Volume": volume
+            })
+
+    output_file = "data/binance/binance_data_"+symbol+"_1min.json"
+    with open(output_file, "w") as json_output:
+        json.dump(output_data, json_output, indent=4)
+    print(f"Data saved to {output_file}")
+    return 0
+
+def run_reference(args):
+    """
+    Function to get the 1 minute klines of every Binance market that prices a feed's pair, directly or crossed
+    through a bridge asset, and build the feed's reference price from them
+
+    Args:
+        args: The network, the feed, the from date, the to date and optionally stored to use the stored klines only
+    """
+    if len(args) < 4:
+        print("Please pass in a feed and dates like: "+USAGE["reference"])
+        return 1
+
+    from datetime import datetime
+    from reference_prices import build_reference_prices, download_klines, feed_assets, route_symbols
+
+    network = args[0].lower()
+    feed_details = read_feed_details(network, args[1].lower())
+    if feed_details is None:
+        return 1
+    start_date = datetime.strptime(args[2], "%Y-%m-%d")
+    end_date = datetime.strptime(args[3], "%Y-%m-%d")
+
+    if len(args) < 5 or args[4] != "stored":
+        from binance.client import Client
+
+        credentials = read_json("./binance-credentials.json")
+        client = Client(credentials["api_key"], credentials["api_secret"], requests_params={'timeout': 30})
+        listed = {symbol["symbol"] for symbol in client.get_exchange_info()["symbols"]}
+        for symbol in route_symbols(*feed_assets(feed_details)):
+            if symbol in listed:
+                download_klines(client, symbol, start_date, end_date)
+
+    reference = build_reference_prices(feed_details, start_date, end_date)
+    if reference is None:
+        print("No Binance klines are stored for the markets of "+feed_details["name"])
+        return 1
+    print("Saved data/"+feed_details["path"]+"/prices/binance-reference.npz with "+str(len(reference["price"]))+" minutes from "+", ".join(reference["routes"]))
+    return 0
+
+def run_gas(args):
+    """
+    Function to get the gas market of the blocks of a collected feed's transmissions, and compare it with what each
+    operator paid and was reimbursed
+
+    Args:
+        args: The network and the feed
+    """
+    if len(args) < 2:
+        print("Please pass in a feed like: "+USAGE["gas"])
+        return 1
+
+    network = args[0].lower()
+    feed_details = read_feed_details(network, args[1].lower())
+    if feed_details is None:
+        return 1
+    feed_path = feed_details["path"]
+    if not os.path.exists("data/"+feed_path+"/transmissions.csv"):
+        print("transmissions.csv is missing for "+feed_path+". Run python cli.py data first")
+        return 1
+
+    from schema import read_frame
+    from gas_market import update_gas_market, feed_gas_metrics
+
+    blocks = read_frame("data/"+feed_path+"/transmissions.csv", "transmissions", usecols=["blockNumber"])["blockNumber"]
+    if len(blocks) == 0:
+        print("No transmissions collected for "+feed_path)
+        return 0
+    session = FeedSession(network, feed_details)
+    market = update_gas_market(session.provider, "/".join(feed_path.split("/")[:2]), int(blocks.min()), int(blocks.max()))
+
+    gas_metrics = feed_gas_metrics(feed_path, market)
+    gas_metrics.to_csv("data/"+feed_path+"/gas_metrics.csv")
+    print(gas_metrics.to_string())
+    return 0
+
+def run_monitor(args):
+    """
+    Function to follow a feed's new transmissions and keep rolling operator statistics, or to replay recorded ones
+
+    Args:
+        args: The network, the feed and optionally the snapshots file. Or replay, the feed path, the recording, the
+            speed and optionally the snapshots file
+    """
+    if len(args) > 0 and args[0].lower() == "replay":
+        if len(args) < 4:
+            print("Please pass in a feed path, a recording and a speed like: "+USAGE["monitor replay"])
+            return 1
+
+        from helper import read_nop_details
+        from monitor import TransmissionMonitor, file_sink, read_recorded_transmissions, replay_transmissions
+
+        feed_path = args[1]
+        nop_details, _ = read_nop_details(feed_path)
+        snapshots_filename = args[4] if len(args) > 4 else "data/"+feed_path+"/monitor_snapshots.jsonl"
+        rows = read_recorded_transmissions(args[2])
+        print("Replaying "+str(len(rows))+" transmissions")
+        monitor = replay_transmissions(rows, TransmissionMonitor(nop_details), file_sink(snapshots_filename), speed=float(args[3]))
+        print(json.dumps(monitor.snapshot(), indent=4))
+        return 0
+
+    if len(args) < 2:
+        print("Please pass in a feed like: "+USAGE["monitor"])
+        return 1
+
+    network = args[0].lower()
+    feed_details = read_feed_details(network, args[1].lower())
+    if feed_details is None:
+        return 1
+
+    from helper import read_nop_details
+    from monitor import TransmissionMonitor, file_sink, stream_transmissions
+
+    session = FeedSession(network, feed_details)
+    if not os.path.exists("data/"+feed_details["path"]+"/nops.json"):
+        print("Getting operators from the feed's ConfigSet and PayeeshipTransferred events...")
+        update_operators(session, [feed_details])
+    nop_details, _ = read_nop_details(feed_details["path"])
+
+    snapshots_filename = args[2] if len(args) > 2 else "data/"+feed_details["path"]+"/monitor_snapshots.jsonl"
+    record_filename = "data/"+feed_details["path"]+"/monitor_transmissions.jsonl"
+    start_block = session.w3.eth.get_block('latest')['number']
+
+    print("Following transmissions from block "+str(start_block))
+    stream_transmissions(session.w3, session.provider, feed_details["address"], session.event_sigs, nop_details, session.events, session.contract, start_block, TransmissionMonitor(nop_details), file_sink(snapshots_filename), record_filename=record_filename)
+    return 0
+
+COMMANDS = {
+    "data": run_data,
+    "prices": run_prices,
+    "feeds": run_feeds,
+    "gas": run_gas,
+    "binance": run_binance,
+    "reference": run_reference,
+    "monitor": run_monitor
+}
+
+def parse_import_times(lines):
+    """
+    Function to parse the output of python -X importtime
+
+    Args:
+        lines: The lines written to stderr
+
+    Returns:
+        A list of (module, self microseconds, cumulative microseconds, depth) in import order
+    """
+    imports = []
+    for line in lines:
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        imports.append((name.strip(), int(self_time), int(cumulative), depth))
+    return imports
+
+def print_import_profile(imports, wall_time, top=15):
+    """
+    Function to print where the import time of a run went
+
+    Args:
+        imports: The imports from parse_import_times
+        wall_time: The duration of the run in seconds
+        top: The number of modules to list
+    """
+    top_level = sorted([item for item in imports if item[3] == 0], key=lambda item: -item[2])
+    total = sum(item[2] for item in top_level)
+    print(f"\nImports took {total / 1000000:.3f}s of {wall_time:.3f}s, {len(imports)} modules")
+    print(f"{'top-level import':<45} {'cumulative':>12}")
+    for name, _, cumulative, _ in top_level[:top]:
+        print(f"{name:<45} {cumulative / 1000000:11.3f}s")
+    print(f"{'slowest module':<45} {'self':>12}")
+    for name, self_time, _, _ in sorted(imports, key=lambda item: -item[1])[:top]:
+        print(f"{name:<45} {self_time / 1000000:11.3f}s")
+
+def profile_imports(args):
+    """
+    Function to run a command under python -X importtime and print its import profile
+
+    Args:
+        args: The command and its arguments
+
+    Returns:
+        The exit code of the command
+    """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", os.path.abspath(__file__)] + args, stderr=subprocess.PIPE, text=True)
+    wall_time = time.perf_counter() - start
+    lines = process.stderr.splitlines()
+    # keep the command's own errors
+    other = [line for line in lines if not line.startswith("import time:")]
+    if len(other) > 0:
+        print("\n".join(other), file=sys.stderr)
+    print_import_profile(parse_import_times(lines), wall_time)
+    return process.returncode
+
+def main(args):
+    """
+    Function to run a command
+
+    Args:
+        args: The command and its arguments. --importtime before the command prints where its import time went
+
+    Returns:
+        The exit code
+    """
+    if len(args) > 0 and args[0] == "--importtime":
+        return profile_imports(args[1:])
+    if len(args) == 0 or args[0] not in COMMANDS:
+        print("Please pass in a command like:")
+        for usage in USAGE.values():
+            print("    "+usage)
+        return 1
+
+    metrics.enable_from_env()
+    return COMMANDS[args[0]](args[1:])
+
+if __name__ == "__main__":
+    exit(main(sys.argv[1:]))
@@ -0,0 +1,293 @@
+import bisect
+import json
+import os
+from eth_utils import to_checksum_address
+from helper import decode_logs_data
+from ingestion import scan_logs
+
+# Events of an aggregator that change who its operators are and where they are paid
+INDEX_EVENTS = ["ConfigSet", "PayeeshipTransferred"]
+# Hand-maintained names of operators by transmitter or payee address, taking precedence over the names of the nops.json
+NAMES_FILENAME = "data/operator_names.json"
+
+def config_index_filename(feed_path):
+    return "data/"+feed_path+"/config_index.json"
+
+class ConfigIndex:
+    """
+    The ConfigSet and PayeeshipTransferred history of an aggregator up to a block, with the transmitters and each
+    transmitter's payee at any block found by bisection
+    """
+
+    def __init__(self, feed_path, address, last_block=-1, configs=None, payees=None):
+        """
+        Args:
+            feed_path: The path of the feed
+            address: The address of the aggregator
+            last_block: The last block scanned, -1 if never scanned
+            configs: The ConfigSet events as dicts with block, logIndex and transmitters
+            payees: The PayeeshipTransferred events as dicts with block, logIndex, transmitter, previous and payee
+        """
+        self.feed_path = feed_path
+        self.address = address
+        self.last_block = last_block
+        self.configs = configs or []
+        self.payee_events = payees or []
+        self._names = None
+        self._build()
+
+    def _build(self):
+        # sorted by block and log index, so the last event of a block wins
+        self.configs.sort(key=lambda event: (event["block"], event["logIndex"]))
+        self.payee_events.sort(key=lambda event: (event["block"], event["logIndex"]))
+        self.config_blocks = [event["block"] for event in self.configs]
+        self.payee_history = {}
+        for event in self.payee_events:
+            blocks, payees = self.payee_history.setdefault(event["transmitter"], ([], []))
+            blocks.append(event["block"])
+            payees.append(event["payee"])
+
+    @classmethod
+    def load(cls, feed_path, address):
+        """
+        Function to read a feed's index
+
+        Args:
+            feed_path: The path of the feed
+            address: The address of the aggregator
+
+        Returns:
+            The stored index, or an empty one if the feed was never indexed or its aggregator changed
+        """
+        filename = config_index_filename(feed_path)
+        if not os.path.exists(filename):
+            return cls(feed_path, address)
+        with open(filename, "r") as file:
+            stored = json.load(file)
+        if stored["address"].lower() != address.lower():
+            return cls(feed_path, address)
+        return cls(feed_path, address, stored["lastBlock"], stored["configs"], stored["payees"])
+
+    def save(self):
+        os.makedirs("data/"+self.feed_path, exist_ok=True)
+        with open(config_index_filename(self.feed_path), "w", encoding="utf-8") as outfile:
+            json.dump({"address": self.address, "lastBlock": self.last_block, "configs": self.configs, "payees": self.payee_events}, outfile, ensure_ascii=False, indent=4)
+
+    def add_logs(self, logs, event_sigs, event_params):
+        """
+        Function to add ConfigSet and PayeeshipTransferred logs of the aggregator. Logs of blocks already scanned are
+        skipped, so the logs of a scan overlapping the index can be passed as they are
+
+        Args:
+            logs: The Log array
+            event_sigs: The event signatures of the contract
+            event_params: The event parameters of the contract
+
+        Returns:
+            The number of events added
+        """
+        config_topic = bytes.fromhex(event_sigs["ConfigSet"][2:])
+        payee_topic = bytes.fromhex(event_sigs["PayeeshipTransferred"][2:])
+        added = 0
+        for log in logs:
+            if log.block_number <= self.last_block or log.removed:
+                continue
+            if log.topics[0] == config_topic:
+                transmitters = decode_logs_data(event_params["ConfigSet"]["params"], log.data)[3]
+                self.configs.append({"block": log.block_number, "logIndex": log.log_index, "transmitters": [to_checksum_address(transmitter) for transmitter in transmitters]})
+                added += 1
+            elif log.topics[0] == payee_topic:
+                # the transmitter, previous and current payees are indexed, as the last 20 bytes of their topics
+                transmitter, previous, payee = ["0x"+topic[-20:].hex() for topic in log.topics[1:4]]
+                self.payee_events.append({"block": log.block_number, "logIndex": log.log_index, "transmitter": transmitter, "previous": previous, "payee": payee})
+                added += 1
+        if added > 0:
+            self._build()
+        return added
+
+    def transmitter_sets(self):
+        """
+        Returns:
+            A sorted array of the blocks at which the transmitters were set and an array with the transmitters set at
+            each, like transmitter_sets_from_logs
+        """
+        return self.config_blocks, [event["transmitters"] for event in self.configs]
+
+    def transmitters_at(self, block_number=None):
+        """
+        Function to get the transmitters at a block
+
+        Args:
+            block_number: The block. The latest transmitters if None
+
+        Returns:
+            The transmitters, or None if the block is before the first ConfigSet event
+        """
+        if block_number is None:
+            return self.configs[-1]["transmitters"] if len(self.configs) > 0 else None
+        index = bisect.bisect_right(self.config_blocks, block_number) - 1
+        return self.configs[index]["transmitters"] if index >= 0 else None
+
+    def payee_at(self, transmitter, block_number=None):
+        """
+        Function to get the address a transmitter's payments went to at a block
+
+        Args:
+            transmitter: The address of the transmitter
+            block_number: The block. The latest payee if None
+
+        Returns:
+            The lowercase payee address, or None if no payee was set by then
+        """
+        history = self.payee_history.get(transmitter.lower())
+        if history is None:
+            return None
+        blocks, payees = history
+        index = len(blocks) - 1 if block_number is None else bisect.bisect_right(blocks, block_number) - 1
+        return payees[index] if index >= 0 else None
+
+    def payees(self, transmitter):
+        """
+        Returns:
+            The distinct payees of a transmitter in the order they were set
+        """
+        history = self.payee_history.get(transmitter.lower())
+        return list(dict.fromkeys(history[1])) if history is not None else []
+
+    def all_transmitters(self):
+        """
+        Returns:
+            The lowercase addresses of every transmitter that was configured or had a payee, in order of appearance
+        """
+        transmitters = [transmitter.lower() for event in self.configs for transmitter in event["transmitters"]]
+        return list(dict.fromkeys(transmitters + [event["transmitter"] for event in self.payee_events]))
+
+    @property
+    def names(self):
+        if self._names is None:
+            self._names = read_operator_names(self.feed_path)
+        return self._names
+
+    def operator_name(self, transmitter, block_number=None):
+        """
+        Function to get the name of the operator of a transmitter, from the name of the transmitter itself or else of
+        the payee it had at the block
+
+        Args:
+            transmitter: The address of the transmitter
+            block_number: The block. The latest payee is used if None
+
+        Returns:
+            The name, or one made from the transmitter's address if neither it nor its payees are named
+        """
+        transmitter = transmitter.lower()
+        if transmitter in self.names:
+            return self.names[transmitter]
+        payee = self.payee_at(transmitter, block_number)
+        if payee in self.names:
+            return self.names[payee]
+        for payee in reversed(self.payees(transmitter)):
+            if payee in self.names:
+                return self.names[payee]
+        return "nop_"+transmitter[2:10]
+
+def read_operator_names(feed_path=None):
+    """
+    Function to get the known names of operators by address. Operators are usually paid at the same payee on every
+    feed, so the nops.json of the other feeds name the new transmitters of a feed
+
+    Args:
+        feed_path: The feed whose nops.json takes precedence over the other feeds'
+
+    Returns:
+        Dict of names by lowercase transmitter or payee address, from the nops.json of every feed, then the feed's own
+        nops.json, then data/operator_names.json
+    """
+    own_filename = "data/"+feed_path+"/nops.json" if feed_path is not None else None
+    nops_filenames = []
+    for dir_path, dir_names, file_names in os.walk("data"):
+        dir_names[:] = [name for name in dir_names if name not in ["per_op", "prices", "rollups"]]
+        if "nops.json" in file_names and os.path.join(dir_path, "nops.json") != own_filename:
+            nops_filenames.append(os.path.join(dir_path, "nops.json"))
+    nops_filenames.sort()
+    if own_filename is not None and os.path.exists(own_filename):
+        nops_filenames.append(own_filename)
+
+    names = {}
+    for filename in nops_filenames:
+        with open(filename, "r") as file:
+            nops_details = json.load(file).get("nops_details", {})
+        for transmitter, details in nops_details.items():
+            names[transmitter.lower()] = details["name"]
+            for payee in details.get("paymentAddress", []):
+                names[payee.lower()] = details["name"]
+
+    if os.path.exists(NAMES_FILENAME):
+        with open(NAMES_FILENAME, "r") as file:
+            names.update({address.lower(): name for address, name in json.load(file).items()})
+    return names
+
+def update_config_indexes(provider_url, feeds, event_sigs, event_params, to_block, window=None):
+    """
+    Function to bring the indexes of several feeds of a network up to a block, scanning the ConfigSet and
+    PayeeshipTransferred logs of all their aggregators at once from the first block one of them is missing
+
+    Args:
+        provider_url: The endpoint of the node to query
+        feeds: The details of the feeds as in feeds.json
+        event_sigs: The event signatures of the contract
+        event_params: The event parameters of the contract
+        to_block: The last block to scan
+        window: The number of blocks per eth_getLogs call. Defaults to the whole range on ethereum and 100000 blocks elsewhere
+
+    Returns:
+        A dict with the saved ConfigIndex of each feed, by feed path
+    """
+    if window is None and not all("ethereum" in feed["path"] for feed in feeds):
+        window = 100000
+    indexes = {feed["path"]: ConfigIndex.load(feed["path"], feed["address"]) for feed in feeds}
+    by_address = {index.address.lower(): index for index in indexes.values()}
+    from_block = min(index.last_block + 1 for index in indexes.values())
+
+    topics = [event_sigs[event].lower() for event in INDEX_EVENTS]
+    for logs in scan_logs(provider_url, list(by_address), topics, from_block, to_block, window):
+        for address, index in by_address.items():
+            index.add_logs([log for log in logs if log.address == address], event_sigs, event_params)
+
+    for index in indexes.values():
+        index.last_block = max(index.last_block, to_block)
+        index.save()
+    return indexes
+
+def write_nops(index):
+    """
+    Function to write a feed's nops.json from its index. Operators keep the names and other details they have in the
+    existing file, their payment addresses become the payees they had on chain and the transmitters the latest ones
+
+    Args:
+        index: The ConfigIndex of the feed
+
+    Returns:
+        The details of the node operators and the transmitters, as read_nop_details returns them
+    """
+    nops_filename = "data/"+index.feed_path+"/nops.json"
+    nop_data = {"nops_details": {}, "transmitters": []}
+    if os.path.exists(nops_filename):
+        with open(nops_filename, "r") as file:
+            nop_data = json.load(file)
+
+    nops_details = nop_data["nops_details"]
+    for transmitter in index.all_transmitters():
+        details = dict(nops_details.get(transmitter, {}))
+        details["name"] = index.operator_name(transmitter)
+        payees = index.payees(transmitter)
+        details["paymentAddress"] = payees if len(payees) > 0 else details.get("paymentAddress", [])
+        nops_details[transmitter] = details
+    transmitters = index.transmitters_at()
+    if transmitters is not None:
+        nop_data["transmitters"] = transmitters
+
+    os.makedirs("data/"+index.feed_path, exist_ok=True)
+    with open(nops_filename, "w", encoding="utf-8") as outfile:
+        json.dump(nop_data, outfile, ensure_ascii=False, indent=4)
+    return nops_details, nop_data["transmitters"]
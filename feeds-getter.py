@@ -0,0 +1,5 @@
+import sys
+from cli import main
+
+# Same as python cli.py feeds, which only imports what the command needs
+exit(main(["feeds"] + sys.argv[1:]))
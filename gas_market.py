@@ -0,0 +1,363 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from helper import post_json_rpc, read_nop_details, transmission_repayments_eth
+from schema import read_frame
+
+# Nodes answer eth_feeHistory for at most 1024 blocks per call
+FEE_HISTORY_MAX_BLOCKS = 1024
+# Percentiles of the priority fees paid in each block, weighted by gas
+REWARD_PERCENTILES = [10, 50, 90]
+# The percentile taken as the tip the market asked for, on top of the base fee
+MARKET_PERCENTILE = 50
+
+def gas_market_filename(network_path):
+    return "data/"+network_path+"/gas_market.npz"
+
+class GasMarket:
+    """
+    The base fee, gas used ratio and priority fee percentiles of every block of a range, in arrays indexed by the
+    block number minus the first block. Blocks not fetched yet are NaN
+    """
+
+    def __init__(self, first_block, base_fee, gas_used_ratio, rewards, percentiles):
+        """
+        Args:
+            first_block: The block of the first entry
+            base_fee: The base fee of each block in gwei
+            gas_used_ratio: The share of each block's gas limit that was used
+            rewards: The priority fees of each block in gwei, one column per percentile
+            percentiles: The percentiles of the rewards' columns
+        """
+        self.first_block = int(first_block)
+        self.base_fee = np.asarray(base_fee, dtype=np.float64)
+        self.gas_used_ratio = np.asarray(gas_used_ratio, dtype=np.float32)
+        self.rewards = np.asarray(rewards, dtype=np.float64).reshape(len(self.base_fee), len(percentiles))
+        self.percentiles = list(percentiles)
+
+    @classmethod
+    def empty(cls, first_block, last_block, percentiles=REWARD_PERCENTILES):
+        blocks = max(last_block - first_block + 1, 0)
+        return cls(first_block, np.full(blocks, np.nan), np.full(blocks, np.nan), np.full((blocks, len(percentiles)), np.nan), percentiles)
+
+    @property
+    def last_block(self):
+        return self.first_block + len(self.base_fee) - 1
+
+    def __len__(self):
+        return len(self.base_fee)
+
+    def extend(self, first_block, last_block):
+        """
+        Function to cover more blocks, the new ones being NaN
+
+        Args:
+            first_block: The first block to cover
+            last_block: The last block to cover
+
+        Returns:
+            The market covering both its blocks and the given ones
+        """
+        if len(self) > 0:
+            first_block, last_block = min(first_block, self.first_block), max(last_block, self.last_block)
+        if len(self) > 0 and first_block == self.first_block and last_block == self.last_block:
+            return self
+        market = GasMarket.empty(first_block, last_block, self.percentiles)
+        offset = self.first_block - first_block
+        market.base_fee[offset:offset+len(self)] = self.base_fee
+        market.gas_used_ratio[offset:offset+len(self)] = self.gas_used_ratio
+        market.rewards[offset:offset+len(self)] = self.rewards
+        return market
+
+    def missing_ranges(self, first_block, last_block):
+        """
+        Function to find the blocks of a range that were not fetched yet
+
+        Args:
+            first_block: The first block of the range
+            last_block: The last block of the range
+
+        Returns:
+            An array of (first, last) block ranges
+        """
+        blocks = np.arange(first_block, last_block + 1)
+        missing = np.isnan(self.lookup(blocks)[0])
+        if not missing.any():
+            return []
+        # split the missing blocks where they stop being consecutive
+        missing_blocks = blocks[missing]
+        breaks = np.flatnonzero(np.diff(missing_blocks) != 1)
+        starts = np.concatenate([[0], breaks + 1])
+        ends = np.concatenate([breaks, [len(missing_blocks) - 1]])
+        return [(int(missing_blocks[start]), int(missing_blocks[end])) for start, end in zip(starts, ends)]
+
+    def lookup(self, block_numbers):
+        """
+        Function to get the market of many blocks at once
+
+        Args:
+            block_numbers: The block numbers, as an array
+
+        Returns:
+            1. The base fee of each block in gwei
+            2. The rewards of each block in gwei, one column per percentile
+            Blocks outside of the market are NaN
+        """
+        indexes = np.asarray(block_numbers, dtype=np.int64) - self.first_block
+        inside = (indexes >= 0) & (indexes < len(self))
+        clipped = np.where(inside, indexes, 0)
+        base_fee = np.where(inside, self.base_fee[clipped] if len(self) > 0 else np.nan, np.nan)
+        rewards = np.where(inside[:, None], self.rewards[clipped] if len(self) > 0 else np.nan, np.nan)
+        return base_fee, rewards
+
+    def save(self, filename):
+        dir_path = os.path.dirname(filename)
+        if dir_path != "":
+            os.makedirs(dir_path, exist_ok=True)
+        np.savez(filename, first_block=self.first_block, base_fee=self.base_fee, gas_used_ratio=self.gas_used_ratio, rewards=self.rewards, percentiles=np.asarray(self.percentiles, dtype=np.float64))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Function to load a stored market
+
+        Args:
+            filename: The .npz file written by save
+
+        Returns:
+            The GasMarket, or None if the file does not exist
+        """
+        if not os.path.exists(filename):
+            return None
+        with np.load(filename) as stored:
+            return cls(int(stored["first_block"]), stored["base_fee"], stored["gas_used_ratio"], stored["rewards"], [float(percentile) for percentile in stored["percentiles"]])
+
+def fee_history_calls(first_block, last_block, block_count=FEE_HISTORY_MAX_BLOCKS):
+    """
+    Function to split a range of blocks into eth_feeHistory calls
+
+    Args:
+        first_block: The first block of the range
+        last_block: The last block of the range
+        block_count: The number of blocks per call
+
+    Returns:
+        An array of (block count, newest block) per call
+    """
+    return [(min(block_count, last_block - start + 1), min(start + block_count - 1, last_block)) for start in range(first_block, last_block + 1, block_count)]
+
+def fill_fee_history(market, result):
+    """
+    Function to store an eth_feeHistory result in a market
+
+    Args:
+        market: The GasMarket covering the result's blocks
+        result: The result of the call
+    """
+    oldest_block = int(result["oldestBlock"], 16)
+    blocks = len(result["gasUsedRatio"])
+    # blocks outside of the market are skipped, like the base fee of the block after the newest
+    skip = max(market.first_block - oldest_block, 0)
+    offset = oldest_block + skip - market.first_block
+    blocks = min(blocks, len(market) - offset + skip)
+    if blocks <= skip:
+        return
+    market.base_fee[offset:offset+blocks-skip] = np.array([int(fee, 16) for fee in result["baseFeePerGas"][skip:blocks]], dtype=np.float64) / 1000000000
+    market.gas_used_ratio[offset:offset+blocks-skip] = result["gasUsedRatio"][skip:blocks]
+    if result.get("reward") is not None and len(market.percentiles) > 0:
+        market.rewards[offset:offset+blocks-skip] = np.array([[int(reward, 16) for reward in block_rewards] for block_rewards in result["reward"][skip:blocks]], dtype=np.float64) / 1000000000
+
+def fetch_fee_history(provider_url, market, first_block, last_block, block_count=FEE_HISTORY_MAX_BLOCKS, workers=8):
+    """
+    Function to fetch the market of a range of blocks with concurrent eth_feeHistory calls
+
+    Args:
+        provider_url: Endpoint of the node to query, or a ProviderRouter spreading the calls over several nodes
+        market: The GasMarket to fill, covering the range
+        first_block: The first block of the range
+        last_block: The last block of the range
+        block_count: The number of blocks per call
+        workers: The number of calls in flight
+
+    Returns:
+        The market
+    """
+    percentiles = market.percentiles
+
+    def fetch(call):
+        count, newest_block = call
+        payload = {"jsonrpc": "2.0", "method": "eth_feeHistory", "params": [hex(count), hex(newest_block), percentiles], "id": 1}
+        return post_json_rpc(provider_url, payload)
+
+    calls = fee_history_calls(first_block, last_block, block_count)
+    with metrics.stage("gasMarket.feeHistory"), ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(fetch, calls):
+            fill_fee_history(market, result)
+    metrics.record_rows("gasMarket.feeHistory", last_block - first_block + 1)
+    return market
+
+def update_gas_market(provider_url, network_path, first_block, last_block, percentiles=REWARD_PERCENTILES, workers=8):
+    """
+    Function to fetch the blocks of a range missing from a network's stored market, and save it
+
+    Args:
+        provider_url: Endpoint of the node to query, or a ProviderRouter
+        network_path: The path of the network like ethereum/mainnet
+        first_block: The first block of the range
+        last_block: The last block of the range
+        percentiles: The reward percentiles, used if the network has no stored market yet
+        workers: The number of calls in flight
+
+    Returns:
+        The GasMarket covering the range
+    """
+    filename = gas_market_filename(network_path)
+    market = GasMarket.load(filename) or GasMarket.empty(first_block, last_block, percentiles)
+    market = market.extend(first_block, last_block)
+
+    missing = market.missing_ranges(first_block, last_block)
+    for start, end in missing:
+        print("Getting the gas market of blocks "+str(start)+" to "+str(end))
+        fetch_fee_history(provider_url, market, start, end, workers=workers)
+    if len(missing) > 0:
+        market.save(filename)
+    return market
+
+def block_billing_params(block_numbers, billing_params):
+    """
+    Function to get the billing parameters of many blocks at once, with the same rule as get_block_billing
+
+    Args:
+        block_numbers: The block numbers, as an array
+        billing_params: All the billing params for each block
+
+    Returns:
+        A dict of arrays with the maximumGasPrice and reasonableGasPrice of each block
+    """
+    keys = list(billing_params)
+    blocks = np.array([int(key) for key in keys], dtype=np.int64)
+    # get_block_billing takes the first set after the block, or the last one
+    indexes = np.minimum(np.searchsorted(blocks, np.asarray(block_numbers, dtype=np.int64), side="right"), len(keys) - 1)
+    return {
+        param: np.array([billing_params[key][param] for key in keys], dtype=np.float64)[indexes]
+        for param in ["maximumGasPrice", "reasonableGasPrice"]
+    }
+
+def join_transmissions(transmissions, market, billing_params=None):
+    """
+    Function to add the gas market of each transmission's block to the transmissions
+
+    Args:
+        transmissions: DataFrame of transmissions with blockNumber, gasPriceGwei and fee
+        market: The GasMarket covering their blocks
+        billing_params: All the billing params for each block. Adds the reimbursement columns if given
+
+    Returns:
+        A DataFrame with the transmissions' gas columns. Prices are in gwei and amounts in ETH
+    """
+    blocks = transmissions["blockNumber"].to_numpy(dtype=np.int64)
+    gas_price = transmissions["gasPriceGwei"].to_numpy(dtype=np.float64)
+    fee = transmissions["fee"].to_numpy(dtype=np.float64)
+    gas_used = fee / (gas_price / 1000000000)
+    base_fee, rewards = market.lookup(blocks)
+    tip = rewards[:, market.percentiles.index(MARKET_PERCENTILE)] if MARKET_PERCENTILE in market.percentiles else np.zeros(len(blocks))
+    market_gas_price = base_fee + tip
+
+    joined = pd.DataFrame({
+        "blockNumber": blocks,
+        "submitter": transmissions["submitter"].to_numpy(),
+        "gasPriceGwei": gas_price,
+        "gasUsed": gas_used,
+        "fee": fee,
+        "baseFeeGwei": base_fee,
+        "priorityFeeGwei": gas_price - base_fee,
+        "marketGasPriceGwei": market_gas_price,
+        "overpaymentGwei": gas_price - market_gas_price,
+        "overpaymentEth": (gas_price - market_gas_price) / 1000000000 * gas_used
+    }, index=transmissions.index)
+    for percentile, column in zip(market.percentiles, rewards.T):
+        joined["rewardP"+str(int(percentile))+"Gwei"] = column
+
+    if billing_params is not None:
+        billing = block_billing_params(blocks, billing_params)
+        joined["maximumGasPrice"] = billing["maximumGasPrice"]
+        joined["reasonableGasPrice"] = billing["reasonableGasPrice"]
+        joined["reimbursedEth"] = transmission_repayments_eth(gas_price, gas_used, billing)
+        # what the contract paid back beyond the gas paid, negative when the operator was out of pocket
+        joined["reimbursementGapEth"] = joined["reimbursedEth"] - fee
+        # what the contract would have paid back beyond the gas at the market's price
+        joined["marketReimbursementGapEth"] = transmission_repayments_eth(market_gas_price, gas_used, billing) - market_gas_price / 1000000000 * gas_used
+        joined["marketAboveMaximum"] = market_gas_price > billing["maximumGasPrice"]
+        joined["marketBelowReasonable"] = market_gas_price < billing["reasonableGasPrice"]
+    return joined
+
+def operator_gas_metrics(transmissions, market, billing_params, nop_details):
+    """
+    Function to compare what each operator paid for gas with the market and with what it was reimbursed
+
+    Args:
+        transmissions: DataFrame of transmissions with blockNumber, gasPriceGwei, fee and submitter
+        market: The GasMarket covering their blocks
+        billing_params: All the billing params for each block
+        nop_details: The details of the node operators
+
+    Returns:
+        A DataFrame with a row per operator. Transmissions in blocks missing from the market are left out
+    """
+    joined = join_transmissions(transmissions, market, billing_params)
+    joined = joined[~np.isnan(joined["baseFeeGwei"].to_numpy())]
+    names = {address.lower(): details["name"] for address, details in nop_details.items()}
+    joined["operator"] = joined["submitter"].astype(str).str.lower().map(names).fillna(joined["submitter"].astype(str))
+
+    grouped = joined.groupby("operator", sort=True)
+    summary = grouped.agg(
+        transmissions=("fee", "size"),
+        gasUsed=("gasUsed", "sum"),
+        feeEth=("fee", "sum"),
+        overpaymentEth=("overpaymentEth", "sum"),
+        reimbursedEth=("reimbursedEth", "sum"),
+        reimbursementGapEth=("reimbursementGapEth", "sum"),
+        marketReimbursementGapEth=("marketReimbursementGapEth", "sum"),
+        meanGasPriceGwei=("gasPriceGwei", "mean"),
+        meanBaseFeeGwei=("baseFeeGwei", "mean"),
+        meanMarketGasPriceGwei=("marketGasPriceGwei", "mean"),
+        marketAboveMaximum=("marketAboveMaximum", "mean"),
+        marketBelowReasonable=("marketBelowReasonable", "mean")
+    )
+    summary["overpaymentRate"] = summary["overpaymentEth"] / summary["feeEth"]
+    return summary
+
+def feed_gas_metrics(feed_path, market=None):
+    """
+    Function to compare the gas paid by the operators of a collected feed with its network's stored market
+
+    Args:
+        feed_path: The path of the feed
+        market: The GasMarket to use. Defaults to the network's stored market
+
+    Returns:
+        A DataFrame with a row per operator, see operator_gas_metrics
+    """
+    if market is None:
+        market = GasMarket.load(gas_market_filename("/".join(feed_path.split("/")[:2])))
+        if market is None:
+            raise FileNotFoundError("No gas market collected for "+feed_path+". Run python cli.py gas first")
+    transmissions = read_frame("data/"+feed_path+"/transmissions.csv", "transmissions", usecols=["blockNumber", "gasPriceGwei", "fee", "submitter"])
+    with open("data/"+feed_path+"/billing_params.json", "r") as file:
+        billing_params = json.load(file)
+    nop_details, _ = read_nop_details(feed_path)
+    return operator_gas_metrics(transmissions, market, billing_params, nop_details)
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv
+
+    if len(args) < 2:
+        print("Please pass in the data path of a collected feed like: python gas_market.py ethereum/mainnet/crypto-usd/link-usd")
+        exit()
+
+    pd.set_option("display.width", 250)
+    print(feed_gas_metrics(args[1]).to_string())
@@ -1,20 +1,22 @@
 import pandas as pd
-from web3 import Web3 
-import web3
-import eth_utils
-from eth_utils import to_checksum_address,keccak,to_hex
 from datetime import datetime
 import math
 import binascii
-from web3 import Web3
 import hashlib
-from eth_abi import abi
-import requests
 import json
-from bs4 import BeautifulSoup
 import re
 import os
-from web3.logs import STRICT, IGNORE, DISCARD, WARN
+import bisect
+import time
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+from schema import read_frame, write_frame, date_text
+from rpc_decode import loads, decode_logs, Receipt
+
+# Metadata of the contracts that never changes, like their decimals. None to always query the contracts
+CONTRACTS_FILENAME = "data/contracts.json"
 
 def create_contract(w3, aggregator_contract_address, contract_abi):
     """
@@ -33,6 +35,39 @@ def create_contract(w3, aggregator_contract_address, contract_abi):
 
     return contract, abi_events
 
+def get_contract_decimals(contract, network):
+    """
+    Function to get the decimals of a contract, cached in CONTRACTS_FILENAME as they never change
+
+    Args:
+        contract: The contract's instance
+        network: The network of the contract, as the same address can be on several networks
+
+    Returns:
+        The decimals of the contract
+    """
+    cache_filename = CONTRACTS_FILENAME
+    if cache_filename is None:
+        return contract.functions.decimals().call()
+
+    contracts = {}
+    if os.path.exists(cache_filename):
+        with open(cache_filename, "r") as file:
+            contracts = json.load(file)
+
+    key = network+"/"+contract.address.lower()
+    if "decimals" in contracts.get(key, {}):
+        metrics.record_cache("contracts", True)
+        return contracts[key]["decimals"]
+
+    metrics.record_cache("contracts", False)
+    decimals = contract.functions.decimals().call()
+    contracts.setdefault(key, {})["decimals"] = decimals
+    os.makedirs(os.path.dirname(cache_filename) or ".", exist_ok=True)
+    with open(cache_filename, "w", encoding="utf-8") as outfile:
+        json.dump(contracts, outfile, ensure_ascii=False, indent=4)
+    return decimals
+
 def calculate_event_sigs(abi_events):
     """
     Get Event signatures from ABI's events
@@ -43,6 +78,9 @@ def calculate_event_sigs(abi_events):
     Returns:
         Contract's event signatures
     """
+    # web3 takes about a second to import, so it is only imported once it is needed
+    from web3 import Web3
+
     event_sigs = {}
     for event in abi_events:
         # Define the event name and parameter types
@@ -127,24 +165,88 @@ def get_block_by_date(w3, date):
 
     return get_block_number_by_timestamp(w3, timestamp)
 
+def send_json_rpc(provider_url, payload):
+    """
+    Function to send a JSON-RPC request or batch to a node
+
+    Args:
+        provider_url: Endpoint of the node to query, or a ProviderRouter choosing the node
+        payload: The JSON-RPC request, or a batch of requests
+
+    Returns:
+        The parsed response, the bytes sent and the bytes received
+    """
+    if not isinstance(provider_url, str):
+        return provider_url.post(payload)
+
+    import requests
+
+    response = requests.post(provider_url, json=payload)
+    return loads(response.content), len(response.request.body or b""), len(response.content)
+
+def post_json_rpc(provider_url, payload):
+    """
+    Function to send a JSON-RPC request, recording its latency and size when metrics are enabled
+
+    Args:
+        provider_url: Endpoint of the node to query, or a ProviderRouter choosing the node
+        payload: The JSON-RPC request
+
+    Returns:
+        The result of the request
+    """
+    if not metrics.is_enabled():
+        return send_json_rpc(provider_url, payload)[0]["result"]
+
+    start = time.perf_counter()
+    body, bytes_sent, bytes_received = send_json_rpc(provider_url, payload)
+    metrics.record_rpc(payload["method"], time.perf_counter() - start, bytes_sent, bytes_received, "error" in body)
+    return body["result"]
+
+def post_json_rpc_batch(provider_url, payloads):
+    """
+    Function to send JSON-RPC requests in a single batch
+
+    Args:
+        provider_url: Endpoint of the node to query, or a ProviderRouter choosing the node
+        payloads: The JSON-RPC requests
+
+    Returns:
+        The responses in the order of the requests, each with either a result or an error
+    """
+    payloads = [dict(payload, id=index) for index, payload in enumerate(payloads)]
+    start = time.perf_counter()
+    body, bytes_sent, bytes_received = send_json_rpc(provider_url, payloads)
+    responses = sorted(body, key=lambda body: body["id"])
+
+    if metrics.is_enabled():
+        # the request's latency and bytes are shared between its calls
+        seconds = (time.perf_counter() - start) / len(payloads)
+        for payload, body in zip(payloads, responses):
+            metrics.record_rpc(payload["method"], seconds, bytes_sent // len(payloads), bytes_received // len(payloads), "error" in body)
+        metrics.record_rpc("batch", time.perf_counter() - start, bytes_sent, bytes_received)
+
+    return responses
+
 # Get nop details
-def get_payee_addresses_changes(provider_url, aggregator_contract_address, event_sig):
+def get_payee_addresses_changes(provider_url, aggregator_contract_address, event_sig, from_block="0x0"):
     """
-    Get Events of when the payee addresses changed
+    Get Events of when the payee addresses changed. config_index.py keeps them per feed and only queries new blocks
 
     Args:
         provider_url: Endpoint of the node to query
         aggregator_contract_address: The address of the contract to query
         event_sig: The event signatures
+        from_block: The first block to query as hex
 
     Returns:
-        An array of events for payee address changes
+        An array of Log for payee address changes
     """
     payload = {
         "jsonrpc": "2.0",
         "method": "eth_getLogs",
         "params": [
-            {"fromBlock": "0x0", 
+            {"fromBlock": from_block, 
              "address": aggregator_contract_address, 
              "topics": [event_sig]
             }
@@ -152,8 +254,7 @@ def get_payee_addresses_changes(provider_url, aggregator_contract_address, event
         "id": 1,
     }
     
-    response = requests.post(provider_url, json=payload)
-    events = json.loads(response.text)["result"]
+    events = decode_logs(post_json_rpc(provider_url, payload))
     return events
 
 def get_oracle_index_from_cl(transmitter, oracles):
@@ -200,6 +301,9 @@ def get_decoded_logs(abi_events, receipt, contract):
     Returns:
         An array of decoded logs from the receipt
     """
+    from eth_utils import keccak, to_hex
+    from web3.logs import DISCARD
+
     logs = []
     for log in receipt["logs"]:
         receipt_event_signature_hex = log["topics"][0].hex()
@@ -231,7 +335,7 @@ def get_logs(provider_url, aggregator_contract_address, topic, fromBlock):
         fromBlock: The minimum block number from which to get blocks
 
     Returns:
-        An array of events for the given topic
+        An array of Log for the given topic
     """
     payload = {
         "jsonrpc": "2.0",
@@ -245,8 +349,7 @@ def get_logs(provider_url, aggregator_contract_address, topic, fromBlock):
         "id": 1,
     }
     
-    response = requests.post(provider_url, json=payload)
-    events = json.loads(response.text)["result"]
+    events = decode_logs(post_json_rpc(provider_url, payload))
     return events
 
 def get_logs_throttled(provider_url, aggregator_contract_address, topic, fromBlock, toBlock):
@@ -261,7 +364,7 @@ def get_logs_throttled(provider_url, aggregator_contract_address, topic, fromBlo
         toBlock: The maximum block number from which to get blocks
 
     Returns:
-        An array of events for the given topic
+        An array of Log for the given topic
     """
 
     # Throttle amount
@@ -301,8 +404,7 @@ def get_logs_throttled(provider_url, aggregator_contract_address, topic, fromBlo
                 "id": 1,
             }
 
-        response = requests.post(provider_url, json=payload)
-        events = json.loads(response.text)["result"]
+        events = decode_logs(post_json_rpc(provider_url, payload))
         if len(events) > 0:
             all_events.extend(events)
         counter += 1
@@ -322,7 +424,13 @@ def get_transaction_details(w3, abi_events, tx_hash, decode_logs, contract):
     Returns:
         An object with transaction details
     """
-    receipt = w3.eth.get_transaction_receipt(tx_hash)
+    with metrics.stage("receipts"):
+        receipt = w3.eth.get_transaction_receipt(tx_hash)
+
+    logs = []
+    if decode_logs:
+        with metrics.stage("decodeLogs"):
+            logs = get_decoded_logs(abi_events, receipt, contract)
     
     tx_details = {
         "blockNumber": receipt["blockNumber"],
@@ -331,7 +439,7 @@ def get_transaction_details(w3, abi_events, tx_hash, decode_logs, contract):
         "to": receipt["to"],
         "gasPriceGwei": float(receipt["effectiveGasPrice"]/1000000000),
         "txfee": receipt["gasUsed"]*receipt["effectiveGasPrice"]/1000000000000000000,
-        "logs": get_decoded_logs(abi_events, receipt, contract) if decode_logs else []
+        "logs": logs
     }
     
     return tx_details
@@ -342,12 +450,14 @@ def decode_logs_data(event_params, data):
 
     Args:
         event_params: Parameters of an event
-        data: Data to decode
+        data: Data to decode, as bytes or hex
 
     Returns:
         Decoded data
     """
-    byte_data = bytes.fromhex(data[2:])
+    from eth_abi import abi
+
+    byte_data = data if isinstance(data, bytes) else bytes.fromhex(data[2:])
     decodedABI = abi.decode(event_params, byte_data)
     return decodedABI
 
@@ -357,12 +467,14 @@ def decode_log_topic(topic, data):
 
     Args:
         topic: Topic params
-        data: Data to decode
+        data: Data to decode, as bytes or hex
 
     Returns:
         Decoded data
     """
-    byte_data = bytes.fromhex(data[2:])
+    from eth_abi import abi
+
+    byte_data = data if isinstance(data, bytes) else bytes.fromhex(data[2:])
     decodedABI = abi.decode([topic], byte_data)
     return decodedABI[0]
 
@@ -386,6 +498,101 @@ def column_builder_transmissions(nop_details, transmitters):
 
     return columns
 
+def get_transmission_tx(w3, abi_events, tx_hash, contract, transactions):
+    """
+    Function to get a transmission's transaction details with decoded logs and block timestamp
+
+    Args:
+        w3: web3 Instance
+        abi_events: Contract's ABI Events
+        tx_hash: The hash of the transmission's transaction
+        contract: The contract's instance
+        transactions: Dict of already fetched transactions by lowercase hash. Updated with the fetched transaction
+
+    Returns:
+        An object with transaction details and the block timestamp
+    """
+    if tx_hash.lower() in transactions:
+        metrics.record_cache("transactions", True)
+        return transactions[tx_hash.lower()]
+
+    metrics.record_cache("transactions", False)
+    tx = get_transaction_details(w3, abi_events, tx_hash.lower(), True, contract)
+    with metrics.stage("blocks"):
+        block = w3.eth.get_block(tx["blockNumber"])
+    tx["timestamp"] = block['timestamp']
+    transactions[tx["hash"].lower()] = tx
+
+    return tx
+
+def build_transmission_row(tx, nop_details, contract, transmission_log=None, transmitters=None):
+    """
+    Function to build a row of operators' submissions from a transmission's transaction
+
+    Args:
+        tx: The transaction details from get_transmission_tx
+        nop_details: The details of the node operators
+        contract: The contract's instance
+        transmission_log: The decoded NewTransmission arguments. Taken from the transaction's logs if None
+        transmitters: The transmitters at the transaction's block. Queried from the contract if None
+
+    Returns:
+        A dict with the transmission's details and each operator's answer and deviation from the aggregated value
+    """
+    #get new transmission log
+    if transmission_log is None:
+        for log in tx["logs"]:
+            if log["event"] == "NewTransmission":
+                transmission_log = log["data"][0]["args"];
+                break
+
+    new_transmission = {
+        "blockNumber": tx["blockNumber"], 
+        "gasPriceGwei": tx["gasPriceGwei"], 
+        "fee": tx["txfee"], 
+        "timestamp": tx["timestamp"], 
+        "submitter": tx["from"].lower(), 
+        "txHash": tx["hash"].lower(),
+        "aggregatedAnswer": transmission_log["answer"],
+        "minAnswer": transmission_log["observations"][0],
+        "maxAnswer": transmission_log["observations"][-1]
+    }
+    
+    aggregated_answer =  transmission_log["answer"]
+    obs = transmission_log["observers"]
+    observers = binascii.hexlify(obs).decode('utf-8')
+    observers = [int(observers[i:i+2],16) for i in range(0, len(observers), 2)]
+    submissions = transmission_log["observations"]
+    answers = {}
+    deviations = {}
+
+    if transmitters is None:
+        # Get transmitters at this block
+        with metrics.stage("transmitters"):
+            transmitters = get_transmitters_for_blocknumber(contract, tx["blockNumber"])
+
+    #initialise by all transmitters
+    for transmitter in transmitters:
+        transmitter_name = nop_details[transmitter.lower()]["name"]
+        answers[transmitter_name] = 0
+        deviations[transmitter_name] = 0
+
+    #go through submissions and fill
+    for index,answer in enumerate(submissions):
+        transmitter_index = observers[index]
+        transmitter = transmitters[transmitter_index]
+        transmitter_name = nop_details[transmitter.lower()]["name"]
+        answers[transmitter_name] = answer
+        deviation = ((answer - aggregated_answer) / aggregated_answer) * 100
+        deviations[transmitter_name] = abs(deviation)
+
+    # loop through transmitters
+    for answer in answers:
+        new_transmission[answer+"_answer"] = answers[answer]
+        new_transmission[answer+"_deviation"] = deviations[answer]
+
+    return new_transmission
+
 def get_transmissions(w3, provider_url, aggregator_contract_address, start_block, event_sigs, event_params, feed_path, nop_details, transmitters, abi_events, contract):
     """
     Function to get all the operator's submissions and transmissions from a block
@@ -408,85 +615,313 @@ def get_transmissions(w3, provider_url, aggregator_contract_address, start_block
     """
     transactions = {}
     transmissions_df = pd.DataFrame([],columns=column_builder_transmissions(nop_details, transmitters))
-    if "ethereum" in feed_path:
-        transmissions = get_logs(provider_url, aggregator_contract_address, event_sigs["NewTransmission"], hex(start_block))
-    else: 
-        latest_block_number = w3.eth.get_block('latest')['number']
-        transmissions = get_logs_throttled(provider_url, aggregator_contract_address, event_sigs["NewTransmission"], start_block, latest_block_number)
+    with metrics.stage("transmissions.getLogs"):
+        if "ethereum" in feed_path:
+            transmissions = get_logs(provider_url, aggregator_contract_address, event_sigs["NewTransmission"], hex(start_block))
+        else: 
+            latest_block_number = w3.eth.get_block('latest')['number']
+            transmissions = get_logs_throttled(provider_url, aggregator_contract_address, event_sigs["NewTransmission"], start_block, latest_block_number)
 
     for index,transmission in enumerate(transmissions):
         print("Ready", index, len(transmissions))
 
-        if transmission["transactionHash"].lower() in transactions:
-            tx = transactions[transmission["transactionHash"].lower()]
-        else:
-            tx = get_transaction_details(w3, abi_events, transmission["transactionHash"].lower(), True, contract)
-            
-            block = w3.eth.get_block(tx["blockNumber"])
-            timestamp = block['timestamp']
-            tx["timestamp"] = timestamp
-            transactions[tx["hash"].lower()] = tx
-            
-        transmission_log = None
-        #get new transmission log
-        for log in tx["logs"]:
-            if log["event"] == "NewTransmission":
-                transmission_log = log["data"][0]["args"];
-                break
-                
-        new_transmission = {
-            "blockNumber": tx["blockNumber"], 
-            "gasPriceGwei": tx["gasPriceGwei"], 
-            "fee": tx["txfee"], 
-            "timestamp": tx["timestamp"], 
-            "submitter": tx["from"].lower(), 
-            "txHash": tx["hash"].lower(),
-            "aggregatedAnswer": transmission_log["answer"],
-            "minAnswer": transmission_log["observations"][0],
-            "maxAnswer": transmission_log["observations"][-1]
-        }
-        
-        aggregated_answer =  transmission_log["answer"]
-        obs = transmission_log["observers"]
-        observers = binascii.hexlify(obs).decode('utf-8')
-        observers = [int(observers[i:i+2],16) for i in range(0, len(observers), 2)]
-        submissions = transmission_log["observations"]
-        answers = {}
-        deviations = {}
-
-        print("Getting transmitters for "+str(tx["blockNumber"]))
-        # Get transmitters at this block
-        transmitters = get_transmitters_for_blocknumber(contract, tx["blockNumber"])
-        print(len(transmitters))
-
-        #initialise by all transmitters
-        for transmitter in transmitters:
-            transmitter_name = nop_details[transmitter.lower()]["name"]
-            answers[transmitter_name] = 0
-            deviations[transmitter_name] = 0
-
-        #go through submissions and fill
-        for index,answer in enumerate(submissions):
-            transmitter_index = observers[index]
-            transmitter = transmitters[transmitter_index]
-            transmitter_name = nop_details[transmitter.lower()]["name"]
-            answers[transmitter_name] = answer
-            deviation = ((answer - aggregated_answer) / aggregated_answer) * 100
-            deviations[transmitter_name] = abs(deviation)
-
-        # loop through transmitters
-        for answer in answers:
-            new_transmission[answer+"_answer"] = answers[answer]
-            new_transmission[answer+"_deviation"] = deviations[answer]
-            
-        transmissions_df = pd.concat([transmissions_df, pd.DataFrame([new_transmission])], ignore_index=True)
+        with metrics.stage("transmissions"):
+            tx = get_transmission_tx(w3, abi_events, transmission.transaction_hash, contract, transactions)
+            new_transmission = build_transmission_row(tx, nop_details, contract)
+
+            with metrics.stage("transmissions.concat"):
+                transmissions_df = pd.concat([transmissions_df, pd.DataFrame([new_transmission])], ignore_index=True)
+        metrics.record_rows("transmissions")
         
     
     transmissions_df["txDate"] = pd.to_datetime(transmissions_df['timestamp'], unit='s').dt.tz_localize('UTC')
 
     dir_path = "data/"+feed_path
     os.makedirs(dir_path, exist_ok=True)
-    transmissions_df.to_csv(dir_path+'/transmissions.csv')
+    transmissions_df = write_frame(transmissions_df, dir_path+'/transmissions.csv', "transmissions")
+        
+    return transmissions_df
+
+def decode_transmission_log(event_params, log):
+    """
+    Function to decode a NewTransmission log as returned by eth_getLogs
+
+    Args:
+        event_params: The event parameters of the contract
+        log: The Log to decode
+
+    Returns:
+        A dict with the same arguments as the NewTransmission event decoded from a receipt
+    """
+    # the round id is the only indexed parameter, the data holds the rest
+    answer, transmitter, observations, observers, raw_report_context = decode_logs_data(event_params["NewTransmission"]["params"][1:], log.data)
+    return {
+        "aggregatorRoundId": decode_log_topic(event_params["NewTransmission"]["params"][0], log.topics[1]),
+        "answer": answer,
+        "transmitter": transmitter,
+        "observations": observations,
+        "observers": observers,
+        "rawReportContext": raw_report_context
+    }
+
+def get_block_headers(provider_url, block_numbers, headers, batch_size=100):
+    """
+    Function to get the timestamps and base fees of blocks in batches, skipping the ones already fetched
+
+    Args:
+        provider_url: The endpoint of the node to query
+        block_numbers: The blocks to get
+        headers: Dict of already fetched headers by block number, shared between collectors. Updated with the fetched headers
+        batch_size: The number of blocks per request
+
+    Returns:
+        The headers dict
+    """
+    missing = []
+    for block_number in sorted(set(int(num) for num in block_numbers)):
+        metrics.record_cache("blockHeaders", block_number in headers)
+        if block_number not in headers:
+            missing.append(block_number)
+
+    for i in range(0, len(missing), batch_size):
+        chunk = missing[i:i+batch_size]
+        with metrics.stage("blockHeaders"):
+            responses = post_json_rpc_batch(provider_url, [{"jsonrpc": "2.0", "method": "eth_getBlockByNumber", "params": [hex(num), False]} for num in chunk])
+        for block_number, response in zip(chunk, responses):
+            block = response["result"]
+            headers[block_number] = {
+                "timestamp": int(block["timestamp"], 16),
+                # blocks before London have no base fee
+                "baseFeePerGas": int(block["baseFeePerGas"], 16) if block.get("baseFeePerGas") is not None else None
+            }
+
+    return headers
+
+def get_block_receipts(provider_url, block_tx_hashes, batch_size=50, receipts=None):
+    """
+    Function to get the sender and gas of transactions with one eth_getBlockReceipts call per block, sent in batches.
+    Falls back to batched eth_getTransactionReceipt calls for blocks the node does not serve that way
+
+    Args:
+        provider_url: The endpoint of the node to query
+        block_tx_hashes: Dict of the sets of lowercase transaction hashes to keep by block number
+        batch_size: The number of calls per request
+        receipts: Dict of already fetched receipts by lowercase transaction hash, shared between collectors. Updated with the fetched receipts
+
+    Returns:
+        A dict of Receipt with the sender, receiver, gas used and effective gas price by lowercase transaction hash
+    """
+    if receipts is None:
+        receipts = {}
+
+    # only ask for the blocks with transactions that were not fetched yet
+    missing = {}
+    for block_number, tx_hashes in block_tx_hashes.items():
+        for tx_hash in tx_hashes:
+            metrics.record_cache("receipts", tx_hash in receipts)
+        if any(tx_hash not in receipts for tx_hash in tx_hashes):
+            missing[block_number] = tx_hashes
+    block_tx_hashes = missing
+
+    fallback = []
+    block_receipts_supported = True
+    block_numbers = sorted(block_tx_hashes)
+    for i in range(0, len(block_numbers), batch_size):
+        chunk = block_numbers[i:i+batch_size]
+        if not block_receipts_supported:
+            fallback.extend(tx_hash for num in chunk for tx_hash in block_tx_hashes[num])
+            continue
+
+        with metrics.stage("blockReceipts"):
+            responses = post_json_rpc_batch(provider_url, [{"jsonrpc": "2.0", "method": "eth_getBlockReceipts", "params": [hex(num)]} for num in chunk])
+        for block_number, response in zip(chunk, responses):
+            if response.get("result") is None:
+                fallback.extend(block_tx_hashes[block_number])
+                continue
+            for receipt in response["result"]:
+                if receipt["transactionHash"].lower() in block_tx_hashes[block_number]:
+                    receipts[receipt["transactionHash"].lower()] = Receipt.from_json(receipt)
+
+        # stop asking a node that does not have the method
+        if all(response.get("error", {}).get("code") == -32601 for response in responses):
+            block_receipts_supported = False
+
+    for i in range(0, len(fallback), batch_size):
+        chunk = fallback[i:i+batch_size]
+        with metrics.stage("receipts"):
+            responses = post_json_rpc_batch(provider_url, [{"jsonrpc": "2.0", "method": "eth_getTransactionReceipt", "params": [tx_hash]} for tx_hash in chunk])
+        for tx_hash, response in zip(chunk, responses):
+            receipts[tx_hash] = Receipt.from_json(response["result"])
+
+    return receipts
+
+def get_transmitter_sets(provider_url, aggregator_contract_address, event_sigs, event_params):
+    """
+    Function to get the history of a feed's transmitters from its ConfigSet events
+
+    Args:
+        provider_url: The endpoint of the node to query
+        aggregator_contract_address: The address of the aggregator contract
+        event_sigs: The event signatures of the contract
+        event_params: The event parameters of the contract
+
+    Returns:
+        A sorted array of the blocks at which the transmitters were set and an array with the transmitters set at each
+    """
+    configs = get_logs(provider_url, aggregator_contract_address, event_sigs["ConfigSet"], "0x0")
+    return transmitter_sets_from_logs(configs, event_params)
+
+def transmitter_sets_from_logs(configs, event_params):
+    """
+    Function to build the history of a feed's transmitters from ConfigSet logs
+
+    Args:
+        configs: The ConfigSet logs sorted by block
+        event_params: The event parameters of the contract
+
+    Returns:
+        A sorted array of the blocks at which the transmitters were set and an array with the transmitters set at each
+    """
+    blocks = []
+    transmitter_sets = []
+    for config in configs:
+        transmitters = decode_logs_data(event_params["ConfigSet"]["params"], config.data)[3]
+        blocks.append(config.block_number)
+        transmitter_sets.append(list(transmitters))
+
+    return blocks, transmitter_sets
+
+def get_transmitters_from_sets(transmitter_sets, block_number):
+    """
+    Function to get the transmitters at a block from the history of ConfigSet events
+
+    Args:
+        transmitter_sets: The blocks and transmitters from get_transmitter_sets
+        block_number: The block at which to get the transmitters
+
+    Returns:
+        The transmitters at the given block, or None if the block is before the first ConfigSet event
+    """
+    blocks, sets = transmitter_sets
+    index = bisect.bisect_right(blocks, block_number) - 1
+    return sets[index] if index >= 0 else None
+
+def get_transmissions_lean(w3, provider_url, aggregator_contract_address, start_block, event_sigs, event_params, feed_path, nop_details, transmitters, abi_events, contract, headers=None, transmitter_sets=None):
+    """
+    Function to get all the operator's submissions and transmissions from a block like get_transmissions, without
+    fetching a receipt, a block and the transmitters for every transmission. NewTransmission is decoded from the logs,
+    senders and gas come from one eth_getBlockReceipts call per block, timestamps from the AnswerUpdated events or the
+    shared header cache and transmitters from the ConfigSet events. The calls are sent in batches
+
+    Args:
+        w3: web3 Instance
+        provider_url: The endpoint of the node to query
+        aggregator_contract_address: The address of the aggregator contract
+        start_block: The block from which to start getting transmissions
+        event_sigs: The event signatures of the contract
+        event_params: The event parameters of the contract
+        feed_path: The path of the feed
+        nop_details: The details of the node operators
+        transmitters: A array of operators
+        abi_events: Contract's ABI Events 
+        contract: The contract's instance
+        headers: Dict of block headers by block number shared between collectors, see get_block_headers
+        transmitter_sets: The blocks and transmitters from a feed's ConfigIndex. Queried from the ConfigSet events if None
+
+    Returns:
+        A DataFrame with operators' submissions and their deviation from the aggregated value
+    """
+    latest_block_number = None if "ethereum" in feed_path else w3.eth.get_block('latest')['number']
+    def get_feed_logs(topic):
+        if latest_block_number is None:
+            return get_logs(provider_url, aggregator_contract_address, topic, hex(start_block))
+        return get_logs_throttled(provider_url, aggregator_contract_address, topic, start_block, latest_block_number)
+
+    with metrics.stage("transmissions.getLogs"):
+        transmissions = get_feed_logs(event_sigs["NewTransmission"])
+    with metrics.stage("answers.getLogs"):
+        answers = get_feed_logs(event_sigs["AnswerUpdated"])
+    if transmitter_sets is None:
+        transmitter_sets = get_transmitter_sets(provider_url, aggregator_contract_address, event_sigs, event_params)
+
+    return transmissions_from_logs(provider_url, transmissions, answers, transmitter_sets, event_params, feed_path, nop_details, transmitters, contract, headers)
+
+def transmissions_from_logs(provider_url, transmissions, answers, transmitter_sets, event_params, feed_path, nop_details, transmitters, contract, headers=None, receipts=None):
+    """
+    Function to build and save the operators' submissions from NewTransmission logs, see get_transmissions_lean
+
+    Args:
+        provider_url: The endpoint of the node to query
+        transmissions: The NewTransmission logs
+        answers: The AnswerUpdated logs of the same blocks, for the timestamps
+        transmitter_sets: The blocks and transmitters from get_transmitter_sets
+        event_params: The event parameters of the contract
+        feed_path: The path of the feed
+        nop_details: The details of the node operators
+        transmitters: A array of operators
+        contract: The contract's instance
+        headers: Dict of block headers by block number shared between collectors, see get_block_headers
+        receipts: Dict of receipts by transaction hash shared between collectors, see get_block_receipts
+
+    Returns:
+        A DataFrame with operators' submissions and their deviation from the aggregated value
+    """
+    if headers is None:
+        headers = {}
+
+    # every transmission emits AnswerUpdated with the block's timestamp as updatedAt
+    timestamps = {}
+    for answer in answers:
+        timestamps[answer.transaction_hash.lower()] = decode_log_topic(event_params["AnswerUpdated"]["params"][2], answer.data)
+
+    block_tx_hashes = {}
+    for transmission in transmissions:
+        block_tx_hashes.setdefault(transmission.block_number, set()).add(transmission.transaction_hash.lower())
+
+    get_block_headers(provider_url, [transmission.block_number for transmission in transmissions if transmission.transaction_hash.lower() not in timestamps], headers)
+    receipts = get_block_receipts(provider_url, block_tx_hashes, receipts=receipts)
+    initial_transmitters = None
+
+    rows = []
+    for transmission in transmissions:
+        with metrics.stage("transmissions"):
+            block_number = transmission.block_number
+            tx_hash = transmission.transaction_hash.lower()
+            receipt = receipts[tx_hash]
+            tx = {
+                "blockNumber": block_number,
+                "hash": tx_hash,
+                "from": receipt.sender,
+                "to": receipt.to,
+                "gasPriceGwei": float(receipt.effective_gas_price/1000000000),
+                "txfee": receipt.gas_used*receipt.effective_gas_price/1000000000000000000,
+                "timestamp": timestamps[tx_hash] if tx_hash in timestamps else headers[block_number]["timestamp"],
+                "logs": []
+            }
+
+            with metrics.stage("decodeLogs"):
+                transmission_log = decode_transmission_log(event_params, transmission)
+
+            block_transmitters = get_transmitters_from_sets(transmitter_sets, block_number)
+            if block_transmitters is None:
+                # no ConfigSet before this block, so the transmitters did not change up to the first one
+                if initial_transmitters is None:
+                    with metrics.stage("transmitters"):
+                        initial_transmitters = get_transmitters_for_blocknumber(contract, block_number)
+                block_transmitters = initial_transmitters
+
+            rows.append(build_transmission_row(tx, nop_details, contract, transmission_log, block_transmitters))
+        metrics.record_rows("transmissions")
+
+    with metrics.stage("transmissions.concat"):
+        # object columns keep the values as built, like the row by row concat of get_transmissions
+        transmissions_df = pd.concat([pd.DataFrame([],columns=column_builder_transmissions(nop_details, transmitters)), pd.DataFrame(rows, dtype=object)], ignore_index=True)
+
+    transmissions_df["txDate"] = pd.to_datetime(transmissions_df['timestamp'], unit='s').dt.tz_localize('UTC')
+
+    dir_path = "data/"+feed_path
+    os.makedirs(dir_path, exist_ok=True)
+    transmissions_df = write_frame(transmissions_df, dir_path+'/transmissions.csv', "transmissions")
         
     return transmissions_df
 
@@ -510,37 +945,55 @@ def get_new_answers(w3, provider_url, aggregator_contract_address, start_block,
     Returns:
         A DataFrame with CL aggregated prices for each feed for every block
     """
-    answers_df = pd.DataFrame([],columns=["timestamp", "answer"])
-
-    latest_block_number = w3.eth.get_block('latest')['number']
-    new_answers = get_logs_throttled(provider_url, aggregator_contract_address, event_sigs["AnswerUpdated"], start_block, latest_block_number)
+    with metrics.stage("answers.getLogs"):
+        latest_block_number = w3.eth.get_block('latest')['number']
+        new_answers = get_logs_throttled(provider_url, aggregator_contract_address, event_sigs["AnswerUpdated"], start_block, latest_block_number)
     
-    decimals = contract.functions.decimals().call()
+    decimals = get_contract_decimals(contract, feed_path.split("/")[0])
+
+    return answers_from_logs(new_answers, event_params, feed_path, decimals)
+
+def answers_from_logs(new_answers, event_params, feed_path, decimals):
+    """
+    Function to build and save a CL feed's prices from AnswerUpdated logs
+
+    Args:
+        new_answers: The AnswerUpdated logs
+        event_params: The event parameters of the contract
+        feed_path: The path of the feed
+        decimals: The decimals of the feed's answers
+
+    Returns:
+        A DataFrame with CL aggregated prices for each feed for every block
+    """
+    answers_df = pd.DataFrame([],columns=["timestamp", "answer"])
 
     print("got new answers "+str(len(new_answers)))
     for index,answer in enumerate(new_answers):
         # print("Ready", index, len(new_answers))
         
-        value = decode_log_topic(event_params["AnswerUpdated"]["params"][1], answer["topics"][1])
-        timestamp = decode_log_topic(event_params["AnswerUpdated"]["params"][2], answer["data"])
+        value = decode_log_topic(event_params["AnswerUpdated"]["params"][1], answer.topics[1])
+        timestamp = decode_log_topic(event_params["AnswerUpdated"]["params"][2], answer.data)
 
         new_answer = {
             "timestamp": timestamp, 
             "answer": value / 10 ** decimals, 
         }
             
-        answers_df = pd.concat([answers_df, pd.DataFrame([new_answer])], ignore_index=True)
+        with metrics.stage("answers.concat"):
+            answers_df = pd.concat([answers_df, pd.DataFrame([new_answer])], ignore_index=True)
+        metrics.record_rows("answers.concat")
         
     
     answers_df["txDate"] = pd.to_datetime(answers_df['timestamp'], unit='s').dt.tz_localize('UTC')
 
     dir_path = "data/"+feed_path
     os.makedirs(dir_path, exist_ok=True)
-    answers_df.to_csv(dir_path+'/answers.csv')
+    answers_df = write_frame(answers_df, dir_path+'/answers.csv', "answers")
         
     return answers_df
 
-def get_payments(w3, provider_url, aggregator_contract_address, start_block, event_sigs, event_params, feed_path, nop_details, transmitters, abi_events, contract):
+def get_payments(w3, provider_url, aggregator_contract_address, start_block, event_sigs, event_params, feed_path, nop_details, transmitters, abi_events, contract, config_index=None):
     """
     Function to get all the operator's withdrawals from a start block
 
@@ -556,29 +1009,65 @@ def get_payments(w3, provider_url, aggregator_contract_address, start_block, eve
         transmitters: A array of operators
         abi_events: Contract's ABI Events 
         contract: The contract's instance
+        config_index: The feed's ConfigIndex naming the operators, see payments_from_logs
 
     Returns:
         A DataFrame with operators' withdrawals starting from the given block
     """
-    transactions = {}
+    with metrics.stage("payments.getLogs"):
+        payments = get_logs(provider_url, aggregator_contract_address, event_sigs["OraclePaid"], hex(start_block))
+
+    return payments_from_logs(w3, payments, event_params, feed_path, nop_details, abi_events, contract, config_index=config_index)
+
+def payments_from_logs(w3, payments, event_params, feed_path, nop_details, abi_events, contract, transactions=None, headers=None, config_index=None):
+    """
+    Function to build and save the operators' withdrawals from OraclePaid logs
+
+    Args:
+        w3: web3 Instance
+        payments: The OraclePaid logs
+        event_params: The event parameters of the contract
+        feed_path: The path of the feed
+        nop_details: The details of the node operators
+        abi_events: Contract's ABI Events 
+        contract: The contract's instance
+        transactions: Dict of already fetched transactions by hash, shared between collectors. Updated with the fetched transactions
+        headers: Dict of block headers by block number shared between collectors, see get_block_headers
+        config_index: The feed's ConfigIndex. Operators are named after their transmitter or payee at the payment's
+            block if given, from nop_details otherwise
+
+    Returns:
+        A DataFrame with operators' withdrawals
+    """
+    if transactions is None:
+        transactions = {}
     payments_df = pd.DataFrame([],columns=["blockNumber", "txHash", "txTimestamp", "gasPriceGwei", "fee", "submitter", "payeeAddress", "oracleName", "amount"])
-    payments = get_logs(provider_url, aggregator_contract_address, event_sigs["OraclePaid"], hex(start_block))
 
     for index,payment in enumerate(payments):
         print("Ready", index, len(payments))
-        if "ethereum" in feed_path:
-            transmitter, payee, amount = decode_logs_data(event_params["OraclePaid"]["params"], payment["data"])
-        else:
-            amount = decode_log_topic(event_params["OraclePaid"]["params"][2], payment["data"])
-            transmitter = decode_log_topic(event_params["OraclePaid"]["params"][0], payment["topics"][1])
-            payee = decode_log_topic(event_params["OraclePaid"]["params"][1], payment["topics"][2])
+        payment_start = time.perf_counter()
+        with metrics.stage("payments.decode"):
+            if "ethereum" in feed_path:
+                transmitter, payee, amount = decode_logs_data(event_params["OraclePaid"]["params"], payment.data)
+            else:
+                amount = decode_log_topic(event_params["OraclePaid"]["params"][2], payment.data)
+                transmitter = decode_log_topic(event_params["OraclePaid"]["params"][0], payment.topics[1])
+                payee = decode_log_topic(event_params["OraclePaid"]["params"][1], payment.topics[2])
 
-        if payment["transactionHash"] in transactions:
-            tx = transactions[payment["transactionHash"]]
+        if payment.transaction_hash in transactions:
+            metrics.record_cache("transactions", True)
+            tx = transactions[payment.transaction_hash]
         else:
-            tx = get_transaction_details(w3, abi_events, payment["transactionHash"], False, contract)
-            block = w3.eth.get_block(tx["blockNumber"])
-            timestamp = block['timestamp']
+            metrics.record_cache("transactions", False)
+            tx = get_transaction_details(w3, abi_events, payment.transaction_hash, False, contract)
+            if headers is not None and tx["blockNumber"] in headers:
+                timestamp = headers[tx["blockNumber"]]["timestamp"]
+            else:
+                with metrics.stage("blocks"):
+                    block = w3.eth.get_block(tx["blockNumber"])
+                timestamp = block['timestamp']
+                if headers is not None:
+                    headers[tx["blockNumber"]] = {"timestamp": timestamp, "baseFeePerGas": block.get("baseFeePerGas")}
             tx["timestamp"] = timestamp
             transactions[tx["hash"]] = tx
             
@@ -590,20 +1079,44 @@ def get_payments(w3, provider_url, aggregator_contract_address, start_block, eve
                 "fee": tx["txfee"], 
                 "submitter": tx["from"].lower(), 
                 "payeeAddress": payee.lower(),
-                "oracleName": nop_details[transmitter.lower()]["name"],
+                "oracleName": nop_details[transmitter.lower()]["name"] if config_index is None else config_index.operator_name(transmitter, payment.block_number),
                 "amount": amount / 1000000000000000000
             }
             
-        payments_df = pd.concat([payments_df, pd.DataFrame([new_payment])], ignore_index=True)
+        with metrics.stage("payments.concat"):
+            payments_df = pd.concat([payments_df, pd.DataFrame([new_payment])], ignore_index=True)
+        metrics.record_stage("payments", time.perf_counter() - payment_start)
+        metrics.record_rows("payments")
         
     payments_df["txDate"] = pd.to_datetime(payments_df['txTimestamp'], unit='s').dt.tz_localize('UTC')
 
     dir_path = "data/"+feed_path
     os.makedirs(dir_path, exist_ok=True)
-    payments_df.to_csv(dir_path+'/payments.csv')
+    payments_df = write_frame(payments_df, dir_path+'/payments.csv', "payments")
         
     return payments_df
 
+def save_per_op_data(transmissions, payments, transmitters, nop_details, feed_path):
+    """
+    Function to split submissions and withdrawals by operator into the per_op directory
+
+    Args:
+        transmissions: DataFrame of submissions and transmissions
+        payments: DataFrame of payments
+        transmitters: An array of transmitters
+        nop_details: The details of node operators
+        feed_path: The path of the feed
+    """
+    for transmitter in transmitters:
+        transmitter_name = nop_details[transmitter.lower()]["name"]
+        mask = transmissions.filter(like=transmitter_name+'_answer').ne(0).any(axis=1)
+        op_submissions = transmissions.loc[mask]
+        dir_path = "data/"+feed_path+"/per_op/"+transmitter_name
+        op_payments = payments[payments["oracleName"]==transmitter_name]
+        os.makedirs(dir_path, exist_ok=True)
+        write_frame(op_submissions, dir_path+"/submissions.csv", "transmissions")
+        write_frame(op_payments, dir_path+"/payments.csv", "payments")
+
 def get_transmitters_for_block(w3_archive, aggregator_contract_address, aggregator_abi, block_numbers):
     """
     Function to get the operators for a feed at particular blocks
@@ -618,6 +1131,8 @@ def get_transmitters_for_block(w3_archive, aggregator_contract_address, aggregat
     Returns:
         A dict of the transmitters at every block starting fr
     """
+    from eth_utils import to_checksum_address
+
     price_address = to_checksum_address(aggregator_contract_address)
     price_contract_archive = w3_archive.eth.contract(address=aggregator_contract_address, abi=aggregator_abi)
     
@@ -625,7 +1140,8 @@ def get_transmitters_for_block(w3_archive, aggregator_contract_address, aggregat
     
     # for each block number
     for index, num in enumerate(block_numbers):
-        transmitters[str(num)] = price_contract_archive.functions.transmitters().call(block_identifier=int(num))
+        with metrics.stage("transmitters"):
+            transmitters[str(num)] = price_contract_archive.functions.transmitters().call(block_identifier=int(num))
         print("Got transmitters "+str(index)+"/"+str(len(block_numbers)))
 
     dir_path = "data/"+feed_path
@@ -664,16 +1180,20 @@ def get_prices_for_blocknumbers(w3_archive, aggregator_contract_address, aggrega
     Returns:
         A dict of prices for each block number
     """
+    from eth_utils import to_checksum_address
+
     price_address = to_checksum_address(aggregator_contract_address)
     price_contract_archive = w3_archive.eth.contract(address=aggregator_contract_address, abi=aggregator_abi)
-    decimals = price_contract_archive.functions.decimals().call()
+    decimals = get_contract_decimals(price_contract_archive, feed_path.split("/")[0])
     
     prices = {}
     
     # for each block number
     for index, num in enumerate(block_numbers):
         try:
-            prices[str(num)] = price_contract_archive.functions.latestAnswer().call(block_identifier=int(num)) / (10 ** decimals)
+            with metrics.stage("prices"):
+                prices[str(num)] = price_contract_archive.functions.latestAnswer().call(block_identifier=int(num)) / (10 ** decimals)
+            metrics.record_rows("prices")
             print("Got price "+str(index)+"/"+str(len(block_numbers)))
         except:
             print("Failed to get price for "+feed+" for block "+str(+num))
@@ -745,6 +1265,37 @@ def get_billing_ranges(billing_params):
 
     return ranges
 
+def transmission_repayments_eth(gas_prices, gas_costs, billing):
+    """
+    Function to get the reimbursement of each transmission: the gas paid up to maximumGasPrice plus half of the
+    savings below reasonableGasPrice
+
+    Args:
+        gas_prices: The gas price paid by each transmission in gwei
+        gas_costs: The gas used by each transmission
+        billing: The billing parameters, as numbers or as arrays with a value per transmission
+
+    Returns:
+        An array with the reimbursement of each transmission in ETH
+    """
+    repayments_eth = (np.minimum(gas_prices, billing["maximumGasPrice"]) / 1000000000.0) * gas_costs
+    savings = (np.maximum(billing["reasonableGasPrice"] - gas_prices, 0) / 1000000000.0) * gas_costs
+    return repayments_eth + savings/2.0
+
+def transmission_repayments_link(gas_prices, gas_costs, billing):
+    """
+    Function to get the reimbursement of each transmission in LINK
+
+    Args:
+        gas_prices: The gas price paid by each transmission in gwei
+        gas_costs: The gas used by each transmission
+        billing: The billing parameters, as numbers or as arrays with a value per transmission
+
+    Returns:
+        An array with the reimbursement of each transmission in LINK
+    """
+    return transmission_repayments_eth(gas_prices, gas_costs, billing) * billing["microLinkPerEth"] / 1000000.0
+
 def get_transmission_repayments(submissions, billing_params):
     """
     Function to get repayments for transmissions for a list of submissions
@@ -756,21 +1307,9 @@ def get_transmission_repayments(submissions, billing_params):
     Returns:
         The repayment for submissions
     """
-
-    repayments_eth = 0
-    for index, row in submissions.iterrows():
-        price_paid = row['gasPriceGwei']
-        # if paid more than max price in eth gwei units
-        if price_paid > billing_params["maximumGasPrice"]:
-            repayments_eth += (billing_params["maximumGasPrice"] / 1000000000.0) * row["gasCost"]
-        else:
-            repayments_eth += (price_paid/1000000000.0) * row["gasCost"]
-
-        # if price paid is less than reasonable, give half savings
-        if price_paid < billing_params["reasonableGasPrice"]:
-            savings = ((billing_params["reasonableGasPrice"] - price_paid) / 1000000000.0) * row["gasCost"]
-            repayments_eth += savings/2.0
-
+    gas_prices = submissions["gasPriceGwei"].to_numpy(dtype=np.float64)
+    gas_costs = submissions["gasCost"].to_numpy(dtype=np.float64)
+    repayments_eth = float(transmission_repayments_eth(gas_prices, gas_costs, billing_params).sum())
     return repayments_eth * billing_params["microLinkPerEth"] / 1000000.0
 
 def count_consecutive_missed(df, column_name):
@@ -818,7 +1357,63 @@ def count_consecutive_missed(df, column_name):
 
     return missed, separate_missed_instances, separate_consecutive_missed_instances
 
-def calculate_estimated_earnings(nop_details, billing_params, index_withdrawal_dates, feed_details, withdrawal_range, withdrawal_block):
+def estimate_operator_earnings(nop, nop_details, billing_params_range, link_price, index_withdrawal_dates, feed_details, withdrawal_range, submissions_cache=None):
+    """
+    Function to estimate the earnings of one operator in a withdrawal range
+
+    Args:
+        nop: The transmitter address of the operator
+        nop_details: The details of node operators
+        billing_params_range: The billing params at the withdrawal block
+        link_price: The LINK price at the withdrawal block
+        index_withdrawal_dates: The index of the withdrawal. If it is the first withdrawal, this would be 0
+        feed_details: The details of the feed
+        withdrawal_range: The withdrawal range with the start and end dates of the submissions in that range
+        submissions_cache: Dict of the operators' submissions by file name, kept between ranges. Read every time if None
+
+    Returns:
+        A dict with the counts and estimated earnings of the operator, or None if the operator has no submissions file
+    """
+    submissions_filename = "data/"+feed_details["path"]+"/per_op/"+nop_details[nop]["name"]+"/submissions.csv"
+    if not os.path.exists(submissions_filename):
+        return None
+    if submissions_cache is None:
+        submissions = read_frame(submissions_filename, "transmissions")
+    else:
+        if submissions_filename not in submissions_cache:
+            submissions_cache[submissions_filename] = read_frame(submissions_filename, "transmissions")
+        submissions = submissions_cache[submissions_filename]
+
+    # trim submissions to given range
+    withdrawal_date_from = withdrawal_range["from"]
+    withdrawal_date_to = withdrawal_range["to"]
+
+    # if first withdrawal index
+    submissions = submissions[submissions["txDate"] < withdrawal_date_to] if index_withdrawal_dates == 0 else submissions[(submissions["txDate"] < withdrawal_date_to) & (submissions["txDate"] >= withdrawal_date_from)]
+
+    # calculate gas cost from price 
+    submissions["gasCost"] = submissions["fee"] / (submissions["gasPriceGwei"]/1000000000)
+    
+    observations_count = len(submissions)
+    transmissions_in_range = submissions[submissions["submitter"] == nop]
+    transmissions_count = len(transmissions_in_range)
+    # get transmission repayments in link
+    repayments_link = get_transmission_repayments(transmissions_in_range, billing_params_range)
+    repayments_usd = repayments_link * link_price
+    # calculate observation earnings for billing range. Divide by 1000000000 to get amount in link
+    estimated_observations_earnings = observations_count * (billing_params_range["linkGweiPerObservation"] / 1000000000.0) * link_price
+    estimated_transmissions_earnings = transmissions_count * (billing_params_range["linkGweiPerTransmission"] / 1000000000.0) * link_price
+
+    return {
+        "observationsCounts": observations_count,
+        "transmissionsCounts": transmissions_count,
+        "estimatedObservationsEarnings": estimated_observations_earnings,
+        "estimatedTransmissionsEarnings": estimated_transmissions_earnings,
+        "estimatedTransmissionsRepayments": repayments_usd,
+        "estimatedTotalEarnings": estimated_observations_earnings + estimated_transmissions_earnings + repayments_usd
+    }
+
+def calculate_estimated_earnings(nop_details, billing_params, index_withdrawal_dates, feed_details, withdrawal_range, withdrawal_block, executor=None):
     """
     Function to calculate consecutive missed observations
 
@@ -829,22 +1424,16 @@ def calculate_estimated_earnings(nop_details, billing_params, index_withdrawal_d
         feed_details: The details of the feed
         withdrawal_range: The withdrawal range with the start and end dates of the submissions in that range
         withdrawal_block: The block of the withdrawal
+        executor: A process pool started with _init_totals_worker to estimate the operators in parallel. Serial if None
 
     Returns:
         A dict with estimated earnings for each operator
     """
-    billing_ranges = get_billing_ranges(billing_params)
-
     # read link prices
     linkprices_filename = "data/"+feed_details["path"]+"/prices/link-usd.json"
     with open(linkprices_filename, "r") as file:
         link_prices = json.load(file)
 
-    # read eth prices
-    ethprices_filename = "data/"+feed_details["path"]+"/prices/eth-usd.json"
-    with open(ethprices_filename, "r") as file:
-        eth_prices = json.load(file)
-
     estimated_earnings = {
         "observationsCounts": {},
         "transmissionsCounts": {},
@@ -854,48 +1443,236 @@ def calculate_estimated_earnings(nop_details, billing_params, index_withdrawal_d
         "estimatedTotalEarnings": {}
     }
 
-    for nop in nop_details:
-        observations_count = 0
-        transmissions_count = 0
-        estimated_observations_earnings = 0
-        estimated_transmissions_earnings = 0
-        submissions_filename = "data/"+feed_details["path"]+"/per_op/"+nop_details[nop]["name"]+"/submissions.csv"
-        if os.path.exists(submissions_filename):
-            submissions = pd.read_csv(submissions_filename)
+    # get billing params at withdrawal block
+    billing_params_range = get_block_billing(withdrawal_block, billing_params)
+    operator_args = [(nop, nop_details, billing_params_range, link_prices[withdrawal_block], index_withdrawal_dates, feed_details, withdrawal_range) for nop in nop_details]
+    if executor is None:
+        results = [estimate_operator_earnings(*args) for args in operator_args]
+    else:
+        # map keeps the order of the operators, so the merge does not depend on which worker finishes first
+        results = list(executor.map(_run_operator_earnings, operator_args))
+
+    for nop, result in zip(nop_details, results):
+        if result is None:
+            continue
+        for key in result:
+            estimated_earnings[key][nop_details[nop]["name"]] = result[key]
+        
+    return estimated_earnings
+
+def get_unique_withdrawal_dates(payments):
+    """
+    Function to get the dates on which every operator was paid together
 
-            # trim submissions to given range
-            withdrawal_date_from = withdrawal_range["from"]
-            withdrawal_date_to = withdrawal_range["to"]
+    Args:
+        payments: DataFrame of payments
 
-            # if first withdrawal index
-            submissions = submissions[submissions["txDate"] < withdrawal_date_to] if index_withdrawal_dates == 0 else submissions[(submissions["txDate"] < withdrawal_date_to) & (submissions["txDate"] >= withdrawal_date_from)]
+    Returns:
+        A sorted array of withdrawal dates
+    """
+    operators_paid = payments.groupby("txDate")["oracleName"].nunique()
+    return sorted(operators_paid[operators_paid == payments["oracleName"].nunique()].index)
 
-            # get billing params at withdrawal block
-            billing_params_range = get_block_billing(withdrawal_block, billing_params)
+def finalize_range_total(total):
+    """
+    Function to sort a range's totals by value and derive its profits and differences from the estimated earnings
 
-            # calculate gas cost from price 
-            submissions["gasCost"] = submissions["fee"] / (submissions["gasPriceGwei"]/1000000000)
-            
-            observations_count = len(submissions)
-            transmissions_in_range = submissions[submissions["submitter"] == nop]
-            transmissions_count = len(transmissions_in_range)
-            # get transmission repayments in link
-            repayments_link = get_transmission_repayments(transmissions_in_range, billing_params_range)
-            repayments_usd = repayments_link * link_prices[withdrawal_block]
-            # calculate observation earnings for billing range. Divide by 1000000000 to get amount in link
-            estimated_observations_earnings = observations_count * (billing_params_range["linkGweiPerObservation"] / 1000000000.0) * link_prices[withdrawal_block]
-            estimated_transmissions_earnings = transmissions_count * (billing_params_range["linkGweiPerTransmission"] / 1000000000.0) * link_prices[withdrawal_block]
-
-            estimated_earnings["observationsCounts"][nop_details[nop]["name"]] = observations_count
-            estimated_earnings["transmissionsCounts"][nop_details[nop]["name"]] = transmissions_count
-            estimated_earnings["estimatedObservationsEarnings"][nop_details[nop]["name"]] = estimated_observations_earnings
-            estimated_earnings["estimatedTransmissionsEarnings"][nop_details[nop]["name"]] = estimated_transmissions_earnings
-            estimated_earnings["estimatedTransmissionsRepayments"][nop_details[nop]["name"]] = repayments_usd
-            estimated_earnings["estimatedTotalEarnings"][nop_details[nop]["name"]] = estimated_observations_earnings + estimated_transmissions_earnings + repayments_usd
+    Args:
+        total: The totals of a withdrawal range for each operator, as built by get_totals. Updated in place
+
+    Returns:
+        The updated totals
+    """
+    total["deviations"] = dict(sorted(total["deviations"].items(), key=lambda item: item[1], reverse=True))
+    total["maxDeviation"] = dict(sorted(total["maxDeviation"].items(), key=lambda item: item[1], reverse=True))
+    total["fees"] = dict(sorted(total["fees"].items(), key=lambda item: item[1], reverse=True))
+    total["payments"] = dict(sorted(total["payments"].items(), key=lambda item: item[1], reverse=True))
+    total["profits"] = {key: total["payments"][key] - total["fees"][key] for key in total["payments"]}
+    total["profits"] = dict(sorted(total["profits"].items(), key=lambda item: item[1], reverse=True))
+    total["observationsCounts"] = dict(sorted(total["observationsCounts"].items(), key=lambda item: item[1], reverse=True))
+    total["missedObservations"] = dict(sorted(total["missedObservations"].items(), key=lambda item: item[1], reverse=True))
+    total["consecutiveMissedObservations"] = dict(sorted(total["consecutiveMissedObservations"].items(), key=lambda item: item[1], reverse=True))
+    total["maxConsecutiveMissedObservations"] = dict(sorted(total["maxConsecutiveMissedObservations"].items(), key=lambda item: item[1], reverse=True))
+    total["separateMissedObservationsInstances"] = dict(sorted(total["separateMissedObservationsInstances"].items(), key=lambda item: item[1], reverse=True))
+    total["separateConsecutiveMissedObservationsInstances"] = dict(sorted(total["missedObservations"].items(), key=lambda item: item[1], reverse=True))
+    total["transmissionsCounts"] = dict(sorted(total["transmissionsCounts"].items(), key=lambda item: item[1], reverse=True))
+    total["estimatedObservationsEarnings"] = dict(sorted(total["estimatedObservationsEarnings"].items(), key=lambda item: item[1], reverse=True))
+    total["estimatedTransmissionsEarnings"] = dict(sorted(total["estimatedTransmissionsEarnings"].items(), key=lambda item: item[1], reverse=True))
+    total["estimatedTransmissionsRepayments"] = dict(sorted(total["estimatedTransmissionsRepayments"].items(), key=lambda item: item[1], reverse=True))
+    total["estimatedTotalEarnings"] = dict(sorted(total["estimatedTotalEarnings"].items(), key=lambda item: item[1], reverse=True))
+    total["diffFromCalc"] = {key: total["estimatedTotalEarnings"][key] - total["payments"][key] for key in total["payments"]}
+    total["diffFromCalc"] = dict(sorted(total["diffFromCalc"].items(), key=lambda item: item[1], reverse=True))
+    total["diffFromCalcPerTransmission"] = {key: total["diffFromCalc"][key] / float(total["transmissionsCounts"][key]) for key in total["diffFromCalc"]}
+    total["diffFromCalcPerTransmission"] = dict(sorted(total["diffFromCalcPerTransmission"].items(), key=lambda item: item[1], reverse=True))
+    total["diffFromCalcPerObs"] = {key: total["diffFromCalc"][key] / float(total["observationsCounts"][key]) for key in total["diffFromCalc"]}
+    total["diffFromCalcPerObs"] = dict(sorted(total["diffFromCalcPerObs"].items(), key=lambda item: item[1], reverse=True))
+
+    return total
+
+def share_frame(frame, dir_path):
+    """
+    Function to write a DataFrame's columns to .npy files so that worker processes can map them instead of unpickling the frame
+
+    Args:
+        frame: The DataFrame to share
+        dir_path: The directory to write the columns to
+
+    Returns:
+        The directory the columns were written to
+    """
+    os.makedirs(dir_path, exist_ok=True)
+    columns = []
+    for position, column in enumerate(frame.columns):
+        values = frame[column]
+        filename = dir_path+"/"+str(position)
+        if pd.api.types.is_numeric_dtype(values.dtype) and not isinstance(values.dtype, pd.api.extensions.ExtensionDtype):
+            np.save(filename+".npy", values.to_numpy())
+            columns.append({"name": column, "kind": "numeric"})
+        elif pd.api.types.is_string_dtype(values.dtype) and values.map(lambda value: isinstance(value, str) or pd.isna(value)).all():
+            # fixed width unicode can be mapped, the mask keeps the missing values
+            missing = values.isna().to_numpy()
+            np.save(filename+".npy", values.fillna("").to_numpy(dtype=str))
+            np.save(filename+"_missing.npy", missing)
+            columns.append({"name": column, "kind": "string", "dtype": str(values.dtype)})
+        else:
+            values.to_pickle(filename+".pkl")
+            columns.append({"name": column, "kind": "pickle"})
+    frame.index.to_series().to_pickle(dir_path+"/index.pkl")
+    with open(dir_path+"/columns.json", "w") as outfile:
+        json.dump(columns, outfile)
+    return dir_path
+
+def load_shared_frame(dir_path):
+    """
+    Function to load a DataFrame written by share_frame, mapping its numeric columns from disk
+
+    Args:
+        dir_path: The directory the columns were written to
+
+    Returns:
+        The DataFrame
+    """
+    with open(dir_path+"/columns.json", "r") as file:
+        columns = json.load(file)
+    index = pd.Index(pd.read_pickle(dir_path+"/index.pkl"))
+    data = {}
+    for position, column in enumerate(columns):
+        filename = dir_path+"/"+str(position)
+        if column["kind"] == "numeric":
+            data[column["name"]] = pd.Series(np.load(filename+".npy", mmap_mode="r"), index=index, copy=False)
+        elif column["kind"] == "string":
+            values = np.load(filename+".npy", mmap_mode="r").astype(object)
+            values[np.load(filename+"_missing.npy")] = np.nan
+            data[column["name"]] = pd.Series(values, index=index, dtype=column["dtype"])
+        else:
+            data[column["name"]] = pd.read_pickle(filename+".pkl")
+    return pd.DataFrame(data, index=index, copy=False)
+
+def get_range_total(index, unique_withdrawal_dates, payments, transmissions, transmitters, nop_details, feed_details, executor=None):
+    """
+    Function to calculate the totals of each operator in a withdrawal range
+
+    Args:
+        index: The index of the withdrawal. If it is the first withdrawal, this would be 0
+        unique_withdrawal_dates: Array of withdrawal dates
+        payments: DataFrame of payments
+        transmissions: DataFrame of submissions and transmissions
+        transmitters: An array of transmitters
+        nop_details: The details of node operators
+        feed_details: The details of the feed
+        executor: A process pool started with _init_totals_worker to estimate the operators in parallel. Serial if None
+
+    Returns:
+        The range with its from and to dates, and a dict with totals for each operator in that range
+    """
+    withdrawal_date = unique_withdrawal_dates[index]
+    total = {
+        "deviations": {},
+        "maxDeviation": {},
+        "fees": {},
+        "payments": {},
+        "profits": {},
+        "observationsCounts": {},
+        "missedObservations": {},
+        "transmissionsCounts": {},
+        "estimatedObservationsEarnings": {},
+        "estimatedTransmissionsEarnings": {},
+        "estimatedTotalEarnings": {},
+        "consecutiveMissedObservations": {},
+        "maxConsecutiveMissedObservations": {},
+        "separateMissedObservationsInstances": {},
+        "separateConsecutiveMissedObservationsInstances": {},
+    }
+    if index == 0:
+        submission_df = transmissions[transmissions["txDate"] < withdrawal_date]
+        withdrawal_df = payments[payments["txDate"] <= withdrawal_date]
+        range_total = {
+            "from": date_text(withdrawal_df.iloc[0]["txDate"]),
+            "to": date_text(withdrawal_date)
+        }
+    else:
+        submission_df = transmissions[(transmissions["txDate"] < withdrawal_date) & (transmissions["txDate"] >= unique_withdrawal_dates[index-1])]
+        withdrawal_df = payments[(payments["txDate"] <= withdrawal_date) & (payments["txDate"] > unique_withdrawal_dates[index-1])]
+        range_total = {
+            "from": date_text(unique_withdrawal_dates[index-1]),
+            "to": date_text(withdrawal_date)
+        }
+
+    # get withdrawal block from withdrawal date
+    withdrawal_block = payments[payments["txDate"]==withdrawal_date].iloc[0]["blockNumber"]
+
+    #group withdrawal_df by receiver
+    withdrawal_df_totals = withdrawal_df.groupby("oracleName")["usdAmount"].sum()
+
+    for transmitter in transmitters:
+        transmitter_name = nop_details[transmitter.lower()]["name"]
         
-    return estimated_earnings
+        # change with actual prices
+        submission_df[transmitter_name+"_fees"] = submission_df["ethPrice"] * submission_df[transmitter_name+"_fees"]
+        
+        total["deviations"][transmitter_name] = submission_df[transmitter_name+"_deviation"].mean()
+        total["maxDeviation"][transmitter_name] = submission_df[transmitter_name+"_deviation"].max()
+        total["fees"][transmitter_name] = submission_df[transmitter_name+"_fees"].sum()
+        total["payments"][transmitter_name] = withdrawal_df_totals[transmitter_name] if transmitter_name in withdrawal_df_totals.index.unique() else 0
+        total["missedObservations"][transmitter_name] = len(submission_df[submission_df[transmitter_name+"_answer"]==0])
+        total["consecutiveMissedObservations"][transmitter_name] = len(submission_df[submission_df[transmitter_name+"_consecutiveMissed"]!=0])
+        total["maxConsecutiveMissedObservations"][transmitter_name] = submission_df[transmitter_name+"_consecutiveMissed"].max()
+        total["separateMissedObservationsInstances"][transmitter_name] = len(submission_df[submission_df[transmitter_name+"_separateMissed"]!=0])
+        total["separateConsecutiveMissedObservationsInstances"][transmitter_name] = len(submission_df[submission_df[transmitter_name+"_separateConsecutiveMissed"]!=0])
+
+    # Read billings
+    billing_params_filename = "data/"+feed_details["path"]+"/billing_params.json"
+    with open(billing_params_filename, 'r') as file:
+        billing_params = json.load(file)
+    # get estimated earnings per nop
+    with metrics.stage("totals.estimatedEarnings"):
+        estimated_earnings = calculate_estimated_earnings(nop_details, billing_params, index, feed_details, range_total, withdrawal_block, executor)
+    metrics.record_rows("totals.estimatedEarnings")
+    for key in estimated_earnings:
+        total[key] = estimated_earnings[key]
+    
+    finalize_range_total(total)
+    return range_total, total
+
+_worker_state = {}
+
+def _init_totals_worker(shared_dir, transmitters, nop_details, feed_details):
+    # the frames are mapped from the shared directory, so only their paths are pickled
+    _worker_state["transmissions"] = load_shared_frame(shared_dir+"/transmissions") if os.path.exists(shared_dir+"/transmissions") else None
+    _worker_state["payments"] = load_shared_frame(shared_dir+"/payments") if os.path.exists(shared_dir+"/payments") else None
+    _worker_state["transmitters"] = transmitters
+    _worker_state["nop_details"] = nop_details
+    _worker_state["feed_details"] = feed_details
+    _worker_state["submissions"] = {}
+
+def _run_totals_range(args):
+    index, unique_withdrawal_dates = args
+    return get_range_total(index, unique_withdrawal_dates, _worker_state["payments"], _worker_state["transmissions"], _worker_state["transmitters"], _worker_state["nop_details"], _worker_state["feed_details"])
+
+def _run_operator_earnings(args):
+    return estimate_operator_earnings(*args, submissions_cache=_worker_state["submissions"])
 
-def get_totals(unique_withdrawal_dates, payments, transmissions, transmitters, nop_details, feed_details):
+def get_totals(unique_withdrawal_dates, payments, transmissions, transmitters, nop_details, feed_details, processes=1, shard="range"):
     """
     Function to calculate consecutive missed observations
 
@@ -906,119 +1683,42 @@ def get_totals(unique_withdrawal_dates, payments, transmissions, transmitters, n
         transmitters: An array of transmitters
         nop_details: The details of node operators
         feed_details: The details of the feed
+        processes: The number of worker processes. None uses the number of cores. 1 runs in this process
+        shard: "range" to give each worker whole withdrawal ranges, or "operator" to estimate the operators of each range in parallel
 
     Returns:
         A dict with totals for each operator. Includes profits and observation misses
     """
-    submission_dfs = []
+    if shard not in ("range", "operator"):
+        raise ValueError("Unknown shard "+str(shard)+". Use range or operator")
+    processes = processes or os.cpu_count()
+
     totals = {
         "ranges": [],
         "totals": []
     }
-    for index,withdrawal_date in enumerate(unique_withdrawal_dates):
-        total = {
-            "deviations": {},
-            "maxDeviation": {},
-            "fees": {},
-            "payments": {},
-            "profits": {},
-            "observationsCounts": {},
-            "missedObservations": {},
-            "transmissionsCounts": {},
-            "estimatedObservationsEarnings": {},
-            "estimatedTransmissionsEarnings": {},
-            "estimatedTotalEarnings": {},
-            "consecutiveMissedObservations": {},
-            "maxConsecutiveMissedObservations": {},
-            "separateMissedObservationsInstances": {},
-            "separateConsecutiveMissedObservationsInstances": {},
-        }
-        if index == 0:
-            submission_df = transmissions[transmissions["txDate"] < withdrawal_date]
-            withdrawal_df = payments[payments["txDate"] <= withdrawal_date]
-            range_total = {
-                "from": withdrawal_df.iloc[0]["txDate"],
-                "to": withdrawal_date
-            }
-        else:
-            submission_df = transmissions[(transmissions["txDate"] < withdrawal_date) & (transmissions["txDate"] >= unique_withdrawal_dates[index-1])]
-            withdrawal_df = payments[(payments["txDate"] <= withdrawal_date) & (payments["txDate"] > unique_withdrawal_dates[index-1])]
-            range_total = {
-                "from": unique_withdrawal_dates[index-1],
-                "to": withdrawal_date
-            }
-
-        # get withdrawal block from withdrawal date
-        withdrawal_block = payments[payments["txDate"]==withdrawal_date].iloc[0]["blockNumber"]
-            
-        if len(submission_df) > 0:
-            submission_dfs.append(submission_df)
-            
-        #group withdrawal_df by receiver
-        withdrawal_df_totals = withdrawal_df.groupby("oracleName")["usdAmount"].sum()
-
-        # read link prices
-        linkprices_filename = "data/"+feed_details["path"]+"/prices/link-usd.json"
-        with open(linkprices_filename, "r") as file:
-            link_prices = json.load(file)
-
-
-        for transmitter in transmitters:
-            transmitter_name = nop_details[transmitter.lower()]["name"]
-            
-            # change with actual prices
-            submission_df[transmitter_name+"_fees"] = submission_df["ethPrice"] * submission_df[transmitter_name+"_fees"]
-            
-            total["deviations"][transmitter_name] = submission_df[transmitter_name+"_deviation"].mean()
-            total["maxDeviation"][transmitter_name] = submission_df[transmitter_name+"_deviation"].max()
-            total["fees"][transmitter_name] = submission_df[transmitter_name+"_fees"].sum()
-            total["payments"][transmitter_name] = withdrawal_df_totals[transmitter_name] if transmitter_name in withdrawal_df_totals.index.unique() else 0
-            total["missedObservations"][transmitter_name] = len(submission_df[submission_df[transmitter_name+"_answer"]==0])
-            total["consecutiveMissedObservations"][transmitter_name] = len(submission_df[submission_df[transmitter_name+"_consecutiveMissed"]!=0])
-            total["maxConsecutiveMissedObservations"][transmitter_name] = submission_df[transmitter_name+"_consecutiveMissed"].max()
-            total["separateMissedObservationsInstances"][transmitter_name] = len(submission_df[submission_df[transmitter_name+"_separateMissed"]!=0])
-            total["separateConsecutiveMissedObservationsInstances"][transmitter_name] = len(submission_df[submission_df[transmitter_name+"_separateConsecutiveMissed"]!=0])
-
-        # Read billings
-        billing_params_filename = "data/"+feed_details["path"]+"/billing_params.json"
-        with open(billing_params_filename, 'r') as file:
-            billing_params = json.load(file)
-        # get estimated earnings per nop
-        estimated_earnings = calculate_estimated_earnings(nop_details, billing_params, index, feed_details, range_total, withdrawal_block)
-        # estimated_earnings = calculate_estimated_earnings2(nop_details, billing_params, unique_withdrawal_dates, index, feed_details)
-        for key in estimated_earnings:
-            total[key] = estimated_earnings[key]
-        
-        total["deviations"] = dict(sorted(total["deviations"].items(), key=lambda item: item[1], reverse=True))
-        total["maxDeviation"] = dict(sorted(total["maxDeviation"].items(), key=lambda item: item[1], reverse=True))
-        total["fees"] = dict(sorted(total["fees"].items(), key=lambda item: item[1], reverse=True))
-        total["payments"] = dict(sorted(total["payments"].items(), key=lambda item: item[1], reverse=True))
-        total["profits"] = {key: total["payments"][key] - total["fees"][key] for key in total["payments"]}
-        total["profits"] = dict(sorted(total["profits"].items(), key=lambda item: item[1], reverse=True))
-        total["observationsCounts"] = dict(sorted(total["observationsCounts"].items(), key=lambda item: item[1], reverse=True))
-        total["missedObservations"] = dict(sorted(total["missedObservations"].items(), key=lambda item: item[1], reverse=True))
-        total["consecutiveMissedObservations"] = dict(sorted(total["consecutiveMissedObservations"].items(), key=lambda item: item[1], reverse=True))
-        total["maxConsecutiveMissedObservations"] = dict(sorted(total["maxConsecutiveMissedObservations"].items(), key=lambda item: item[1], reverse=True))
-        total["separateMissedObservationsInstances"] = dict(sorted(total["separateMissedObservationsInstances"].items(), key=lambda item: item[1], reverse=True))
-        total["separateConsecutiveMissedObservationsInstances"] = dict(sorted(total["missedObservations"].items(), key=lambda item: item[1], reverse=True))
-        total["transmissionsCounts"] = dict(sorted(total["transmissionsCounts"].items(), key=lambda item: item[1], reverse=True))
-        total["estimatedObservationsEarnings"] = dict(sorted(total["estimatedObservationsEarnings"].items(), key=lambda item: item[1], reverse=True))
-        total["estimatedTransmissionsEarnings"] = dict(sorted(total["estimatedTransmissionsEarnings"].items(), key=lambda item: item[1], reverse=True))
-        total["estimatedTransmissionsRepayments"] = dict(sorted(total["estimatedTransmissionsRepayments"].items(), key=lambda item: item[1], reverse=True))
-        total["estimatedTotalEarnings"] = dict(sorted(total["estimatedTotalEarnings"].items(), key=lambda item: item[1], reverse=True))
-        total["diffFromCalc"] = {key: total["estimatedTotalEarnings"][key] - total["payments"][key] for key in total["payments"]}
-        total["diffFromCalc"] = dict(sorted(total["diffFromCalc"].items(), key=lambda item: item[1], reverse=True))
-        total["diffFromCalcPerTransmission"] = {key: total["diffFromCalc"][key] / float(total["transmissionsCounts"][key]) for key in total["diffFromCalc"]}
-        total["diffFromCalcPerTransmission"] = dict(sorted(total["diffFromCalcPerTransmission"].items(), key=lambda item: item[1], reverse=True))
-        total["diffFromCalcPerObs"] = {key: total["diffFromCalc"][key] / float(total["observationsCounts"][key]) for key in total["diffFromCalc"]}
-        total["diffFromCalcPerObs"] = dict(sorted(total["diffFromCalcPerObs"].items(), key=lambda item: item[1], reverse=True))
+    if processes == 1 or len(unique_withdrawal_dates) == 0:
+        range_totals = [get_range_total(index, unique_withdrawal_dates, payments, transmissions, transmitters, nop_details, feed_details) for index in range(len(unique_withdrawal_dates))]
+    elif shard == "operator":
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_totals_worker, initargs=("", transmitters, nop_details, feed_details)) as executor:
+            range_totals = [get_range_total(index, unique_withdrawal_dates, payments, transmissions, transmitters, nop_details, feed_details, executor) for index in range(len(unique_withdrawal_dates))]
+    else:
+        with tempfile.TemporaryDirectory() as shared_dir:
+            share_frame(transmissions, shared_dir+"/transmissions")
+            share_frame(payments, shared_dir+"/payments")
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_totals_worker, initargs=(shared_dir, transmitters, nop_details, feed_details)) as executor:
+                # map returns the ranges in order, whichever worker finishes first
+                range_totals = list(executor.map(_run_totals_range, [(index, unique_withdrawal_dates) for index in range(len(unique_withdrawal_dates))]))
+
+    for range_total, total in range_totals:
         totals["ranges"].append(range_total)
         totals["totals"].append(total)
 
     dir_path = "data/"+feed_details["path"]
     os.makedirs(dir_path, exist_ok=True)
     with open(dir_path+"/totals.json", "w", encoding="utf-8") as outfile:
-            json.dump(totals, outfile, ensure_ascii=False, indent=4)
+            # maxima of integer columns are numpy scalars
+            json.dump(totals, outfile, ensure_ascii=False, indent=4, default=lambda value: value.item())
 
     return totals
 
@@ -1040,11 +1740,30 @@ def get_billing_params(w3, provider_url, aggregator_contract_address, event_sigs
         A dict with billing parameters at each block for a contract
     """
     
+    with metrics.stage("billingParams.getLogs"):
+        billings = get_logs(provider_url, aggregator_contract_address, event_sigs["BillingSet"], "0x0")
+
+    return billing_params_from_logs(w3, billings, event_params, feed_path, abi_events, contract)
+
+def billing_params_from_logs(w3, billings, event_params, feed_path, abi_events, contract):
+    """
+    Function to build and save billing parameters from BillingSet logs
+
+    Args:
+        w3: web3 Instance 
+        billings: The BillingSet logs
+        event_params: The parameters of the contract's events
+        feed_path: The path of the feed 
+        abi_events: The events from the contract's ABI 
+        contract: The contract's Instance
+
+    Returns:
+        A dict with billing parameters at each block for a contract
+    """
     billing_params = {}
-    billings = get_logs(provider_url, aggregator_contract_address, event_sigs["BillingSet"], "0x0")
     for index,billing in enumerate(billings):
-        tx = get_transaction_details(w3, abi_events, billing["transactionHash"], False, contract)
-        maximumGasPrice, reasonableGasPrice, microLinkPerEth, linkGweiPerObservation, linkGweiPerTransmission = decode_logs_data(event_params["BillingSet"]["params"], billing["data"])
+        tx = get_transaction_details(w3, abi_events, billing.transaction_hash, False, contract)
+        maximumGasPrice, reasonableGasPrice, microLinkPerEth, linkGweiPerObservation, linkGweiPerTransmission = decode_logs_data(event_params["BillingSet"]["params"], billing.data)
         block_num = tx["blockNumber"]
         new_billing = {
             "maximumGasPrice": maximumGasPrice,
@@ -0,0 +1,212 @@
+import metrics
+from rpc_decode import decode_logs
+from rounds import rounds_from_logs
+from helper import post_json_rpc, create_contract, get_contract_decimals, calculate_event_sigs, get_event_params, read_nop_details, get_block_receipts, transmitter_sets_from_logs, transmissions_from_logs, payments_from_logs, answers_from_logs, billing_params_from_logs
+
+# Events of an aggregator collected by a feed's scan
+FEED_EVENTS = ["NewTransmission", "AnswerUpdated", "OraclePaid", "BillingSet", "ConfigSet", "PayeeshipTransferred"]
+# Events needed from the contract's whole history whatever the start block
+CONFIG_EVENTS = ["BillingSet", "ConfigSet", "PayeeshipTransferred"]
+
+def scan_logs(provider_url, address, topics, from_block, to_block, window=None):
+    """
+    Function to query the logs of several events at once, with one eth_getLogs call per window of blocks
+
+    Args:
+        provider_url: The endpoint of the node to query
+        address: The address of the contract, or an array of addresses
+        topics: The topic0 values of the events to get
+        from_block: The first block to scan
+        to_block: The last block to scan
+        window: The number of blocks per call. The whole range is queried at once if None
+
+    Yields:
+        The Log array of each window, in block order
+    """
+    if to_block < from_block:
+        return
+    window = window or (to_block - from_block + 1)
+
+    for start in range(from_block, to_block + 1, window):
+        end = min(start + window - 1, to_block)
+        payload = {
+            "jsonrpc": "2.0",
+            "method": "eth_getLogs",
+            "params": [
+                {"fromBlock": hex(start),
+                 "toBlock": hex(end),
+                 "address": address,
+                 # a list in the first position matches any of its topics
+                 "topics": [topics]
+                }
+            ],
+            "id": 1,
+        }
+        with metrics.stage("ingestion.getLogs"):
+            logs = decode_logs(post_json_rpc(provider_url, payload))
+        metrics.record_rows("ingestion.getLogs", len(logs))
+        yield logs
+
+def route_logs(logs, topic_events, sinks):
+    """
+    Function to pass each log to the sink of its event
+
+    Args:
+        logs: The logs to route
+        topic_events: Dict of event names by topic0 as bytes
+        sinks: Dict of functions taking a log by event name
+    """
+    for log in logs:
+        event = topic_events.get(log.topics[0])
+        if event is not None:
+            sinks[event](log)
+
+def ingest_logs(provider_url, address, event_sigs, start_block, to_block, sinks, window=None):
+    """
+    Function to scan a contract's logs once for several events, routing each log to its event's sink.
+    Events in CONFIG_EVENTS are also collected from the blocks before the start block, in one extra call
+
+    Args:
+        provider_url: The endpoint of the node to query
+        address: The address of the contract, or an array of addresses
+        event_sigs: The event signatures of the contract
+        start_block: The first block to scan
+        to_block: The last block to scan
+        sinks: Dict of functions taking a log by event name. Only these events are queried
+        window: The number of blocks per call, see scan_logs
+    """
+    topic_events = {bytes.fromhex(event_sigs[event][2:]): event for event in sinks}
+    topics = [event_sigs[event].lower() for event in sinks]
+    config_topics = [event_sigs[event].lower() for event in sinks if event in CONFIG_EVENTS]
+
+    if len(config_topics) > 0:
+        for logs in scan_logs(provider_url, address, config_topics, 0, start_block - 1):
+            route_logs(logs, topic_events, sinks)
+
+    for logs in scan_logs(provider_url, address, topics, start_block, to_block, window):
+        route_logs(logs, topic_events, sinks)
+
+def collect_feed(w3, provider_url, aggregator_contract_address, start_block, event_sigs, event_params, feed_path, nop_details, transmitters, abi_events, contract, headers=None, window=None, config_index=None):
+    """
+    Function to collect and save a feed's transmissions, payments, answers and billing parameters from a single scan
+    of its logs, instead of one scan per event
+
+    Args:
+        w3: web3 Instance
+        provider_url: The endpoint of the node to query
+        aggregator_contract_address: The address of the aggregator contract
+        start_block: The block from which to start collecting
+        event_sigs: The event signatures of the contract
+        event_params: The event parameters of the contract
+        feed_path: The path of the feed
+        nop_details: The details of the node operators
+        transmitters: A array of operators
+        abi_events: Contract's ABI Events
+        contract: The contract's instance
+        headers: Dict of block headers by block number shared between collectors, see get_block_headers
+        window: The number of blocks per eth_getLogs call. Defaults to the whole range on ethereum and 100000 blocks elsewhere
+        config_index: The feed's ConfigIndex. Updated with the scanned ConfigSet and PayeeshipTransferred logs, it then
+            gives the transmitters and the names of the paid operators
+
+    Returns:
+        A dict with the transmissions, payments, answers, rounds, billing parameters and PayeeshipTransferred logs
+    """
+    if window is None and "ethereum" not in feed_path:
+        window = 100000
+    if headers is None:
+        headers = {}
+    receipts = {}
+    to_block = w3.eth.get_block('latest')['number']
+
+    logs = {event: [] for event in FEED_EVENTS}
+    ingest_logs(provider_url, aggregator_contract_address, event_sigs, start_block, to_block, {event: logs[event].append for event in FEED_EVENTS}, window)
+    decimals = get_contract_decimals(contract, feed_path.split("/")[0])
+
+    if config_index is not None:
+        config_index.add_logs(logs["ConfigSet"] + logs["PayeeshipTransferred"], event_sigs, event_params)
+        config_index.last_block = max(config_index.last_block, to_block)
+        transmitter_sets = config_index.transmitter_sets()
+    else:
+        transmitter_sets = transmitter_sets_from_logs(logs["ConfigSet"], event_params)
+    payments = payments_from_logs(w3, logs["OraclePaid"], event_params, feed_path, nop_details, abi_events, contract, headers=headers, config_index=config_index)
+    transmissions = transmissions_from_logs(provider_url, logs["NewTransmission"], logs["AnswerUpdated"], transmitter_sets, event_params, feed_path, nop_details, transmitters, contract, headers, receipts)
+    answers = answers_from_logs(logs["AnswerUpdated"], event_params, feed_path, decimals)
+    rounds = rounds_from_logs(provider_url, logs["NewTransmission"], logs["AnswerUpdated"], transmitter_sets, event_params, feed_path, nop_details, contract, decimals, headers, receipts)
+    billing_params = billing_params_from_logs(w3, logs["BillingSet"], event_params, feed_path, abi_events, contract)
+
+    return {
+        "transmissions": transmissions,
+        "payments": payments,
+        "answers": answers,
+        "rounds": rounds,
+        "billingParams": billing_params,
+        "payeeshipTransferred": logs["PayeeshipTransferred"]
+    }
+
+def collect_feeds(w3, provider_url, feeds, start_block, contract_abi, window=None, config_indexes=None):
+    """
+    Function to collect and save several feeds of a network from a single scan of their logs. Each eth_getLogs call
+    filters on all the aggregators, the logs are split by address into per-feed sinks, and the block headers, receipts
+    and payment transactions are shared between the feeds
+
+    Args:
+        w3: web3 Instance
+        provider_url: The endpoint of the node to query
+        feeds: The details of the feeds as in feeds.json, each with a nops.json
+        start_block: The block from which to start collecting
+        contract_abi: The aggregators' ABI
+        window: The number of blocks per eth_getLogs call, see collect_feed
+        config_indexes: Dict of the feeds' ConfigIndex by feed path, see collect_feed
+
+    Returns:
+        A dict with the results of each feed as returned by collect_feed, by feed path
+    """
+    if window is None and not all("ethereum" in feed["path"] for feed in feeds):
+        window = 100000
+    to_block = w3.eth.get_block('latest')['number']
+    contracts = {feed["path"]: create_contract(w3, feed["address"], contract_abi)[0] for feed in feeds}
+    abi_events = [abi for abi in contract_abi if abi["type"] == "event"]
+    event_sigs = calculate_event_sigs(abi_events)
+    event_params = get_event_params(abi_events)
+
+    feed_logs = {feed["address"].lower(): {event: [] for event in FEED_EVENTS} for feed in feeds}
+    def feed_sink(event):
+        def sink(log):
+            feed_logs[log.address][event].append(log)
+        return sink
+    ingest_logs(provider_url, [feed["address"] for feed in feeds], event_sigs, start_block, to_block, {event: feed_sink(event) for event in FEED_EVENTS}, window)
+
+    headers = {}
+    transactions = {}
+    # the receipts of all feeds' transmissions are fetched together, so blocks shared between feeds are fetched once
+    block_tx_hashes = {}
+    for logs in feed_logs.values():
+        for transmission in logs["NewTransmission"]:
+            block_tx_hashes.setdefault(transmission.block_number, set()).add(transmission.transaction_hash.lower())
+    receipts = get_block_receipts(provider_url, block_tx_hashes)
+
+    results = {}
+    for feed in feeds:
+        print("Saving "+feed["path"])
+        logs = feed_logs[feed["address"].lower()]
+        nop_details, transmitters = read_nop_details(feed["path"])
+        contract = contracts[feed["path"]]
+        decimals = get_contract_decimals(contract, feed["path"].split("/")[0])
+
+        config_index = (config_indexes or {}).get(feed["path"])
+        if config_index is not None:
+            config_index.add_logs(logs["ConfigSet"] + logs["PayeeshipTransferred"], event_sigs, event_params)
+            config_index.last_block = max(config_index.last_block, to_block)
+            transmitter_sets = config_index.transmitter_sets()
+        else:
+            transmitter_sets = transmitter_sets_from_logs(logs["ConfigSet"], event_params)
+        results[feed["path"]] = {
+            "transmissions": transmissions_from_logs(provider_url, logs["NewTransmission"], logs["AnswerUpdated"], transmitter_sets, event_params, feed["path"], nop_details, transmitters, contract, headers, receipts),
+            "payments": payments_from_logs(w3, logs["OraclePaid"], event_params, feed["path"], nop_details, abi_events, contract, transactions, headers, config_index),
+            "answers": answers_from_logs(logs["AnswerUpdated"], event_params, feed["path"], decimals),
+            "rounds": rounds_from_logs(provider_url, logs["NewTransmission"], logs["AnswerUpdated"], transmitter_sets, event_params, feed["path"], nop_details, contract, decimals, headers, receipts),
+            "billingParams": billing_params_from_logs(w3, logs["BillingSet"], event_params, feed["path"], abi_events, contract),
+            "payeeshipTransferred": logs["PayeeshipTransferred"]
+        }
+
+    return results
@@ -0,0 +1,382 @@
+import contextlib
+import threading
+import atexit
+from collections import deque
+import json
+import os
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# Checked by every recording function, so the disabled mode costs one global lookup
+_enabled = False
+_lock = threading.Lock()
+_started = None
+_stages = {}
+_rpc = {}
+_rows = {}
+_caches = {}
+_endpoints = {}
+_trace_memory = False
+_exporter = None
+# Recent latencies kept per method and per node for the percentiles, so long runs use constant memory
+LATENCY_WINDOW = 1000
+
+_NOOP = contextlib.nullcontext()
+
+class _Stage:
+    __slots__ = ["name", "start"]
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        record_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+def enable(trace_memory=False):
+    """
+    Function to start recording metrics
+
+    Args:
+        trace_memory: Whether to trace Python allocations with tracemalloc for the peak memory. Slows the run down
+    """
+    global _enabled, _started, _trace_memory
+    reset()
+    _enabled = True
+    _started = time.perf_counter()
+    _trace_memory = trace_memory
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+
+def disable():
+    """
+    Function to stop recording metrics
+    """
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """
+    Function to clear every recorded metric
+    """
+    with _lock:
+        _stages.clear()
+        _rpc.clear()
+        _rows.clear()
+        _caches.clear()
+        _endpoints.clear()
+
+def stage(name):
+    """
+    Function to time a block of code as a stage
+
+    Args:
+        name: The name of the stage
+
+    Returns:
+        A context manager timing the block. A shared no-op one when metrics are disabled
+    """
+    return _Stage(name) if _enabled else _NOOP
+
+def record_stage(name, seconds):
+    if not _enabled:
+        return
+    with _lock:
+        entry = _stages.setdefault(name, {"count": 0, "seconds": 0.0, "maxSeconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["maxSeconds"] = max(entry["maxSeconds"], seconds)
+
+def record_rpc(method, seconds, bytes_sent=0, bytes_received=0, error=False):
+    """
+    Function to record an RPC call
+
+    Args:
+        method: The JSON-RPC method
+        seconds: The latency of the call
+        bytes_sent: The size of the request body
+        bytes_received: The size of the response body
+        error: Whether the call failed
+    """
+    if not _enabled:
+        return
+    with _lock:
+        entry = _rpc.setdefault(method, {"count": 0, "errors": 0, "seconds": 0.0, "maxSeconds": 0.0, "bytesSent": 0, "bytesReceived": 0, "latencies": deque(maxlen=LATENCY_WINDOW)})
+        entry["count"] += 1
+        entry["errors"] += int(error)
+        entry["seconds"] += seconds
+        entry["maxSeconds"] = max(entry["maxSeconds"], seconds)
+        entry["bytesSent"] += bytes_sent
+        entry["bytesReceived"] += bytes_received
+        entry["latencies"].append(seconds)
+
+def record_endpoint(url, kind, seconds, error=False):
+    """
+    Function to record a request sent to one of the nodes of a ProviderRouter
+
+    Args:
+        url: The URL of the node
+        kind: full or archive
+        seconds: The latency of the request
+        error: Whether the node failed
+    """
+    if not _enabled:
+        return
+    with _lock:
+        entry = _endpoints.setdefault(url, {"kind": kind, "count": 0, "errors": 0, "seconds": 0.0, "latencies": deque(maxlen=LATENCY_WINDOW)})
+        entry["count"] += 1
+        entry["errors"] += int(error)
+        entry["seconds"] += seconds
+        entry["latencies"].append(seconds)
+
+def record_rows(name, rows=1):
+    """
+    Function to count rows produced by a stage, reported as rows per second of that stage
+
+    Args:
+        name: The name of the stage
+        rows: The number of rows
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _rows[name] = _rows.get(name, 0) + rows
+
+def record_cache(name, hit):
+    """
+    Function to record a cache lookup
+
+    Args:
+        name: The name of the cache
+        hit: Whether the lookup was a hit
+    """
+    if not _enabled:
+        return
+    with _lock:
+        entry = _caches.setdefault(name, {"hits": 0, "misses": 0})
+        entry["hits" if hit else "misses"] += 1
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def peak_memory_bytes():
+    """
+    Returns:
+        The peak memory of the process in bytes, from tracemalloc if tracing or the resident set size otherwise
+    """
+    if _trace_memory:
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1]
+    if resource is None:
+        return None
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+def summary():
+    """
+    Returns:
+        A dict with every recorded metric
+    """
+    with _lock:
+        stages = {name: dict(entry) for name, entry in _stages.items()}
+        rpc = {}
+        for method, entry in _rpc.items():
+            rpc[method] = {key: value for key, value in entry.items() if key != "latencies"}
+            rpc[method]["p50Seconds"] = _percentile(entry["latencies"], 0.5)
+            rpc[method]["p95Seconds"] = _percentile(entry["latencies"], 0.95)
+        rows = {}
+        for name, count in _rows.items():
+            seconds = _stages.get(name, {}).get("seconds", 0)
+            rows[name] = {"rows": count, "rowsPerSecond": count / seconds if seconds > 0 else None}
+        caches = {}
+        for name, entry in _caches.items():
+            lookups = entry["hits"] + entry["misses"]
+            caches[name] = dict(entry, hitRate=entry["hits"] / lookups if lookups > 0 else None)
+        endpoints = {}
+        for url, entry in _endpoints.items():
+            endpoints[url] = {key: value for key, value in entry.items() if key != "latencies"}
+            endpoints[url]["p50Seconds"] = _percentile(entry["latencies"], 0.5)
+            endpoints[url]["p95Seconds"] = _percentile(entry["latencies"], 0.95)
+
+    return {
+        "elapsedSeconds": time.perf_counter() - _started if _started is not None else None,
+        "peakMemoryBytes": peak_memory_bytes(),
+        "stages": stages,
+        "rpc": rpc,
+        "rows": rows,
+        "caches": caches,
+        "endpoints": endpoints
+    }
+
+def _write_atomic(filename, text):
+    # readers like the textfile collector never see a half written file
+    temporary_filename = filename+".tmp"
+    with open(temporary_filename, "w", encoding="utf-8") as outfile:
+        outfile.write(text)
+    os.replace(temporary_filename, filename)
+
+def export_json(filename):
+    """
+    Function to write the summary as JSON
+
+    Args:
+        filename: The file to write
+    """
+    _write_atomic(filename, json.dumps(summary(), ensure_ascii=False, indent=4))
+
+def prometheus_text():
+    """
+    Returns:
+        The summary in the Prometheus text exposition format
+    """
+    metrics = summary()
+    lines = []
+
+    def add(name, help_text, metric_type, samples):
+        lines.append("# HELP "+name+" "+help_text)
+        lines.append("# TYPE "+name+" "+metric_type)
+        for labels, value in samples:
+            label_text = ",".join(key+"=\""+str(label)+"\"" for key, label in labels.items())
+            lines.append(name+("{"+label_text+"}" if label_text != "" else "")+" "+repr(float(value)))
+
+    add("clpbim_stage_seconds_total", "Time spent in each stage", "counter", [({"stage": name}, entry["seconds"]) for name, entry in metrics["stages"].items()])
+    add("clpbim_stage_runs_total", "Number of times each stage ran", "counter", [({"stage": name}, entry["count"]) for name, entry in metrics["stages"].items()])
+    add("clpbim_rpc_requests_total", "RPC calls per method", "counter", [({"method": method}, entry["count"]) for method, entry in metrics["rpc"].items()])
+    add("clpbim_rpc_errors_total", "Failed RPC calls per method", "counter", [({"method": method}, entry["errors"]) for method, entry in metrics["rpc"].items()])
+    add("clpbim_rpc_seconds_total", "RPC latency per method", "counter", [({"method": method}, entry["seconds"]) for method, entry in metrics["rpc"].items()])
+    add("clpbim_rpc_latency_seconds", "RPC latency percentiles per method", "gauge", [({"method": method, "quantile": quantile}, entry[key]) for method, entry in metrics["rpc"].items() for quantile, key in [("0.5", "p50Seconds"), ("0.95", "p95Seconds")]])
+    add("clpbim_rpc_bytes_received_total", "Response bytes per method", "counter", [({"method": method}, entry["bytesReceived"]) for method, entry in metrics["rpc"].items()])
+    add("clpbim_rpc_bytes_sent_total", "Request bytes per method", "counter", [({"method": method}, entry["bytesSent"]) for method, entry in metrics["rpc"].items()])
+    add("clpbim_rows_total", "Rows produced per stage", "counter", [({"stage": name}, entry["rows"]) for name, entry in metrics["rows"].items()])
+    add("clpbim_cache_hits_total", "Cache hits", "counter", [({"cache": name}, entry["hits"]) for name, entry in metrics["caches"].items()])
+    add("clpbim_cache_misses_total", "Cache misses", "counter", [({"cache": name}, entry["misses"]) for name, entry in metrics["caches"].items()])
+    add("clpbim_endpoint_requests_total", "Requests per node", "counter", [({"url": url, "kind": entry["kind"]}, entry["count"]) for url, entry in metrics["endpoints"].items()])
+    add("clpbim_endpoint_errors_total", "Failed requests per node", "counter", [({"url": url, "kind": entry["kind"]}, entry["errors"]) for url, entry in metrics["endpoints"].items()])
+    add("clpbim_endpoint_latency_seconds", "Request latency percentiles per node", "gauge", [({"url": url, "kind": entry["kind"], "quantile": quantile}, entry[key]) for url, entry in metrics["endpoints"].items() for quantile, key in [("0.5", "p50Seconds"), ("0.95", "p95Seconds")]])
+    if metrics["peakMemoryBytes"] is not None:
+        add("clpbim_peak_memory_bytes", "Peak memory of the process", "gauge", [({}, metrics["peakMemoryBytes"])])
+
+    return "\n".join(lines)+"\n"
+
+def export_prometheus(filename):
+    """
+    Function to write the summary in the Prometheus text format, e.g. for the node exporter's textfile collector
+
+    Args:
+        filename: The file to write
+    """
+    _write_atomic(filename, prometheus_text())
+
+def web3_middleware(make_request, w3):
+    """
+    web3 middleware recording the latency, errors and approximate response size of every call
+    """
+    def middleware(method, params):
+        if not _enabled:
+            return make_request(method, params)
+        start = time.perf_counter()
+        try:
+            response = make_request(method, params)
+        except Exception:
+            record_rpc(method, time.perf_counter() - start, error=True)
+            raise
+        # the raw body is not exposed to middleware, so measure the parsed response
+        record_rpc(method, time.perf_counter() - start, len(json.dumps(params, default=str)), len(json.dumps(response, default=str)), "error" in response)
+        return response
+    return middleware
+
+def instrument_web3(w3):
+    """
+    Function to record the calls of a web3 instance
+
+    Args:
+        w3: web3 Instance
+
+    Returns:
+        The web3 instance
+    """
+    w3.middleware_onion.add(web3_middleware, name="metrics")
+    return w3
+
+def export_files(json_filename=None, prometheus_filename=None):
+    """
+    Function to write the summary to the given files
+
+    Args:
+        json_filename: The JSON file to write, if any
+        prometheus_filename: The Prometheus text file to write, if any
+    """
+    if json_filename is not None:
+        export_json(json_filename)
+    if prometheus_filename is not None:
+        export_prometheus(prometheus_filename)
+
+def start_periodic_export(seconds, json_filename=None, prometheus_filename=None):
+    """
+    Function to write the summary every few seconds from a background thread, for processes that run until killed
+
+    Args:
+        seconds: The interval between exports
+        json_filename: The JSON file to write, if any
+        prometheus_filename: The Prometheus text file to write, if any
+
+    Returns:
+        The threading.Event that stops the exports when set
+    """
+    global _exporter
+    stop_periodic_export()
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(seconds):
+            try:
+                export_files(json_filename, prometheus_filename)
+            except OSError as e:
+                print("Could not export metrics: "+str(e))
+
+    thread = threading.Thread(target=run, name="metrics-export", daemon=True)
+    thread.start()
+    _exporter = (stopped, thread)
+    return stopped
+
+def stop_periodic_export():
+    """
+    Function to stop the exports of start_periodic_export
+    """
+    global _exporter
+    if _exporter is not None:
+        _exporter[0].set()
+        _exporter[1].join()
+        _exporter = None
+
+def enable_from_env():
+    """
+    Function to enable metrics if METRICS_JSON or METRICS_PROMETHEUS is set, writing them there when the run ends and
+    every METRICS_EXPORT_SECONDS seconds if that is set
+    """
+    json_filename = os.environ.get("METRICS_JSON")
+    prometheus_filename = os.environ.get("METRICS_PROMETHEUS")
+    if json_filename is None and prometheus_filename is None:
+        return
+
+    enable(trace_memory=os.environ.get("METRICS_TRACE_MEMORY") == "1")
+    atexit.register(export_files, json_filename, prometheus_filename)
+    # registered after export_files, so it runs first and the last export is not written twice at once
+    atexit.register(stop_periodic_export)
+    if os.environ.get("METRICS_EXPORT_SECONDS") is not None:
+        start_periodic_export(float(os.environ["METRICS_EXPORT_SECONDS"]), json_filename, prometheus_filename)
@@ -0,0 +1,232 @@
+import pandas as pd
+import json
+import math
+import socket
+import time
+from helper import get_logs_throttled, get_transmission_tx, build_transmission_row
+from schema import apply_schema
+
+class OperatorStats:
+    """
+    Rolling statistics of one operator, updated in constant time and memory per transmission
+    """
+    __slots__ = ["rounds", "observations", "misses", "miss_streak", "max_miss_streak", "deviation_ewma", "transmissions", "gas_spent_eth"]
+
+    def __init__(self):
+        self.rounds = 0
+        self.observations = 0
+        self.misses = 0
+        self.miss_streak = 0
+        self.max_miss_streak = 0
+        self.deviation_ewma = None
+        self.transmissions = 0
+        self.gas_spent_eth = 0.0
+
+class TransmissionMonitor:
+    """
+    Keeps per-operator miss streaks, deviation EWMA, transmission share and gas spend over a stream of transmission rows
+    """
+
+    def __init__(self, nop_details, alpha=0.05):
+        """
+        Args:
+            nop_details: The details of the node operators
+            alpha: The weight of the newest deviation in the EWMA
+        """
+        self.names = {transmitter.lower(): details["name"] for transmitter, details in nop_details.items()}
+        self.alpha = alpha
+        self.operators = {}
+        self.rounds = 0
+        self.last_block = None
+        self.last_timestamp = None
+
+    def update(self, row):
+        """
+        Function to add a transmission row, as built by build_transmission_row or read from transmissions.csv
+
+        Args:
+            row: A dict with the transmission's details and each operator's answer and deviation
+        """
+        self.rounds += 1
+        self.last_block = int(row["blockNumber"])
+        self.last_timestamp = int(row["timestamp"])
+
+        for column in row:
+            if not column.endswith("_answer"):
+                continue
+            answer = row[column]
+            # operators outside the transmitter set at this block have no answer
+            if answer is None or (isinstance(answer, float) and math.isnan(answer)):
+                continue
+
+            name = column[:-len("_answer")]
+            stats = self.operators.get(name)
+            if stats is None:
+                stats = self.operators[name] = OperatorStats()
+            stats.rounds += 1
+            if answer == 0:
+                stats.misses += 1
+                stats.miss_streak += 1
+                stats.max_miss_streak = max(stats.max_miss_streak, stats.miss_streak)
+            else:
+                stats.observations += 1
+                stats.miss_streak = 0
+                deviation = float(row[name+"_deviation"])
+                stats.deviation_ewma = deviation if stats.deviation_ewma is None else self.alpha * deviation + (1 - self.alpha) * stats.deviation_ewma
+
+        submitter = self.names.get(str(row["submitter"]).lower())
+        if submitter is not None:
+            stats = self.operators.get(submitter)
+            if stats is None:
+                stats = self.operators[submitter] = OperatorStats()
+            stats.transmissions += 1
+            stats.gas_spent_eth += float(row["fee"])
+
+    def snapshot(self):
+        """
+        Returns:
+            A dict with the current statistics of every operator
+        """
+        operators = {}
+        for name, stats in self.operators.items():
+            operators[name] = {
+                "rounds": stats.rounds,
+                "observations": stats.observations,
+                "misses": stats.misses,
+                "missStreak": stats.miss_streak,
+                "maxMissStreak": stats.max_miss_streak,
+                "deviationEwma": stats.deviation_ewma,
+                "transmissions": stats.transmissions,
+                "transmissionShare": stats.transmissions / self.rounds if self.rounds > 0 else 0,
+                "gasSpentEth": stats.gas_spent_eth
+            }
+
+        return {
+            "blockNumber": self.last_block,
+            "timestamp": self.last_timestamp,
+            "rounds": self.rounds,
+            "operators": operators
+        }
+
+def file_sink(filename):
+    """
+    Function to create a sink appending snapshots to a file as JSON lines
+
+    Args:
+        filename: The file to append to
+
+    Returns:
+        A function taking a snapshot
+    """
+    def sink(snapshot):
+        with open(filename, "a", encoding="utf-8") as outfile:
+            outfile.write(json.dumps(snapshot, ensure_ascii=False)+"\n")
+    return sink
+
+def socket_sink(host, port):
+    """
+    Function to create a sink sending snapshots as JSON lines over a TCP connection
+
+    Args:
+        host: The host to connect to
+        port: The port to connect to
+
+    Returns:
+        A function taking a snapshot
+    """
+    connection = socket.create_connection((host, port))
+    def sink(snapshot):
+        connection.sendall((json.dumps(snapshot, ensure_ascii=False)+"\n").encode("utf-8"))
+    return sink
+
+def stream_transmissions(w3, provider_url, aggregator_contract_address, event_sigs, nop_details, abi_events, contract, start_block, monitor, sink, poll_interval=12, record_filename=None, max_polls=None):
+    """
+    Function to follow new transmissions by polling eth_getLogs from the last seen block
+
+    Args:
+        w3: web3 Instance
+        provider_url: The endpoint of the node to query
+        aggregator_contract_address: The address of the aggregator contract
+        event_sigs: The event signatures of the contract
+        nop_details: The details of the node operators
+        abi_events: Contract's ABI Events
+        contract: The contract's instance
+        start_block: The block from which to start following transmissions
+        monitor: The TransmissionMonitor to update
+        sink: A function called with a snapshot after every poll with new transmissions
+        poll_interval: Seconds to wait between polls
+        record_filename: If given, every transmission row is appended to this file as JSON lines for later replay
+        max_polls: Stop after this many polls. Runs forever if None
+
+    Returns:
+        The monitor
+    """
+    next_block = start_block
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        polls += 1
+        latest_block_number = w3.eth.get_block('latest')['number']
+        if latest_block_number >= next_block:
+            logs = get_logs_throttled(provider_url, aggregator_contract_address, event_sigs["NewTransmission"], next_block, latest_block_number)
+            # only dedupe within a poll, so memory does not grow with the stream
+            transactions = {}
+            for log in logs:
+                tx = get_transmission_tx(w3, abi_events, log.transaction_hash, contract, transactions)
+                row = build_transmission_row(tx, nop_details, contract)
+                monitor.update(row)
+                if record_filename is not None:
+                    with open(record_filename, "a", encoding="utf-8") as outfile:
+                        outfile.write(json.dumps(row, ensure_ascii=False)+"\n")
+            next_block = latest_block_number + 1
+            if len(logs) > 0:
+                sink(monitor.snapshot())
+        time.sleep(poll_interval)
+
+    return monitor
+
+def read_recorded_transmissions(filename):
+    """
+    Function to read recorded transmission rows
+
+    Args:
+        filename: A transmissions.csv file or a JSON lines file written by stream_transmissions
+
+    Returns:
+        A list of transmission rows sorted by timestamp
+    """
+    if filename.endswith(".csv"):
+        rows = apply_schema(pd.read_csv(filename, index_col=0), "transmissions").to_dict("records")
+    else:
+        with open(filename, "r") as file:
+            rows = [json.loads(line) for line in file if line.strip() != ""]
+
+    return sorted(rows, key=lambda row: (row["timestamp"], row["blockNumber"]))
+
+def replay_transmissions(rows, monitor, sink, speed=None, snapshot_every=1):
+    """
+    Function to replay recorded transmission rows through a monitor
+
+    Args:
+        rows: Transmission rows sorted by timestamp
+        monitor: The TransmissionMonitor to update
+        sink: A function called with snapshots
+        speed: How many times faster than real time to replay. Replays without waiting if None
+        snapshot_every: Emit a snapshot every this many rows
+
+    Returns:
+        The monitor
+    """
+    previous_timestamp = None
+    for index, row in enumerate(rows):
+        if speed is not None and previous_timestamp is not None:
+            time.sleep(max(int(row["timestamp"]) - previous_timestamp, 0) / speed)
+        previous_timestamp = int(row["timestamp"])
+
+        monitor.update(row)
+        if (index + 1) % snapshot_every == 0:
+            sink(monitor.snapshot())
+
+    if len(rows) % snapshot_every != 0:
+        sink(monitor.snapshot())
+
+    return monitor
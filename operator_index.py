@@ -0,0 +1,346 @@
+import pandas as pd
+import numpy as np
+import json
+import io
+import os
+from helper import read_nop_details
+from schema import apply_schema
+
+INDEX_DIR = "data/operator_index"
+# The stores of a feed that are indexed, with their file and timestamp column
+STORES = {
+    "submissions": ("transmissions.csv", "timestamp"),
+    "payments": ("payments.csv", "txTimestamp")
+}
+# Columns of transmissions.csv kept for every operator in submission queries
+SUBMISSION_COLUMNS = ["blockNumber", "txDate", "gasPriceGwei", "fee", "timestamp", "txHash", "submitter", "aggregatedAnswer", "minAnswer", "maxAnswer"]
+
+def find_feed_paths():
+    """
+    Function to find the collected feeds under the data directory
+
+    Returns:
+        A sorted array of the paths of the feeds with a nops.json and at least one store
+    """
+    feed_paths = []
+    for dir_path, dir_names, file_names in os.walk("data"):
+        # per-operator splits and the index itself are not feeds
+        dir_names[:] = [name for name in dir_names if name not in ["per_op", "prices"] and os.path.join(dir_path, name) != INDEX_DIR]
+        if "nops.json" in file_names and any(filename in file_names for filename, _ in STORES.values()):
+            feed_paths.append(os.path.relpath(dir_path, "data"))
+    return sorted(feed_paths)
+
+def row_offsets(filename):
+    """
+    Function to find where each row of a CSV file starts
+
+    Args:
+        filename: The CSV file, without quoted newlines
+
+    Returns:
+        An array with the byte offset of every row and of the end of the file, the header ending at the first offset
+    """
+    with open(filename, "rb") as file:
+        content = np.frombuffer(file.read(), dtype=np.uint8)
+    offsets = np.flatnonzero(content == ord("\n")) + 1
+    if len(content) > 0 and content[-1] != ord("\n"):
+        offsets = np.append(offsets, len(content))
+    return offsets
+
+def row_ranges(mask):
+    """
+    Function to find the runs of consecutive rows in a mask
+
+    Args:
+        mask: A boolean array with a value for every row
+
+    Returns:
+        An array of [first row, row after the last] for each run of True values
+    """
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.column_stack([np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)])
+
+def index_store(filename, timestamp_column, operator_masks):
+    """
+    Function to index a feed's store
+
+    Args:
+        filename: The CSV file of the store
+        timestamp_column: The column with the timestamp of each row
+        operator_masks: A function taking the store's DataFrame and returning a dict of row masks by operator name
+
+    Returns:
+        The arrays of the store (byte offsets and timestamps of its rows) and a dict of row ranges by operator name
+    """
+    frame = pd.read_csv(filename, index_col=0)
+    offsets = row_offsets(filename)
+    if len(offsets) != len(frame) + 1:
+        raise ValueError(filename+" has rows spanning several lines")
+
+    arrays = {"offsets": offsets, "timestamps": frame[timestamp_column].to_numpy(dtype=np.int64)}
+    ranges = {}
+    for name, mask in operator_masks(frame).items():
+        if mask.any():
+            ranges[name] = row_ranges(mask).tolist()
+    return arrays, ranges
+
+def submission_masks(frame):
+    # an operator is in a row if it was in the transmitter set, whether it observed or not
+    return {column[:-len("_answer")]: frame[column].notna().to_numpy() for column in frame.columns if column.endswith("_answer")}
+
+def payment_masks(frame):
+    return {name: (frame["oracleName"] == name).to_numpy() for name in frame["oracleName"].dropna().unique()}
+
+def file_stamp(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def to_timestamp(value):
+    """
+    Function to convert a date, a datetime or a Unix timestamp to a Unix timestamp
+
+    Args:
+        value: The value to convert, or None
+
+    Returns:
+        The Unix timestamp in seconds, or None
+    """
+    if value is None or isinstance(value, (int, np.integer)):
+        return value
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return int(timestamp.timestamp())
+
+class OperatorIndex:
+    """
+    Maps every operator to the row ranges it occupies in each feed's transmissions.csv and payments.csv, with the byte
+    offsets of those rows, so an operator's data across feeds is read without parsing unrelated feeds or rows
+    """
+
+    def __init__(self, index_dir=INDEX_DIR):
+        """
+        Args:
+            index_dir: The directory of the index
+        """
+        self.index_dir = index_dir
+        self.feeds = {}
+        self.operators = {}
+        self.addresses = {}
+        self._arrays = {}
+        if os.path.exists(index_dir+"/index.json"):
+            with open(index_dir+"/index.json", "r") as file:
+                index = json.load(file)
+            self.feeds = index["feeds"]
+            self.operators = index["operators"]
+            self.addresses = index["addresses"]
+
+    def _arrays_filename(self, feed_path, store):
+        return self.index_dir+"/"+feed_path.replace("/", "__")+"__"+store+".npz"
+
+    def arrays(self, feed_path, store):
+        """
+        Returns:
+            The byte offsets and timestamps of the rows of a feed's store, loaded once
+        """
+        key = (feed_path, store)
+        if key not in self._arrays:
+            with np.load(self._arrays_filename(feed_path, store)) as arrays:
+                self._arrays[key] = {"offsets": arrays["offsets"], "timestamps": arrays["timestamps"]}
+        return self._arrays[key]
+
+    def update(self, feed_paths=None):
+        """
+        Function to index new feeds and reindex the stores that changed since they were indexed
+
+        Args:
+            feed_paths: The feeds to index. Every feed under the data directory if None
+
+        Returns:
+            The index
+        """
+        if feed_paths is None:
+            feed_paths = find_feed_paths()
+            # drop the feeds that were removed
+            self.feeds = {feed_path: feed for feed_path, feed in self.feeds.items() if feed_path in feed_paths}
+        os.makedirs(self.index_dir, exist_ok=True)
+
+        for feed_path in feed_paths:
+            feed = self.feeds.setdefault(feed_path, {"stores": {}})
+            nop_details, transmitters = read_nop_details(feed_path)
+            feed["operators"] = sorted(set(details["name"] for details in nop_details.values()))
+            for transmitter, details in nop_details.items():
+                self.addresses[transmitter.lower()] = details["name"]
+                for payee in details.get("paymentAddress", []):
+                    self.addresses[payee.lower()] = details["name"]
+
+            for store, (filename, timestamp_column) in STORES.items():
+                store_filename = "data/"+feed_path+"/"+filename
+                if not os.path.exists(store_filename):
+                    feed["stores"].pop(store, None)
+                    continue
+                if store in feed["stores"] and feed["stores"][store]["stamp"] == file_stamp(store_filename):
+                    continue
+
+                print("Indexing "+feed_path+" "+store)
+                arrays, ranges = index_store(store_filename, timestamp_column, submission_masks if store == "submissions" else payment_masks)
+                np.savez(self._arrays_filename(feed_path, store), **arrays)
+                self._arrays.pop((feed_path, store), None)
+                feed["stores"][store] = {"stamp": file_stamp(store_filename), "rows": len(arrays["timestamps"]), "ranges": ranges}
+
+        # operator -> feed -> store -> ranges, with each range's time span to skip feeds outside a query
+        self.operators = {}
+        for feed_path, feed in self.feeds.items():
+            for store, details in feed["stores"].items():
+                timestamps = self.arrays(feed_path, store)["timestamps"]
+                for name, ranges in details["ranges"].items():
+                    spans = [[start, end, int(timestamps[start:end].min()), int(timestamps[start:end].max())] for start, end in ranges]
+                    self.operators.setdefault(name, {}).setdefault(feed_path, {})[store] = spans
+
+        with open(self.index_dir+"/index.json", "w", encoding="utf-8") as outfile:
+            json.dump({"feeds": self.feeds, "operators": self.operators, "addresses": self.addresses}, outfile, ensure_ascii=False)
+
+        return self
+
+    def operator_names(self):
+        return sorted(self.operators)
+
+    def operator_for_address(self, address):
+        """
+        Returns:
+            The name of the operator with the given transmitter or payee address, or None
+        """
+        return self.addresses.get(address.lower())
+
+    def operator_addresses(self, name):
+        """
+        Returns:
+            The transmitter and payee addresses of an operator across the indexed feeds
+        """
+        return sorted(address for address, operator in self.addresses.items() if operator == name)
+
+    def operator_feeds(self, name):
+        """
+        Returns:
+            The feeds with data of an operator
+        """
+        return sorted(self.operators.get(name, {}))
+
+    def _read_rows(self, feed_path, store, spans, start, end):
+        filename, timestamp_column = STORES[store]
+        arrays = self.arrays(feed_path, store)
+        offsets = arrays["offsets"]
+        timestamps = arrays["timestamps"]
+        sorted_rows = bool(np.all(np.diff(timestamps) >= 0))
+
+        row_bounds = []
+        for first, last, first_timestamp, last_timestamp in spans:
+            if (start is not None and last_timestamp < start) or (end is not None and first_timestamp > end):
+                continue
+            # narrow the range to the query's time span when the rows are in time order
+            if sorted_rows:
+                if start is not None:
+                    first = max(first, int(np.searchsorted(timestamps, start, side="left")))
+                if end is not None:
+                    last = min(last, int(np.searchsorted(timestamps, end, side="right")))
+            if first < last:
+                row_bounds.append((first, last))
+        if len(row_bounds) == 0:
+            return None
+
+        with open("data/"+feed_path+"/"+filename, "rb") as file:
+            header = file.read(int(offsets[0]))
+            chunks = [header]
+            for first, last in row_bounds:
+                file.seek(int(offsets[first]))
+                chunks.append(file.read(int(offsets[last] - offsets[first])))
+
+        frame = apply_schema(pd.read_csv(io.BytesIO(b"".join(chunks)), index_col=0), "payments" if store == "payments" else "transmissions")
+        if start is not None:
+            frame = frame[frame[timestamp_column] >= start]
+        if end is not None:
+            frame = frame[frame[timestamp_column] <= end]
+        return frame
+
+    def submissions(self, name, start=None, end=None, feed_paths=None):
+        """
+        Function to get an operator's submissions across feeds
+
+        Args:
+            name: The name of the operator
+            start: The first date, datetime or Unix timestamp to include
+            end: The last date, datetime or Unix timestamp to include
+            feed_paths: The feeds to query. Every feed of the operator if None
+
+        Returns:
+            A DataFrame with every transmission of the feeds while the operator was a transmitter, with its answer,
+            deviation and whether it observed and transmitted, and the feed of each row
+        """
+        start, end = to_timestamp(start), to_timestamp(end)
+        frames = []
+        for feed_path, stores in self.operators.get(name, {}).items():
+            if "submissions" not in stores or (feed_paths is not None and feed_path not in feed_paths):
+                continue
+            frame = self._read_rows(feed_path, "submissions", stores["submissions"], start, end)
+            if frame is None:
+                continue
+            frame = frame[SUBMISSION_COLUMNS + [name+"_answer", name+"_deviation"]].rename(columns={name+"_answer": "answer", name+"_deviation": "deviation"})
+            frame["observed"] = frame["answer"] != 0
+            frame["transmitted"] = frame["submitter"].str.lower().isin(self.operator_addresses(name))
+            frame.insert(0, "feed", feed_path)
+            frames.append(frame)
+
+        if len(frames) == 0:
+            return pd.DataFrame([], columns=["feed"] + SUBMISSION_COLUMNS + ["answer", "deviation", "observed", "transmitted"])
+        return pd.concat(frames, ignore_index=True).sort_values(["timestamp", "feed"], kind="stable", ignore_index=True)
+
+    def payments(self, name, start=None, end=None, feed_paths=None):
+        """
+        Function to get an operator's payments across feeds
+
+        Args:
+            name: The name of the operator
+            start: The first date, datetime or Unix timestamp to include
+            end: The last date, datetime or Unix timestamp to include
+            feed_paths: The feeds to query. Every feed of the operator if None
+
+        Returns:
+            A DataFrame with the operator's payments and the feed of each
+        """
+        start, end = to_timestamp(start), to_timestamp(end)
+        frames = []
+        for feed_path, stores in self.operators.get(name, {}).items():
+            if "payments" not in stores or (feed_paths is not None and feed_path not in feed_paths):
+                continue
+            frame = self._read_rows(feed_path, "payments", stores["payments"], start, end)
+            if frame is None:
+                continue
+            frame.insert(0, "feed", feed_path)
+            frames.append(frame)
+
+        if len(frames) == 0:
+            return pd.DataFrame([], columns=["feed", "blockNumber", "txHash", "txTimestamp", "gasPriceGwei", "fee", "submitter", "payeeAddress", "oracleName", "amount", "txDate"])
+        return pd.concat(frames, ignore_index=True).sort_values(["txTimestamp", "feed"], kind="stable", ignore_index=True)
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv
+
+    index = OperatorIndex().update()
+    if len(args) < 2:
+        print("Indexed "+str(len(index.feeds))+" feeds and "+str(len(index.operators))+" operators")
+        exit()
+
+    name = args[1]
+    start = args[2] if len(args) > 2 else None
+    end = args[3] if len(args) > 3 else None
+    submissions = index.submissions(name, start, end)
+    payments = index.payments(name, start, end)
+    summary = pd.DataFrame({
+        "rounds": submissions.groupby("feed").size(),
+        "observations": submissions.groupby("feed")["observed"].sum(),
+        "transmissions": submissions.groupby("feed")["transmitted"].sum(),
+        "payments": payments.groupby("feed").size(),
+        "paidLink": payments.groupby("feed")["amount"].sum()
+    }).fillna(0)
+    print(summary.to_string())
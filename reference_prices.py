@@ -0,0 +1,351 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+from datetime import datetime, timedelta, timezone
+import metrics
+
+KLINES_DIR = "data/binance"
+KLINE_COLUMNS = ["open", "high", "low", "close", "volume"]
+# Quotes a pair can be crossed through when Binance has no market of its own for it or little volume in it
+BRIDGES = ["USDT", "BUSD", "USDC", "BTC"]
+# Binance has no USD markets, so feeds quoted in USD use the stablecoins
+USD_QUOTES = ["USDT", "BUSD", "USDC"]
+# A minute takes the last close of a symbol at most this many minutes before it, later minutes are a gap
+MAX_STALENESS = 5
+# The routes of a composite are weighted by the volume of their thinnest leg over this many minutes
+VOLUME_WINDOW = 60
+MINUTE_MS = 60000
+
+def klines_filename(symbol, klines_dir=KLINES_DIR):
+    return klines_dir+"/klines_"+symbol+"_1min.npz"
+
+def reference_filename(feed_path):
+    return "data/"+feed_path+"/prices/binance-reference.npz"
+
+def klines_from_rows(rows):
+    """
+    Function to get the columns of 1 minute klines
+
+    Args:
+        rows: The klines as Binance returns them, lists starting with the open time, open, high, low, close and volume,
+            or as dicts with Timestamp, Open, High, Low, Close and Volume like the files of python cli.py binance
+
+    Returns:
+        A dict with an int64 array of the open times in milliseconds and a float64 array per column of KLINE_COLUMNS,
+        sorted by time with one kline per minute
+    """
+    if len(rows) > 0 and isinstance(rows[0], dict):
+        rows = [[row["Timestamp"], row["Open"], row["High"], row["Low"], row["Close"], row["Volume"]] for row in rows]
+    values = np.array([row[:6] for row in rows], dtype=np.float64).reshape(-1, 6)
+    timestamps = values[:, 0].astype(np.int64)
+    # the last kline of a minute wins
+    timestamps, first = np.unique(timestamps[::-1], return_index=True)
+    rows_kept = len(values) - 1 - first
+    klines = {"timestamp": timestamps}
+    for column, name in enumerate(KLINE_COLUMNS):
+        klines[name] = values[rows_kept, column + 1]
+    return klines
+
+def merge_klines(stored, klines):
+    """
+    Function to merge new klines into stored ones, the new ones replacing the stored ones of the same minutes
+
+    Args:
+        stored: The stored klines, or None
+        klines: The new klines
+
+    Returns:
+        The merged klines sorted by time
+    """
+    if stored is None or len(stored["timestamp"]) == 0:
+        return klines
+    keep = ~np.isin(stored["timestamp"], klines["timestamp"])
+    timestamps = np.concatenate([stored["timestamp"][keep], klines["timestamp"]])
+    order = np.argsort(timestamps, kind="stable")
+    merged = {"timestamp": timestamps[order]}
+    for name in KLINE_COLUMNS:
+        merged[name] = np.concatenate([stored[name][keep], klines[name]])[order]
+    return merged
+
+def load_klines(symbol, klines_dir=KLINES_DIR):
+    """
+    Function to read the stored 1 minute klines of a symbol. The JSON files of python cli.py binance are read when
+    there is no .npz file, and converted to one
+
+    Args:
+        symbol: The Binance symbol like LINKUSDT
+        klines_dir: The directory of the klines
+
+    Returns:
+        The klines as klines_from_rows returns them, or None if the symbol has none stored
+    """
+    filename = klines_filename(symbol, klines_dir)
+    if os.path.exists(filename):
+        with np.load(filename) as arrays:
+            return {name: arrays[name] for name in ["timestamp"] + KLINE_COLUMNS}
+    json_filename = klines_dir+"/binance_data_"+symbol+"_1min.json"
+    if os.path.exists(json_filename):
+        with open(json_filename, "r") as file:
+            klines = klines_from_rows(json.load(file))
+        save_klines(symbol, klines, klines_dir)
+        return klines
+    return None
+
+def save_klines(symbol, klines, klines_dir=KLINES_DIR):
+    os.makedirs(klines_dir, exist_ok=True)
+    np.savez_compressed(klines_filename(symbol, klines_dir), **klines)
+
+def download_klines(client, symbol, start_date, end_date, klines_dir=KLINES_DIR):
+    """
+    Function to get the 1 minute klines of a symbol between two dates, only downloading the minutes before and after
+    the stored ones
+
+    Args:
+        client: A python-binance Client
+        symbol: The Binance symbol like LINKUSDT
+        start_date: The first date as a datetime
+        end_date: The last date as a datetime
+        klines_dir: The directory of the klines
+
+    Returns:
+        The stored klines, merged with the downloaded ones
+    """
+    to_ms = lambda date: int(date.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    stored = load_klines(symbol, klines_dir)
+    start, end = to_ms(start_date), to_ms(end_date)
+    if stored is None or len(stored["timestamp"]) == 0:
+        missing = [(start, end)]
+    else:
+        missing = [(start, int(stored["timestamp"][0]) - MINUTE_MS), (int(stored["timestamp"][-1]) + MINUTE_MS, end)]
+
+    klines = stored
+    for missing_start, missing_end in missing:
+        # 6 month windows, as python cli.py binance downloads them
+        window_start = missing_start
+        while window_start <= missing_end:
+            window_end = min(window_start + int(timedelta(days=180).total_seconds() * 1000), missing_end)
+            print("Getting "+symbol+" between "+str(datetime.fromtimestamp(window_start / 1000, timezone.utc))+" and "+str(datetime.fromtimestamp(window_end / 1000, timezone.utc)))
+            with metrics.stage("binance.klines"):
+                rows = client.get_historical_klines(symbol, "1m", window_start, window_end)
+            metrics.record_rows("binance.klines", len(rows))
+            if len(rows) > 0:
+                klines = merge_klines(klines, klines_from_rows(rows))
+            window_start = window_end + MINUTE_MS
+
+    if klines is not None and klines is not stored:
+        save_klines(symbol, klines, klines_dir)
+    return klines
+
+def feed_assets(feed_details):
+    """
+    Returns:
+        The base and quote assets of a feed from its name in feeds.json, like LINK and ETH for LINK / ETH
+    """
+    name = feed_details.get("name") or feed_details["path"].split("/")[-1].replace("-", " / ")
+    base, quote = [asset.strip().upper() for asset in name.split("/")[:2]]
+    return base, quote
+
+def pair_leg(base, quote, symbols):
+    """
+    Function to find the market giving the price of an asset in another
+
+    Args:
+        base: The asset priced
+        quote: The asset it is priced in
+        symbols: The available Binance symbols
+
+    Returns:
+        The symbol and whether its price has to be inverted, or None if neither BASEQUOTE nor QUOTEBASE is available
+    """
+    if base+quote in symbols:
+        return base+quote, False
+    if quote+base in symbols:
+        return quote+base, True
+    return None
+
+def reference_routes(base, quote, symbols, bridges=BRIDGES):
+    """
+    Function to find the ways the price of a pair can be read from Binance: its own markets and the crosses through a
+    bridge asset, like LINKETH, and LINKUSDT / ETHUSDT through USDT
+
+    Args:
+        base: The base asset of the feed
+        quote: The quote asset of the feed, USD for the stablecoins of USD_QUOTES
+        symbols: The available Binance symbols
+        bridges: The assets to cross through
+
+    Returns:
+        A list of routes, each a list of (symbol, inverted) legs whose prices multiply to the price of the pair
+    """
+    symbols = set(symbols)
+    quotes = USD_QUOTES if quote == "USD" else [quote]
+    routes = []
+    for pair_quote in quotes:
+        leg = pair_leg(base, pair_quote, symbols)
+        if leg is not None:
+            routes.append([leg])
+    for bridge in bridges:
+        if bridge == base or bridge in quotes:
+            continue
+        for pair_quote in quotes:
+            first, second = pair_leg(base, bridge, symbols), pair_leg(bridge, pair_quote, symbols)
+            if first is not None and second is not None:
+                routes.append([first, second])
+    return routes
+
+def route_symbols(base, quote, bridges=BRIDGES):
+    """
+    Returns:
+        Every symbol a route of the pair could use, to download those Binance lists
+    """
+    quotes = USD_QUOTES if quote == "USD" else [quote]
+    pairs = [(base, pair_quote) for pair_quote in quotes]
+    pairs += [(first, second) for bridge in bridges if bridge != base and bridge not in quotes for first, second in [(base, bridge)] + [(bridge, pair_quote) for pair_quote in quotes]]
+    return list(dict.fromkeys(symbol for first, second in pairs for symbol in [first+second, second+first]))
+
+def asof_klines(klines, minutes, max_staleness=MAX_STALENESS):
+    """
+    Function to align klines on a grid of minutes, each minute taking the close of the last kline opened at or before it
+
+    Args:
+        klines: The klines of a symbol, at least one
+        minutes: A sorted int64 array of minutes since the epoch
+        max_staleness: The most minutes a close is carried forward, later minutes are a gap
+
+    Returns:
+        The close at each minute, NaN in gaps, and the volume of the kline opened at each minute, 0 if none was
+    """
+    times = klines["timestamp"] // MINUTE_MS
+    positions = np.searchsorted(times, minutes, side="right") - 1
+    found = positions >= 0
+    positions = np.maximum(positions, 0)
+    age = minutes - times[positions]
+    valid = found & (age <= max_staleness)
+    close = np.where(valid, klines["close"][positions], np.nan)
+    volume = np.where(valid & (age == 0), klines["volume"][positions], 0.0)
+    return close, volume
+
+def route_prices(route, aligned):
+    """
+    Function to get the price of a route and the volume of its thinnest leg in the base asset at each minute
+
+    Args:
+        route: The (symbol, inverted) legs
+        aligned: Dict of the closes and volumes of asof_klines by symbol
+
+    Returns:
+        The prices, NaN where a leg has a gap, and the volumes
+    """
+    price = None
+    volume = None
+    for symbol, inverted in route:
+        close, leg_volume = aligned[symbol]
+        # the volume of BASEQUOTE is in BASE, of QUOTEBASE in QUOTE, worth close units of BASE
+        leg_volume = leg_volume * close if inverted else leg_volume
+        leg_price = 1.0 / close if inverted else close
+        # in units of the route's base asset, through the legs before this one
+        leg_volume = leg_volume if price is None else leg_volume / price
+        price = leg_price if price is None else price * leg_price
+        volume = leg_volume if volume is None else np.fmin(volume, leg_volume)
+    return price, np.nan_to_num(volume)
+
+def composite_prices(prices, volumes, window=VOLUME_WINDOW):
+    """
+    Function to combine the prices of several routes, weighted by their volume over the last minutes
+
+    Args:
+        prices: A routes x minutes array of prices, NaN in gaps
+        volumes: A routes x minutes array of volumes
+        window: The number of minutes the volumes are summed over
+
+    Returns:
+        The price at each minute, the mean of the routes with a price where none traded in the window, NaN where no
+        route has a price, and the weight of each route
+    """
+    cumulative = np.cumsum(volumes, axis=1)
+    before_window = np.zeros_like(cumulative)
+    before_window[:, window:] = cumulative[:, :-window]
+    windowed = cumulative - before_window
+    weights = np.where(np.isnan(prices), 0.0, windowed)
+    total = weights.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weighted = np.nansum(weights * prices, axis=0) / total
+        available = (~np.isnan(prices)).sum(axis=0)
+        mean = np.nansum(prices, axis=0) / available
+    composite = np.where(total > 0, weighted, np.where(available > 0, mean, np.nan))
+    return composite, weights / np.where(total > 0, total, 1.0)
+
+def build_reference_prices(feed_details, start_date=None, end_date=None, klines_dir=KLINES_DIR, max_staleness=MAX_STALENESS, window=VOLUME_WINDOW):
+    """
+    Function to build a feed's minute reference price from the stored Binance klines of every route of its pair
+
+    Args:
+        feed_details: The details of the feed in feeds.json
+        start_date: The first minute as a datetime. The first kline of the routes if None
+        end_date: The last minute as a datetime. The last kline of the routes if None
+        klines_dir: The directory of the klines
+        max_staleness: The most minutes a close is carried forward
+        window: The number of minutes the volumes of the routes are summed over
+
+    Returns:
+        A dict with the first minute in milliseconds, the composite price per minute, the names of the routes and
+        routes x minutes arrays of their prices and weights, also saved to the feed's prices/binance-reference.npz.
+        None if no route has klines stored
+    """
+    base, quote = feed_assets(feed_details)
+    stored = {}
+    for symbol in route_symbols(base, quote):
+        klines = load_klines(symbol, klines_dir)
+        if klines is not None and len(klines["timestamp"]) > 0:
+            stored[symbol] = klines
+    routes = reference_routes(base, quote, stored)
+    if len(routes) == 0:
+        return None
+    used = list(dict.fromkeys(symbol for route in routes for symbol, _ in route))
+
+    to_minute = lambda date: int(date.replace(tzinfo=timezone.utc).timestamp()) // 60
+    first = to_minute(start_date) if start_date is not None else min(int(stored[symbol]["timestamp"][0]) // MINUTE_MS for symbol in used)
+    last = to_minute(end_date) if end_date is not None else max(int(stored[symbol]["timestamp"][-1]) // MINUTE_MS for symbol in used)
+    minutes = np.arange(first, last + 1, dtype=np.int64)
+
+    with metrics.stage("reference.align"):
+        aligned = {symbol: asof_klines(stored[symbol], minutes, max_staleness) for symbol in used}
+    with metrics.stage("reference.composite"):
+        prices, volumes = zip(*[route_prices(route, aligned) for route in routes]) if len(minutes) > 0 else ([], [])
+        prices = np.array(prices).reshape(len(routes), len(minutes))
+        volumes = np.array(volumes).reshape(len(routes), len(minutes))
+        composite, weights = composite_prices(prices, volumes, window)
+    metrics.record_rows("reference.composite", len(minutes))
+
+    reference = {
+        "start": np.int64(first * MINUTE_MS),
+        "price": composite,
+        "routes": np.array(["*".join(("1/" if inverted else "")+symbol for symbol, inverted in route) for route in routes], dtype=str),
+        "routePrices": prices.astype(np.float32),
+        "routeWeights": weights.astype(np.float32)
+    }
+    os.makedirs("data/"+feed_details["path"]+"/prices", exist_ok=True)
+    np.savez_compressed(reference_filename(feed_details["path"]), **reference)
+    return reference
+
+def load_reference_prices(feed_path, routes=False):
+    """
+    Function to read a feed's reference prices
+
+    Args:
+        feed_path: The path of the feed
+        routes: Whether to add a column with the price of each route
+
+    Returns:
+        A DataFrame indexed by UTC minute with the composite price, or None if it was not built
+    """
+    if not os.path.exists(reference_filename(feed_path)):
+        return None
+    with np.load(reference_filename(feed_path)) as arrays:
+        index = pd.to_datetime(int(arrays["start"]) + np.arange(len(arrays["price"]), dtype=np.int64) * MINUTE_MS, unit="ms", utc=True)
+        frame = pd.DataFrame({"price": arrays["price"]}, index=index)
+        if routes:
+            for name, prices in zip(arrays["routes"], arrays["routePrices"]):
+                frame[str(name)] = prices
+    return frame
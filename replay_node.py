@@ -0,0 +1,659 @@
+from eth_abi import abi
+from eth_utils import keccak, to_checksum_address
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+import random
+import json
+import os
+import bisect
+import threading
+import time
+
+ZERO_BLOOM = "0x" + "00" * 256
+
+class RpcError(Exception):
+    """
+    A JSON-RPC error returned to the caller
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+def event_topic(signature):
+    """
+    Function to get the topic0 of an event signature
+
+    Args:
+        signature: The event signature, e.g. NewTransmission(uint32,int192,address,int192[],bytes,bytes32)
+
+    Returns:
+        The topic as a 0x-prefixed hex string
+    """
+    return "0x" + keccak(text=signature).hex()
+
+def function_selector(signature):
+    """
+    Function to get the selector of a function signature
+
+    Args:
+        signature: The function signature, e.g. transmitters()
+
+    Returns:
+        The selector as a 0x-prefixed hex string
+    """
+    return "0x" + keccak(text=signature)[:4].hex()
+
+def encode_topic(param_type, value):
+    return "0x" + abi.encode([param_type], [value]).hex()
+
+def encode_data(param_types, values):
+    return "0x" + abi.encode(param_types, values).hex()
+
+def to_block_number(tag, latest):
+    if tag is None or tag in ("latest", "safe", "finalized", "pending"):
+        return latest
+    if tag == "earliest":
+        return 0
+    return int(tag, 16) if isinstance(tag, str) else int(tag)
+
+def filter_logs(logs, log_filter, latest, log_blocks=None):
+    """
+    Function to apply an eth_getLogs filter to logs
+
+    Args:
+        logs: Logs sorted by block number and log index
+        log_filter: The eth_getLogs filter object
+        latest: The latest block number
+        log_blocks: The block number of each log, to only scan the requested block range
+
+    Returns:
+        The matching logs
+    """
+    from_block = to_block_number(log_filter.get("fromBlock", "latest"), latest)
+    to_block = to_block_number(log_filter.get("toBlock", "latest"), latest)
+    if log_blocks is not None:
+        logs = logs[bisect.bisect_left(log_blocks, from_block):bisect.bisect_right(log_blocks, to_block)]
+    addresses = log_filter.get("address")
+    if isinstance(addresses, str):
+        addresses = [addresses]
+    addresses = None if addresses is None else {address.lower() for address in addresses}
+    topics = log_filter.get("topics") or []
+
+    matches = []
+    for log in logs:
+        block_number = int(log["blockNumber"], 16)
+        if block_number < from_block or block_number > to_block:
+            continue
+        if addresses is not None and log["address"].lower() not in addresses:
+            continue
+        matched = True
+        for position, wanted in enumerate(topics):
+            if wanted is None:
+                continue
+            wanted = [wanted] if isinstance(wanted, str) else wanted
+            if position >= len(log["topics"]) or log["topics"][position].lower() not in {topic.lower() for topic in wanted}:
+                matched = False
+                break
+        if matched:
+            matches.append(log)
+    return matches
+
+class SyntheticChain:
+    """
+    Generates an aggregator's history with NewTransmission, AnswerUpdated, OraclePaid, ConfigSet, BillingSet and
+    PayeeshipTransferred events, and answers the RPC calls the collectors make against it
+    """
+
+    def __init__(self, rounds=1000, operators=31, observers_missing_rate=0.02, start_block=16000000, start_timestamp=1672531200, blocks_per_round=20, payment_interval=500, decimals=8, seed=0, name="aggregator"):
+        """
+        Args:
+            rounds: The number of transmissions
+            operators: The number of operators in the transmitter set
+            observers_missing_rate: The probability of an operator missing an observation
+            start_block: The block of the first round
+            start_timestamp: The timestamp of the first round's block
+            blocks_per_round: The number of blocks between rounds
+            payment_interval: Every operator withdraws in the same block after this many rounds
+            decimals: The decimals of the feed's answers
+            seed: The seed of the generator
+            name: Seeds the aggregator's address and transaction hashes, so chains with different names can be merged
+        """
+        generator = random.Random(seed)
+        self.name = name
+        self.decimals = decimals
+        self.start_block = start_block
+        self.start_timestamp = start_timestamp
+        self.aggregator_address = to_checksum_address(keccak(text=name).hex()[-40:])
+        self.transmitters = [to_checksum_address(keccak(text="transmitter"+str(index)).hex()[-40:]) for index in range(operators)]
+        self.payees = [to_checksum_address(keccak(text="payee"+str(index)).hex()[-40:]) for index in range(operators)]
+        self.logs = []
+        self.receipts = {}
+        self.block_transactions = {}
+        self.answers = []
+
+        topics = {
+            "NewTransmission": event_topic("NewTransmission(uint32,int192,address,int192[],bytes,bytes32)"),
+            "AnswerUpdated": event_topic("AnswerUpdated(int256,uint256,uint256)"),
+            "OraclePaid": event_topic("OraclePaid(address,address,uint256)"),
+            "ConfigSet": event_topic("ConfigSet(uint32,uint64,address[],address[],uint8,uint64,bytes)"),
+            "BillingSet": event_topic("BillingSet(uint32,uint32,uint32,uint32,uint32)"),
+            "PayeeshipTransferred": event_topic("PayeeshipTransferred(address,address,address)")
+        }
+        self.topics = topics
+
+        # configuration at the block before the first round
+        signers = [to_checksum_address(keccak(text="signer"+str(index)).hex()[-40:]) for index in range(operators)]
+        setup_logs = [
+            {"topics": [topics["ConfigSet"]], "data": encode_data(["uint32", "uint64", "address[]", "address[]", "uint8", "uint64", "bytes"], [0, 1, signers, self.transmitters, operators // 3, 1, b""])},
+            {"topics": [topics["BillingSet"]], "data": encode_data(["uint32"] * 5, [3000, 60, 200000000, 90000000, 540000000])}
+        ]
+        for transmitter, payee in zip(self.transmitters, self.payees):
+            setup_logs.append({"topics": [topics["PayeeshipTransferred"], encode_topic("address", transmitter), encode_topic("address", "0x" + "00" * 20), encode_topic("address", payee)], "data": "0x"})
+        self._add_transaction(start_block - 1, "setup", self.payees[0], setup_logs, generator)
+
+        price = 1500 * 10 ** decimals
+        for round_id in range(1, rounds + 1):
+            block_number = start_block + (round_id - 1) * blocks_per_round
+            price = max(1, int(price * (1 + generator.gauss(0, 0.002))))
+            observer_indexes = [index for index in range(operators) if generator.random() >= observers_missing_rate]
+            observations = sorted((int(price * (1 + generator.gauss(0, 0.0005))), index) for index in observer_indexes)
+            answer = observations[len(observations) // 2][0]
+            transmitter = self.transmitters[round_id % operators]
+            timestamp = self.block_timestamp(block_number)
+
+            transmission_data = encode_data(
+                ["int192", "address", "int192[]", "bytes", "bytes32"],
+                [answer, transmitter, [value for value, _ in observations], bytes(index for _, index in observations), keccak(text="context"+str(round_id))]
+            )
+            self._add_transaction(block_number, "round"+str(round_id), transmitter, [
+                {"topics": [topics["NewTransmission"], encode_topic("uint32", round_id)], "data": transmission_data},
+                {"topics": [topics["AnswerUpdated"], encode_topic("int256", answer), encode_topic("uint256", round_id)], "data": encode_data(["uint256"], [timestamp])}
+            ], generator)
+            self.answers.append((block_number, answer))
+
+            if round_id % payment_interval == 0:
+                for index, (transmitter_address, payee) in enumerate(zip(self.transmitters, self.payees)):
+                    amount = generator.randint(10, 100) * 10 ** 18
+                    self._add_transaction(block_number + 1, "payment"+str(round_id)+"-"+str(index), payee, [
+                        {"topics": [topics["OraclePaid"]], "data": encode_data(["address", "address", "uint256"], [transmitter_address, payee, amount])}
+                    ], generator)
+
+        self.logs.sort(key=lambda log: (int(log["blockNumber"], 16), int(log["logIndex"], 16)))
+        self.log_blocks = [int(log["blockNumber"], 16) for log in self.logs]
+        self.latest_block = max(self.block_transactions) + blocks_per_round
+
+    def block_timestamp(self, block_number):
+        return self.start_timestamp + (block_number - self.start_block) * 12
+
+    def block_hash(self, block_number):
+        return "0x" + keccak(text="block"+str(block_number)).hex()
+
+    def base_fee(self, block_number):
+        # between 5 and 15 gwei, so some transmissions pay less than the base fee plus a tip
+        return 5000000000 + int(keccak(text="baseFee"+str(block_number)).hex()[:8], 16) % 10000 * 1000000
+
+    def fee_history(self, block_count, newest_block, percentiles):
+        """
+        Function to answer eth_feeHistory like geth, with the rewards weighted by the gas used of each transaction
+
+        Args:
+            block_count: The number of blocks, at most 1024
+            newest_block: The last block
+            percentiles: The percentiles of the priority fees to return for each block
+
+        Returns:
+            The eth_feeHistory result
+        """
+        newest_block = min(newest_block, self.latest_block)
+        oldest_block = max(newest_block - min(block_count, 1024) + 1, 0)
+        gas_used_ratios = []
+        rewards = []
+        for block_number in range(oldest_block, newest_block + 1):
+            receipts = [self.receipts[tx_hash] for tx_hash in self.block_transactions.get(block_number, [])]
+            tips = sorted((max(int(receipt["effectiveGasPrice"], 16) - self.base_fee(block_number), 0), int(receipt["gasUsed"], 16)) for receipt in receipts)
+            gas_used = sum(gas for _, gas in tips)
+            gas_used_ratios.append(gas_used / 30000000)
+            block_rewards = []
+            for percentile in percentiles:
+                if len(tips) == 0:
+                    block_rewards.append(hex(0))
+                    continue
+                threshold = gas_used * percentile / 100
+                cumulative = 0
+                for tip, gas in tips:
+                    cumulative += gas
+                    if cumulative >= threshold:
+                        break
+                block_rewards.append(hex(tip))
+            rewards.append(block_rewards)
+        return {
+            "oldestBlock": hex(oldest_block),
+            # the base fee of the block after the newest one is included
+            "baseFeePerGas": [hex(self.base_fee(block_number)) for block_number in range(oldest_block, newest_block + 2)],
+            "gasUsedRatio": gas_used_ratios,
+            "reward": rewards
+        }
+
+    def _add_transaction(self, block_number, key, sender, logs, generator):
+        tx_hash = "0x" + keccak(text="tx"+self.name+key).hex()
+        transactions = self.block_transactions.setdefault(block_number, [])
+        gas_used = generator.randint(150000, 400000)
+        gas_price = generator.randint(10, 100) * 1000000000
+        formatted_logs = []
+        for log in logs:
+            log_index = sum(len(self.receipts[other]["logs"]) for other in transactions) + len(formatted_logs)
+            formatted_logs.append({
+                "address": self.aggregator_address,
+                "topics": log["topics"],
+                "data": log["data"],
+                "blockNumber": hex(block_number),
+                "blockHash": self.block_hash(block_number),
+                "transactionHash": tx_hash,
+                "transactionIndex": hex(len(transactions)),
+                "logIndex": hex(log_index),
+                "removed": False
+            })
+        self.receipts[tx_hash] = {
+            "transactionHash": tx_hash,
+            "transactionIndex": hex(len(transactions)),
+            "blockHash": self.block_hash(block_number),
+            "blockNumber": hex(block_number),
+            "from": sender.lower(),
+            "to": self.aggregator_address.lower(),
+            "cumulativeGasUsed": hex(gas_used * (len(transactions) + 1)),
+            "gasUsed": hex(gas_used),
+            "effectiveGasPrice": hex(gas_price),
+            "contractAddress": None,
+            "logs": formatted_logs,
+            "logsBloom": ZERO_BLOOM,
+            "status": "0x1",
+            "type": "0x2"
+        }
+        transactions.append(tx_hash)
+        self.logs.extend(formatted_logs)
+
+    def block(self, block_number, full_transactions=False):
+        if block_number > self.latest_block or block_number < 0:
+            return None
+        transactions = self.block_transactions.get(block_number, [])
+        return {
+            "number": hex(block_number),
+            "hash": self.block_hash(block_number),
+            "parentHash": self.block_hash(block_number - 1),
+            "timestamp": hex(self.block_timestamp(block_number)),
+            "miner": "0x" + "00" * 20,
+            "difficulty": "0x0",
+            "totalDifficulty": "0x0",
+            "extraData": "0x",
+            "size": "0x0",
+            "gasLimit": hex(30000000),
+            "gasUsed": hex(sum(int(self.receipts[tx_hash]["gasUsed"], 16) for tx_hash in transactions)),
+            "baseFeePerGas": hex(self.base_fee(block_number)),
+            "logsBloom": ZERO_BLOOM,
+            "transactionsRoot": "0x" + "00" * 32,
+            "stateRoot": "0x" + "00" * 32,
+            "receiptsRoot": "0x" + "00" * 32,
+            "sha3Uncles": "0x" + "00" * 32,
+            "nonce": "0x0000000000000000",
+            "mixHash": "0x" + "00" * 32,
+            "uncles": [],
+            "transactions": [self.transaction(tx_hash) for tx_hash in transactions] if full_transactions else transactions
+        }
+
+    def transaction(self, tx_hash):
+        receipt = self.receipts[tx_hash]
+        return {
+            "hash": tx_hash,
+            "blockHash": receipt["blockHash"],
+            "blockNumber": receipt["blockNumber"],
+            "transactionIndex": receipt["transactionIndex"],
+            "from": receipt["from"],
+            "to": receipt["to"],
+            "gas": hex(500000),
+            "gasPrice": receipt["effectiveGasPrice"],
+            "input": "0x",
+            "nonce": "0x0",
+            "value": "0x0",
+            "type": receipt["type"]
+        }
+
+    def call(self, call, block_number):
+        selector = call["data"][:10] if "data" in call else call["input"][:10]
+        if selector == function_selector("transmitters()"):
+            return encode_data(["address[]"], [self.transmitters])
+        if selector == function_selector("decimals()"):
+            return encode_data(["uint8"], [self.decimals])
+        if selector == function_selector("latestAnswer()"):
+            latest_answer = 0
+            for answer_block, answer in self.answers:
+                if answer_block > block_number:
+                    break
+                latest_answer = answer
+            return encode_data(["int256"], [latest_answer])
+        raise RpcError(-32000, "execution reverted")
+
+    def handle(self, method, params):
+        """
+        Function to answer a JSON-RPC call
+
+        Args:
+            method: The JSON-RPC method
+            params: The JSON-RPC params
+
+        Returns:
+            The JSON-RPC result
+        """
+        if method == "eth_chainId":
+            return "0x1"
+        if method == "net_version":
+            return "1"
+        if method == "eth_blockNumber":
+            return hex(self.latest_block)
+        if method == "eth_getBlockByNumber":
+            return self.block(to_block_number(params[0], self.latest_block), params[1] if len(params) > 1 else False)
+        if method == "eth_getBlockByHash":
+            for block_number in self.block_transactions:
+                if self.block_hash(block_number) == params[0].lower():
+                    return self.block(block_number, params[1] if len(params) > 1 else False)
+            return None
+        if method == "eth_getTransactionReceipt":
+            return self.receipts.get(params[0].lower())
+        if method == "eth_getBlockReceipts":
+            block_number = to_block_number(params[0], self.latest_block)
+            if block_number > self.latest_block or block_number < 0:
+                return None
+            return [self.receipts[tx_hash] for tx_hash in self.block_transactions.get(block_number, [])]
+        if method == "eth_getTransactionByHash":
+            return self.transaction(params[0].lower()) if params[0].lower() in self.receipts else None
+        if method == "eth_getLogs":
+            return filter_logs(self.logs, params[0], self.latest_block, self.log_blocks)
+        if method == "eth_feeHistory":
+            block_count = int(params[0], 16) if isinstance(params[0], str) else int(params[0])
+            return self.fee_history(block_count, to_block_number(params[1], self.latest_block), params[2] if len(params) > 2 else [])
+        if method == "eth_call":
+            return self.call(params[0], to_block_number(params[1] if len(params) > 1 else "latest", self.latest_block))
+        raise RpcError(-32601, "the method "+method+" does not exist/is not available")
+
+    def nop_details(self):
+        """
+        Returns:
+            The contents of a nops.json matching the synthetic operators
+        """
+        nops_details = {}
+        for index, (transmitter, payee) in enumerate(zip(self.transmitters, self.payees)):
+            nops_details[transmitter.lower()] = {"name": "operator_"+str(index).zfill(2), "paymentAddress": [payee.lower()]}
+        return {"nops_details": nops_details, "transmitters": self.transmitters}
+
+class MergedChain:
+    """
+    Serves several SyntheticChains with different names as one chain, like aggregators of many feeds on one network
+    """
+
+    def __init__(self, chains):
+        """
+        Args:
+            chains: The SyntheticChains to merge
+        """
+        self.chains = chains
+        self.latest_block = max(chain.latest_block for chain in chains)
+        # log indexes are only unique per chain, which none of the collectors rely on
+        self.logs = sorted((log for chain in chains for log in chain.logs), key=lambda log: (int(log["blockNumber"], 16), log["address"], int(log["logIndex"], 16)))
+        self.log_blocks = [int(log["blockNumber"], 16) for log in self.logs]
+
+    def handle(self, method, params):
+        """
+        Function to answer a JSON-RPC call
+
+        Args:
+            method: The JSON-RPC method
+            params: The JSON-RPC params
+
+        Returns:
+            The JSON-RPC result
+        """
+        if method == "eth_blockNumber":
+            return hex(self.latest_block)
+        if method == "eth_getLogs":
+            return filter_logs(self.logs, params[0], self.latest_block, self.log_blocks)
+        if method == "eth_call":
+            call = params[0]
+            for chain in self.chains:
+                if chain.aggregator_address.lower() == call["to"].lower():
+                    return chain.handle(method, params)
+            return "0x"
+        if method in ["eth_getBlockByNumber", "eth_getBlockByHash"]:
+            blocks = [chain.handle(method, params) for chain in self.chains]
+            blocks = [block for block in blocks if block is not None]
+            if len(blocks) == 0:
+                return None
+            return dict(blocks[0], transactions=[tx for block in blocks for tx in block["transactions"]])
+        if method == "eth_getBlockReceipts":
+            receipts = [chain.handle(method, params) for chain in self.chains]
+            if all(block_receipts is None for block_receipts in receipts):
+                return None
+            return [receipt for block_receipts in receipts if block_receipts is not None for receipt in block_receipts]
+        if method in ["eth_getTransactionReceipt", "eth_getTransactionByHash"]:
+            for chain in self.chains:
+                result = chain.handle(method, params)
+                if result is not None:
+                    return result
+            return None
+        return self.chains[0].handle(method, params)
+
+class FixtureChain:
+    """
+    Answers JSON-RPC calls from recorded responses, keyed by method and params
+    """
+
+    def __init__(self, responses=None):
+        """
+        Args:
+            responses: A dict of recorded responses from request_key to result
+        """
+        self.responses = responses if responses is not None else {}
+
+    def handle(self, method, params):
+        key = request_key(method, params)
+        if key not in self.responses:
+            raise RpcError(-32000, "no recorded response for "+key)
+        return self.responses[key]
+
+class RecordingChain:
+    """
+    Forwards JSON-RPC calls to a live node and records the responses for a FixtureChain
+    """
+
+    def __init__(self, upstream_url):
+        """
+        Args:
+            upstream_url: The endpoint of the node to forward calls to
+        """
+        self.upstream_url = upstream_url
+        self.responses = {}
+
+    def handle(self, method, params):
+        payload = {"jsonrpc": "2.0", "method": method, "params": params, "id": 1}
+        response = json.loads(requests.post(self.upstream_url, json=payload).text)
+        if "error" in response:
+            raise RpcError(response["error"]["code"], response["error"]["message"])
+        self.responses[request_key(method, params)] = response["result"]
+        return response["result"]
+
+def request_key(method, params):
+    return method + ":" + json.dumps(params, sort_keys=True)
+
+def save_fixture(chain, filename):
+    """
+    Function to save the responses of a RecordingChain or FixtureChain to a file
+
+    Args:
+        chain: The chain with recorded responses
+        filename: The file to write
+    """
+    dir_path = os.path.dirname(filename)
+    if dir_path != "":
+        os.makedirs(dir_path, exist_ok=True)
+    with open(filename, "w", encoding="utf-8") as outfile:
+        json.dump(chain.responses, outfile)
+
+def load_fixture(filename):
+    """
+    Function to load recorded responses
+
+    Args:
+        filename: The file written by save_fixture
+
+    Returns:
+        A FixtureChain answering from the recorded responses
+    """
+    with open(filename, "r") as file:
+        return FixtureChain(json.load(file))
+
+def write_feed_fixture(chain, feed_path):
+    """
+    Function to write the nops.json of a synthetic chain so the collectors can run against it
+
+    Args:
+        chain: The SyntheticChain
+        feed_path: The path of the feed to write under data/
+    """
+    dir_path = "data/"+feed_path
+    os.makedirs(dir_path, exist_ok=True)
+    with open(dir_path+"/nops.json", "w", encoding="utf-8") as outfile:
+        json.dump(chain.nop_details(), outfile, ensure_ascii=False, indent=4)
+
+class ReplayNode:
+    """
+    A local JSON-RPC endpoint serving a chain, with configurable latency and error injection
+    """
+
+    def __init__(self, chain, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, host="127.0.0.1", port=0):
+        """
+        Args:
+            chain: The SyntheticChain, FixtureChain or RecordingChain to serve
+            latency: Seconds to wait before every response
+            jitter: Maximum extra seconds of uniformly random wait before every response
+            error_rate: The probability of answering a call with a JSON-RPC error instead of its result
+            seed: The seed for the jitter and injected errors, so runs are reproducible
+            host: The host to listen on
+            port: The port to listen on. A free port is picked if 0
+        """
+        self.chain = chain
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://"+host+":"+str(port)
+
+    def _answer(self, request):
+        with self.lock:
+            self.calls[request["method"]] = self.calls.get(request["method"], 0) + 1
+            wait = self.latency + self.random.uniform(0, self.jitter)
+            fail = self.random.random() < self.error_rate
+        if wait > 0:
+            time.sleep(wait)
+
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        if fail:
+            response["error"] = {"code": -32005, "message": "injected error"}
+            return response
+        try:
+            response["result"] = self.chain.handle(request["method"], request.get("params", []))
+        except RpcError as error:
+            response["error"] = {"code": error.code, "message": error.message}
+        return response
+
+    def _handler(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                request = json.loads(body)
+                # batches are answered in order, one entry per call
+                response = [node._answer(call) for call in request] if isinstance(request, list) else node._answer(request)
+                payload = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """
+        Function to start serving in a background thread
+
+        Returns:
+            The node
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Function to stop serving
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+if __name__ == "__main__":
+    import sys
+
+    # Read args
+    args = sys.argv
+
+    if len(args) < 3:
+        print("Please pass in a mode like: python replay_node.py synthetic 1000 31 8545, python replay_node.py fixture fixture.json 8545 or python replay_node.py record https://node fixture.json 8545")
+        exit()
+
+    mode = args[1].lower()
+    if mode == "synthetic":
+        chain = SyntheticChain(rounds=int(args[2]), operators=int(args[3]) if len(args) > 3 else 31)
+        port = int(args[4]) if len(args) > 4 else 8545
+        write_feed_fixture(chain, "synthetic/mainnet/synthetic")
+        print("Aggregator "+chain.aggregator_address+" with operators in data/synthetic/mainnet/synthetic/nops.json")
+    elif mode == "fixture":
+        chain = load_fixture(args[2])
+        port = int(args[3]) if len(args) > 3 else 8545
+    elif mode == "record":
+        chain = RecordingChain(args[2])
+        port = int(args[4]) if len(args) > 4 else 8545
+    else:
+        print("Unknown mode "+mode)
+        exit()
+
+    node = ReplayNode(chain, port=port)
+    print("Serving on "+node.url)
+    try:
+        node.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        node.server.server_close()
+        if mode == "record":
+            save_fixture(chain, args[3])
+            print("Saved "+str(len(chain.responses))+" responses to "+args[3])
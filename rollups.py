@@ -0,0 +1,602 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import io
+import os
+from helper import read_nop_details, get_block_billing, get_unique_withdrawal_dates, finalize_range_total, transmission_repayments_eth
+from attribution import load_price_store, price_at_blocks, missed_streaks
+from operator_index import find_feed_paths, file_stamp
+from sketches import QuantileSketch, aggregate_counts
+
+ROLLUP_VERSION = 2
+# Seconds per period of the time rollups, in UTC
+GRANULARITIES = {"hourly": 3600, "daily": 86400}
+# Per-operator metrics of the submissions, summed over the rows of a period except the maxima
+SUBMISSION_METRICS = ["rounds", "observations", "missed", "deviationSum", "deviationCount", "maxDeviation", "transmissions", "observedTransmissions", "fees", "feesUsd", "consecutiveMissed", "maxConsecutiveMissed", "separateMissed"]
+# The withdrawal ranges also keep the gas repayments at the billing parameters of their withdrawal
+RANGE_METRICS = SUBMISSION_METRICS + ["repaymentsEth"]
+MAX_METRICS = ["maxDeviation", "maxConsecutiveMissed"]
+PAYMENT_METRICS = ["payments", "paidLink", "paidUsd"]
+# Deviation quantiles reported by default
+QUANTILES = [0.5, 0.95, 0.99]
+SOURCE_FILES = ["transmissions.csv", "payments.csv", "billing_params.json", "nops.json", "prices/eth-usd.json", "prices/link-usd.json"]
+
+def rollup_dir(feed_path):
+    return "data/"+feed_path+"/rollups"
+
+def missing_rollup_sources(feed_path):
+    """
+    Function to find the files a feed still needs before it can be rolled up
+
+    Args:
+        feed_path: The path of the feed
+
+    Returns:
+        An array of the missing files
+    """
+    return [filename for filename in SOURCE_FILES if not os.path.exists("data/"+feed_path+"/"+filename)]
+
+def read_rows(filename, offset):
+    """
+    Function to read the rows of a CSV file from a byte offset
+
+    Args:
+        filename: The CSV file, without quoted newlines
+        offset: The offset of the first row to read. The header is always read
+
+    Returns:
+        1. A DataFrame with the rows
+        2. An array with the byte offset of each row
+        3. The offset after the last complete row
+        4. The header line
+    """
+    with open(filename, "rb") as file:
+        header = file.readline()
+        offset = max(offset, len(header))
+        file.seek(offset)
+        content = file.read()
+    # a row still being written has no newline yet
+    content = content[:content.rfind(b"\n") + 1]
+    newlines = np.flatnonzero(np.frombuffer(content, dtype=np.uint8) == ord("\n"))
+    starts = offset + np.concatenate([[0], newlines[:-1] + 1]) if len(newlines) > 0 else np.zeros(0, dtype=np.int64)
+    frame = pd.read_csv(io.BytesIO(header + content), dtype={"txDate": str, "submitter": str})
+    return frame, starts, offset + len(content), header
+
+def operator_names(header, nop_details, transmitters):
+    """
+    Returns:
+        The names of the transmitters with an answer column in the transmissions, in transmitters order
+    """
+    columns = header.decode().rstrip("\r\n").split(",")
+    names = dict.fromkeys(nop_details[transmitter.lower()]["name"] for transmitter in transmitters)
+    return [name for name in names if name+"_answer" in columns and name+"_deviation" in columns]
+
+def operator_rows(frame, names, address_names, eth_prices, streaks):
+    """
+    Function to build the per-operator metrics of every row
+
+    Args:
+        frame: DataFrame of transmissions
+        names: The names of the operators, one column each
+        address_names: Dict of operator names by lowercase transmitter address
+        eth_prices: The eth-usd price store of the feed
+        streaks: Dict of each operator's consecutive missed counter at the row before the frame, -1 if it did not miss
+
+    Returns:
+        1. A dict of rows x operators arrays for every metric in SUBMISSION_METRICS
+        2. The rows x operators consecutive missed counters
+    """
+    def matrix(suffix):
+        if len(names) == 0:
+            return np.zeros((len(frame), 0))
+        return np.column_stack([frame[name+suffix].to_numpy(dtype=np.float64) for name in names])
+
+    answers = matrix("_answer")
+    deviations = matrix("_deviation")
+    missed = answers == 0
+
+    # continue each streak from the previous rows, as if they were in the frame
+    counters = np.zeros(answers.shape, dtype=np.int64)
+    separate = np.zeros(answers.shape, dtype=np.int64)
+    for column, name in enumerate(names):
+        carried = streaks.get(name, -1) + 1
+        counter, starts, _ = missed_streaks(np.concatenate([np.zeros(carried), answers[:, column]]))
+        counters[:, column] = counter[carried:]
+        separate[:, column] = starts[carried:]
+
+    submitters = frame["submitter"].str.lower().map(address_names).to_numpy()
+    transmitted = submitters[:, None] == np.array(names, dtype=object)[None, :]
+    fees = frame["fee"].to_numpy(dtype=np.float64)
+    fees_usd = fees * price_at_blocks(eth_prices, frame["blockNumber"].to_numpy())
+
+    rows = {
+        "rounds": np.ones(answers.shape),
+        "observations": ~missed,
+        "missed": missed,
+        "deviationSum": np.nan_to_num(deviations),
+        "deviationCount": ~np.isnan(deviations),
+        "maxDeviation": deviations,
+        "transmissions": transmitted,
+        "observedTransmissions": transmitted & ~missed,
+        "fees": np.where(transmitted, fees[:, None], 0.0),
+        "feesUsd": np.where(transmitted, fees_usd[:, None], 0.0),
+        "consecutiveMissed": counters != 0,
+        "maxConsecutiveMissed": counters.astype(np.float64),
+        "separateMissed": separate != 0
+    }
+    return rows, counters
+
+def aggregate(periods, rows, operators_count):
+    """
+    Function to aggregate rows x operators metrics by period
+
+    Args:
+        periods: The period of each row
+        rows: A dict of rows x operators arrays by metric
+        operators_count: The number of operators
+
+    Returns:
+        The sorted unique periods and a dict of periods x operators arrays by metric
+    """
+    unique_periods, inverse = np.unique(np.asarray(periods, dtype=np.int64), return_inverse=True)
+    aggregated = {}
+    for metric, values in rows.items():
+        if metric in MAX_METRICS:
+            aggregated[metric] = np.full((len(unique_periods), operators_count), np.nan)
+            np.fmax.at(aggregated[metric], inverse, values)
+        else:
+            aggregated[metric] = np.zeros((len(unique_periods), operators_count))
+            np.add.at(aggregated[metric], inverse, np.asarray(values, dtype=np.float64))
+    return unique_periods, aggregated
+
+def merge(stored, periods, aggregated, operators_count):
+    """
+    Function to add aggregated periods to stored ones, combining the periods they share
+
+    Args:
+        stored: The stored periods and dict of arrays, or None
+        periods: The new periods
+        aggregated: The new dict of periods x operators arrays
+        operators_count: The number of operators
+
+    Returns:
+        The merged periods and dict of arrays
+    """
+    if stored is None or len(stored[0]) == 0:
+        return periods, aggregated
+    return aggregate(np.concatenate([stored[0], periods]), {metric: np.concatenate([stored[1][metric], aggregated[metric]]) for metric in aggregated}, operators_count)
+
+def withdrawal_ranges(payments, billing_params, link_prices):
+    """
+    Function to get the withdrawal ranges of get_totals with the withdrawal block, LINK price and billing parameters of each
+
+    Args:
+        payments: DataFrame of payments
+        billing_params: All the billing params for each block
+        link_prices: The link-usd prices by block
+
+    Returns:
+        An array of ranges
+    """
+    ranges = []
+    dates = get_unique_withdrawal_dates(payments)
+    for index, withdrawal_date in enumerate(dates):
+        withdrawal_block = int(payments[payments["txDate"] == withdrawal_date].iloc[0]["blockNumber"])
+        ranges.append({
+            "from": payments[payments["txDate"] <= withdrawal_date].iloc[0]["txDate"] if index == 0 else dates[index-1],
+            "to": withdrawal_date,
+            "withdrawalBlock": withdrawal_block,
+            "linkPrice": link_prices.get(str(withdrawal_block)),
+            "billing": get_block_billing(withdrawal_block, billing_params)
+        })
+    # as stored in the state
+    return json.loads(json.dumps(ranges))
+
+def prices_digest(prices, last_block):
+    """
+    Returns:
+        A digest of the prices at or before a block, which the rolled up rows depend on
+    """
+    known = sorted((int(block), value) for block, value in prices.items() if int(block) <= last_block)
+    return hashlib.sha1(json.dumps(known).encode()).hexdigest()
+
+def tail_digest(filename, offset):
+    """
+    Returns:
+        A digest of the bytes before an offset of a file, to check that rows were only appended after it
+    """
+    with open(filename, "rb") as file:
+        start = max(offset - 4096, 0)
+        file.seek(start)
+        return hashlib.sha1(file.read(offset - start)).hexdigest()
+
+def payment_rollups(payments, payees, link_prices, ranges):
+    """
+    Function to roll up the payments of every operator, which are small enough to be rolled up again on every update
+
+    Args:
+        payments: DataFrame of payments
+        payees: The names of the paid operators, one column each
+        link_prices: The link-usd price store of the feed
+        ranges: The withdrawal ranges
+
+    Returns:
+        A dict of the periods and dict of periods x operators arrays for each granularity and the ranges
+    """
+    columns = payments["oracleName"].map({name: index for index, name in enumerate(payees)}).to_numpy()
+    paid = columns[:, None] == np.arange(len(payees))[None, :]
+    amounts = payments["amount"].to_numpy(dtype=np.float64)
+    usd_amounts = amounts * price_at_blocks(link_prices, payments["blockNumber"].to_numpy())
+    rows = {
+        "payments": paid,
+        "paidLink": np.where(paid, amounts[:, None], 0.0),
+        "paidUsd": np.where(paid, usd_amounts[:, None], 0.0)
+    }
+
+    rollups = {}
+    timestamps = payments["txTimestamp"].to_numpy(dtype=np.int64)
+    for granularity, seconds in GRANULARITIES.items():
+        rollups[granularity] = aggregate(timestamps // seconds * seconds, rows, len(payees))
+
+    # payments after the previous withdrawal up to and including this one, as in get_totals
+    range_ids = np.searchsorted(np.array([withdrawal_range["to"] for withdrawal_range in ranges], dtype=object), payments["txDate"].to_numpy(dtype=object), side="left")
+    in_range = range_ids < len(ranges)
+    rollups["ranges"] = aggregate(range_ids[in_range], {metric: values[in_range] for metric, values in rows.items()}, len(payees))
+    return rollups
+
+def load_arrays(feed_path, granularity, prefix=""):
+    filename = rollup_dir(feed_path)+"/"+granularity+".npz"
+    if not os.path.exists(filename):
+        return None
+    arrays = np.load(filename)
+    metrics = [key[len(prefix):] for key in arrays.files if key.startswith(prefix) and key != prefix+"periods" and (prefix != "" or not key.startswith("payment_"))]
+    return arrays[prefix+"periods"], {metric: arrays[prefix+metric] for metric in metrics}
+
+def load_sketches(feed_path):
+    """
+    Function to load a feed's daily deviation sketches
+
+    Args:
+        feed_path: The path of the feed
+
+    Returns:
+        The days, operator columns, buckets and counts, see aggregate_counts, or None if there are none
+    """
+    filename = rollup_dir(feed_path)+"/deviation_sketches.npz"
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as arrays:
+        return arrays["periods"], arrays["operators"], arrays["buckets"], arrays["counts"]
+
+def read_state(feed_path):
+    filename = rollup_dir(feed_path)+"/state.json"
+    if not os.path.exists(filename):
+        return None
+    with open(filename, "r") as file:
+        return json.load(file)
+
+def update_rollups(feed_path):
+    """
+    Function to bring a feed's hourly, daily and per-withdrawal-range rollups up to date. Only the transmissions after the
+    last withdrawal are read again when rows were appended. Everything is rolled up again if older rows, the operators,
+    the earlier prices or the earlier ranges changed
+
+    Args:
+        feed_path: The path of the feed
+
+    Returns:
+        The state of the rollups
+    """
+    transmissions_filename = "data/"+feed_path+"/transmissions.csv"
+    nop_details, transmitters = read_nop_details(feed_path)
+    payments = pd.read_csv("data/"+feed_path+"/payments.csv", dtype={"txDate": str})
+    with open("data/"+feed_path+"/billing_params.json", "r") as file:
+        billing_params = json.load(file)
+    with open("data/"+feed_path+"/prices/link-usd.json", "r") as file:
+        link_prices = json.load(file)
+    with open("data/"+feed_path+"/prices/eth-usd.json", "r") as file:
+        eth_prices = json.load(file)
+    ranges = withdrawal_ranges(payments, billing_params, link_prices)
+    with open(transmissions_filename, "rb") as file:
+        header = file.readline()
+
+    state = read_state(feed_path)
+    rebuild = (state is None
+        or state["version"] != ROLLUP_VERSION
+        or state["nops"] != file_stamp("data/"+feed_path+"/nops.json")
+        or state["header"] != header.decode()
+        or os.path.getsize(transmissions_filename) < state["processed"]
+        or state["processedDigest"] != tail_digest(transmissions_filename, state["processed"])
+        or state["ethPricesDigest"] != prices_digest(eth_prices, state["lastBlock"])
+        or state["ranges"] != ranges[:len(state["ranges"])])
+    if rebuild:
+        state = {
+            "version": ROLLUP_VERSION,
+            "nops": file_stamp("data/"+feed_path+"/nops.json"),
+            "header": header.decode(),
+            "operators": operator_names(header, nop_details, transmitters),
+            "processed": len(header),
+            "lastBlock": -1,
+            "ranges": [],
+            # the rows after the last withdrawal, which are not in a range yet
+            "tail": {"offset": len(header), "streaks": {}}
+        }
+    names = state["operators"]
+    address_names = {address.lower(): details["name"] for address, details in nop_details.items()}
+
+    frame, starts, end, _ = read_rows(transmissions_filename, state["tail"]["offset"])
+    rows, counters = operator_rows(frame, names, address_names, load_price_store(feed_path, "eth-usd"), state["tail"]["streaks"])
+
+    stored = {granularity: None if rebuild else load_arrays(feed_path, granularity) for granularity in list(GRANULARITIES) + ["ranges"]}
+    rollups = {}
+
+    # the rows after the last update go to the time rollups
+    new_rows = starts >= state["processed"]
+    timestamps = frame["timestamp"].to_numpy(dtype=np.int64)[new_rows]
+    for granularity, seconds in GRANULARITIES.items():
+        periods, aggregated = aggregate(timestamps // seconds * seconds, {metric: values[new_rows] for metric, values in rows.items()}, len(names))
+        rollups[granularity] = merge(stored[granularity], periods, aggregated, len(names))
+
+    # the deviations of the operators' observations in the new rows go to a sketch per operator and day
+    deviations = rows["maxDeviation"][new_rows]
+    sketch_rows, sketch_columns = np.nonzero(rows["observations"][new_rows] & ~np.isnan(deviations))
+    sketches = aggregate_counts((timestamps // GRANULARITIES["daily"] * GRANULARITIES["daily"])[sketch_rows], sketch_columns, QuantileSketch().buckets(deviations[sketch_rows, sketch_columns]))
+    stored_sketches = None if rebuild else load_sketches(feed_path)
+    if stored_sketches is not None:
+        sketches = aggregate_counts(*[np.concatenate([stored_values, values]) for stored_values, values in zip(stored_sketches, sketches)])
+
+    # the tail rows before a new withdrawal go to its range
+    closed = len(state["ranges"])
+    new_dates = np.array([withdrawal_range["to"] for withdrawal_range in ranges[closed:]], dtype=object)
+    range_ids = closed + np.searchsorted(new_dates, frame["txDate"].to_numpy(dtype=object), side="right")
+    in_range = range_ids < len(ranges)
+    range_rows = {metric: values[in_range] for metric, values in rows.items()}
+    billing = {key: np.array([withdrawal_range["billing"][key] for withdrawal_range in ranges] + [np.nan], dtype=np.float64)[range_ids[in_range]] for key in ["maximumGasPrice", "reasonableGasPrice"]}
+    gas_prices = frame["gasPriceGwei"].to_numpy(dtype=np.float64)[in_range]
+    gas_costs = frame["fee"].to_numpy(dtype=np.float64)[in_range] / (gas_prices/1000000000)
+    repayments_eth = transmission_repayments_eth(gas_prices, gas_costs, billing)
+    range_rows["repaymentsEth"] = np.where(range_rows["observedTransmissions"], repayments_eth[:, None], 0.0)
+    periods, aggregated = aggregate(range_ids[in_range], range_rows, len(names))
+    rollups["ranges"] = merge(stored["ranges"], periods, aggregated, len(names))
+
+    # the streaks at the first row left in the tail
+    tail_rows = np.flatnonzero(~in_range)
+    if len(tail_rows) > 0:
+        tail_row = tail_rows[0]
+        tail_offset = int(starts[tail_row])
+    else:
+        tail_row = len(frame)
+        tail_offset = end
+    if tail_row > 0:
+        previous = counters[tail_row - 1]
+        missed = frame[[name+"_answer" for name in names]].to_numpy(dtype=np.float64)[tail_row - 1] == 0
+        state["tail"]["streaks"] = {name: int(previous[column]) if missed[column] else -1 for column, name in enumerate(names)}
+    state["tail"]["offset"] = tail_offset
+
+    payees = list(dict.fromkeys(names + list(payments["oracleName"].dropna().unique())))
+    payment = payment_rollups(payments, payees, load_price_store(feed_path, "link-usd"), ranges)
+
+    if len(frame) > 0:
+        state["lastBlock"] = max(state["lastBlock"], int(frame["blockNumber"].max()))
+    state["processed"] = end
+    state["processedDigest"] = tail_digest(transmissions_filename, end)
+    state["ethPricesDigest"] = prices_digest(eth_prices, state["lastBlock"])
+    state["ranges"] = ranges
+    state["payees"] = payees
+
+    dir_path = rollup_dir(feed_path)
+    os.makedirs(dir_path, exist_ok=True)
+    for granularity in rollups:
+        periods, aggregated = rollups[granularity]
+        payment_periods, payment_aggregated = payment[granularity]
+        arrays = {"periods": periods, **aggregated, "payment_periods": payment_periods}
+        arrays.update(("payment_"+metric, values) for metric, values in payment_aggregated.items())
+        np.savez(dir_path+"/"+granularity+".npz", **arrays)
+    np.savez(dir_path+"/deviation_sketches.npz", periods=sketches[0], operators=sketches[1], buckets=sketches[2], counts=sketches[3])
+    # written last, so an interrupted update is redone
+    with open(dir_path+"/state.json", "w", encoding="utf-8") as outfile:
+        json.dump(state, outfile, ensure_ascii=False, indent=4)
+
+    return state
+
+def load_rollup(feed_path, granularity="daily"):
+    """
+    Function to load a rollup as a table
+
+    Args:
+        feed_path: The path of the feed
+        granularity: hourly, daily or ranges
+
+    Returns:
+        A DataFrame with a row per period and operator, with the period as a UTC datetime or a range index. Includes the
+        deviation average, the payments and the profit in USD
+    """
+    state = read_state(feed_path)
+    if state is None:
+        raise FileNotFoundError("No rollups for "+feed_path+". Run rollups.py first")
+
+    def table(periods, aggregated, names):
+        frame = pd.DataFrame({metric: values.reshape(-1) for metric, values in aggregated.items()})
+        frame.insert(0, "oracleName", np.tile(np.array(names, dtype=object), len(periods)))
+        frame.insert(0, "period", np.repeat(periods, len(names)))
+        return frame
+
+    submissions = table(*load_arrays(feed_path, granularity), state["operators"])
+    payments = table(*load_arrays(feed_path, granularity, "payment_"), state["payees"])
+    rollup = submissions.merge(payments, on=["period", "oracleName"], how="outer")
+    counts = [column for column in SUBMISSION_METRICS + PAYMENT_METRICS + ["repaymentsEth"] if column in rollup.columns and column not in MAX_METRICS]
+    rollup[counts] = rollup[counts].fillna(0)
+    rollup["deviation"] = rollup["deviationSum"] / rollup["deviationCount"].where(rollup["deviationCount"] > 0)
+    rollup["profit"] = rollup["paidUsd"] - rollup["feesUsd"]
+    if granularity in GRANULARITIES:
+        rollup["period"] = pd.to_datetime(rollup["period"], unit="s", utc=True)
+    return rollup.sort_values(["period", "oracleName"], ignore_index=True)
+
+def deviation_quantiles(feed_path, quantiles=QUANTILES, start=None, end=None, operators=None):
+    """
+    Function to get quantiles of the operators' deviations over days from the daily sketches of the rollups. The
+    deviations are those of the rounds an operator observed. A quantile q is within RELATIVE_ACCURACY of the deviation
+    of rank floor(q * (n - 1)) among the n deviations, as np.quantile with method="lower" gives it
+
+    Args:
+        feed_path: The path of the feed
+        quantiles: The quantiles like [0.5, 0.95, 0.99]
+        start: The first day like 2023-01-01. From the first day if None
+        end: The day after the last one. Up to the last day if None
+        operators: The names of the operators. Every operator if None
+
+    Returns:
+        A DataFrame with the observations and the quantiles of each operator, and of all of them together in a last
+        row named all
+    """
+    state = read_state(feed_path)
+    sketches = load_sketches(feed_path)
+    if state is None or sketches is None:
+        raise FileNotFoundError("No rollups for "+feed_path+". Run rollups.py first")
+    periods, columns, buckets, counts = sketches
+    names = state["operators"] if operators is None else [name for name in operators if name in state["operators"]]
+    selected = np.array([state["operators"].index(name) for name in names], dtype=np.int32)
+
+    mask = np.isin(columns, selected)
+    if start is not None:
+        mask &= periods >= pd.Timestamp(start, tz="UTC").timestamp()
+    if end is not None:
+        mask &= periods < pd.Timestamp(end, tz="UTC").timestamp()
+    columns, buckets, counts = columns[mask], buckets[mask], counts[mask]
+
+    sketch = QuantileSketch()
+    rows = []
+    for name, column in list(zip(names, selected)) + [("all", None)]:
+        entries = columns == column if column is not None else np.ones(len(columns), dtype=bool)
+        rows.append([name, int(counts[entries].sum())] + list(sketch.quantiles(buckets[entries], counts[entries], quantiles)))
+    return pd.DataFrame(rows, columns=["oracleName", "observations"] + ["p"+format(quantile * 100, "g") for quantile in quantiles])
+
+def rollup_totals(feed_path, save=True):
+    """
+    Function to build a feed's totals from its rollups, with the same structure and values as get_totals
+
+    Args:
+        feed_path: The path of the feed
+        save: Whether to write them to the feed's totals.json, as get_totals does
+
+    Returns:
+        A dict with totals for each operator. Includes profits and observation misses
+    """
+    nop_details, transmitters = read_nop_details(feed_path)
+    state = read_state(feed_path)
+    if state is None:
+        raise FileNotFoundError("No rollups for "+feed_path+". Run rollups.py first")
+    names = {name: column for column, name in enumerate(state["operators"])}
+    payees = {name: column for column, name in enumerate(state["payees"])}
+    periods, ranges = load_arrays(feed_path, "ranges")
+    payment_periods, payments = load_arrays(feed_path, "ranges", "payment_")
+    rows = {int(period): row for row, period in enumerate(periods)}
+    payment_rows = {int(period): row for row, period in enumerate(payment_periods)}
+
+    def value(index, name, metric):
+        # a range without rows has no entry
+        return ranges[metric][rows[index], names[name]] if index in rows else (np.nan if metric in MAX_METRICS else 0.0)
+
+    totals = {
+        "ranges": [],
+        "totals": []
+    }
+    for index, withdrawal_range in enumerate(state["ranges"]):
+        total = {
+            "deviations": {},
+            "maxDeviation": {},
+            "fees": {},
+            "payments": {},
+            "profits": {},
+            "observationsCounts": {},
+            "missedObservations": {},
+            "transmissionsCounts": {},
+            "estimatedObservationsEarnings": {},
+            "estimatedTransmissionsEarnings": {},
+            "estimatedTotalEarnings": {},
+            "consecutiveMissedObservations": {},
+            "maxConsecutiveMissedObservations": {},
+            "separateMissedObservationsInstances": {},
+            "separateConsecutiveMissedObservationsInstances": {},
+        }
+        for transmitter in transmitters:
+            name = nop_details[transmitter.lower()]["name"]
+            deviation_count = value(index, name, "deviationCount")
+            paid = payment_rows.get(index) is not None and payments["payments"][payment_rows[index], payees[name]] > 0 if name in payees else False
+            total["deviations"][name] = np.float64(value(index, name, "deviationSum") / deviation_count) if deviation_count > 0 else np.nan
+            total["maxDeviation"][name] = np.float64(value(index, name, "maxDeviation"))
+            total["fees"][name] = np.float64(value(index, name, "feesUsd"))
+            total["payments"][name] = np.float64(payments["paidUsd"][payment_rows[index], payees[name]]) if paid else 0
+            total["missedObservations"][name] = int(value(index, name, "missed"))
+            total["consecutiveMissedObservations"][name] = int(value(index, name, "consecutiveMissed"))
+            max_consecutive = value(index, name, "maxConsecutiveMissed")
+            total["maxConsecutiveMissedObservations"][name] = np.int64(max_consecutive) if not np.isnan(max_consecutive) else np.nan
+            total["separateMissedObservationsInstances"][name] = int(value(index, name, "separateMissed"))
+
+        # as calculate_estimated_earnings, for the operators with a per_op split
+        link_price = withdrawal_range["linkPrice"]
+        billing = withdrawal_range["billing"]
+        estimated_earnings = {
+            "observationsCounts": {},
+            "transmissionsCounts": {},
+            "estimatedObservationsEarnings": {},
+            "estimatedTransmissionsEarnings": {},
+            "estimatedTransmissionsRepayments": {},
+            "estimatedTotalEarnings": {}
+        }
+        for nop in nop_details:
+            name = nop_details[nop]["name"]
+            if name not in names:
+                continue
+            observations_count = int(value(index, name, "observations"))
+            transmissions_count = int(value(index, name, "observedTransmissions"))
+            repayments_usd = np.float64(value(index, name, "repaymentsEth")) * billing["microLinkPerEth"] / 1000000.0 * link_price
+            estimated_observations_earnings = np.float64(observations_count * (billing["linkGweiPerObservation"] / 1000000000.0) * link_price)
+            estimated_transmissions_earnings = np.float64(transmissions_count * (billing["linkGweiPerTransmission"] / 1000000000.0) * link_price)
+            estimated_earnings["observationsCounts"][name] = observations_count
+            estimated_earnings["transmissionsCounts"][name] = transmissions_count
+            estimated_earnings["estimatedObservationsEarnings"][name] = estimated_observations_earnings
+            estimated_earnings["estimatedTransmissionsEarnings"][name] = estimated_transmissions_earnings
+            estimated_earnings["estimatedTransmissionsRepayments"][name] = repayments_usd
+            estimated_earnings["estimatedTotalEarnings"][name] = estimated_observations_earnings + estimated_transmissions_earnings + repayments_usd
+        for key in estimated_earnings:
+            total[key] = estimated_earnings[key]
+
+        finalize_range_total(total)
+        totals["ranges"].append({"from": withdrawal_range["from"], "to": withdrawal_range["to"]})
+        totals["totals"].append(total)
+
+    if save:
+        with open("data/"+feed_path+"/totals.json", "w", encoding="utf-8") as outfile:
+            # maxima of integer columns are numpy scalars
+            json.dump(totals, outfile, ensure_ascii=False, indent=4, default=lambda value: value.item())
+
+    return totals
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv
+
+    if len(args) > 2 and args[1] == "quantiles":
+        # python rollups.py quantiles FEED_PATH [START END] [OPERATORS]
+        start = args[3] if len(args) > 4 else None
+        end = args[4] if len(args) > 4 else None
+        operators = args[5].split(",") if len(args) > 5 else None
+        print(deviation_quantiles(args[2], start=start, end=end, operators=operators).to_string(index=False))
+        exit()
+
+    if len(args) > 2 and args[1] == "totals":
+        update_rollups(args[2])
+        rollup_totals(args[2])
+        print("Saved data/"+args[2]+"/totals.json")
+        exit()
+
+    feed_paths = args[1:] if len(args) > 1 else find_feed_paths()
+    for feed_path in feed_paths:
+        missing = missing_rollup_sources(feed_path)
+        if len(missing) > 0:
+            print("Skipping "+feed_path+", missing "+", ".join(missing))
+            continue
+        state = update_rollups(feed_path)
+        print("Rolled up "+feed_path+": "+str(len(state["ranges"]))+" ranges up to block "+str(state["lastBlock"]))
@@ -0,0 +1,282 @@
+import pandas as pd
+import numpy as np
+import os
+import metrics
+from helper import decode_transmission_log, decode_log_topic, get_block_headers, get_transmitters_from_sets, get_transmitters_for_blocknumber
+from schema import read_frame, write_frame
+
+# Columns of rounds.csv, one row per NewTransmission. A round is keyed by its aggregatorRoundId, and by the block and
+# log index of its NewTransmission. Its observations are rows observationOffset to observationOffset+observationCount
+# of the arrays in rounds_observations.npz
+ROUND_COLUMNS = ["aggregatorRoundId", "blockNumber", "logIndex", "txHash", "timestamp", "transmitter", "oracleName", "submitter", "gasUsed", "gasPriceGwei", "fee", "answer", "price", "epoch", "round", "observationOffset", "observationCount"]
+
+def rounds_filename(feed_path):
+    return "data/"+feed_path+"/rounds.csv"
+
+def observations_filename(feed_path):
+    return "data/"+feed_path+"/rounds_observations.npz"
+
+def answer_array(values):
+    """
+    Function to hold answers or observations, which are int192 on chain
+
+    Args:
+        values: A list of ints
+
+    Returns:
+        An int64 array, or an object array of the ints if some are out of the int64 range, like the answers of
+        18 decimals feeds priced above 9.22
+    """
+    try:
+        return np.array(values, dtype=np.int64)
+    except OverflowError:
+        return np.array(values, dtype=object)
+
+def report_epoch_round(raw_report_context):
+    """
+    Function to get the epoch and round of the OCR report a transmission came from
+
+    Args:
+        raw_report_context: The rawReportContext of NewTransmission: 11 zero bytes, the 16 bytes of the config digest,
+            the epoch in 4 bytes and the round in 1 byte
+
+    Returns:
+        The epoch and the round
+    """
+    return int.from_bytes(raw_report_context[27:31], "big"), raw_report_context[31]
+
+def rounds_from_logs(provider_url, transmissions, answers, transmitter_sets, event_params, feed_path, nop_details, contract, decimals, headers=None, receipts=None):
+    """
+    Function to build and save a feed's rounds from the NewTransmission and AnswerUpdated logs of the same scan. Each
+    AnswerUpdated is matched to its NewTransmission by transaction and round id, so the published answer, the
+    observations, the transmitter and the gas of a round are in one row
+
+    Args:
+        provider_url: The endpoint of the node to query
+        transmissions: The NewTransmission logs
+        answers: The AnswerUpdated logs
+        transmitter_sets: The blocks and transmitters from get_transmitter_sets or a ConfigIndex
+        event_params: The event parameters of the contract
+        feed_path: The path of the feed
+        nop_details: The details of the node operators
+        contract: The contract's instance, for the transmitters before the first ConfigSet event
+        decimals: The decimals of the feed's answers
+        headers: Dict of block headers by block number shared between collectors, see get_block_headers
+        receipts: Dict of receipts by lowercase transaction hash, see get_block_receipts. Rounds without one have no gas
+
+    Returns:
+        The RoundTable of the feed
+    """
+    if headers is None:
+        headers = {}
+    if receipts is None:
+        receipts = {}
+
+    published = {}
+    for answer in answers:
+        round_id = decode_log_topic(event_params["AnswerUpdated"]["params"][1], answer.topics[2])
+        published[(answer.transaction_hash.lower(), round_id)] = (
+            decode_log_topic(event_params["AnswerUpdated"]["params"][0], answer.topics[1]),
+            decode_log_topic(event_params["AnswerUpdated"]["params"][2], answer.data)
+        )
+
+    # every transmission emits AnswerUpdated with the block's timestamp as updatedAt, headers are only a fallback
+    published_txs = {tx_hash for tx_hash, _ in published}
+    get_block_headers(provider_url, [transmission.block_number for transmission in transmissions if transmission.transaction_hash.lower() not in published_txs], headers)
+
+    rows = []
+    observations, observers, operators = [], [], []
+    names = {}
+    initial_transmitters = None
+    with metrics.stage("rounds"):
+        for transmission in transmissions:
+            tx_hash = transmission.transaction_hash.lower()
+            decoded = decode_transmission_log(event_params, transmission)
+            round_id = decoded["aggregatorRoundId"]
+            answer, timestamp = published.get((tx_hash, round_id), (None, None))
+            receipt = receipts.get(tx_hash)
+            epoch, report_round = report_epoch_round(decoded["rawReportContext"])
+
+            block_transmitters = get_transmitters_from_sets(transmitter_sets, transmission.block_number)
+            if block_transmitters is None:
+                if initial_transmitters is None:
+                    initial_transmitters = get_transmitters_for_blocknumber(contract, transmission.block_number)
+                block_transmitters = initial_transmitters
+
+            rows.append({
+                "aggregatorRoundId": round_id,
+                "blockNumber": transmission.block_number,
+                "logIndex": transmission.log_index,
+                "txHash": tx_hash,
+                "timestamp": timestamp if timestamp is not None else headers[transmission.block_number]["timestamp"],
+                "transmitter": decoded["transmitter"].lower(),
+                "oracleName": nop_details[decoded["transmitter"].lower()]["name"],
+                "submitter": receipt.sender.lower() if receipt is not None else None,
+                "gasUsed": receipt.gas_used if receipt is not None else None,
+                "gasPriceGwei": receipt.effective_gas_price / 1000000000 if receipt is not None else None,
+                "fee": receipt.gas_used * receipt.effective_gas_price / 1000000000000000000 if receipt is not None else None,
+                "answer": answer if answer is not None else decoded["answer"],
+                "price": (answer if answer is not None else decoded["answer"]) / 10 ** decimals,
+                "epoch": epoch,
+                "round": report_round,
+                "observationOffset": len(observations),
+                "observationCount": len(decoded["observations"])
+            })
+            # observers are indexes into the transmitters at the block, stored with the index of the operator's name
+            for value, observer in zip(decoded["observations"], decoded["observers"]):
+                name = nop_details[block_transmitters[observer].lower()]["name"]
+                observations.append(value)
+                observers.append(observer)
+                operators.append(names.setdefault(name, len(names)))
+        metrics.record_rows("rounds", len(rows))
+
+    frame = pd.DataFrame(rows, columns=ROUND_COLUMNS)
+    frame["answer"] = answer_array([row["answer"] for row in rows])
+    frame["txDate"] = pd.to_datetime(frame["timestamp"], unit="s").dt.tz_localize("UTC")
+    table = RoundTable(frame, answer_array(observations), np.array(observers, dtype=np.uint8), np.array(operators, dtype=np.int16), list(names))
+    table.save(feed_path)
+    return table
+
+class RoundTable:
+    """
+    A feed's rounds with their observations, looked up by round id or transaction hash without merging on timestamps
+    """
+
+    def __init__(self, frame, observations, observers, operators, names):
+        """
+        Args:
+            frame: The rounds, with the columns of ROUND_COLUMNS
+            observations: The observations of all the rounds, in round order, as answer_array holds them
+            observers: The index of each observation's transmitter in the transmitters at its block
+            operators: The index of each observation's operator in names
+            names: The names of the operators
+        """
+        self.frame = frame.sort_values(["blockNumber", "logIndex"], ignore_index=True)
+        self.observations = observations
+        self.observers = observers
+        self.operators = operators
+        self.names = list(names)
+
+        # round ids increase by one per transmission, so a round's row is at its id minus the first id
+        round_ids = self.frame["aggregatorRoundId"].to_numpy(dtype=np.int64)
+        self.first_round = int(round_ids.min()) if len(round_ids) > 0 else 0
+        self._round_rows = np.full(int(round_ids.max()) - self.first_round + 1 if len(round_ids) > 0 else 0, -1, dtype=np.int64)
+        self._round_rows[round_ids - self.first_round] = np.arange(len(round_ids))
+        self._tx_rows = pd.Index(self.frame["txHash"].astype(str).str.lower())
+
+    @classmethod
+    def load(cls, feed_path):
+        """
+        Function to read a feed's rounds
+
+        Args:
+            feed_path: The path of the feed
+
+        Returns:
+            The RoundTable, or None if the feed's rounds were not collected
+        """
+        if not os.path.exists(rounds_filename(feed_path)) or not os.path.exists(observations_filename(feed_path)):
+            return None
+        frame = read_frame(rounds_filename(feed_path), "rounds", index_col=0)
+        with np.load(observations_filename(feed_path)) as arrays:
+            observations = arrays["observations"]
+            if observations.dtype.kind == "U":
+                observations = answer_array([int(value) for value in observations])
+            return cls(frame, observations, arrays["observers"], arrays["operators"], arrays["names"].tolist())
+
+    def save(self, feed_path):
+        os.makedirs("data/"+feed_path, exist_ok=True)
+        self.frame = write_frame(self.frame, rounds_filename(feed_path), "rounds")
+        # observations out of the int64 range are stored as text, as .npz files are read without pickle
+        observations = self.observations.astype(str) if self.observations.dtype == object else self.observations
+        np.savez(observations_filename(feed_path), observations=observations, observers=self.observers, operators=self.operators, names=np.array(self.names, dtype=str))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def round_rows(self, round_ids):
+        """
+        Function to find the rows of rounds
+
+        Args:
+            round_ids: An array of aggregatorRoundId
+
+        Returns:
+            An array with the row of each round, -1 for rounds not in the table
+        """
+        positions = np.asarray(round_ids, dtype=np.int64) - self.first_round
+        inside = (positions >= 0) & (positions < len(self._round_rows))
+        rows = np.full(len(positions), -1, dtype=np.int64)
+        rows[inside] = self._round_rows[positions[inside]]
+        return rows
+
+    def transaction_rows(self, tx_hashes):
+        """
+        Function to find the rows of the rounds of transactions
+
+        Args:
+            tx_hashes: An array of transaction hashes
+
+        Returns:
+            An array with the row of each transaction's round, -1 for transactions not in the table
+        """
+        return self._tx_rows.get_indexer(pd.Index(tx_hashes).astype(str).str.lower())
+
+    def round(self, round_id):
+        """
+        Function to get a round with its observations
+
+        Args:
+            round_id: The aggregatorRoundId
+
+        Returns:
+            The round's row as a Series and a DataFrame of its observations by operator, or None if it is not in the table
+        """
+        row = self.round_rows([round_id])[0]
+        if row < 0:
+            return None
+        details = self.frame.iloc[row]
+        start = int(details["observationOffset"])
+        end = start + int(details["observationCount"])
+        observations = pd.DataFrame({
+            "oracleName": [self.names[operator] for operator in self.operators[start:end]],
+            "observer": self.observers[start:end],
+            "observation": self.observations[start:end]
+        })
+        return details, observations
+
+    def join(self, frame, on="txHash", columns=None):
+        """
+        Function to add the columns of the rounds to a frame with a round id or transaction hash column, like
+        transmissions.csv
+
+        Args:
+            frame: The DataFrame
+            on: The column of frame to look rounds up by, txHash or aggregatorRoundId
+            columns: The columns of the rounds to add. All but the key if None
+
+        Returns:
+            A DataFrame with the columns of each row's round, missing for rows without one
+        """
+        rows = self.transaction_rows(frame[on]) if on == "txHash" else self.round_rows(frame[on])
+        columns = columns or [column for column in self.frame.columns if column != on]
+        # rows of -1 are not in the frame's index, so they come out missing
+        return frame.assign(**{column: self.frame[column].reindex(rows).set_axis(frame.index) for column in columns})
+
+    def observation_frame(self):
+        """
+        Returns:
+            A DataFrame with a row per observation: its round, block, operator, value, the round's published answer
+            and the observation's deviation from it in percent
+        """
+        counts = self.frame["observationCount"].to_numpy(dtype=np.int64)
+        answers = np.repeat(self.frame["answer"].to_numpy(dtype=np.float64), counts)
+        observations = self.observations.astype(np.float64)
+        return pd.DataFrame({
+            "aggregatorRoundId": np.repeat(self.frame["aggregatorRoundId"].to_numpy(), counts),
+            "blockNumber": np.repeat(self.frame["blockNumber"].to_numpy(), counts),
+            "oracleName": pd.Categorical.from_codes(self.operators, self.names),
+            "observation": self.observations,
+            "answer": np.repeat(self.frame["answer"].to_numpy(), counts),
+            "deviation": np.abs(observations - answers) / answers * 100
+        })
@@ -0,0 +1,368 @@
+import threading
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from web3 import Web3
+from web3.providers import JSONBaseProvider
+import metrics
+from rpc_decode import loads
+
+# Methods reading the state at a block, with the position of their block parameter. Only those need an archive node
+# when the block is not recent. Logs, blocks, transactions and receipts are served by full nodes for every block
+STATE_METHODS = {
+    "eth_call": 1,
+    "eth_getBalance": 1,
+    "eth_getCode": 1,
+    "eth_getTransactionCount": 1,
+    "eth_getStorageAt": 2,
+    "eth_getProof": 2
+}
+# Block tags a full node can always serve
+RECENT_TAGS = ["latest", "pending", "safe", "finalized"]
+# Block tags of the oldest state, which only archive nodes keep
+ARCHIVE_TAGS = ["earliest"]
+# Full nodes keep the state of the last 128 blocks, this leaves a margin for the head moving on
+RECENT_BLOCKS = 64
+# JSON-RPC error codes of a busy or rate-limited node, retried on another endpoint
+RETRY_ERROR_CODES = [-32005, -32097, 429]
+
+class EndpointError(Exception):
+    """
+    A node failed to answer, so the request can be sent to another one
+    """
+
+class Endpoint:
+    """
+    A node's URL with its recent latencies, errors and back-off
+    """
+
+    def __init__(self, url, kind, window=200):
+        """
+        Args:
+            url: The URL of the node
+            kind: full or archive
+            window: The number of recent latencies kept for the percentiles
+        """
+        self.url = url
+        self.kind = kind
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedgesWon = 0
+        self.inflight = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+    def latency_percentile(self, percentile):
+        """
+        Function to get a percentile of the endpoint's recent latencies
+
+        Args:
+            percentile: The percentile like 95
+
+        Returns:
+            The latency in seconds, or None without latencies
+        """
+        if len(self.latencies) == 0:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(percentile / 100 * len(ordered)), len(ordered) - 1)]
+
+    def stats(self):
+        return {
+            "kind": self.kind,
+            "requests": self.requests,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "hedgesWon": self.hedgesWon,
+            "inflight": self.inflight,
+            "down": self.down_until > time.monotonic(),
+            "p50Seconds": self.latency_percentile(50),
+            "p95Seconds": self.latency_percentile(95),
+            "p99Seconds": self.latency_percentile(99)
+        }
+
+class ProviderRouter:
+    """
+    Sends JSON-RPC requests to a network's nodes. Historical state calls go to the archive nodes and everything else to
+    the full nodes. Requests go to the endpoint with the fewest requests in flight, move on to the next endpoint when
+    one fails, and can be sent again to a second endpoint when the first is slower than usual
+    """
+
+    def __init__(self, full_urls, archive_urls, hedge_percentile=None, min_hedge_samples=20, timeout=60, cooldown=5.0, max_cooldown=300.0):
+        """
+        Args:
+            full_urls: The URLs of the full nodes. Every request goes to the archive nodes if empty
+            archive_urls: The URLs of the archive nodes. Historical state calls go to the full nodes if empty
+            hedge_percentile: The percentile of an endpoint's latency after which the request is also sent to another
+                endpoint, like 95. No hedging if None
+            min_hedge_samples: The number of latencies an endpoint needs before its requests are hedged
+            timeout: The timeout of a request in seconds
+            cooldown: The seconds an endpoint is skipped after failing, doubled for each consecutive failure
+            max_cooldown: The longest an endpoint is skipped
+        """
+        if len(full_urls) == 0 and len(archive_urls) == 0:
+            raise ValueError("The router needs at least one provider URL")
+        # a node listed as both serves both kinds of calls, with a single set of stats
+        archive = {url: Endpoint(url, "archive") for url in archive_urls}
+        self.endpoints = {
+            "full": [archive[url] if url in archive else Endpoint(url, "full") for url in full_urls],
+            "archive": list(archive.values())
+        }
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_samples = min_hedge_samples
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.head = None
+        self._lock = threading.Lock()
+        self._sessions = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=8) if hedge_percentile is not None else None
+
+    @classmethod
+    def from_config(cls, config, network, **kwargs):
+        """
+        Function to create the router of a network from config.json
+
+        Args:
+            config: The contents of config.json
+            network: The network like ethereum
+            kwargs: Other arguments of the router
+
+        Returns:
+            The router. providerUrls and providerUrlsArchive list more nodes besides providerUrl and providerUrlArchive,
+            and hedgePercentile turns hedging on
+        """
+        settings = config[network]
+        full_urls = [settings.get("providerUrl", "")] + settings.get("providerUrls", [])
+        archive_urls = [settings.get("providerUrlArchive", "")] + settings.get("providerUrlsArchive", [])
+        kwargs.setdefault("hedge_percentile", settings.get("hedgePercentile"))
+        # the same node can be listed twice, like a full node that is also an archive node
+        full_urls = list(dict.fromkeys(url for url in full_urls if url != ""))
+        archive_urls = list(dict.fromkeys(url for url in archive_urls if url != ""))
+        return cls(full_urls, archive_urls, **kwargs)
+
+    def needs_archive(self, payload):
+        """
+        Function to check if a call reads the state at a block a full node may no longer have
+
+        Args:
+            payload: The JSON-RPC request, or a batch of requests
+
+        Returns:
+            Whether the call should go to an archive node
+        """
+        if isinstance(payload, list):
+            return any(self.needs_archive(call) for call in payload)
+        position = STATE_METHODS.get(payload["method"])
+        params = payload.get("params") or []
+        if position is None or len(params) <= position:
+            return False
+        block = params[position]
+        if isinstance(block, dict):
+            # EIP-1898 block parameter
+            block = block.get("blockNumber", block.get("blockHash"))
+        if block is None or block in RECENT_TAGS:
+            return False
+        if block in ARCHIVE_TAGS:
+            return True
+        if isinstance(block, str) and len(block) == 66:
+            # a block hash could be of any block
+            return True
+        if isinstance(block, str):
+            try:
+                block_number = int(block, 16)
+            except ValueError:
+                # a tag this router does not know, which the full nodes can answer or reject
+                return False
+        else:
+            block_number = int(block)
+        return self.head is None or block_number < self.head - RECENT_BLOCKS
+
+    def candidates(self, payload):
+        """
+        Function to order the endpoints a request can be sent to
+
+        Args:
+            payload: The JSON-RPC request, or a batch of requests
+
+        Returns:
+            The endpoints that are up, with the fewest requests in flight first, then the ones that are down
+        """
+        kind = "archive" if self.needs_archive(payload) else "full"
+        endpoints = self.endpoints[kind] or self.endpoints["archive" if kind == "full" else "full"]
+        now = time.monotonic()
+        with self._lock:
+            up = sorted([endpoint for endpoint in endpoints if endpoint.down_until <= now], key=lambda endpoint: (endpoint.inflight, endpoint.requests))
+            down = sorted([endpoint for endpoint in endpoints if endpoint.down_until > now], key=lambda endpoint: endpoint.down_until)
+        return up + down
+
+    def session(self):
+        # sessions keep connections open, one per thread as they are not thread safe
+        if not hasattr(self._sessions, "session"):
+            self._sessions.session = requests.Session()
+        return self._sessions.session
+
+    def _send(self, endpoint, payload):
+        """
+        Function to send a request to an endpoint, recording its latency and errors
+
+        Args:
+            endpoint: The endpoint
+            payload: The JSON-RPC request, or a batch of requests
+
+        Returns:
+            The parsed response, the bytes sent and the bytes received
+
+        Raises:
+            EndpointError: If the node failed or is rate limiting
+        """
+        with self._lock:
+            endpoint.inflight += 1
+            endpoint.requests += 1
+        start = time.perf_counter()
+        error = None
+        try:
+            response = self.session().post(endpoint.url, json=payload, timeout=self.timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise EndpointError(endpoint.url+" answered with HTTP "+str(response.status_code))
+            body = loads(response.content)
+            bodies = body if isinstance(body, list) else [body]
+            if any(isinstance(item, dict) and item.get("error", {}).get("code") in RETRY_ERROR_CODES for item in bodies):
+                raise EndpointError(endpoint.url+" is rate limiting")
+            return body, len(response.request.body or b""), len(response.content)
+        except (requests.RequestException, ValueError, EndpointError) as exception:
+            error = exception
+            raise exception if isinstance(exception, EndpointError) else EndpointError(endpoint.url+" failed: "+str(exception))
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                endpoint.inflight -= 1
+                if error is None:
+                    endpoint.latencies.append(seconds)
+                    endpoint.failures = 0
+                    endpoint.down_until = 0.0
+                else:
+                    endpoint.errors += 1
+                    endpoint.failures += 1
+                    endpoint.down_until = time.monotonic() + min(self.cooldown * 2 ** (endpoint.failures - 1), self.max_cooldown)
+            metrics.record_endpoint(endpoint.url, endpoint.kind, seconds, error is not None)
+
+    def _send_with_failover(self, payload, endpoints):
+        last_error = None
+        for endpoint in endpoints:
+            try:
+                return self._send(endpoint, payload), endpoint
+            except EndpointError as error:
+                last_error = error
+        raise last_error
+
+    def post(self, payload):
+        """
+        Function to send a request to the network
+
+        Args:
+            payload: The JSON-RPC request, or a batch of requests
+
+        Returns:
+            The parsed response, the bytes sent and the bytes received
+
+        Raises:
+            EndpointError: If every endpoint failed
+        """
+        endpoints = self.candidates(payload)
+        threshold = None
+        if self._executor is not None and len(endpoints) > 1 and len(endpoints[0].latencies) >= self.min_hedge_samples:
+            threshold = endpoints[0].latency_percentile(self.hedge_percentile)
+
+        if threshold is None:
+            result, _ = self._send_with_failover(payload, endpoints)
+            self._track_head(payload, result[0])
+            return result
+
+        # send the request again to the next endpoint if the first is slower than its usual latency
+        primary = self._executor.submit(self._send_with_failover, payload, endpoints)
+        done, _ = wait([primary], timeout=threshold)
+        futures = [primary]
+        if len(done) == 0:
+            futures.append(self._executor.submit(self._send_with_failover, payload, endpoints[1:] + endpoints[:1]))
+            with self._lock:
+                endpoints[1].hedges += 1
+
+        last_error = None
+        pending = futures
+        while len(pending) > 0:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, endpoint = future.result()
+                except EndpointError as error:
+                    last_error = error
+                    continue
+                if future is not primary:
+                    with self._lock:
+                        endpoint.hedgesWon += 1
+                self._track_head(payload, result[0])
+                return result
+        raise last_error
+
+    def _track_head(self, payload, body):
+        # the head tells whether a block's state is still on the full nodes
+        try:
+            if isinstance(payload, dict) and payload["method"] == "eth_blockNumber":
+                head = int(body["result"], 16)
+            elif isinstance(payload, dict) and payload["method"] == "eth_getBlockByNumber" and payload["params"][0] == "latest":
+                head = int(body["result"]["number"], 16)
+            else:
+                return
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._lock:
+            self.head = head if self.head is None else max(self.head, head)
+
+    def stats(self):
+        """
+        Returns:
+            A dict with the requests, errors, hedges and latency percentiles of every endpoint by URL
+        """
+        with self._lock:
+            return {endpoint.url: endpoint.stats() for endpoint in self.endpoints["full"] + self.endpoints["archive"]}
+
+    def web3(self):
+        """
+        Returns:
+            A web3 instance sending its calls through the router
+        """
+        return Web3(RouterProvider(self))
+
+class RouterProvider(JSONBaseProvider):
+    """
+    web3 provider sending every call through a ProviderRouter
+    """
+
+    def __init__(self, router):
+        super().__init__()
+        self.router = router
+
+    def make_request(self, method, params):
+        payload = {"jsonrpc": "2.0", "method": method, "params": params, "id": next(self.request_counter)}
+        body, _, _ = self.router.post(json.loads(json.dumps(payload, cls=Web3JsonEncoder)))
+        return body
+
+    def is_connected(self, show_traceback=False):
+        try:
+            return "result" in self.make_request("web3_clientVersion", [])
+        except EndpointError:
+            if show_traceback:
+                raise
+            return False
+
+class Web3JsonEncoder(json.JSONEncoder):
+    # web3 passes bytes and HexBytes in the params of some calls
+    def default(self, value):
+        if isinstance(value, (bytes, bytearray)):
+            return Web3.to_hex(value)
+        return super().default(value)
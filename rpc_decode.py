@@ -0,0 +1,153 @@
+import json
+
+# orjson and msgspec parse bytes without decoding them to text first. Both are optional, the standard library parses
+# the same responses slower
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+def loads(content):
+    """
+    Function to parse a JSON-RPC response body
+
+    Args:
+        content: The body as bytes or text
+
+    Returns:
+        The parsed response
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    if msgspec is not None:
+        return msgspec.json.decode(content)
+    return json.loads(content)
+
+def parser_name():
+    """
+    Returns:
+        The name of the parser used by loads
+    """
+    return "orjson" if orjson is not None else "msgspec" if msgspec is not None else "json"
+
+class Log:
+    """
+    A log as returned by eth_getLogs, with the numbers as ints, the topics and data as bytes and the address lowercase
+    """
+    __slots__ = ["address", "topics", "data", "block_number", "block_hash", "transaction_hash", "transaction_index", "log_index", "removed"]
+
+    def __init__(self, address, topics, data, block_number, block_hash, transaction_hash, transaction_index, log_index, removed=False):
+        self.address = address
+        self.topics = topics
+        self.data = data
+        self.block_number = block_number
+        self.block_hash = block_hash
+        self.transaction_hash = transaction_hash
+        self.transaction_index = transaction_index
+        self.log_index = log_index
+        self.removed = removed
+
+    @classmethod
+    def from_json(cls, log):
+        """
+        Function to convert a log from a JSON-RPC response
+
+        Args:
+            log: The log as parsed, with hex strings
+
+        Returns:
+            The Log
+        """
+        return cls(
+            log["address"].lower(),
+            [bytes.fromhex(topic[2:]) for topic in log["topics"]],
+            bytes.fromhex(log["data"][2:]),
+            int(log["blockNumber"], 16),
+            log.get("blockHash"),
+            log["transactionHash"],
+            int(log["transactionIndex"], 16) if log.get("transactionIndex") is not None else None,
+            int(log["logIndex"], 16) if log.get("logIndex") is not None else None,
+            log.get("removed", False)
+        )
+
+    def __repr__(self):
+        return "Log("+self.transaction_hash+", block="+str(self.block_number)+", index="+str(self.log_index)+")"
+
+class Receipt:
+    """
+    The sender and gas of a transaction from eth_getBlockReceipts or eth_getTransactionReceipt, without its logs
+    """
+    __slots__ = ["transaction_hash", "block_number", "sender", "to", "gas_used", "effective_gas_price", "status"]
+
+    def __init__(self, transaction_hash, block_number, sender, to, gas_used, effective_gas_price, status=None):
+        self.transaction_hash = transaction_hash
+        self.block_number = block_number
+        self.sender = sender
+        self.to = to
+        self.gas_used = gas_used
+        self.effective_gas_price = effective_gas_price
+        self.status = status
+
+    @classmethod
+    def from_json(cls, receipt):
+        """
+        Function to convert a receipt from a JSON-RPC response
+
+        Args:
+            receipt: The receipt as parsed, with hex strings
+
+        Returns:
+            The Receipt
+        """
+        return cls(
+            receipt["transactionHash"],
+            int(receipt["blockNumber"], 16),
+            receipt["from"],
+            receipt["to"],
+            int(receipt["gasUsed"], 16),
+            int(receipt["effectiveGasPrice"], 16),
+            int(receipt["status"], 16) if receipt.get("status") is not None else None
+        )
+
+    def __repr__(self):
+        return "Receipt("+self.transaction_hash+", block="+str(self.block_number)+")"
+
+def decode_logs(logs):
+    """
+    Function to convert the result of eth_getLogs
+
+    Args:
+        logs: The logs as parsed
+
+    Returns:
+        An array of Log
+    """
+    # Log.from_json inlined, as responses can hold tens of thousands of logs
+    fromhex = bytes.fromhex
+    return [Log(
+        log["address"].lower(),
+        [fromhex(topic[2:]) for topic in log["topics"]],
+        fromhex(log["data"][2:]),
+        int(log["blockNumber"], 16),
+        log.get("blockHash"),
+        log["transactionHash"],
+        int(log["transactionIndex"], 16) if log.get("transactionIndex") is not None else None,
+        int(log["logIndex"], 16) if log.get("logIndex") is not None else None,
+        log.get("removed", False)
+    ) for log in logs]
+
+def decode_receipts(receipts):
+    """
+    Function to convert the result of eth_getBlockReceipts
+
+    Args:
+        receipts: The receipts as parsed
+
+    Returns:
+        An array of Receipt
+    """
+    return [Receipt.from_json(receipt) for receipt in receipts]
@@ -0,0 +1,253 @@
+import pandas as pd
+import numpy as np
+import os
+
+# Types of the stored frames' columns. "answer" columns are int64 when they are complete and fit, as int64 cannot
+# hold NaN and float64 would round large answers. Addresses and names repeat across rows, so they are categorical.
+# "hash" columns are categorical when their values repeat, as a categorical of unique hashes is larger than the text
+TRANSMISSION_DTYPES = {
+    "blockNumber": "int64",
+    "txDate": "datetime",
+    "gasPriceGwei": "float64",
+    "fee": "float64",
+    "timestamp": "int64",
+    "txHash": "hash",
+    "submitter": "category",
+    "aggregatedAnswer": "answer",
+    "minAnswer": "answer",
+    "maxAnswer": "answer"
+}
+# Types of the per-operator columns of the transmissions, by suffix
+OPERATOR_DTYPES = {
+    "_answer": "answer",
+    "_deviation": "float64"
+}
+PAYMENT_DTYPES = {
+    "blockNumber": "int64",
+    "txHash": "hash",
+    "txTimestamp": "int64",
+    "gasPriceGwei": "float64",
+    "fee": "float64",
+    "submitter": "category",
+    "payeeAddress": "category",
+    "oracleName": "category",
+    "amount": "float64",
+    "txDate": "datetime"
+}
+ANSWER_DTYPES = {
+    "timestamp": "int64",
+    "answer": "float64",
+    "txDate": "datetime"
+}
+ROUND_DTYPES = {
+    "aggregatorRoundId": "int64",
+    "blockNumber": "int64",
+    "logIndex": "int64",
+    "txHash": "hash",
+    "timestamp": "int64",
+    "transmitter": "category",
+    "oracleName": "category",
+    "submitter": "category",
+    "gasUsed": "int64",
+    "gasPriceGwei": "float64",
+    "fee": "float64",
+    "answer": "answer",
+    "price": "float64",
+    "epoch": "int64",
+    "round": "int64",
+    "observationOffset": "int64",
+    "observationCount": "int64",
+    "txDate": "datetime"
+}
+# The Unix timestamp each kind's txDate is derived from when it is collected
+DATE_SOURCES = {
+    "transmissions": "timestamp",
+    "payments": "txTimestamp",
+    "answers": "timestamp",
+    "rounds": "timestamp"
+}
+SCHEMAS = {
+    "transmissions": TRANSMISSION_DTYPES,
+    "payments": PAYMENT_DTYPES,
+    "answers": ANSWER_DTYPES,
+    "rounds": ROUND_DTYPES
+}
+INT64_RANGE = (np.iinfo(np.int64).min, np.iinfo(np.int64).max)
+
+def column_dtypes(columns, kind):
+    """
+    Function to get the schema's type of each column of a stored frame
+
+    Args:
+        columns: The names of the columns
+        kind: The kind of frame. One of transmissions, payments, answers or rounds. Per-operator submissions are transmissions
+
+    Returns:
+        A dict with the type of each column in the schema
+    """
+    schema = SCHEMAS[kind]
+    dtypes = {}
+    for column in columns:
+        if column in schema:
+            dtypes[column] = schema[column]
+        elif kind == "transmissions":
+            for suffix in OPERATOR_DTYPES:
+                if column.endswith(suffix):
+                    dtypes[column] = OPERATOR_DTYPES[suffix]
+    return dtypes
+
+def to_answers(values):
+    """
+    Function to store answers as int64 when they can be
+
+    Args:
+        values: A Series of answers
+
+    Returns:
+        The answers as int64, or unchanged if some are missing or out of the int64 range
+    """
+    if values.dtype == "int64" or len(values) == 0 or values.isna().any():
+        return values
+    if pd.api.types.is_float_dtype(values.dtype):
+        # floats are only kept as such by the parser when they are not whole or too large, e.g. the answers of
+        # 18-decimal feeds above 9.22. The largest int64 rounds up to 2**63 as a float, so that is out of range too
+        if (values % 1 != 0).any() or values.min() < INT64_RANGE[0] or values.max() >= -float(INT64_RANGE[0]):
+            return values
+        return values.astype("int64")
+    try:
+        if values.min() < INT64_RANGE[0] or values.max() > INT64_RANGE[1]:
+            return values
+        return values.astype("int64")
+    except (TypeError, ValueError, OverflowError):
+        return values
+
+def to_dates(values, timestamps=None):
+    """
+    Function to store dates as UTC datetime64
+
+    Args:
+        values: A Series of dates, as datetimes or as text like 2023-01-01 04:05:47+00:00
+        timestamps: A Series of the Unix timestamps the dates were derived from. Converting them is faster than parsing
+
+    Returns:
+        The dates as UTC datetime64
+    """
+    if isinstance(values.dtype, pd.DatetimeTZDtype):
+        return values.dt.tz_convert("UTC")
+    if pd.api.types.is_datetime64_dtype(values.dtype):
+        return values.dt.tz_localize("UTC")
+    if timestamps is not None and pd.api.types.is_integer_dtype(timestamps.dtype) and values.notna().all():
+        return pd.to_datetime(timestamps, unit="s", utc=True).rename(values.name)
+    return pd.to_datetime(values, utc=True, format="ISO8601")
+
+def date_text(value):
+    """
+    Function to write a date the way it is stored in the CSV files
+
+    Args:
+        value: A date, as a Timestamp or as text
+
+    Returns:
+        The date as text like 2023-01-01 04:05:47+00:00
+    """
+    return str(value) if isinstance(value, pd.Timestamp) else value
+
+def apply_schema(frame, kind):
+    """
+    Function to give a frame's columns the schema's types
+
+    Args:
+        frame: The DataFrame to convert. It is not changed, and is returned as it is if its columns have the types
+        kind: The kind of frame. One of transmissions, payments, answers or rounds
+
+    Returns:
+        A DataFrame with the typed columns
+    """
+    typed = {}
+    for column, dtype in column_dtypes(frame.columns, kind).items():
+        values = frame[column]
+        if values.dtype == dtype or (dtype == "answer" and values.dtype == "int64") or (dtype == "datetime" and str(values.dtype).endswith(", UTC]")):
+            continue
+        if dtype == "answer":
+            typed[column] = to_answers(values)
+        elif dtype == "datetime":
+            typed[column] = to_dates(values, frame[DATE_SOURCES[kind]] if DATE_SOURCES[kind] in frame.columns else None)
+        elif dtype == "category":
+            typed[column] = values.astype("category")
+        elif dtype == "hash":
+            if values.dtype != "category" and values.nunique() <= len(values) // 2:
+                typed[column] = values.astype("category")
+        elif dtype == "int64":
+            typed[column] = values if values.isna().any() else values.astype("int64")
+        else:
+            typed[column] = values.astype(dtype)
+    return frame.assign(**typed) if len(typed) > 0 else frame
+
+def read_frame(filename, kind, **kwargs):
+    """
+    Function to read a stored frame with the schema's types
+
+    Args:
+        filename: The CSV file
+        kind: The kind of frame. One of transmissions, payments, answers or rounds. Per-operator submissions are transmissions
+        kwargs: Other arguments for pd.read_csv, like usecols
+
+    Returns:
+        A DataFrame with the typed columns
+    """
+    return apply_schema(pd.read_csv(filename, **kwargs), kind)
+
+def write_frame(frame, filename, kind):
+    """
+    Function to store a frame with the schema's types
+
+    Args:
+        frame: The DataFrame to store
+        filename: The CSV file
+        kind: The kind of frame. One of transmissions, payments, answers or rounds
+
+    Returns:
+        The DataFrame with the typed columns
+    """
+    typed = apply_schema(frame, kind)
+    typed.to_csv(filename)
+    return typed
+
+def memory_report(frame, kind):
+    """
+    Function to compare the memory used by a frame before and after applying the schema
+
+    Args:
+        frame: The DataFrame as read or built
+        kind: The kind of frame. One of transmissions, payments, answers or rounds
+
+    Returns:
+        A DataFrame with the dtype and bytes of each column before and after, with a total row
+    """
+    typed = apply_schema(frame, kind)
+    report = pd.DataFrame({
+        "dtypeBefore": frame.dtypes.astype(str),
+        "bytesBefore": frame.memory_usage(index=False, deep=True),
+        "dtypeAfter": typed.dtypes.astype(str),
+        "bytesAfter": typed.memory_usage(index=False, deep=True)
+    })
+    report.loc["total"] = ["", report["bytesBefore"].sum(), "", report["bytesAfter"].sum()]
+    return report
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv
+
+    if len(args) < 2:
+        print("Please pass in the data path of a feed like: python schema.py ethereum/mainnet/crypto-usd/link-usd")
+        exit()
+
+    for kind in ["transmissions", "payments", "answers", "rounds"]:
+        filename = "data/"+args[1]+"/"+kind+".csv"
+        if not os.path.exists(filename):
+            continue
+        report = memory_report(pd.read_csv(filename), kind)
+        before, after = report.loc["total", "bytesBefore"], report.loc["total", "bytesAfter"]
+        print(f"{kind}: {before / 1000000:.2f} MB -> {after / 1000000:.2f} MB ({before / max(after, 1):.1f}x)")
+        if "--columns" in args:
+            print(report[report["bytesBefore"] != report["bytesAfter"]].to_string())
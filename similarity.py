@@ -0,0 +1,234 @@
+import pandas as pd
+import numpy as np
+import tempfile
+import os
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+from helper import read_nop_details, get_unique_withdrawal_dates
+from schema import read_frame, date_text
+
+# Rounds per block of the matrix products. The exact-match indicator of a block has up to this many rows per operator
+CHUNK_ROWS = 8192
+MATRICES = ["bothObserved", "exactMatchRate", "deviationCorrelation", "jointMissRate"]
+
+def observation_matrix(transmissions, names):
+    """
+    Function to build the rounds x operators matrices of the <op>_answer columns
+
+    Args:
+        transmissions: DataFrame of transmissions sorted by date
+        names: The names of the operators, one column each
+
+    Returns:
+        1. A boolean matrix of the rounds each operator was in the transmitter set for, False where its answer is NaN
+        2. A boolean matrix of the observations, False where an operator missed the round or was not in the set
+        3. The signed deviations from the aggregated answer in percent, 0 where not observed
+        4. An int64 code per answer, equal codes meaning equal answers, so answers too large for int64 compare exactly
+    """
+    answers = transmissions[[name+"_answer" for name in names]]
+    # NaN means the operator was not part of the transmitter set for that round
+    eligible = answers.notna().to_numpy()
+    observed = eligible & (answers != 0).to_numpy()
+    # answers are int64 when they fit, python ints otherwise
+    values = answers.to_numpy(dtype=np.int64 if all(dtype == "int64" for dtype in answers.dtypes) else object)
+    codes = pd.factorize(values.reshape(-1))[0].reshape(values.shape).astype(np.int64)
+
+    aggregated = transmissions["aggregatedAnswer"].to_numpy(dtype=np.float64)[:, None]
+    deviations = np.nan_to_num(np.where(observed, (answers.to_numpy(dtype=np.float64) - aggregated) / aggregated * 100, 0.0))
+    return eligible, observed, deviations, codes
+
+def range_bounds(dates, unique_withdrawal_dates):
+    """
+    Function to find the rows of each withdrawal range, as get_range_total splits the transmissions
+
+    Args:
+        dates: The sorted txDate Series of the transmissions
+        unique_withdrawal_dates: The sorted withdrawal dates
+
+    Returns:
+        An array of [first row, row after the last] for each range. The first range starts at the first row
+    """
+    ends = np.asarray(dates.searchsorted(list(unique_withdrawal_dates), side="left"), dtype=np.int64)
+    return np.column_stack([np.concatenate([[0], ends[:-1]]), ends]).astype(np.int64)
+
+def similarity_counts(eligible, observed, deviations, codes, chunk_rows=CHUNK_ROWS):
+    """
+    Function to sum the pairwise counts of a range's rounds with matrix products over blocks of rows, so the memory
+    used does not grow with the number of rounds
+
+    Args:
+        eligible: The rounds x operators transmitter set memberships
+        observed: The rounds x operators observations
+        deviations: The rounds x operators signed deviations, 0 where missed
+        codes: The rounds x operators answer codes
+        chunk_rows: The number of rounds per block
+
+    Returns:
+        A dict of operators x operators sums: rounds both were in the transmitter set for, rounds observed by both,
+        matching answers, rounds missed by both while in the set, and the sums of deviations, squared deviations and
+        products of deviations over the rounds observed by both
+    """
+    operators = observed.shape[1]
+    counts = {key: np.zeros((operators, operators)) for key in ["eligible", "both", "matches", "missed", "sumX", "sumXX", "sumXY"]}
+    for start in range(0, len(observed), chunk_rows):
+        block_observed = np.asarray(observed[start:start+chunk_rows])
+        block_eligible = np.asarray(eligible[start:start+chunk_rows])
+        block = block_observed.astype(np.float64)
+        missed = (block_eligible & ~block_observed).astype(np.float64)
+        block_deviations = np.asarray(deviations[start:start+chunk_rows])
+        in_set = block_eligible.astype(np.float64)
+        counts["eligible"] += in_set.T @ in_set
+        counts["both"] += block.T @ block
+        counts["missed"] += missed.T @ missed
+        # deviations are 0 where missed, so only the rounds observed by both add to the products
+        counts["sumX"] += block_deviations.T @ block
+        counts["sumXX"] += (block_deviations * block_deviations).T @ block
+        counts["sumXY"] += block_deviations.T @ block_deviations
+
+        # a row per distinct answer of each round with a 1 for the operators that gave it. Its Gram matrix counts the
+        # rounds in which two operators gave the same answer
+        rows, columns = np.nonzero(block_observed)
+        block_codes = np.asarray(codes[start:start+chunk_rows])[rows, columns]
+        _, cells = np.unique(rows * (int(block_codes.max(initial=0)) + 1) + block_codes, return_inverse=True)
+        indicator = np.zeros((cells.max(initial=-1) + 1, operators), dtype=np.float32)
+        indicator[cells, columns] = 1.0
+        counts["matches"] += indicator.T @ indicator
+    return counts
+
+def similarity_matrices(counts):
+    """
+    Function to get the rates and correlations from the pairwise counts of a range
+
+    Args:
+        counts: The sums of similarity_counts
+
+    Returns:
+        A dict of operators x operators matrices: the rounds observed by both operators, the share of those with the
+        same answer, the Pearson correlation of their deviations and the share of the rounds both were in the
+        transmitter set for that both missed. NaN where undefined
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        both = counts["both"]
+        mean_x = counts["sumX"] / both
+        mean_y = mean_x.T
+        covariance = counts["sumXY"] / both - mean_x * mean_y
+        variance_x = counts["sumXX"] / both - mean_x * mean_x
+        variance_y = variance_x.T
+        correlation = covariance / np.sqrt(variance_x * variance_y)
+        return {
+            "bothObserved": both,
+            "exactMatchRate": np.where(both > 0, counts["matches"] / both, np.nan),
+            "deviationCorrelation": np.where((variance_x > 0) & (variance_y > 0), np.clip(correlation, -1.0, 1.0), np.nan),
+            "jointMissRate": np.where(counts["eligible"] > 0, counts["missed"] / counts["eligible"], np.nan)
+        }
+
+_worker_state = {}
+
+def _init_similarity_worker(shared_dir):
+    # the matrices are mapped from disk, so the workers share the pages instead of each getting a copy
+    for name in ["eligible", "observed", "deviations", "codes"]:
+        _worker_state[name] = np.load(shared_dir+"/"+name+".npy", mmap_mode="r")
+
+def _run_similarity_range(args):
+    start, end, chunk_rows = args
+    return similarity_counts(_worker_state["eligible"][start:end], _worker_state["observed"][start:end], _worker_state["deviations"][start:end], _worker_state["codes"][start:end], chunk_rows)
+
+def operator_similarity(transmissions, names, unique_withdrawal_dates, processes=1, chunk_rows=CHUNK_ROWS):
+    """
+    Function to compare every pair of operators in each withdrawal range: how often they give the exact same answer,
+    how their deviations from the aggregated answer move together and how often they miss the same rounds
+
+    Args:
+        transmissions: DataFrame of transmissions
+        names: The names of the operators with answer columns
+        unique_withdrawal_dates: The withdrawal dates from get_unique_withdrawal_dates
+        processes: The number of worker processes, each computing whole ranges. None uses the number of cores. 1 runs in this process
+        chunk_rows: The number of rounds per block of the matrix products
+
+    Returns:
+        A dict with the names, the from and to dates and rounds of each range, and a ranges x operators x operators
+        array for each of MATRICES
+    """
+    processes = processes or os.cpu_count()
+    transmissions = transmissions.sort_values("txDate", kind="stable")
+    with metrics.stage("similarity.matrix"):
+        eligible, observed, deviations, codes = observation_matrix(transmissions, names)
+    bounds = range_bounds(transmissions["txDate"], unique_withdrawal_dates)
+
+    with metrics.stage("similarity.ranges"):
+        if processes == 1 or len(bounds) < 2:
+            range_counts = [similarity_counts(eligible[start:end], observed[start:end], deviations[start:end], codes[start:end], chunk_rows) for start, end in bounds]
+        else:
+            with tempfile.TemporaryDirectory() as shared_dir:
+                for name, values in [("eligible", eligible), ("observed", observed), ("deviations", deviations), ("codes", codes)]:
+                    np.save(shared_dir+"/"+name+".npy", values)
+                with ProcessPoolExecutor(max_workers=processes, initializer=_init_similarity_worker, initargs=(shared_dir,)) as executor:
+                    range_counts = list(executor.map(_run_similarity_range, [(start, end, chunk_rows) for start, end in bounds]))
+
+    rounds = (bounds[:, 1] - bounds[:, 0]) if len(bounds) > 0 else np.zeros(0, dtype=np.int64)
+    matrices = [similarity_matrices(counts) for counts in range_counts]
+    result = {
+        "names": np.array(names, dtype=str),
+        "from": np.array([date_text(transmissions["txDate"].iloc[0]) if len(transmissions) > 0 else ""] + [date_text(date) for date in unique_withdrawal_dates[:-1]], dtype=str)[:len(bounds)],
+        "to": np.array([date_text(date) for date in unique_withdrawal_dates], dtype=str),
+        "rounds": rounds
+    }
+    for key in MATRICES:
+        result[key] = np.stack([range_matrices[key] for range_matrices in matrices]) if len(matrices) > 0 else np.zeros((0, len(names), len(names)))
+    return result
+
+def similarity_filename(feed_path):
+    return "data/"+feed_path+"/similarity.npz"
+
+def feed_similarity(feed_path, processes=1, chunk_rows=CHUNK_ROWS):
+    """
+    Function to compare the operators of a collected feed in each withdrawal range and save the matrices
+
+    Args:
+        feed_path: The path of the feed
+        processes: The number of worker processes, see operator_similarity
+        chunk_rows: The number of rounds per block of the matrix products
+
+    Returns:
+        The result of operator_similarity, also saved to the feed's similarity.npz
+    """
+    nop_details, transmitters = read_nop_details(feed_path)
+    transmissions = read_frame("data/"+feed_path+"/transmissions.csv", "transmissions")
+    payments = read_frame("data/"+feed_path+"/payments.csv", "payments")
+    names = [name for name in dict.fromkeys(nop_details[transmitter.lower()]["name"] for transmitter in transmitters) if name+"_answer" in transmissions.columns]
+
+    result = operator_similarity(transmissions, names, get_unique_withdrawal_dates(payments), processes, chunk_rows)
+    np.savez(similarity_filename(feed_path), **result)
+    return result
+
+def similarity_pairs(result, range_index=-1):
+    """
+    Function to list the pairs of operators of a range
+
+    Args:
+        result: The result of operator_similarity, or the arrays of a similarity.npz
+        range_index: The range. The last one by default
+
+    Returns:
+        A DataFrame with a row per pair of operators and a column per matrix, by decreasing exact-match rate
+    """
+    names = list(result["names"])
+    first, second = np.triu_indices(len(names), k=1)
+    pairs = pd.DataFrame({"operator": np.array(names, dtype=object)[first], "other": np.array(names, dtype=object)[second]})
+    for key in MATRICES:
+        pairs[key] = result[key][range_index][first, second]
+    return pairs.sort_values(["exactMatchRate", "deviationCorrelation"], ascending=False, ignore_index=True)
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv
+
+    if len(args) < 2:
+        print("Please pass in the data path of a feed like: python similarity.py ethereum/mainnet/crypto-usd/link-usd [processes]")
+        exit()
+
+    result = feed_similarity(args[1], int(args[2]) if len(args) > 2 else 1)
+    print("Saved "+similarity_filename(args[1])+" with "+str(len(result["rounds"]))+" ranges")
+    if len(result["rounds"]) > 0:
+        print("Pairs of the last range from "+str(result["from"][-1])+" to "+str(result["to"][-1])+":")
+        print(similarity_pairs(result).head(20).to_string(index=False))
@@ -0,0 +1,286 @@
+import pandas as pd
+import numpy as np
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from attribution import missed_streaks
+from helper import transmission_repayments_link
+
+def build_observation_matrix(transmissions, operator_names):
+    """
+    Function to build the observation matrix of a feed from the wide transmissions frame
+
+    Args:
+        transmissions: DataFrame of submissions and transmissions
+        operator_names: The names of the operators, in column order
+
+    Returns:
+        A dict of numpy arrays with one row per round and one column per operator
+    """
+    transmissions = transmissions.sort_values("blockNumber", kind="stable")
+    answers = transmissions[[name+"_answer" for name in operator_names]].to_numpy(dtype=np.float64)
+    deviations = transmissions[[name+"_deviation" for name in operator_names]].to_numpy(dtype=np.float64)
+    # NaN means the operator was not part of the transmitter set for that round
+    eligible = ~np.isnan(answers)
+    observed = eligible & (answers != 0)
+
+    transmitted = np.zeros(answers.shape, dtype=bool)
+    if "submitterName" in transmissions.columns:
+        names = transmissions["submitterName"].to_numpy()
+        for column, name in enumerate(operator_names):
+            transmitted[:, column] = names == name
+
+    gas_price = transmissions["gasPriceGwei"].to_numpy(dtype=np.float64)
+    fee = transmissions["fee"].to_numpy(dtype=np.float64)
+
+    return {
+        "names": list(operator_names),
+        "blockNumber": transmissions["blockNumber"].to_numpy(dtype=np.int64),
+        "timestamp": transmissions["timestamp"].to_numpy(dtype=np.int64),
+        "answers": answers,
+        "deviations": np.nan_to_num(np.where(observed, deviations, 0.0)),
+        "eligible": eligible,
+        "observed": observed,
+        "transmitted": transmitted,
+        "gasPriceGwei": gas_price,
+        "gasCost": fee / (gas_price/1000000000),
+        "missStreak": np.stack([missed_streaks(np.where(eligible[:, column], answers[:, column], np.nan))[0] for column in range(len(operator_names))], axis=1) if len(operator_names) > 0 else np.zeros((len(answers), 0), dtype=np.int64)
+    }
+
+def observation_matrix_for_feed(attribution):
+    """
+    Function to build the observation matrix of a feed from its attribution engine
+
+    Args:
+        attribution: A FeedAttribution instance of the feed
+
+    Returns:
+        A dict of numpy arrays with one row per round and one column per operator
+    """
+    transmissions = attribution.transmissions_frame(["submitterName"])
+    return build_observation_matrix(transmissions, attribution.operator_names)
+
+def ocr_payout(matrix, params):
+    """
+    Payout rule of the current OCR billing: a fixed reward per observation and per transmission plus gas reimbursement
+
+    Args:
+        matrix: The observation matrix
+        params: linkGweiPerObservation, linkGweiPerTransmission, maximumGasPrice, reasonableGasPrice and microLinkPerEth
+
+    Returns:
+        A rounds x operators array with payouts in LINK
+    """
+    payouts = matrix["observed"] * (params["linkGweiPerObservation"] / 1000000000.0)
+    payouts = payouts + matrix["transmitted"] * (params["linkGweiPerTransmission"] / 1000000000.0)
+
+    repayments_link = transmission_repayments_link(matrix["gasPriceGwei"], matrix["gasCost"], params)
+    return payouts + matrix["transmitted"] * repayments_link[:, None]
+
+def deviation_weighted_payout(matrix, params):
+    """
+    Payout rule sharing a fixed pool per round between observers, weighted by how close they were to the aggregated answer
+
+    Args:
+        matrix: The observation matrix
+        params: roundReward in LINK and deviationScale in percent. A deviation of deviationScale halves an observer's weight
+
+    Returns:
+        A rounds x operators array with payouts in LINK
+    """
+    weights = matrix["observed"] / (1.0 + matrix["deviations"] / params["deviationScale"])
+    totals = weights.sum(axis=1, keepdims=True)
+    return np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0) * params["roundReward"]
+
+def miss_penalized_payout(matrix, params):
+    """
+    Payout rule paying a fixed reward per observation and charging a penalty that grows with each consecutive miss
+
+    Args:
+        matrix: The observation matrix
+        params: observationReward and missPenalty in LINK, and optionally maxPenalty in LINK
+
+    Returns:
+        A rounds x operators array with payouts in LINK. Penalties are negative
+    """
+    missed = matrix["eligible"] & ~matrix["observed"]
+    penalties = missed * (matrix["missStreak"] + 1) * params["missPenalty"]
+    if "maxPenalty" in params:
+        penalties = np.minimum(penalties, params["maxPenalty"])
+    return matrix["observed"] * params["observationReward"] - penalties
+
+def stake_weighted_payout(matrix, params):
+    """
+    Payout rule sharing a fixed pool per round between observers in proportion to their stake
+
+    Args:
+        matrix: The observation matrix
+        params: roundReward in LINK and stakes, a dict of operator name to stake. Operators without a stake use defaultStake
+
+    Returns:
+        A rounds x operators array with payouts in LINK
+    """
+    stakes = np.array([params["stakes"].get(name, params.get("defaultStake", 0)) for name in matrix["names"]], dtype=np.float64)
+    weights = matrix["observed"] * stakes
+    totals = weights.sum(axis=1, keepdims=True)
+    return np.divide(weights, totals, out=np.zeros_like(weights), where=totals > 0) * params["roundReward"]
+
+PAYOUT_RULES = {
+    "ocr": ocr_payout,
+    "deviation_weighted": deviation_weighted_payout,
+    "miss_penalized": miss_penalized_payout,
+    "stake_weighted": stake_weighted_payout,
+}
+
+def get_payout_rule(rule):
+    """
+    Function to resolve a payout rule
+
+    Args:
+        rule: The name of a rule in PAYOUT_RULES or a module-level function taking (matrix, params)
+
+    Returns:
+        The payout rule function
+    """
+    if callable(rule):
+        return rule
+    if rule not in PAYOUT_RULES:
+        raise ValueError("Unknown payout rule "+str(rule)+". Available rules: "+", ".join(PAYOUT_RULES))
+    return PAYOUT_RULES[rule]
+
+def period_starts(timestamps, period_edges):
+    """
+    Function to get the first round of each period
+
+    Args:
+        timestamps: Sorted round timestamps
+        period_edges: Sorted timestamps at which each period starts
+
+    Returns:
+        The index of the first round of each period
+    """
+    return np.searchsorted(timestamps, np.asarray(period_edges, dtype=np.int64), side="left")
+
+def simulate(matrix, rule, params, period_edges=None):
+    """
+    Function to replay a payout rule over every round of a feed
+
+    Args:
+        matrix: The observation matrix
+        rule: The name of a payout rule or a payout rule function
+        params: The parameters of the rule
+        period_edges: Sorted timestamps at which each period starts, e.g. withdrawal dates. Rounds before the first edge are left out. Defaults to a single period
+
+    Returns:
+        A dict with per-round payouts (rounds x operators) and per-period payouts (periods x operators)
+    """
+    payouts = get_payout_rule(rule)(matrix, params)
+    if period_edges is None:
+        period_edges = matrix["timestamp"][:1]
+    starts = period_starts(matrix["timestamp"], period_edges)
+    # reduceat needs in-bounds starts; empty trailing periods sum to 0
+    in_bounds = starts < len(payouts)
+    periods = np.zeros((len(starts), payouts.shape[1]))
+    if len(payouts) > 0 and in_bounds.any():
+        periods[in_bounds] = np.add.reduceat(payouts, starts[in_bounds], axis=0)
+        # reduceat returns the row itself for empty periods
+        empty = np.append(starts[in_bounds][1:] == starts[in_bounds][:-1], False)
+        periods[np.flatnonzero(in_bounds)[empty]] = 0
+
+    return {"rounds": payouts, "periods": periods}
+
+def expand_grid(param_grid):
+    """
+    Function to expand a parameter grid into parameter combinations
+
+    Args:
+        param_grid: A dict of parameter name to a list of values. Scalars are fixed values
+
+    Returns:
+        A list of parameter dicts, one per combination
+    """
+    names = list(param_grid)
+    values = [param_grid[name] if isinstance(param_grid[name], (list, tuple, np.ndarray)) else [param_grid[name]] for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+# Set in each worker by the pool initializer, so the matrix is sent once per process
+_worker_state = {}
+
+def _init_sweep_worker(matrix, rule, period_edges):
+    _worker_state["matrix"] = matrix
+    _worker_state["rule"] = rule
+    _worker_state["period_edges"] = period_edges
+
+def _run_sweep_point(params):
+    result = simulate(_worker_state["matrix"], _worker_state["rule"], params, _worker_state["period_edges"])
+    return result["periods"]
+
+def run_sweep(matrix, rule, param_grid, period_edges=None, processes=None):
+    """
+    Function to replay a payout rule for every combination of a parameter grid across a process pool
+
+    Args:
+        matrix: The observation matrix
+        rule: The name of a payout rule or a module-level payout rule function
+        param_grid: A dict of parameter name to a list of values
+        period_edges: Sorted timestamps at which each period starts. Defaults to a single period
+        processes: The number of worker processes. Defaults to the number of cores. 1 runs in this process
+
+    Returns:
+        A DataFrame with the payout per combination, period and operator
+    """
+    combinations = expand_grid(param_grid)
+    processes = processes or os.cpu_count()
+
+    if processes == 1:
+        _init_sweep_worker(matrix, rule, period_edges)
+        results = [_run_sweep_point(params) for params in combinations]
+    else:
+        chunksize = max(1, len(combinations) // (processes * 4))
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_sweep_worker, initargs=(matrix, rule, period_edges)) as executor:
+            results = list(executor.map(_run_sweep_point, combinations, chunksize=chunksize))
+
+    names = matrix["names"]
+    periods_count = results[0].shape[0] if len(results) > 0 else 0
+    payouts = np.stack(results) if len(results) > 0 else np.zeros((0, periods_count, len(names)))
+    sweep_df = pd.DataFrame({
+        "combination": np.repeat(np.arange(len(combinations)), periods_count * len(names)),
+        "period": np.tile(np.repeat(np.arange(periods_count), len(names)), len(combinations)),
+        "oracleName": np.tile(names, len(combinations) * periods_count),
+        "payout": payouts.reshape(-1)
+    })
+
+    params_df = pd.DataFrame(combinations)
+    # dict-valued parameters such as stakes are not useful as columns
+    params_df = params_df[[column for column in params_df.columns if not isinstance(combinations[0][column], dict)]] if len(combinations) > 0 else params_df
+    params_df["combination"] = np.arange(len(combinations))
+
+    return sweep_df.merge(params_df, on="combination", how="left")
+
+if __name__ == "__main__":
+    import sys
+    import json
+    from attribution import FeedAttribution
+    from helper import get_unique_withdrawal_dates
+    args = sys.argv
+
+    if len(args) < 4:
+        print("Please pass in the data path of a feed, a payout rule and a JSON grid of its parameters like: python simulator.py ethereum/mainnet/crypto-usd/link-usd deviation_weighted '{\"roundReward\": [0.5, 1], \"deviationScale\": [0.01, 0.1]}' [processes]")
+        print("Payout rules: "+", ".join(PAYOUT_RULES))
+        exit()
+
+    attribution = FeedAttribution({"path": args[1]})
+    matrix = observation_matrix_for_feed(attribution)
+    # a period before the first withdrawal, then one from each withdrawal to the next
+    withdrawal_timestamps = [int(pd.Timestamp(date).timestamp()) for date in get_unique_withdrawal_dates(attribution.payments)]
+    period_edges = np.array(sorted(set(matrix["timestamp"][:1].tolist() + withdrawal_timestamps)), dtype=np.int64)
+    sweep_df = run_sweep(matrix, args[2], json.loads(args[3]), period_edges, int(args[4]) if len(args) > 4 else None)
+
+    param_columns = [column for column in sweep_df.columns if column not in ["combination", "period", "oracleName", "payout"]]
+    operator_totals = sweep_df.groupby(["combination", "oracleName"], sort=False)["payout"].sum().groupby(level="combination")
+    summary_df = sweep_df.drop_duplicates("combination").set_index("combination")[param_columns]
+    summary_df["totalPayout"] = operator_totals.sum()
+    summary_df["minOperatorPayout"] = operator_totals.min()
+    summary_df["maxOperatorPayout"] = operator_totals.max()
+    print(str(len(summary_df))+" combinations over "+str(len(matrix["timestamp"]))+" rounds and "+str(len(period_edges))+" periods, payouts in LINK:")
+    print(summary_df.head(50).to_string())
@@ -0,0 +1,94 @@
+import numpy as np
+
+# Relative accuracy of the sketches. A quantile is returned within this fraction of the exact value
+RELATIVE_ACCURACY = 0.01
+# Values at or below this are counted as zero, in their own bucket
+MIN_VALUE = 1e-9
+ZERO_BUCKET = np.iinfo(np.int32).min
+
+class QuantileSketch:
+    """
+    Logarithmic buckets counting positive values, like DDSketch. A value x goes to bucket ceil(log(x) / log(gamma))
+    with gamma = (1 + a) / (1 - a), and every value of a bucket is within a relative error a of the bucket's middle.
+    The quantile q of the counted values is the bucket holding the value of rank floor(q * (n - 1)) in sorted order, so
+    it is within a of that value. Sketches of any periods and operators merge exactly by adding their counts
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+
+    def buckets(self, values):
+        """
+        Function to get the bucket of values
+
+        Args:
+            values: An array of values, positive or zero
+
+        Returns:
+            An int32 array with the bucket of each value, ZERO_BUCKET for zeros
+        """
+        values = np.asarray(values, dtype=np.float64)
+        positive = values > MIN_VALUE
+        buckets = np.full(len(values), ZERO_BUCKET, dtype=np.int32)
+        buckets[positive] = np.ceil(np.log(values[positive]) / self.log_gamma).astype(np.int32)
+        return buckets
+
+    def bucket_values(self, buckets):
+        """
+        Function to get the value each bucket stands for
+
+        Args:
+            buckets: An array of buckets
+
+        Returns:
+            The values, 0 for the zero bucket
+        """
+        buckets = np.asarray(buckets)
+        values = 2 * np.power(self.gamma, buckets.astype(np.float64)) / (self.gamma + 1)
+        return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+    def quantiles(self, buckets, counts, quantiles):
+        """
+        Function to get quantiles from bucket counts
+
+        Args:
+            buckets: An array of buckets, repeated or not, in any order
+            counts: The count of each entry of buckets
+            quantiles: The quantiles like [0.5, 0.95, 0.99]
+
+        Returns:
+            An array with the value of each quantile, NaN if there are no counts
+        """
+        counts = np.asarray(counts, dtype=np.int64)
+        if counts.sum() == 0:
+            return np.full(len(quantiles), np.nan)
+        unique_buckets, inverse = np.unique(buckets, return_inverse=True)
+        cumulative = np.cumsum(np.bincount(inverse, weights=counts, minlength=len(unique_buckets)))
+        ranks = np.floor(np.asarray(quantiles, dtype=np.float64) * (cumulative[-1] - 1))
+        return self.bucket_values(unique_buckets[np.searchsorted(cumulative, ranks, side="right")])
+
+def aggregate_counts(periods, columns, buckets, counts=None):
+    """
+    Function to sum the counts of every period, column and bucket, the form sketches are stored and merged in
+
+    Args:
+        periods: The period of each entry
+        columns: The column of each entry, like an operator
+        buckets: The bucket of each entry
+        counts: The count of each entry. 1 each if None
+
+    Returns:
+        The unique periods, columns and buckets sorted in that order, with their summed counts
+    """
+    periods = np.asarray(periods, dtype=np.int64)
+    columns = np.asarray(columns, dtype=np.int32)
+    buckets = np.asarray(buckets, dtype=np.int32)
+    counts = np.ones(len(periods), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    if len(periods) == 0:
+        return periods, columns, buckets, counts
+    order = np.lexsort((buckets, columns, periods))
+    periods, columns, buckets, counts = periods[order], columns[order], buckets[order], counts[order]
+    starts = np.flatnonzero(np.concatenate([[True], (periods[1:] != periods[:-1]) | (columns[1:] != columns[:-1]) | (buckets[1:] != buckets[:-1])]))
+    return periods[starts], columns[starts], buckets[starts], np.add.reduceat(counts, starts)
@@ -0,0 +1,450 @@
+import pandas as pd
+import numpy as np
+import json
+import math
+import os
+from helper import read_nop_details, finalize_range_total
+from operator_index import find_feed_paths
+
+try:
+    import duckdb
+except ImportError:
+    # optional, only needed for the SQL layer
+    duckdb = None
+
+# CSV stores of a feed registered as views, with the columns kept as text so comparisons match the pandas path
+CSV_STORES = {
+    "transmissions": ("transmissions.csv", {"txDate": "VARCHAR", "txHash": "VARCHAR", "submitter": "VARCHAR"}),
+    "payments": ("payments.csv", {"txDate": "VARCHAR", "txHash": "VARCHAR", "submitter": "VARCHAR", "payeeAddress": "VARCHAR", "oracleName": "VARCHAR"}),
+    "answers": ("answers.csv", {"txDate": "VARCHAR"}),
+    "rounds": ("rounds.csv", {"txDate": "VARCHAR", "txHash": "VARCHAR", "transmitter": "VARCHAR", "oracleName": "VARCHAR", "submitter": "VARCHAR"})
+}
+
+# Views derived from the stores. Every view has a feed column, so one database can hold every collected feed
+DERIVED_VIEWS = {
+    # the blocks each price holds for, as price_at_blocks looks them up. Blocks before the first price use the first price
+    "price_ranges": """
+        SELECT feed, price, value,
+            CASE WHEN block = min(block) OVER (PARTITION BY feed, price) THEN -9223372036854775808 ELSE block END AS fromBlock,
+            coalesce(lead(block) OVER (PARTITION BY feed, price ORDER BY block), 9223372036854775807) AS toBlock
+        FROM prices
+    """,
+    "transmission_costs": """
+        SELECT t.feed, t.row, t.blockNumber, t.txDate, t.submitter, o.oracleName AS submitterName, t.fee, t.gasPriceGwei,
+            t.fee / (t.gasPriceGwei / 1000000000) AS gasCost,
+            p.value AS ethPrice,
+            t.fee * p.value AS feeUsd
+        FROM transmissions t
+        LEFT JOIN price_ranges p ON t.feed = p.feed AND p.price = 'eth-usd' AND t.blockNumber >= p.fromBlock AND t.blockNumber < p.toBlock
+        LEFT JOIN operators o ON t.feed = o.feed AND lower(t.submitter) = o.address
+    """,
+    "payments_usd": """
+        SELECT pay.*, p.value AS linkPrice, pay.amount * p.value AS usdAmount
+        FROM payments pay
+        LEFT JOIN price_ranges p ON pay.feed = p.feed AND p.price = 'link-usd' AND pay.blockNumber >= p.fromBlock AND pay.blockNumber < p.toBlock
+    """,
+    # the streak columns of count_consecutive_missed, over the whole feed
+    "observation_streaks": """
+        SELECT *,
+            CASE WHEN missed THEN row_number() OVER (PARTITION BY feed, oracleName, streak, missed ORDER BY row) - 1 ELSE 0 END AS consecutiveMissed
+        FROM (
+            SELECT *, sum(CASE WHEN separateMissed = 1 THEN 1 ELSE 0 END) OVER (PARTITION BY feed, oracleName ORDER BY row) AS streak
+            FROM (
+                SELECT *,
+                    CASE WHEN missed AND NOT coalesce(lag(missed) OVER (PARTITION BY feed, oracleName ORDER BY row), false) THEN 1 ELSE 0 END AS separateMissed
+                FROM (SELECT *, coalesce(answer = 0, false) AS missed, answer IS NULL OR answer != 0 AS observed FROM observations)
+            )
+        )
+    """,
+    # the dates on which every operator was paid, as in get_unique_withdrawal_dates
+    "withdrawal_dates": """
+        SELECT feed, txDate FROM payments p
+        GROUP BY feed, txDate
+        HAVING count(DISTINCT oracleName) = (SELECT count(DISTINCT oracleName) FROM payments WHERE feed = p.feed)
+    """,
+    # the ranges of get_totals with the billing parameters at the withdrawal block as chosen by get_block_billing
+    "withdrawal_ranges": """
+        WITH ranges AS (
+            SELECT w.feed, w.txDate AS withdrawalDate,
+                row_number() OVER (PARTITION BY w.feed ORDER BY w.txDate) - 1 AS rangeIndex,
+                lag(w.txDate) OVER (PARTITION BY w.feed ORDER BY w.txDate) AS previousDate,
+                (SELECT arg_min(blockNumber, row) FROM payments WHERE feed = w.feed AND txDate = w.txDate) AS withdrawalBlock,
+                (SELECT arg_min(txDate, row) FROM payments WHERE feed = w.feed AND txDate <= w.txDate) AS firstPaymentDate
+            FROM withdrawal_dates w
+        ), billing AS (
+            SELECT r.feed, r.rangeIndex, coalesce(min(b.position) FILTER (WHERE r.withdrawalBlock < b.block), max(b.position)) AS position
+            FROM ranges r JOIN billing_params b ON r.feed = b.feed
+            GROUP BY r.feed, r.rangeIndex
+        )
+        SELECT r.feed, r.rangeIndex, coalesce(r.previousDate, r.firstPaymentDate) AS rangeFrom, r.withdrawalDate AS rangeTo, r.previousDate,
+            r.withdrawalBlock, p.value AS linkPrice, b.maximumGasPrice, b.reasonableGasPrice, b.microLinkPerEth, b.linkGweiPerObservation, b.linkGweiPerTransmission
+        FROM ranges r
+        LEFT JOIN billing USING (feed, rangeIndex)
+        LEFT JOIN billing_params b ON b.feed = r.feed AND b.position = billing.position
+        LEFT JOIN prices p ON p.feed = r.feed AND p.price = 'link-usd' AND p.block = r.withdrawalBlock
+    """
+}
+
+# Prepared per-range per-operator queries, taking the feed as $feed
+QUERIES = {
+    "ranges": """
+        SELECT * FROM withdrawal_ranges WHERE feed = $feed ORDER BY rangeIndex
+    """,
+    "operator_totals": """
+        SELECT r.rangeIndex, o.oracleName,
+            avg(o.deviation) AS deviations,
+            max(o.deviation) AS maxDeviation,
+            count(*) FILTER (WHERE o.answer = 0) AS missedObservations,
+            count(*) FILTER (WHERE o.consecutiveMissed != 0) AS consecutiveMissedObservations,
+            max(o.consecutiveMissed) AS maxConsecutiveMissedObservations,
+            count(*) FILTER (WHERE o.separateMissed != 0) AS separateMissedObservationsInstances,
+            count(*) FILTER (WHERE o.observed) AS observationsCounts,
+            coalesce(sum(c.feeUsd) FILTER (WHERE c.submitterName = o.oracleName), 0) AS fees
+        FROM withdrawal_ranges r
+        JOIN observation_streaks o ON o.feed = r.feed AND o.txDate < r.rangeTo AND (r.previousDate IS NULL OR o.txDate >= r.previousDate)
+        JOIN transmission_costs c ON c.feed = o.feed AND c.row = o.row
+        WHERE r.feed = $feed
+        GROUP BY r.rangeIndex, o.oracleName
+    """,
+    # transmissions of each address among the rounds its operator observed, with their repayments in ETH
+    "transmitter_repayments": """
+        SELECT r.rangeIndex, o.oracleName, c.submitter, count(*) AS transmissionsCounts,
+            sum(least(c.gasPriceGwei, r.maximumGasPrice) / 1000000000.0 * c.gasCost
+                + CASE WHEN c.gasPriceGwei < r.reasonableGasPrice THEN (r.reasonableGasPrice - c.gasPriceGwei) / 1000000000.0 * c.gasCost / 2.0 ELSE 0 END) AS repaymentsEth
+        FROM withdrawal_ranges r
+        JOIN observation_streaks o ON o.feed = r.feed AND o.txDate < r.rangeTo AND (r.previousDate IS NULL OR o.txDate >= r.previousDate)
+        JOIN transmission_costs c ON c.feed = o.feed AND c.row = o.row
+        WHERE r.feed = $feed AND o.observed
+        GROUP BY r.rangeIndex, o.oracleName, c.submitter
+    """,
+    "operator_payments": """
+        SELECT r.rangeIndex, p.oracleName, sum(p.usdAmount) AS payments
+        FROM withdrawal_ranges r
+        JOIN payments_usd p ON p.feed = r.feed AND p.txDate <= r.rangeTo AND (r.previousDate IS NULL OR p.txDate > r.previousDate)
+        WHERE r.feed = $feed
+        GROUP BY r.rangeIndex, p.oracleName
+    """
+}
+
+def require_duckdb():
+    if duckdb is None:
+        raise ImportError("The SQL layer needs DuckDB. Install it with: pip install duckdb")
+
+def sql_string(value):
+    return "'"+str(value).replace("'", "''")+"'"
+
+def sql_identifier(value):
+    return '"'+str(value).replace('"', '""')+'"'
+
+class FeedDatabase:
+    """
+    An embedded DuckDB database over the collected feeds.
+
+    The CSV stores stay on disk and are registered as views, so queries scan the files in parallel and only read the
+    columns they need. The JSON stores are small and loaded as tables. Views:
+    transmissions, observations (one row per round and operator), payments, answers, billing_params, prices, operators
+    and the derived views in DERIVED_VIEWS.
+    """
+
+    def __init__(self, feed_paths=None, database=":memory:", threads=None):
+        """
+        Args:
+            feed_paths: The paths of the feeds to register. Every collected feed if None
+            database: The DuckDB database file, in memory by default
+            threads: The number of threads of DuckDB. Every core if None
+        """
+        require_duckdb()
+        config = {} if threads is None else {"threads": threads}
+        self.con = duckdb.connect(database, config=config)
+        self.feed_paths = find_feed_paths() if feed_paths is None else list(feed_paths)
+        self.operator_names = {}
+        self.register()
+
+    def register(self):
+        """
+        Function to create the views and tables of every feed
+
+        Returns:
+            The database
+        """
+        for view, (filename, types) in CSV_STORES.items():
+            selects = [self._csv_select(feed_path, filename, types) for feed_path in self.feed_paths if os.path.exists("data/"+feed_path+"/"+filename)]
+            self._create_union_view(view, selects)
+
+        observations = [self._observations_select(feed_path) for feed_path in self.feed_paths if os.path.exists("data/"+feed_path+"/transmissions.csv")]
+        self._create_union_view("observations", [select for select in observations if select is not None])
+
+        billing_rows, price_rows, operator_rows = [], [], []
+        for feed_path in self.feed_paths:
+            billing_filename = "data/"+feed_path+"/billing_params.json"
+            if os.path.exists(billing_filename):
+                with open(billing_filename, "r") as file:
+                    billing_params = json.load(file)
+                # get_block_billing goes through the blocks in file order
+                for position, block in enumerate(billing_params):
+                    billing_rows.append(dict(billing_params[block], feed=feed_path, position=position, block=int(block)))
+
+            prices_dir = "data/"+feed_path+"/prices"
+            if os.path.isdir(prices_dir):
+                for filename in sorted(os.listdir(prices_dir)):
+                    if filename.endswith(".json"):
+                        with open(prices_dir+"/"+filename, "r") as file:
+                            prices = json.load(file)
+                        price_rows += [(feed_path, filename[:-len(".json")], int(block), float(value)) for block, value in prices.items()]
+
+            if os.path.exists("data/"+feed_path+"/nops.json"):
+                nop_details, _ = read_nop_details(feed_path)
+                operator_rows += [(feed_path, address.lower(), details["name"]) for address, details in nop_details.items()]
+
+        billing_columns = ["maximumGasPrice", "reasonableGasPrice", "microLinkPerEth", "linkGweiPerObservation", "linkGweiPerTransmission"]
+        self.con.execute("CREATE OR REPLACE TABLE billing_params (feed VARCHAR, position INTEGER, block BIGINT, "+", ".join(column+" DOUBLE" for column in billing_columns)+")")
+        self._insert("billing_params", pd.DataFrame([[row["feed"], row["position"], row["block"]] + [row.get(column) for column in billing_columns] for row in billing_rows]))
+        self.con.execute("CREATE OR REPLACE TABLE prices (feed VARCHAR, price VARCHAR, block BIGINT, value DOUBLE)")
+        self._insert("prices", pd.DataFrame(price_rows))
+        self.con.execute("CREATE OR REPLACE TABLE operators (feed VARCHAR, address VARCHAR, oracleName VARCHAR)")
+        self._insert("operators", pd.DataFrame(operator_rows))
+
+        for view, sql in DERIVED_VIEWS.items():
+            try:
+                self.con.execute("CREATE OR REPLACE VIEW "+view+" AS "+sql)
+            except duckdb.CatalogException:
+                # a store no feed has yet, e.g. transmissions before data-getter.py ran
+                self.con.execute("DROP VIEW IF EXISTS "+view)
+        return self
+
+    def _insert(self, table, frame):
+        if len(frame) == 0:
+            return
+        self.con.register("_insert_rows", frame)
+        self.con.execute("INSERT INTO "+table+" SELECT * FROM _insert_rows")
+        self.con.unregister("_insert_rows")
+
+    def _csv_source(self, filename, types):
+        """
+        Function to build a scan of a CSV store with its columns sniffed once, so queries do not sniff the file again
+
+        Args:
+            filename: The CSV file
+            types: The types of columns to override
+
+        Returns:
+            The names of the columns and the read_csv call
+        """
+        described = self.con.execute("DESCRIBE SELECT * FROM read_csv("+sql_string(filename)+", header = true, types = "+json.dumps(types)+")").fetchall()
+        # the first column is the unnamed index written by pandas
+        columns = {"row": described[0][1]}
+        columns.update((row[0], row[1]) for row in described[1:])
+        return list(columns), "read_csv("+sql_string(filename)+", header = true, auto_detect = false, columns = "+json.dumps(columns)+")"
+
+    def _csv_select(self, feed_path, filename, types):
+        _, source = self._csv_source("data/"+feed_path+"/"+filename, types)
+        return "SELECT "+sql_string(feed_path)+" AS feed, * FROM "+source
+
+    def _observations_select(self, feed_path):
+        filename = "data/"+feed_path+"/transmissions.csv"
+        types = CSV_STORES["transmissions"][1]
+        columns, csv_source = self._csv_source(filename, types)
+        nop_details, transmitters = read_nop_details(feed_path)
+        names = [nop_details[transmitter.lower()]["name"] for transmitter in transmitters]
+        names = [name for name in dict.fromkeys(names) if name+"_answer" in columns and name+"_deviation" in columns]
+        self.operator_names[feed_path] = names
+        if len(names) == 0:
+            return None
+
+        casts = ", ".join("CAST("+sql_identifier(name+"_answer")+" AS DOUBLE) AS "+sql_identifier(name+"_answer")+", CAST("+sql_identifier(name+"_deviation")+" AS DOUBLE) AS "+sql_identifier(name+"_deviation") for name in names)
+        pairs = ", ".join("("+sql_identifier(name+"_answer")+", "+sql_identifier(name+"_deviation")+") AS "+sql_string(name) for name in names)
+        source = "SELECT "+sql_string(feed_path)+" AS feed, row, blockNumber, txDate, submitter, "+casts+" FROM "+csv_source
+        # one scan of the file, with a row per round and operator
+        return "SELECT feed, row, blockNumber, txDate, submitter, oracleName, answer, deviation FROM ("+source+") UNPIVOT INCLUDE NULLS ((answer, deviation) FOR oracleName IN ("+pairs+"))"
+
+    def _create_union_view(self, view, selects):
+        if len(selects) == 0:
+            self.con.execute("DROP VIEW IF EXISTS "+view)
+            return
+        self.con.execute("CREATE OR REPLACE VIEW "+view+" AS "+" UNION ALL BY NAME ".join(selects))
+
+    def sql(self, query, params=None):
+        """
+        Function to run a query over the views
+
+        Args:
+            query: The SQL query
+            params: The parameters of the query, a dict for $name parameters or a list for ? parameters
+
+        Returns:
+            A DataFrame with the result
+        """
+        return self.con.execute(query, params).df()
+
+    def query(self, name, **params):
+        """
+        Function to run one of the prepared QUERIES
+
+        Args:
+            name: The name of the query
+            params: The parameters of the query, e.g. feed
+
+        Returns:
+            A DataFrame with the result
+        """
+        return self.sql(QUERIES[name], params)
+
+    def totals(self, feed_path):
+        """
+        Function to compute a feed's totals with the same structure and values as get_totals
+
+        Args:
+            feed_path: The path of the feed
+
+        Returns:
+            A dict with totals for each operator. Includes profits and observation misses
+        """
+        nop_details, transmitters = read_nop_details(feed_path)
+        observed_names = set(self.operator_names.get(feed_path, []))
+        ranges = self.query("ranges", feed=feed_path)
+        operator_totals = {(row.rangeIndex, row.oracleName): row for row in self.query("operator_totals", feed=feed_path).itertuples(index=False)}
+        repayments = {(row.rangeIndex, row.oracleName, row.submitter): row for row in self.query("transmitter_repayments", feed=feed_path).itertuples(index=False)}
+        payments = {(row.rangeIndex, row.oracleName): row.payments for row in self.query("operator_payments", feed=feed_path).itertuples(index=False)}
+
+        totals = {
+            "ranges": [],
+            "totals": []
+        }
+        for withdrawal_range in ranges.itertuples(index=False):
+            index = withdrawal_range.rangeIndex
+            total = {
+                "deviations": {},
+                "maxDeviation": {},
+                "fees": {},
+                "payments": {},
+                "profits": {},
+                "observationsCounts": {},
+                "missedObservations": {},
+                "transmissionsCounts": {},
+                "estimatedObservationsEarnings": {},
+                "estimatedTransmissionsEarnings": {},
+                "estimatedTotalEarnings": {},
+                "consecutiveMissedObservations": {},
+                "maxConsecutiveMissedObservations": {},
+                "separateMissedObservationsInstances": {},
+                "separateConsecutiveMissedObservationsInstances": {},
+            }
+
+            for transmitter in transmitters:
+                transmitter_name = nop_details[transmitter.lower()]["name"]
+                row = operator_totals.get((index, transmitter_name))
+                # an operator without rounds in the range gets the values pandas gives an empty frame
+                total["deviations"][transmitter_name] = np.float64(row.deviations) if row is not None else np.nan
+                total["maxDeviation"][transmitter_name] = np.float64(row.maxDeviation) if row is not None else np.nan
+                total["fees"][transmitter_name] = np.float64(row.fees) if row is not None else np.float64(0)
+                total["payments"][transmitter_name] = np.float64(payments[(index, transmitter_name)]) if (index, transmitter_name) in payments else 0
+                total["missedObservations"][transmitter_name] = int(row.missedObservations) if row is not None else 0
+                total["consecutiveMissedObservations"][transmitter_name] = int(row.consecutiveMissedObservations) if row is not None else 0
+                total["maxConsecutiveMissedObservations"][transmitter_name] = np.int64(row.maxConsecutiveMissedObservations) if row is not None else np.nan
+                total["separateMissedObservationsInstances"][transmitter_name] = int(row.separateMissedObservationsInstances) if row is not None else 0
+
+            # estimated earnings per nop, as calculate_estimated_earnings
+            estimated_earnings = {
+                "observationsCounts": {},
+                "transmissionsCounts": {},
+                "estimatedObservationsEarnings": {},
+                "estimatedTransmissionsEarnings": {},
+                "estimatedTransmissionsRepayments": {},
+                "estimatedTotalEarnings": {}
+            }
+            link_price = withdrawal_range.linkPrice
+            for nop in nop_details:
+                name = nop_details[nop]["name"]
+                if name not in observed_names:
+                    continue
+                row = operator_totals.get((index, name))
+                repayment = repayments.get((index, name, nop))
+                observations_count = int(row.observationsCounts) if row is not None else 0
+                transmissions_count = int(repayment.transmissionsCounts) if repayment is not None else 0
+                repayments_link = np.float64(repayment.repaymentsEth if repayment is not None else 0) * withdrawal_range.microLinkPerEth / 1000000.0
+                repayments_usd = repayments_link * link_price
+                estimated_observations_earnings = np.float64(observations_count * (withdrawal_range.linkGweiPerObservation / 1000000000.0) * link_price)
+                estimated_transmissions_earnings = np.float64(transmissions_count * (withdrawal_range.linkGweiPerTransmission / 1000000000.0) * link_price)
+
+                estimated_earnings["observationsCounts"][name] = observations_count
+                estimated_earnings["transmissionsCounts"][name] = transmissions_count
+                estimated_earnings["estimatedObservationsEarnings"][name] = estimated_observations_earnings
+                estimated_earnings["estimatedTransmissionsEarnings"][name] = estimated_transmissions_earnings
+                estimated_earnings["estimatedTransmissionsRepayments"][name] = repayments_usd
+                estimated_earnings["estimatedTotalEarnings"][name] = estimated_observations_earnings + estimated_transmissions_earnings + repayments_usd
+            for key in estimated_earnings:
+                total[key] = estimated_earnings[key]
+
+            finalize_range_total(total)
+            totals["ranges"].append({"from": withdrawal_range.rangeFrom, "to": withdrawal_range.rangeTo})
+            totals["totals"].append(total)
+
+        return totals
+
+    def save_totals(self, feed_path):
+        """
+        Function to compute a feed's totals and write them to its totals.json, as get_totals does
+
+        Args:
+            feed_path: The path of the feed
+
+        Returns:
+            A dict with totals for each operator
+        """
+        totals = self.totals(feed_path)
+        dir_path = "data/"+feed_path
+        os.makedirs(dir_path, exist_ok=True)
+        with open(dir_path+"/totals.json", "w", encoding="utf-8") as outfile:
+            # maxima of integer columns are numpy scalars
+            json.dump(totals, outfile, ensure_ascii=False, indent=4, default=lambda value: value.item())
+        return totals
+
+    def close(self):
+        self.con.close()
+
+def compare_totals(expected, actual, rel_tol=1e-9):
+    """
+    Function to compare two totals dicts, as summing in a different order changes the last digits of floats
+
+    Args:
+        expected: The totals of get_totals
+        actual: The totals to check
+        rel_tol: The relative tolerance of float values
+
+    Returns:
+        A list of (path, expected value, actual value) for every difference
+    """
+    differences = []
+
+    def compare(path, left, right):
+        if isinstance(left, dict) and isinstance(right, dict):
+            for key in dict.fromkeys(list(left) + list(right)):
+                compare(path+"/"+str(key), left.get(key), right.get(key))
+        elif isinstance(left, list) and isinstance(right, list) and len(left) == len(right):
+            for index in range(len(left)):
+                compare(path+"/"+str(index), left[index], right[index])
+        elif isinstance(left, (int, float)) and isinstance(right, (int, float)):
+            if math.isnan(left) and math.isnan(right):
+                return
+            if not math.isclose(left, right, rel_tol=rel_tol, abs_tol=1e-12):
+                differences.append((path, left, right))
+        elif left != right:
+            differences.append((path, left, right))
+
+    compare("", json.loads(json.dumps(expected, default=lambda value: value.item())), json.loads(json.dumps(actual, default=lambda value: value.item())))
+    return differences
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv
+
+    if len(args) < 3 or args[1] not in ["totals", "query"]:
+        print("Please pass in a feed or a query like: python sql_layer.py totals ethereum/mainnet/crypto-usd/link-usd or python sql_layer.py query \"SELECT feed, count(*) FROM payments GROUP BY feed\"")
+        exit()
+
+    if args[1] == "totals":
+        database = FeedDatabase([args[2]])
+        database.save_totals(args[2])
+        print("Saved data/"+args[2]+"/totals.json")
+    else:
+        print(FeedDatabase().sql(args[2]).to_string())
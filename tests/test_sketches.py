@@ -0,0 +1,101 @@
+import os
+import shutil
+import numpy as np
+import pytest
+import rollups
+import sketches
+from sketches import QuantileSketch, aggregate_counts, RELATIVE_ACCURACY, MIN_VALUE
+
+QUANTILES = [0.0, 0.01, 0.25, 0.5, 0.75, 0.95, 0.99, 1.0]
+RECORDED_FEED_PATH = "ethereum/mainnet/crypto-usd/link-usd"
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def sketch_quantiles(values, quantiles=QUANTILES):
+    sketch = QuantileSketch()
+    buckets = sketch.buckets(values)
+    return sketch.quantiles(buckets, np.ones(len(buckets), dtype=np.int64), quantiles)
+
+def assert_within_accuracy(actual, values, quantiles=QUANTILES):
+    expected = np.quantile(values, quantiles, method="lower")
+    # values up to MIN_VALUE are counted as zero
+    assert (np.abs(actual - expected) <= RELATIVE_ACCURACY * expected + MIN_VALUE).all(), (actual, expected)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_quantiles_of_lognormal_values(seed):
+    values = np.random.default_rng(seed).lognormal(mean=-3, sigma=2, size=20000)
+    assert_within_accuracy(sketch_quantiles(values), values)
+
+def test_single_value():
+    assert_within_accuracy(sketch_quantiles(np.array([0.37])), np.array([0.37]))
+
+def test_split_then_merge_equals_single_sketch():
+    rng = np.random.default_rng(3)
+    values = rng.lognormal(size=9000)
+    columns = rng.integers(0, 3, size=len(values))
+    days = rng.integers(0, 5, size=len(values)) * 86400
+    sketch = QuantileSketch()
+    buckets = sketch.buckets(values)
+
+    whole = aggregate_counts(days, columns, buckets)
+    parts = [aggregate_counts(days[part], columns[part], buckets[part]) for part in np.array_split(np.arange(len(values)), 4)]
+    merged = aggregate_counts(*[np.concatenate(arrays) for arrays in zip(*parts)])
+    for whole_values, merged_values in zip(whole, merged):
+        np.testing.assert_array_equal(whole_values, merged_values)
+
+    # the merged counts of a column over every day give its quantiles
+    for column in range(3):
+        entries = merged[1] == column
+        assert_within_accuracy(sketch.quantiles(merged[2][entries], merged[3][entries], QUANTILES), values[columns == column])
+
+def test_zero_bucket():
+    sketch = QuantileSketch()
+    values = np.array([0.0, MIN_VALUE / 2, MIN_VALUE, 2e-3, 5e-3, 1e-2])
+    buckets = sketch.buckets(values)
+    assert list(buckets[:3]) == [sketches.ZERO_BUCKET] * 3
+    assert (buckets[3:] != sketches.ZERO_BUCKET).all()
+    assert sketch.bucket_values(buckets[:3]).tolist() == [0.0, 0.0, 0.0]
+    assert_within_accuracy(sketch.quantiles(buckets, np.ones(len(buckets)), QUANTILES), values)
+
+def test_empty_counts_are_nan():
+    sketch = QuantileSketch()
+    assert np.isnan(sketch.quantiles(np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64), [0.5, 0.99])).all()
+    assert np.isnan(sketch.quantiles(np.array([3, 4], dtype=np.int32), np.array([0, 0]), [0.5])).all()
+    periods, columns, buckets, counts = aggregate_counts([], [], [])
+    assert len(periods) == len(columns) == len(buckets) == len(counts) == 0
+
+def copy_feed(feed_path, lines):
+    source_dir = REPO_DIR+"/data/"+RECORDED_FEED_PATH
+    dir_path = "data/"+feed_path
+    os.makedirs(dir_path+"/prices")
+    for filename in rollups.SOURCE_FILES:
+        if filename != "transmissions.csv":
+            shutil.copy(source_dir+"/"+filename, dir_path+"/"+filename)
+    with open(dir_path+"/transmissions.csv", "wb") as outfile:
+        outfile.writelines(lines)
+
+def test_incremental_rollups_match_rebuild(tmp_path, monkeypatch):
+    transmissions_filename = REPO_DIR+"/data/"+RECORDED_FEED_PATH+"/transmissions.csv"
+    if not os.path.exists(transmissions_filename):
+        pytest.skip("the recorded feed is not collected")
+    with open(transmissions_filename, "rb") as file:
+        lines = file.readlines()
+    monkeypatch.chdir(tmp_path)
+    copy_feed("incremental", lines[:len(lines) // 2])
+    rollups.update_rollups("incremental")
+    with open("data/incremental/transmissions.csv", "ab") as outfile:
+        outfile.writelines(lines[len(lines) // 2:])
+
+    # the second update merges the stored sketches instead of rolling everything up again
+    loads = []
+    load_sketches = rollups.load_sketches
+    monkeypatch.setattr(rollups, "load_sketches", lambda feed_path: loads.append(feed_path) or load_sketches(feed_path))
+    rollups.update_rollups("incremental")
+    assert loads == ["incremental"]
+    monkeypatch.undo()
+    monkeypatch.chdir(tmp_path)
+
+    copy_feed("rebuilt", lines)
+    rollups.update_rollups("rebuilt")
+    for incremental, rebuilt in zip(rollups.load_sketches("incremental"), rollups.load_sketches("rebuilt")):
+        np.testing.assert_array_equal(incremental, rebuilt)
+    assert rollups.deviation_quantiles("incremental").equals(rollups.deviation_quantiles("rebuilt"))
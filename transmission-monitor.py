@@ -0,0 +1,5 @@
+import sys
+from cli import main
+
+# Same as python cli.py monitor, which only imports what the command needs
+exit(main(["monitor"] + sys.argv[1:]))